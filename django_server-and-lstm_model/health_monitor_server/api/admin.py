@@ -1,9 +1,13 @@
 from django.contrib import admin
-from .models import Patient, Guardian, HealthData, Alert
+from .models import Patient, Guardian, HealthData, HealthDataRollup, SensorWindow, Alert, FirebaseOutbox
 
 class GuardianInline(admin.TabularInline):
     model = Guardian
     extra = 1
+    
+    def get_queryset(self, request):
+        # Each row is labelled with its __str__, which reads the patient name
+        return super().get_queryset(request).select_related('patient')
 
 class AlertInline(admin.TabularInline):
     model = Alert
@@ -12,6 +16,10 @@ class AlertInline(admin.TabularInline):
     can_delete = False
     max_num = 5
     ordering = ['-timestamp']
+    
+    def get_queryset(self, request):
+        # The row label and health_data are shown by their __str__, which reads the patient name
+        return super().get_queryset(request).select_related('patient', 'health_data__patient')
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -32,6 +40,7 @@ class PatientAdmin(admin.ModelAdmin):
 @admin.register(Guardian)
 class GuardianAdmin(admin.ModelAdmin):
     list_display = ['name', 'get_patient_name', 'relationship', 'phone_number', 'notification_enabled']
+    list_select_related = ['patient']
     search_fields = ['name', 'patient__name', 'phone_number', 'email']
     list_filter = ['relationship', 'notification_enabled']
     
@@ -43,6 +52,7 @@ class GuardianAdmin(admin.ModelAdmin):
 @admin.register(HealthData)
 class HealthDataAdmin(admin.ModelAdmin):
     list_display = ['get_patient_name', 'timestamp', 'heart_rate', 'spo2']
+    list_select_related = ['patient']
     search_fields = ['patient__name']
     list_filter = ['timestamp']
     readonly_fields = ['timestamp']
@@ -55,6 +65,7 @@ class HealthDataAdmin(admin.ModelAdmin):
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = ['get_patient_name', 'timestamp', 'type', 'message', 'status']
+    list_select_related = ['patient']
     search_fields = ['patient__name', 'message']
     list_filter = ['status', 'type', 'timestamp']
     readonly_fields = ['timestamp']
@@ -72,4 +83,51 @@ class AlertAdmin(admin.ModelAdmin):
     def mark_as_resolved(self, request, queryset):
         from django.utils import timezone
         queryset.update(status='RESOLVED', resolved_at=timezone.now())
-    mark_as_resolved.short_description = "Mark selected alerts as resolved"
\ No newline at end of file
+    mark_as_resolved.short_description = "Mark selected alerts as resolved"
+
+@admin.register(HealthDataRollup)
+class HealthDataRollupAdmin(admin.ModelAdmin):
+    list_display = ['get_patient_name', 'resolution', 'bucket_start', 'count', 'heart_rate_min', 'heart_rate_max',
+                    'spo2_min']
+    list_select_related = ['patient']
+    search_fields = ['patient__name']
+    list_filter = ['resolution']
+    
+    def get_patient_name(self, obj):
+        return obj.patient.name
+    get_patient_name.short_description = 'Patient'
+    get_patient_name.admin_order_field = 'patient__name'
+    
+    def has_add_permission(self, request):
+        # Rollups are computed from health data, see rollups.py
+        return False
+
+@admin.register(SensorWindow)
+class SensorWindowAdmin(admin.ModelAdmin):
+    list_display = ['get_patient_name', 'timestamp', 'sample_count', 'sample_rate', 'smv_mean', 'smv_max']
+    list_select_related = ['patient']
+    search_fields = ['patient__name']
+    list_filter = ['timestamp']
+    exclude = ['samples']
+    
+    def get_patient_name(self, obj):
+        return obj.patient.name
+    get_patient_name.short_description = 'Patient'
+    get_patient_name.admin_order_field = 'patient__name'
+    
+    def has_add_permission(self, request):
+        # Windows are packed from ingested readings, see window_storage.py
+        return False
+
+@admin.register(FirebaseOutbox)
+class FirebaseOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'object_id', 'status', 'attempts', 'created_at', 'delivered_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'object_id', 'payload', 'attempts', 'last_error', 'claim_token',
+                       'available_at', 'created_at', 'delivered_at']
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        queryset.update(status=FirebaseOutbox.STATUS_PENDING, available_at=timezone.now(), claim_token='')
+    retry_now.short_description = "Retry selected entries now"
\ No newline at end of file
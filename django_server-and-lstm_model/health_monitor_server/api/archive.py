@@ -0,0 +1,253 @@
+"""
+Archival of old health data into per-patient, per-day columnar files
+
+Samples older than the retention period (HEALTH_DATA_RETENTION_DAYS) are
+moved out of the HealthData table into one compressed file per patient and
+UTC day:
+
+    HEALTH_DATA_ARCHIVE_DIR/<patient id>/<YYYY-MM-DD>.hmtb
+
+Each file is one timeseries_codec block with a column per field, sorted by
+(timestamp, id). The id and timestamp (microseconds since the epoch) are
+int64 and stored as deltas of deltas, the measurements float64 and stored
+losslessly with the codec's auto method. A missing optional value is NaN.
+Files written before the codec existed (<YYYY-MM-DD>.npz) are still read,
+and replaced by a .hmtb file the next time their day is written. Samples an
+alert points to stay in the table, so the alert keeps its reading. The read
+path that combines the files with the table is in health_data_repository.py.
+
+A day file is written (merged with any earlier file for that day) and
+renamed into place before its rows are deleted. If the deletion fails, the
+rows are in both places until the next run, and readers skip the archived
+copies of ids that are still in the table.
+"""
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Alert, HealthData
+from .timeseries_codec import decode_block, encode_block
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Archived HealthData columns; the patient is given by the file's directory
+ARCHIVE_FIELDS = ('id', 'timestamp', 'heart_rate', 'spo2',
+                  'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+                  'gyroscope_x', 'gyroscope_y', 'gyroscope_z',
+                  'temperature', 'systolic_bp', 'diastolic_bp', 'respiratory_rate')
+INTEGER_FIELDS = ('id', 'timestamp')
+NULLABLE_FIELDS = ('temperature', 'systolic_bp', 'diastolic_bp', 'respiratory_rate')
+WHOLE_NUMBER_FIELDS = ('systolic_bp', 'diastolic_bp')
+
+DAY_FILE_SUFFIX = '.hmtb'
+# Day files written by earlier versions, before timeseries_codec
+LEGACY_DAY_FILE_SUFFIX = '.npz'
+
+# Ids per DELETE statement, below SQLite's limit on query parameters
+DELETE_BATCH_SIZE = 500
+
+
+def to_micros(moment):
+    """Microseconds since the epoch of an aware datetime"""
+    return (moment - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def day_start(moment):
+    """Midnight UTC of the day containing moment"""
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, moment.day, tzinfo=dt_timezone.utc)
+
+
+def rows_to_columns(rows):
+    """Column arrays from tuples in ARCHIVE_FIELDS order (as values_list returns them)"""
+    columns = {}
+    values = list(zip(*rows)) or [()] * len(ARCHIVE_FIELDS)
+    for field, column in zip(ARCHIVE_FIELDS, values):
+        if field == 'timestamp':
+            columns[field] = np.array([to_micros(moment) for moment in column], dtype=np.int64)
+        elif field in INTEGER_FIELDS:
+            columns[field] = np.array(column, dtype=np.int64)
+        else:
+            columns[field] = np.array(column, dtype=np.float64)  # None becomes NaN
+    return columns
+
+
+def columns_to_instances(columns, patient):
+    """Unsaved HealthData rows of patient (with their original ids) from column arrays"""
+    instances = []
+    lists = {field: columns[field].tolist() for field in ARCHIVE_FIELDS}
+    for position in range(len(lists['id'])):
+        values = {field: lists[field][position] for field in ARCHIVE_FIELDS}
+        values['timestamp'] = from_micros(values['timestamp'])
+        for field in NULLABLE_FIELDS:
+            if values[field] != values[field]:  # NaN
+                values[field] = None
+            elif field in WHOLE_NUMBER_FIELDS:
+                values[field] = int(values[field])
+        instances.append(HealthData(patient=patient, **values))
+    return instances
+
+
+def empty_columns():
+    return rows_to_columns([])
+
+
+def concatenate_columns(parts):
+    parts = list(parts)
+    if not parts:
+        return empty_columns()
+    return {field: np.concatenate([part[field] for part in parts]) for field in ARCHIVE_FIELDS}
+
+
+def select_rows(columns, mask_or_indexes):
+    return {field: column[mask_or_indexes] for field, column in columns.items()}
+
+
+def sort_columns(columns):
+    """Columns sorted by (timestamp, id), keeping the first of any duplicate id"""
+    _, first = np.unique(columns['id'], return_index=True)
+    columns = select_rows(columns, first)
+    return select_rows(columns, np.lexsort((columns['id'], columns['timestamp'])))
+
+
+class HealthDataArchive:
+    """The archive directory: one compressed columnar file per patient and UTC day"""
+
+    def __init__(self, root=None):
+        self.root = str(root or getattr(settings, 'HEALTH_DATA_ARCHIVE_DIR',
+                                        os.path.join(settings.BASE_DIR, 'health_data_archive')))
+
+    def day_path(self, patient_id, day, suffix=DAY_FILE_SUFFIX):
+        return os.path.join(self.root, str(patient_id), f'{day.isoformat()}{suffix}')
+
+    def patient_ids(self):
+        """Patients with at least one archived day"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(name) for name in os.listdir(self.root) if name.isdigit())
+
+    def days(self, patient_id, since=None, until=None):
+        """Sorted archived days of a patient that overlap since..until"""
+        directory = os.path.join(self.root, str(patient_id))
+        if not os.path.isdir(directory):
+            return []
+        days = sorted({date.fromisoformat(name[:-len(suffix)]) for name in os.listdir(directory)
+                       for suffix in (DAY_FILE_SUFFIX, LEGACY_DAY_FILE_SUFFIX) if name.endswith(suffix)})
+        if since is not None:
+            days = [day for day in days if day >= day_start(since).date()]
+        if until is not None:
+            days = [day for day in days if datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc) < until]
+        return days
+
+    def read_day(self, patient_id, day):
+        """Columns of one archived day, or empty columns if there is no file"""
+        path = self.day_path(patient_id, day)
+        if os.path.exists(path):
+            with open(path, 'rb') as archived:
+                columns = decode_block(archived.read())
+            return {field: columns[field] for field in ARCHIVE_FIELDS}
+        legacy_path = self.day_path(patient_id, day, LEGACY_DAY_FILE_SUFFIX)
+        if os.path.exists(legacy_path):
+            with np.load(legacy_path) as archived:
+                return {field: archived[field] for field in ARCHIVE_FIELDS}
+        return empty_columns()
+
+    def write_day(self, patient_id, day, columns):
+        """
+        Add columns to a day's file, replacing it atomically
+
+        Returns:
+            Number of rows in the file
+        """
+        columns = sort_columns(concatenate_columns([self.read_day(patient_id, day), columns]))
+        path = self.day_path(patient_id, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                output.write(encode_block(columns))
+                output.flush()
+                os.fsync(output.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        # Its rows were merged into the new file
+        legacy_path = self.day_path(patient_id, day, LEGACY_DAY_FILE_SUFFIX)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        return len(columns['id'])
+
+    def read(self, patient_id, since=None, until=None):
+        """Archived columns of a patient within since (inclusive) and until (exclusive), oldest first"""
+        parts = []
+        for day in self.days(patient_id, since, until):
+            columns = self.read_day(patient_id, day)
+            keep = np.ones(len(columns['id']), dtype=bool)
+            if since is not None:
+                keep &= columns['timestamp'] >= to_micros(since)
+            if until is not None:
+                keep &= columns['timestamp'] < to_micros(until)
+            parts.append(select_rows(columns, keep))
+        return concatenate_columns(parts)
+
+
+def archive_health_data(retention_days=None, patient_ids=None, archive=None, dry_run=False):
+    """
+    Move samples older than retention_days (whole UTC days) into the archive
+
+    Args:
+        retention_days: Days of samples kept in the table, by default
+                        HEALTH_DATA_RETENTION_DAYS
+        patient_ids: Only archive these patients
+        archive: HealthDataArchive to write to
+        dry_run: Count what would be archived without writing or deleting
+
+    Returns:
+        dict with the number of patients, days and samples archived
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, 'HEALTH_DATA_RETENTION_DAYS', 30)
+    archive = archive or HealthDataArchive()
+    cutoff = day_start(timezone.now()) - timedelta(days=retention_days)
+
+    candidates = HealthData.objects.filter(timestamp__lt=cutoff).exclude(
+        id__in=Alert.objects.filter(health_data__isnull=False).values('health_data_id'))
+    if patient_ids is not None:
+        candidates = candidates.filter(patient_id__in=patient_ids)
+
+    totals = {'patients': 0, 'days': 0, 'samples': 0}
+    for patient_id in candidates.order_by().values_list('patient_id', flat=True).distinct():
+        patient_rows = candidates.filter(patient_id=patient_id)
+        totals['patients'] += 1
+        oldest = patient_rows.order_by('timestamp').values_list('timestamp', flat=True).first()
+        while oldest is not None:
+            start = day_start(oldest)
+            end = start + timedelta(days=1)
+            day_rows = patient_rows.filter(timestamp__gte=start, timestamp__lt=end)
+            rows = list(day_rows.order_by('timestamp', 'id').values_list(*ARCHIVE_FIELDS))
+            if rows:
+                totals['days'] += 1
+                totals['samples'] += len(rows)
+                if not dry_run:
+                    columns = rows_to_columns(rows)
+                    archive.write_day(patient_id, start.date(), columns)
+                    # Exactly the rows written; rows that arrived after the read wait for the next run
+                    ids = columns['id'].tolist()
+                    with transaction.atomic():
+                        for offset in range(0, len(ids), DELETE_BATCH_SIZE):
+                            HealthData.objects.filter(id__in=ids[offset:offset + DELETE_BATCH_SIZE]).delete()
+            oldest = patient_rows.filter(timestamp__gte=end).order_by('timestamp').values_list(
+                'timestamp', flat=True).first()
+    return totals
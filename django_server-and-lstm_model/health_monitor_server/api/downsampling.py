@@ -0,0 +1,138 @@
+"""
+Largest-Triangle-Three-Buckets downsampling of health data series
+
+LTTB keeps the first and last sample and splits the rest into points - 2
+buckets of equal sample count. From each bucket it keeps the sample that
+forms the largest triangle with the sample kept from the previous bucket
+and the mean of the next bucket. Peaks and dips therefore survive, which an
+average or a stride would smooth away or miss. The payload of a chart is
+bounded by points whatever the time range.
+
+Selection is sequential (each bucket depends on the previous choice), so the
+loop runs over buckets, while the areas of all candidates in a bucket are
+computed together on a padded (buckets, width) array. Long ranges are
+streamed and reduced block by block (see downsample_series), so a year of
+readings never has to be in memory at once.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+
+from .archive import concatenate_columns, select_rows
+from .rollups import METRICS, RAW_FIELDS, sample_metrics
+
+# Columns sample_metrics() derives the metrics from
+SERIES_FIELDS = RAW_FIELDS[2:]
+
+# Samples downsampled at a time when a range is read in blocks
+BLOCK_SAMPLES = 50000
+# Samples a block keeps per requested point, for its share of the range
+OVERSAMPLING = 4
+
+
+def lttb(x, y, points):
+    """
+    Indices of the samples of (x, y) that LTTB keeps
+
+    Args:
+        x: Increasing sample positions, e.g. epoch seconds
+        y: Sample values
+        points: Number of samples to keep, at least 3
+
+    Returns:
+        Increasing int array of min(points, len(x)) indices, always including
+        the first and last sample
+    """
+    if points < 3:
+        raise ValueError(f"LTTB needs at least 3 points, got {points}")
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x[0]  # Keeps the area products small
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket b holds samples starts[b]..ends[b]-1 of the interior 1..n-2
+    edges = (np.arange(points - 1) * ((n - 2) / (points - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+
+    # The third corner of a bucket's triangles is the mean of the next bucket, or the last sample
+    next_x = np.append(np.add.reduceat(x[1:n - 1], starts - 1)[1:] / sizes[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[1:n - 1], starts - 1)[1:] / sizes[1:], y[-1])
+
+    candidates = starts[:, None] + np.arange(sizes.max())
+    padding = candidates >= ends[:, None]
+    candidates[padding] = n - 1
+    candidate_x, candidate_y = x[candidates], y[candidates]
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        ax, ay = x[previous], y[previous]
+        # Twice the triangle area; the constant factor does not change the argmax
+        areas = np.abs((ax - next_x[bucket]) * (candidate_y[bucket] - ay)
+                       - (ax - candidate_x[bucket]) * (next_y[bucket] - ay))
+        areas[padding[bucket]] = -1.0
+        previous = candidates[bucket, np.argmax(areas)]
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_series(repository, patient_id, since, until, points, metrics=METRICS, block_samples=BLOCK_SAMPLES):
+    """
+    LTTB-downsample every metric of a patient's samples independently
+
+    Samples are streamed through the repository, so archived days are
+    included and memory stays bounded however long since..until is. A range
+    of up to block_samples samples is downsampled in one pass. Longer ranges
+    are cut into blocks of block_samples samples, each block keeps
+    OVERSAMPLING samples per point for its share of since..until, and a
+    final pass picks points of those. Blocks are cut by sample count, so the
+    result does not depend on which samples are archived.
+
+    Returns:
+        dict with the number of samples read and, per metric, a columnar
+        {"timestamps": [epoch ms, ...], "values": [...]} of at most points
+        samples. Missing temperatures are left out before downsampling.
+    """
+    span_ms = max((until - since) / timedelta(milliseconds=1), 1.0)
+    kept = {metric: ([], []) for metric in metrics}
+
+    def reduce(block, budget_points=None):
+        timestamps = block['timestamp'] // 1000
+        values = sample_metrics(np.vstack([block[field] for field in SERIES_FIELDS]))
+        for metric in metrics:
+            present = ~np.isnan(values[metric])
+            metric_timestamps, metric_values = timestamps[present], values[metric][present]
+            if budget_points is not None and len(metric_timestamps):
+                share = (metric_timestamps[-1] - metric_timestamps[0] + 1) / span_ms
+                keep = lttb(metric_timestamps, metric_values, max(3, math.ceil(budget_points * share)))
+                metric_timestamps, metric_values = metric_timestamps[keep], metric_values[keep]
+            kept[metric][0].append(metric_timestamps)
+            kept[metric][1].append(metric_values)
+
+    pending, samples = [], 0
+    for chunk in repository.iter_columns(patient_id, since, until):
+        samples += len(chunk['id'])
+        pending.append(chunk)
+        buffered = concatenate_columns(pending)
+        while len(buffered['id']) >= block_samples:
+            reduce(select_rows(buffered, slice(0, block_samples)), OVERSAMPLING * points)
+            buffered = select_rows(buffered, slice(block_samples, None))
+        pending = [buffered]
+    # The rest is less than a block, and kept whole
+    reduce(concatenate_columns(pending))
+
+    series = {}
+    for metric, (timestamp_parts, value_parts) in kept.items():
+        metric_timestamps, metric_values = np.concatenate(timestamp_parts), np.concatenate(value_parts)
+        keep = lttb(metric_timestamps, metric_values, points)
+        series[metric] = {
+            'timestamps': metric_timestamps[keep].tolist(),
+            'values': metric_values[keep].tolist(),
+        }
+    return {'samples': samples, 'series': series}
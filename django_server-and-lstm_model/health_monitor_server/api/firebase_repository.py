@@ -50,7 +50,7 @@ class FirebaseRepository:
     def save_health_data(self, health_data):
         """Save health data to Firebase"""
         return self.firebase_service.add_health_data_to_firebase(
-            patient_id=health_data.patient.id if health_data.patient else None,
+            patient_id=health_data.patient_id,
             health_data=health_data
         )
     
@@ -88,7 +88,7 @@ class FirebaseService:
                 body = f"{alert_type}: {alert_message}"
                 data = {
                     "alert_type": alert_type,
-                    "patient_id": str(guardian.patient.id),
+                    "patient_id": str(guardian.patient_id),
                     "guardian_id": str(guardian.id)
                 }
                 
@@ -157,7 +157,7 @@ class FirebaseService:
             
             # Replace patient with patient_id
             if 'patient' in guardian_data and guardian_data['patient']:
-                guardian_data['patient_id'] = str(guardian_data['patient'].id)
+                guardian_data['patient_id'] = str(guardian_data['patient'])
                 del guardian_data['patient']
             
             # Save to Firestore
@@ -185,7 +185,7 @@ class FirebaseService:
             
             # Replace patient with patient_id
             if 'patient' in data_dict and data_dict['patient']:
-                data_dict['patient_id'] = str(data_dict['patient'].id)
+                data_dict['patient_id'] = str(data_dict['patient'])
                 del data_dict['patient']
             
             # Save to Firestore
@@ -213,11 +213,11 @@ class FirebaseService:
             
             # Replace related objects with their IDs
             if 'patient' in alert_data and alert_data['patient']:
-                alert_data['patient_id'] = str(alert_data['patient'].id)
+                alert_data['patient_id'] = str(alert_data['patient'])
                 del alert_data['patient']
             
             if 'health_data' in alert_data and alert_data['health_data']:
-                alert_data['health_data_id'] = str(alert_data['health_data'].id)
+                alert_data['health_data_id'] = str(alert_data['health_data'])
                 del alert_data['health_data']
             
             # Save to Firestore
@@ -0,0 +1,134 @@
+"""
+Health Data Repository - reads a patient's samples from the HealthData table
+and the archive (see archive.py) as one series
+
+Archived days are only opened when a read reaches back into them, so reads
+of recent data cost the same as before archival. An id found in both places
+(a day archived but not yet deleted) is taken from the table.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+
+from .archive import (ARCHIVE_FIELDS, ONE_MICROSECOND, HealthDataArchive, columns_to_instances,
+                      concatenate_columns, day_start, rows_to_columns, select_rows, sort_columns, to_micros)
+from .models import HealthData
+
+
+class HealthDataRepository:
+    """Repository for health data reads that span the table and the archive"""
+
+    def __init__(self, archive=None):
+        self.archive = archive or HealthDataArchive()
+
+    def columns(self, patient_id, since=None, until=None, chunk_size=10000):
+        """
+        A patient's samples within since (inclusive) and until (exclusive)
+
+        Returns:
+            dict of ARCHIVE_FIELDS column arrays, oldest first (timestamps in
+            microseconds since the epoch, NaN for missing optional values)
+        """
+        return concatenate_columns(self.iter_columns(patient_id, since, until, chunk_size))
+
+    def iter_columns(self, patient_id, since=None, until=None, chunk_size=10000):
+        """
+        columns() in chunks, oldest first
+
+        Table rows are read chunk_size at a time. An archived day is read
+        whole, together with any table rows of that day, so at most one
+        chunk or one day of samples is in memory however long the range.
+
+        Yields:
+            dicts of ARCHIVE_FIELDS column arrays, in (timestamp, id) order
+        """
+        start = since
+        for day in self.archive.days(patient_id, since, until):
+            day_begin = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+            day_since = day_begin if since is None else max(since, day_begin)
+            day_until = day_begin + timedelta(days=1) if until is None else min(until, day_begin + timedelta(days=1))
+            yield from self._table_columns(patient_id, start, day_since, chunk_size)
+            # Table rows first, so they win over archived copies of the same id
+            parts = list(self._table_columns(patient_id, day_since, day_until, chunk_size))
+            parts.append(self.archive.read(patient_id, day_since, day_until))
+            yield sort_columns(concatenate_columns(parts))
+            start = day_until
+        yield from self._table_columns(patient_id, start, until, chunk_size)
+
+    def _table_columns(self, patient_id, since, until, chunk_size):
+        """Table rows within since..until as column chunks of up to chunk_size rows"""
+        if since is not None and until is not None and since >= until:
+            return
+        table_rows = HealthData.objects.filter(patient_id=patient_id)
+        if since is not None:
+            table_rows = table_rows.filter(timestamp__gte=since)
+        if until is not None:
+            table_rows = table_rows.filter(timestamp__lt=until)
+        # Converted chunk by chunk, so only one chunk of row tuples is in memory
+        rows = table_rows.order_by('timestamp', 'id').values_list(*ARCHIVE_FIELDS).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield rows_to_columns(chunk)
+
+    def archived_page(self, patient, since, until, position, reverse, limit):
+        """
+        Up to limit archived samples past a keyset position, in page order
+
+        Args:
+            position: (timestamp, id) the page starts after, or None
+            reverse: False for older samples than position, newest first;
+                     True for newer samples, oldest first
+
+        Returns:
+            Unsaved HealthData rows with their original ids
+        """
+        days = self.archive.days(patient.id, since, until)
+        if position is not None:
+            position_day = day_start(position[0]).date()
+            days = [day for day in days if (day >= position_day if reverse else day <= position_day)]
+        if not reverse:
+            days.reverse()
+
+        parts, found = [], 0
+        for day in days:
+            columns = self.archive.read_day(patient.id, day)
+            timestamps, ids = columns['timestamp'], columns['id']
+            keep = np.ones(len(ids), dtype=bool)
+            if since is not None:
+                keep &= timestamps >= to_micros(since)
+            if until is not None:
+                keep &= timestamps < to_micros(until)
+            if position is not None:
+                micros, pk = to_micros(position[0]), position[1]
+                if reverse:
+                    keep &= (timestamps > micros) | ((timestamps == micros) & (ids > pk))
+                else:
+                    keep &= (timestamps < micros) | ((timestamps == micros) & (ids < pk))
+            indexes = np.flatnonzero(keep)  # Day files are sorted by (timestamp, id)
+            indexes = indexes[:limit - found] if reverse else indexes[::-1][:limit - found]
+            parts.append(select_rows(columns, indexes))
+            found += len(indexes)
+            if found >= limit:
+                break
+        return columns_to_instances(concatenate_columns(parts), patient)
+
+    def merge_page(self, rows, patient, since, until, position, reverse, limit):
+        """Merge archived samples into a keyset page of table rows (both in page order)"""
+        if len(rows) >= limit:
+            # A full page only takes archived samples from between its position
+            # and its last row, so pages of recent rows open no archived days
+            boundary = rows[-1].timestamp
+            if reverse:
+                until = boundary + ONE_MICROSECOND if until is None else min(until, boundary + ONE_MICROSECOND)
+            else:
+                since = boundary if since is None else max(since, boundary)
+        archived = self.archived_page(patient, since, until, position, reverse, limit)
+        if not archived:
+            return rows
+        table_ids = {row.pk for row in rows}
+        merged = rows + [row for row in archived if row.pk not in table_ids]
+        merged.sort(key=lambda row: (row.timestamp, row.pk), reverse=not reverse)
+        return merged[:limit]
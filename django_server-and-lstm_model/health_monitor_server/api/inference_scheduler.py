@@ -0,0 +1,201 @@
+"""
+Micro-batching of concurrent model calls
+
+Request threads each submit a small piece of work and wait on a future. A
+single scheduler thread collects pending items for up to max_wait_ms or
+until max_batch_size items are waiting, runs one batched call for all of
+them and resolves every caller's future. Items are handed to the batch
+function in submission order, so per-patient state (sliding windows,
+vitals history) sees readings in the order they arrived.
+
+When a batch call fails, its items are retried one by one, so one bad item
+fails only its own caller. A batch function that updates per-patient state
+must therefore leave it unchanged when it raises, e.g. by computing on
+copies and committing them once the model has scored the batch (see
+ImuWindowStore.stage). Callers wait at most timeout seconds; an item still
+queued by then is cancelled.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class Histogram:
+    """Counts of observed values in fixed upper-bound buckets"""
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            index = len(self.bounds)
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self):
+        """Bucket counts keyed by upper bound ('+Inf' for the overflow bucket)"""
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets['+Inf'] = self.counts[-1]
+        return {
+            'buckets': buckets,
+            'count': self.total,
+            'mean': self.sum / self.total if self.total else 0.0,
+        }
+
+
+def _power_of_two_bounds(limit):
+    bounds = []
+    bound = 1
+    while bound < limit:
+        bounds.append(bound)
+        bound *= 2
+    bounds.append(limit)
+    return bounds
+
+
+class MicroBatcher:
+    """
+    Collects submitted items and runs them through batch_fn together
+
+    Args:
+        batch_fn: Callable taking a list of items and returning a list of
+                  results in the same order
+        max_batch_size: Largest number of items passed to one batch_fn call
+        max_wait_ms: How long the first item of a batch waits for others
+        name: Name of the scheduler thread
+        timeout: Default seconds a caller waits for its result (None to wait
+                 indefinitely)
+    """
+
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=2.0, name='micro-batcher', timeout=None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.timeout = timeout
+        self.stats_lock = threading.Lock()
+        self.batch_sizes = Histogram(_power_of_two_bounds(self.max_batch_size))
+        self.queue_depths = Histogram(_power_of_two_bounds(self.max_batch_size * 4))
+        self.errors = 0
+        self.retried_batches = 0
+        self.timeouts = 0
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = None
+
+    def _ensure_started(self):
+        # The thread and queue do not survive a fork, so each process starts its own
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                            name=self.name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """
+        Submit an item and wait for its result
+
+        Raises:
+            concurrent.futures.TimeoutError: No result within timeout
+                                             (default self.timeout) seconds
+        """
+        future = self.submit(item)
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            # Not scored if it is still queued; a running batch finishes without it
+            future.cancel()
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+
+    def _collect(self, work_queue):
+        """Block for the first item, then gather more until the batch is full or the wait is over"""
+        batch = [work_queue.get()]
+        with self.stats_lock:
+            self.queue_depths.observe(work_queue.qsize() + 1)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(work_queue.get(timeout=remaining))
+                else:
+                    batch.append(work_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _call(self, items):
+        results = self.batch_fn(items)
+        if len(results) != len(items):
+            raise RuntimeError(f'{self.name} returned {len(results)} results for {len(items)} items')
+        return results
+
+    def _run(self, work_queue):
+        while True:
+            # Callers that timed out cancelled their items
+            batch = [(item, future) for item, future in self._collect(work_queue)
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            with self.stats_lock:
+                self.batch_sizes.observe(len(batch))
+            try:
+                results = self._call(items)
+            except Exception as e:
+                if len(items) == 1:
+                    with self.stats_lock:
+                        self.errors += 1
+                    futures[0].set_exception(e)
+                    continue
+                with self.stats_lock:
+                    self.retried_batches += 1
+                # Retry one by one so the failure stays with the items that cause it
+                for item, future in batch:
+                    try:
+                        future.set_result(self._call([item])[0])
+                    except Exception as item_error:
+                        with self.stats_lock:
+                            self.errors += 1
+                        future.set_exception(item_error)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Batch size and queue depth histograms plus settings"""
+        with self.stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batch_size': self.batch_sizes.snapshot(),
+                'queue_depth': self.queue_depths.snapshot(),
+                'errors': self.errors,
+                'retried_batches': self.retried_batches,
+                'timeouts': self.timeouts,
+            }
@@ -0,0 +1,212 @@
+"""
+NumPy-only inference for the vitals LSTM
+
+The vitals model trained by ml_lstm_model.py is a stack of Keras LSTM layers
+(with Dropout between them) followed by a Dense softmax. Importing
+TensorFlow into every server worker costs seconds of startup and hundreds of
+MB of memory, so the weights are exported once to a .npz file (see the
+export_vitals_lstm management command) and evaluated here with NumPy.
+
+The .npz layout:
+    format_version              FORMAT_VERSION
+    n_layers                    number of LSTM layers
+    lstm{i}_kernel              (n_inputs, 4 * units), gates in Keras order i, f, c, o
+    lstm{i}_recurrent_kernel    (units, 4 * units)
+    lstm{i}_bias                (4 * units,)
+    lstm{i}_config              [activation, recurrent_activation, return_sequences]
+    dense_kernel, dense_bias    output layer
+    dense_activation            output activation
+"""
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Layers that do nothing at inference time
+_INFERENCE_NOOP_LAYERS = {'Dropout', 'InputLayer', 'GaussianNoise', 'ActivityRegularization'}
+
+
+def _sigmoid(x):
+    # Same as 1 / (1 + exp(-x)) without overflow for large negative x
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0).astype(x.dtype, copy=False)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0),
+    'linear': lambda x: x,
+    'softmax': _softmax,
+}
+
+
+def _activation(name):
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise ValueError(f'Unsupported activation {name!r}')
+
+
+class LSTMLayer:
+    """One LSTM layer with Keras weight layout"""
+
+    def __init__(self, kernel, recurrent_kernel, bias, activation='tanh',
+                 recurrent_activation='sigmoid', return_sequences=False):
+        self.kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+        self.recurrent_kernel = np.ascontiguousarray(recurrent_kernel, dtype=np.float32)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+        self.activation_name = activation
+        self.recurrent_activation_name = recurrent_activation
+        self.activation = _activation(activation)
+        self.recurrent_activation = _activation(recurrent_activation)
+        self.return_sequences = bool(return_sequences)
+
+        # Internally the gate columns are reordered to i, f, o, c so the three
+        # recurrent_activation gates are evaluated with one call per step
+        units = self.units
+        order = np.r_[0:2 * units, 3 * units:4 * units, 2 * units:3 * units]
+        self._kernel = np.ascontiguousarray(self.kernel[:, order])
+        self._recurrent_kernel = np.ascontiguousarray(self.recurrent_kernel[:, order])
+        self._bias = self.bias[order]
+
+    def __call__(self, x):
+        """
+        Run the layer over a batch
+
+        Args:
+            x: Array of shape (N, T, n_inputs)
+
+        Returns:
+            (N, T, units) when return_sequences is set, else (N, units)
+        """
+        n, steps, _ = x.shape
+        units = self.units
+        # Input projections for every step in one matrix product
+        projected = (x.reshape(n * steps, -1) @ self._kernel + self._bias).reshape(n, steps, 4 * units)
+
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        outputs = np.empty((n, steps, units), dtype=np.float32) if self.return_sequences else None
+        for t in range(steps):
+            z = projected[:, t] + h @ self._recurrent_kernel
+            gates = self.recurrent_activation(z[:, :3 * units])
+            i, f, o = gates[:, :units], gates[:, units:2 * units], gates[:, 2 * units:]
+            g = self.activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * self.activation(c)
+            if outputs is not None:
+                outputs[:, t] = h
+        return outputs if outputs is not None else h
+
+
+class NumpyLSTMNetwork:
+    """Stacked LSTM layers followed by a Dense output layer"""
+
+    def __init__(self, lstm_layers, dense_kernel, dense_bias, dense_activation='softmax'):
+        self.lstm_layers = list(lstm_layers)
+        self.dense_kernel = np.ascontiguousarray(dense_kernel, dtype=np.float32)
+        self.dense_bias = np.ascontiguousarray(dense_bias, dtype=np.float32)
+        self.dense_activation_name = dense_activation
+        self.dense_activation = _activation(dense_activation)
+
+    def __call__(self, batch):
+        """
+        Forward pass
+
+        Args:
+            batch: Array of shape (N, T, n_features)
+
+        Returns:
+            Array of shape (N, n_outputs)
+        """
+        x = np.asarray(batch, dtype=np.float32)
+        for layer in self.lstm_layers:
+            x = layer(x)
+        return self.dense_activation(x @ self.dense_kernel + self.dense_bias)
+
+    def save(self, path):
+        """Write the weights in the .npz layout described in the module docstring"""
+        arrays = {
+            'format_version': np.array(FORMAT_VERSION),
+            'n_layers': np.array(len(self.lstm_layers)),
+            'dense_kernel': self.dense_kernel,
+            'dense_bias': self.dense_bias,
+            'dense_activation': np.array(self.dense_activation_name),
+        }
+        for i, layer in enumerate(self.lstm_layers):
+            arrays[f'lstm{i}_kernel'] = layer.kernel
+            arrays[f'lstm{i}_recurrent_kernel'] = layer.recurrent_kernel
+            arrays[f'lstm{i}_bias'] = layer.bias
+            arrays[f'lstm{i}_config'] = np.array([layer.activation_name,
+                                                  layer.recurrent_activation_name,
+                                                  str(layer.return_sequences)])
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read a network written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != FORMAT_VERSION:
+                raise ValueError(f'Unsupported LSTM weights format version {version}')
+            layers = []
+            for i in range(int(data['n_layers'])):
+                activation, recurrent_activation, return_sequences = data[f'lstm{i}_config'].tolist()
+                layers.append(LSTMLayer(
+                    data[f'lstm{i}_kernel'], data[f'lstm{i}_recurrent_kernel'], data[f'lstm{i}_bias'],
+                    activation, recurrent_activation, return_sequences == 'True'
+                ))
+            return cls(layers, data['dense_kernel'], data['dense_bias'],
+                       str(data['dense_activation']))
+
+
+def _activation_name(activation):
+    """Name of a Keras activation given as a string or a function"""
+    return activation if isinstance(activation, str) else activation.__name__
+
+
+def from_keras(model):
+    """
+    Build a NumpyLSTMNetwork from a loaded Keras model
+
+    Only LSTM layers followed by one Dense layer are supported; layers that
+    are no-ops at inference (Dropout etc.) are skipped.
+    """
+    lstm_layers = []
+    dense = None
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in _INFERENCE_NOOP_LAYERS:
+            continue
+        if dense is not None:
+            raise ValueError(f'Unsupported layer {layer.name!r} after the Dense layer')
+        config = layer.get_config()
+        if kind == 'LSTM':
+            if not config.get('use_bias', True):
+                raise ValueError('LSTM layers without bias are not supported')
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            lstm_layers.append(LSTMLayer(
+                kernel, recurrent_kernel, bias,
+                _activation_name(config['activation']),
+                _activation_name(config['recurrent_activation']),
+                config['return_sequences']
+            ))
+        elif kind == 'Dense':
+            kernel, bias = layer.get_weights()
+            dense = (kernel, bias, _activation_name(config['activation']))
+        else:
+            raise ValueError(f'Unsupported layer type {kind}')
+
+    if not lstm_layers or dense is None:
+        raise ValueError('Expected LSTM layers followed by a Dense layer')
+    return NumpyLSTMNetwork(lstm_layers, *dense)
@@ -0,0 +1,43 @@
+"""
+Management command that moves old health data from the database to the archive
+
+Run it daily, e.g. from cron:
+
+    python manage.py archive_health_data
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import archive_health_data
+from api.models import Patient
+
+
+class Command(BaseCommand):
+    help = "Move health data older than the retention period into compressed per-patient, per-day files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Days of health data kept in the database (default HEALTH_DATA_RETENTION_DAYS)")
+        parser.add_argument('--patient', action='append', dest='user_ids', metavar='USER_ID',
+                            help="Only archive this patient's health data (repeatable)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be archived without changing anything")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        patient_ids = None
+        if options['user_ids']:
+            patients = dict(Patient.objects.filter(user_id__in=options['user_ids']).values_list('user_id', 'id'))
+            missing = set(options['user_ids']) - set(patients)
+            if missing:
+                raise CommandError(f"Unknown patient user_id: {', '.join(sorted(missing))}")
+            patient_ids = list(patients.values())
+
+        start = time.perf_counter()
+        totals = archive_health_data(retention_days=options['days'], patient_ids=patient_ids,
+                                     dry_run=options['dry_run'])
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(f"{verb} {totals['samples']} samples ({totals['days']} patient-days, "
+                          f"{totals['patients']} patients) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,53 @@
+"""
+Management command that exports the vitals LSTM weights for NumPy inference
+
+Needs TensorFlow, so run it once wherever the model was trained:
+
+    python manage.py export_vitals_lstm
+
+The server then serves the vitals model from the .npz file without
+importing TensorFlow.
+"""
+import numpy as np
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import model_loader
+from api.lstm_numpy import from_keras
+
+
+class Command(BaseCommand):
+    help = "Export vital_signs_lstm_model.keras to a .npz file for the NumPy LSTM engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default=None,
+                            help="Keras model file (default: the artifact found by the model loader)")
+        parser.add_argument('--output', default=None,
+                            help="Output .npz file (default: next to the Keras model)")
+        parser.add_argument('--tolerance', type=float, default=1e-4,
+                            help="Maximum difference from Keras allowed on a random check batch")
+
+    def handle(self, *args, **options):
+        try:
+            from tensorflow import keras
+        except ImportError:
+            raise CommandError("TensorFlow is required to read the Keras model")
+
+        source = options['input'] or model_loader.find_artifact(model_loader.VITALS_LSTM_FILE)
+        if source is None:
+            raise CommandError(f"{model_loader.VITALS_LSTM_FILE} not found")
+        output = options['output'] or str(source).rsplit('.', 1)[0] + '.npz'
+
+        model = keras.models.load_model(source)
+        network = from_keras(model)
+
+        # Compare both engines before writing anything
+        batch = np.random.default_rng(0).normal(
+            size=(64, model_loader.TIME_STEPS_VITALS, model_loader.N_FEATURES_VITALS)
+        ).astype(np.float32)
+        difference = float(np.abs(model(batch, training=False).numpy() - network(batch)).max())
+        if difference > options['tolerance']:
+            raise CommandError(f"NumPy output differs from Keras by {difference:.2e}")
+
+        network.save(output)
+        self.stdout.write(f"Exported {source} to {output} (max difference {difference:.2e})")
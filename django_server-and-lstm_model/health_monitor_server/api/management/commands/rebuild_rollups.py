@@ -0,0 +1,53 @@
+"""
+Management command that recomputes the health data rollups from the raw rows
+
+    python manage.py rebuild_rollups --since 2024-06-01
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from api.models import Patient
+from api.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the minute, hour and day rollups of health data from the stored samples"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', action='append', dest='user_ids', metavar='USER_ID',
+                            help="Only rebuild this patient's rollups (repeatable)")
+        parser.add_argument('--since', help="ISO 8601 date or datetime, rounded down to midnight UTC")
+        parser.add_argument('--until', help="ISO 8601 date or datetime (exclusive), rounded up to midnight UTC")
+        parser.add_argument('--chunk-size', type=int, default=20000,
+                            help="Samples read and merged per chunk")
+
+    def handle(self, *args, **options):
+        patient_ids = None
+        if options['user_ids']:
+            patients = dict(Patient.objects.filter(user_id__in=options['user_ids']).values_list('user_id', 'id'))
+            missing = set(options['user_ids']) - set(patients)
+            if missing:
+                raise CommandError(f"Unknown patient user_id: {', '.join(sorted(missing))}")
+            patient_ids = list(patients.values())
+
+        bounds = {}
+        for name in ['since', 'until']:
+            if options[name]:
+                bounds[name] = self._parse_time(name, options[name])
+
+        start = time.perf_counter()
+        total = rebuild_rollups(patient_ids=patient_ids, chunk_size=options['chunk_size'], **bounds)
+        self.stdout.write(f"Rebuilt rollups from {total} samples in {time.perf_counter() - start:.1f}s")
+
+    def _parse_time(self, name, value):
+        moment = parse_datetime(value)
+        if moment is None and parse_date(value) is not None:
+            moment = datetime.combine(parse_date(value), datetime.min.time())
+        if moment is None:
+            raise CommandError(f"--{name} must be an ISO 8601 date or datetime, got {value!r}")
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=dt_timezone.utc)
+        return moment
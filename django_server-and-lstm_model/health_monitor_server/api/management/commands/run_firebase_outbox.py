@@ -0,0 +1,47 @@
+"""
+Management command that drains the Firebase outbox
+
+Run it as a separate process next to the web workers:
+
+    python manage.py run_firebase_outbox
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Deliver queued Firebase writes and notifications from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the currently due entries and exit")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Number of entries claimed per batch")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the outbox is empty")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'])
+
+        if options['once']:
+            totals = worker.drain()
+            self.stdout.write(self._format(totals))
+            return
+
+        self.stdout.write("Firebase outbox worker started")
+        try:
+            while True:
+                totals = worker.drain()
+                if totals['claimed']:
+                    self.stdout.write(self._format(totals))
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Firebase outbox worker stopped")
+
+    def _format(self, totals):
+        return (f"Outbox: {totals['delivered']} delivered, {totals['retried']} retried, "
+                f"{totals['failed']} failed")
@@ -0,0 +1,51 @@
+"""
+Management command that runs the out-of-process model server
+
+Load the models once and serve them from a pool of forked workers:
+
+    python manage.py run_model_server --workers 4
+
+Point the web workers at it with ML_MODEL_SERVER_SOCKET.
+"""
+import os
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import model_loader
+from api.ml_predictor import HealthPredictor
+from api.model_server import ModelServer
+
+
+class Command(BaseCommand):
+    help = "Serve the ML models to the web workers over a Unix socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None,
+                            help="Unix socket path (default: ML_MODEL_SERVER_SOCKET)")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of worker processes (default: ML_MODEL_SERVER_WORKERS)")
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork') or not hasattr(socket, 'AF_UNIX'):
+            raise CommandError("The model server needs fork() and Unix sockets")
+
+        socket_path = options['socket'] or getattr(settings, 'ML_MODEL_SERVER_SOCKET', None)
+        if not socket_path:
+            raise CommandError("Set ML_MODEL_SERVER_SOCKET or pass --socket")
+        workers = options['workers'] or getattr(settings, 'ML_MODEL_SERVER_WORKERS', None) or os.cpu_count()
+
+        # Load and warm up in this process so the forked workers share the weights;
+        # a Keras LSTM is loaded by each worker, as TensorFlow must not be imported before fork()
+        predictor = HealthPredictor(eager=True, batching=False, model_server_socket=False, registry_dir=False,
+                                    network_loader=model_loader.load_network_before_fork)
+        status = predictor.get_status()
+        server = ModelServer(predictor.fall_model, predictor.vitals_model, socket_path, workers,
+                             info={'fall': status['fall'], 'vitals': status['vitals']},
+                             worker_init=lambda: model_loader.load_deferred_network(predictor.vitals_model))
+
+        self.stdout.write(f"Model server listening on {socket_path} with {server.workers} workers")
+        self.stdout.flush()
+        server.serve_forever()
+        self.stdout.write("Model server stopped")
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirebaseOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PATIENT', 'Patient'), ('GUARDIAN', 'Guardian'), ('HEALTH_DATA', 'Health Data'), ('ALERT', 'Alert'), ('NOTIFICATION', 'Guardian Notification')], max_length=20)),
+                ('object_id', models.BigIntegerField(blank=True, help_text='Primary key of the mirrored object', null=True)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('claim_token', models.CharField(blank=True, help_text='Token of the worker currently delivering this entry', max_length=32)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the entry may be (re)tried')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Firebase outbox entry',
+                'verbose_name_plural': 'Firebase outbox entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='api_outbox_status_avail_idx')],
+            },
+        ),
+    ]
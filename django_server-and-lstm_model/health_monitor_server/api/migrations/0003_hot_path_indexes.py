@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_firebaseoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['patient', '-timestamp'], name='api_alert_patient_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['patient', 'status', '-timestamp'], name='api_alert_pat_status_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardian',
+            index=models.Index(fields=['patient', 'notification_enabled'], name='api_guardian_pat_notify_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthdata',
+            index=models.Index(fields=['patient', '-timestamp'], name='api_health_patient_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='api_alert_patient_ts_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='api_alert_pat_status_ts_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='healthdata',
+            name='api_health_patient_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['-timestamp', '-id'], name='api_alert_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['patient', '-timestamp', '-id'], name='api_alert_patient_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['patient', 'status', '-timestamp', '-id'], name='api_alert_pat_status_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthdata',
+            index=models.Index(fields=['patient', '-timestamp', '-id'], name='api_health_patient_ts_idx'),
+        ),
+    ]
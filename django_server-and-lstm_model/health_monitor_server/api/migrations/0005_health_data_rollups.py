@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthDataRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(60, 'Minute'), (3600, 'Hour'), (86400, 'Day')], help_text='Bucket length in seconds')),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.IntegerField(help_text='Number of samples in the bucket')),
+                ('last_timestamp', models.DateTimeField(help_text='Timestamp of the latest sample, the one the last values come from')),
+                ('heart_rate_min', models.FloatField()),
+                ('heart_rate_max', models.FloatField()),
+                ('heart_rate_sum', models.FloatField()),
+                ('heart_rate_last', models.FloatField()),
+                ('spo2_min', models.FloatField()),
+                ('spo2_max', models.FloatField()),
+                ('spo2_sum', models.FloatField()),
+                ('spo2_last', models.FloatField()),
+                ('temperature_count', models.IntegerField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_last', models.FloatField(blank=True, null=True)),
+                ('acc_magnitude_min', models.FloatField()),
+                ('acc_magnitude_max', models.FloatField()),
+                ('acc_magnitude_sum', models.FloatField()),
+                ('acc_magnitude_last', models.FloatField()),
+                ('gyro_magnitude_min', models.FloatField()),
+                ('gyro_magnitude_max', models.FloatField()),
+                ('gyro_magnitude_sum', models.FloatField()),
+                ('gyro_magnitude_last', models.FloatField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.patient')),
+            ],
+            options={
+                'ordering': ['patient', 'resolution', 'bucket_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='healthdatarollup',
+            constraint=models.UniqueConstraint(fields=('patient', 'resolution', 'bucket_start'), name='api_rollup_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_health_data_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(help_text='Time of the first sample')),
+                ('sample_rate', models.FloatField(help_text='Samples per second')),
+                ('sample_count', models.IntegerField()),
+                ('samples', models.BinaryField(help_text='Packed float32 accelerometer and gyroscope axes')),
+                ('smv_mean', models.FloatField()),
+                ('smv_max', models.FloatField()),
+                ('smv_std', models.FloatField(blank=True, help_text='Sample standard deviation, empty for a single sample', null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_windows', to='api.patient')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['patient', '-timestamp', '-id'], name='api_sensorwin_pat_ts_idx')],
+            },
+        ),
+    ]
@@ -1,26 +1,186 @@
 """
 Machine Learning models for health data analysis
 """
-import os
+import threading
+import time
 import numpy as np
-import joblib
-from pathlib import Path
 from django.conf import settings
+from . import model_loader
+from .inference_scheduler import MicroBatcher
+from .model_registry import ModelRegistry, ModelSet
+from .model_server import ModelServerClient, ModelServerError, RemoteFallModel, RemoteVitalsModel
+from .sensor_windows import ImuWindowStore, VitalsHistoryStore, FEATURE_INDEX
+
+# Fall probability at or above which a reading is reported as a fall
+FALL_THRESHOLD = 0.6
+
+# Vitals risk levels and the probability boundaries between them
+RISK_LEVELS = np.array(['NORMAL', 'ELEVATED', 'HIGH', 'CRITICAL'])
+RISK_BOUNDARIES = np.array([0.3, 0.6, 0.8])
 
 class HealthPredictor:
     """Class to handle all ML predictions for health data"""
     
-    def __init__(self):
-        """Initialize ML models"""
-        # In a real application, you would load pre-trained models here
-        # For this example, we'll simulate predictions
-        self.fall_model = self._create_dummy_fall_model()
-        self.vitals_model = self._create_dummy_vitals_model()
+    def __init__(self, model_dirs=None, eager=None, batching=None, model_server_socket=None,
+                 registry_dir=None, network_loader=None):
+        """
+        Initialize ML models
+        
+        The heuristic models are used until the trained artifacts have been
+        loaded, which happens on first use or immediately when eager (default
+        settings.ML_MODELS_EAGER_LOAD) is set.
+        
+        Args:
+            model_dirs: Directories searched for artifacts instead of
+                        model_loader.artifact_dirs()
+            eager: Load the trained models now instead of on first use
+            batching: Batch concurrent per-patient predictions through a
+                      MicroBatcher (default settings.ML_BATCHING_ENABLED)
+            model_server_socket: Unix socket of a run_model_server process to
+                                 score on (default settings.ML_MODEL_SERVER_SOCKET,
+                                 False to always load the models in-process)
+            registry_dir: Versioned model registry (default
+                          settings.ML_MODEL_REGISTRY_DIR, False to disable);
+                          used once it contains a manifest, and ignored
+                          while scoring on the model server
+            network_loader: Loader of the vitals LSTM artifact, see
+                            model_loader.load_vitals_model
+        """
+        self.heuristic_fall_model = self._create_dummy_fall_model()
+        self.heuristic_vitals_model = self._create_dummy_vitals_model()
+        self.fall_model = self.heuristic_fall_model
+        self.vitals_model = self.heuristic_vitals_model
+        self.model_dirs = model_dirs
+        self.network_loader = network_loader
+        if model_server_socket is None:
+            model_server_socket = getattr(settings, 'ML_MODEL_SERVER_SOCKET', None)
+        self.model_server_socket = model_server_socket or None
+        if registry_dir is None:
+            registry_dir = getattr(settings, 'ML_MODEL_REGISTRY_DIR', None)
+        self.registry_dir = registry_dir or None
+        self.registry = None
+        self.model_version = 'heuristic'
+        self.models_loaded = False
+        self.model_info = {}
+        self._load_lock = threading.Lock()
+        
+        # Recent IMU readings per patient for window-based fall detection
+        max_patients = getattr(settings, 'FALL_WINDOW_MAX_PATIENTS', 10000)
+        max_gap_seconds = getattr(settings, 'FALL_WINDOW_MAX_GAP_SECONDS', 30.0)
+        self.imu_windows = ImuWindowStore(max_patients=max_patients, max_gap_seconds=max_gap_seconds)
+        
+        # Recent vitals per patient for the vitals LSTM
+        self.vitals_history = VitalsHistoryStore(
+            length=model_loader.TIME_STEPS_VITALS, n_features=model_loader.N_FEATURES_VITALS,
+            max_patients=max_patients, max_gap_seconds=max_gap_seconds
+        )
+        
+        # Concurrent single-sample requests are scored together
+        if batching is None:
+            batching = getattr(settings, 'ML_BATCHING_ENABLED', True)
+        self.fall_batcher = self.vitals_batcher = None
+        if batching:
+            max_batch_size = getattr(settings, 'ML_BATCH_MAX_SIZE', 64)
+            max_wait_ms = getattr(settings, 'ML_BATCH_MAX_WAIT_MS', 2.0)
+            timeout = getattr(settings, 'ML_BATCH_TIMEOUT_SECONDS', 10.0)
+            self.fall_batcher = MicroBatcher(self._score_fall_items, max_batch_size,
+                                             max_wait_ms, name='fall-batcher', timeout=timeout)
+            self.vitals_batcher = MicroBatcher(self._score_vitals_items, max_batch_size,
+                                               max_wait_ms, name='vitals-batcher', timeout=timeout)
+        
+        if eager is None:
+            eager = getattr(settings, 'ML_MODELS_EAGER_LOAD', False)
+        if eager:
+            self.load_models()
+    
+    def load_models(self):
+        """
+        Load the trained artifacts and run a warmup inference on each
+        
+        Models whose artifacts are missing or fail to load keep their
+        heuristic. Safe to call from several threads; only the first call
+        does any work.
+        
+        Returns:
+            Dictionary with the source, load time and warmup time of each model
+        """
+        if self.models_loaded:
+            return self.model_info
+        
+        with self._load_lock:
+            if self.models_loaded:
+                return self.model_info
+            
+            if self.model_server_socket and self._connect_model_server():
+                self.model_version = 'model_server'
+            else:
+                self.fall_model, self.vitals_model, info = model_loader.load_models(
+                    self.heuristic_fall_model, self.heuristic_vitals_model, self.model_dirs, self.network_loader)
+                for name, details in info.items():
+                    print(f"ML model '{name}': {details}")
+                if any(details['source'] != 'heuristic' for details in info.values()):
+                    self.model_version = 'local'
+                info['loaded_at'] = time.time()
+                self.model_info = info
+            
+            # Registry versions take precedence over the models loaded above. They
+            # would be loaded in every web worker, so not while the model server scores
+            if self.registry_dir and self.model_version == 'model_server':
+                print(f"Model registry at {self.registry_dir} ignored while scoring on the model server")
+                self.model_info['registry'] = {'root': str(self.registry_dir),
+                                               'last_error': 'Ignored while scoring on the model server'}
+            elif self.registry_dir:
+                # A missing manifest leaves the loaded models in place until one is published
+                self.registry = ModelRegistry(
+                    self.registry_dir, self.heuristic_fall_model, self.heuristic_vitals_model,
+                    getattr(settings, 'ML_MODEL_REGISTRY_POLL_SECONDS', 5.0)
+                )
+                self.registry.refresh(force=True)
+            
+            self.models_loaded = True
+        return self.model_info
+    
+    def _connect_model_server(self):
+        """Score on the model server when it answers; returns False to load locally"""
+        client = ModelServerClient(self.model_server_socket)
+        start = time.perf_counter()
+        try:
+            server_info = client.info()
+            fall_model = RemoteFallModel(client, server_info, self.heuristic_fall_model)
+            vitals_model = RemoteVitalsModel(client, server_info, self.heuristic_vitals_model)
+            connect_seconds = time.perf_counter() - start
+            # Warm up the connection and the server side of both models
+            warmup_seconds = model_loader.warmup_fall_model(fall_model, len(FEATURE_INDEX))
+            if vitals_model.needs_history:
+                client.call('vitals_sequences', np.zeros(
+                    (1, model_loader.TIME_STEPS_VITALS, model_loader.N_FEATURES_VITALS)))
+        except ModelServerError as e:
+            print(f"Model server at {self.model_server_socket} unavailable, loading models locally: {e}")
+            return False
         
-        # These would be the paths to your actual models
-        # base_dir = Path(__file__).resolve().parent.parent
-        # self.fall_model = joblib.load(os.path.join(base_dir, 'ml_models', 'fall_detection_model.pkl'))
-        # self.vitals_model = joblib.load(os.path.join(base_dir, 'ml_models', 'vitals_risk_model.pkl'))
+        self.fall_model = fall_model
+        self.vitals_model = vitals_model
+        details = {'source': 'model_server', 'socket': self.model_server_socket,
+                   'load_seconds': connect_seconds,
+                   'warmup_seconds': time.perf_counter() - start - connect_seconds}
+        self.model_info = {
+            'fall': dict(details, server=server_info.get('fall')),
+            'vitals': dict(details, server=server_info.get('vitals')),
+            'loaded_at': time.time(),
+        }
+        return True
+    
+    def get_status(self):
+        """Model sources, load and warmup metrics and batching statistics, without triggering a load"""
+        status = {'loaded': self.models_loaded, 'version': self.model_version, **self.model_info}
+        if self.registry is not None:
+            status['registry'] = self.registry.status()
+        if self.fall_batcher is not None:
+            status['batching'] = {
+                'fall': self.fall_batcher.stats(),
+                'vitals': self.vitals_batcher.stats(),
+            }
+        return status
     
     def _create_dummy_fall_model(self):
         """Create a dummy fall detection model for demonstration"""
@@ -31,14 +191,14 @@ class HealthPredictor:
                 - High acceleration values (sudden movements)
                 - High gyroscope values (rapid rotation)
                 """
-                # X should have format [acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]
-                acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z = X[0]
+                # X should have format [acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z] per row
+                X = np.asarray(X, dtype=float).reshape(-1, 6)
                 
                 # Calculate acceleration magnitude
-                acc_mag = np.sqrt(acc_x**2 + acc_y**2 + acc_z**2)
+                acc_mag = np.sqrt(np.einsum('ij,ij->i', X[:, :3], X[:, :3]))
                 
                 # Calculate gyroscope magnitude
-                gyr_mag = np.sqrt(gyr_x**2 + gyr_y**2 + gyr_z**2)
+                gyr_mag = np.sqrt(np.einsum('ij,ij->i', X[:, 3:], X[:, 3:]))
                 
                 # Fall detection logic
                 # In a real system, this would be a trained model
@@ -47,14 +207,29 @@ class HealthPredictor:
                 # Normal standing acceleration is around 9.8 m/s² (gravity)
                 # If the acceleration is much different from gravity, it could be a fall
                 gravity = 9.8
-                acc_diff = abs(acc_mag - gravity)
+                acc_diff = np.abs(acc_mag - gravity)
                 
                 # Combine factors to get a probability
                 # Higher values of both increase the probability
-                fall_prob = min(0.95, (acc_diff * 0.15 + gyr_mag * 0.01))
+                fall_prob = np.minimum(0.95, acc_diff * 0.15 + gyr_mag * 0.01)
                 
                 # Return probability matrix (for binary classification: not fall, fall)
-                return np.array([[1 - fall_prob, fall_prob]])
+                return np.column_stack([1 - fall_prob, fall_prob])
+            
+            def predict_proba_window(self, F):
+                """
+                Simulate ML prediction from window features - the same heuristic
+                applied to the window's peak acceleration deviation and rotation
+                """
+                F = np.asarray(F, dtype=float)
+                gravity = 9.8
+                acc_diff = np.maximum(
+                    np.abs(F[:, FEATURE_INDEX['SMV_Acc_max']] - gravity),
+                    np.abs(gravity - F[:, FEATURE_INDEX['SMV_Acc_min']])
+                )
+                gyr_mag = F[:, FEATURE_INDEX['SMV_Gyro_max']]
+                fall_prob = np.minimum(0.95, acc_diff * 0.15 + gyr_mag * 0.01)
+                return np.column_stack([1 - fall_prob, fall_prob])
         
         return DummyFallModel()
     
@@ -68,91 +243,326 @@ class HealthPredictor:
                 - Heart rate: 60-100 bpm
                 - SpO2: 95-100%
                 """
-                heart_rate, spo2 = X[0]
+                X = np.asarray(X, dtype=float).reshape(-1, 2)
+                heart_rate, spo2 = X[:, 0], X[:, 1]
                 
                 # Calculate risk based on how far values are from normal ranges
-                hr_risk = 0
-                if heart_rate < 50:
-                    hr_risk = (50 - heart_rate) * 0.05  # Bradycardia risk
-                elif heart_rate > 100:
-                    hr_risk = (heart_rate - 100) * 0.025  # Tachycardia risk
+                hr_risk = np.select(
+                    [heart_rate < 50, heart_rate > 100],
+                    [(50 - heart_rate) * 0.05,     # Bradycardia risk
+                     (heart_rate - 100) * 0.025],  # Tachycardia risk
+                    default=0.0
+                )
                 
-                spo2_risk = 0
-                if spo2 < 95:
-                    spo2_risk = (95 - spo2) * 0.1  # Hypoxemia risk
+                spo2_risk = np.where(spo2 < 95, (95 - spo2) * 0.1, 0.0)  # Hypoxemia risk
                 
                 # Combine risks (higher weight for SpO2 as it's more critical)
-                total_risk = min(0.95, hr_risk + spo2_risk * 1.5)
+                total_risk = np.minimum(0.95, hr_risk + spo2_risk * 1.5)
                 
                 # Return probability matrix (for binary classification: normal, risk)
-                return np.array([[1 - total_risk, total_risk]])
+                return np.column_stack([1 - total_risk, total_risk])
         
         return DummyVitalsModel()
     
-    def predict_fall(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z):
+    @staticmethod
+    def split_results(results):
+        """
+        Turn a batch result of arrays into one dictionary per row
+        
+        Args:
+            results: Dictionary of equal-length arrays as returned by the
+                     *_batch and predict_fall_windows methods
+            
+        Returns:
+            List of dictionaries with plain Python values
+        """
+        columns = {key: np.asarray(values).tolist() for key, values in results.items()}
+        count = len(next(iter(columns.values()))) if columns else 0
+        return [{key: values[i] for key, values in columns.items()} for i in range(count)]
+    
+    def predict_fall(self, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, patient_id=None):
         """
         Predict if a fall has occurred based on sensor data
         
         Args:
             acc_x, acc_y, acc_z: Accelerometer values
             gyr_x, gyr_y, gyr_z: Gyroscope values
+            patient_id: When given, the readings are added to the patient's
+                        sliding window and the whole window is classified;
+                        is_anomaly is then only set when the window becomes
+                        anomalous (see predict_fall_windows)
             
         Returns:
             Dictionary with prediction results
         """
+        if patient_id is not None:
+            X = np.column_stack([acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]).astype(float)
+            if self.fall_batcher is not None:
+                return self.fall_batcher((patient_id, X))
+            return self._score_fall_items([(patient_id, X)])[0]
+        
         # Prepare input data (using only the latest readings)
         X = np.array([[
             float(acc_x[-1]), float(acc_y[-1]), float(acc_z[-1]),
             float(gyr_x[-1]), float(gyr_y[-1]), float(gyr_z[-1])
         ]])
+        return self.split_results(self.predict_fall_batch(X))[0]
+    
+    def predict_vitals_risk(self, heart_rate, spo2, patient_id=None):
+        """
+        Predict health risk based on vital signs
+        
+        Args:
+            heart_rate: Heart rate in BPM
+            spo2: Blood oxygen saturation percentage
+            patient_id: When given, the reading is added to the patient's
+                        vitals history used by the trained model
+            
+        Returns:
+            Dictionary with prediction results
+        """
+        X = np.array([[float(heart_rate), float(spo2)]])
+        if patient_id is None:
+            return self.split_results(self.predict_vitals_risk_batch(X))[0]
+        if self.vitals_batcher is not None:
+            return self.vitals_batcher((patient_id, X))
+        return self._score_vitals_items([(patient_id, X)])[0]
+    
+    def predict_fall_batch(self, X):
+        """
+        Predict falls for a batch of instantaneous sensor readings
+        
+        Args:
+            X: Array-like of shape (N, 6) with columns
+               [acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]
+            
+        Returns:
+            Dictionary of arrays: is_anomaly (bool), fall_probability and
+            model_version
+        """
+        X = np.asarray(X, dtype=float).reshape(-1, 6)
+        fall_probability = np.empty(len(X))
+        model_version = np.empty(len(X), dtype=object)
+        for model_set, indexes in self._model_groups(None, len(X)):
+            fall_probability[indexes] = model_set.fall_model.predict_proba(X[indexes])[:, 1]
+            model_version[indexes] = model_set.version
+        return {
+            'is_anomaly': fall_probability >= FALL_THRESHOLD,
+            'fall_probability': fall_probability,
+            'model_version': model_version,
+        }
+    
+    def predict_vitals_risk_batch(self, X, patient_ids=None):
+        """
+        Predict health risk for a batch of vital sign readings
+        
+        Args:
+            X: Array-like of shape (N, 2) with columns [heart_rate, spo2]
+            patient_ids: Optional sequence of N patient identifiers. When
+                         given, each patient is scored by its registry
+                         version and, with a trained sequence model, each
+                         reading is classified together with its patient's
+                         history
+            
+        Returns:
+            Dictionary of arrays: is_anomaly (bool), risk_probability,
+            risk_level (NORMAL, ELEVATED, HIGH or CRITICAL) and model_version
+        """
+        X = np.asarray(X, dtype=float).reshape(-1, 2)
+        results = {
+            'is_anomaly': np.empty(len(X), dtype=bool),
+            'risk_probability': np.empty(len(X)),
+            'risk_level': np.empty(len(X), dtype=RISK_LEVELS.dtype),
+            'model_version': np.empty(len(X), dtype=object),
+        }
+        staged = {}
+        for model_set, indexes in self._model_groups(patient_ids, len(X)):
+            model = model_set.vitals_model
+            group = None
+            if patient_ids is not None and getattr(model, 'needs_history', False):
+                try:
+                    group = self._predict_vitals_sequences(
+                        model, [patient_ids[i] for i in indexes], X[indexes], staged)
+                except ModelServerError as e:
+                    print(f"Model server vitals scoring failed, using the heuristic: {e}")
+            if group is None:
+                group = self._predict_vitals_heuristic(model, X[indexes])
+            for key, values in group.items():
+                results[key][indexes] = values
+            results['model_version'][indexes] = model_set.version
+        
+        # As for fall windows, histories only change once the whole batch is scored
+        for patient_id, history in staged.items():
+            self.vitals_history.commit(patient_id, history)
+        return results
+    
+    def _predict_vitals_heuristic(self, model, X):
+        """Score vitals readings one by one with an instantaneous model"""
+        risk_probability = model.predict_proba(X)[:, 1]
+        
+        # Bucket probabilities into risk levels
+        level_index = np.digitize(risk_probability, RISK_BOUNDARIES)
+        return {
+            'is_anomaly': level_index > 0,
+            'risk_probability': risk_probability,
+            'risk_level': RISK_LEVELS[level_index],
+        }
+    
+    def predict_fall_windows(self, patient_ids, X):
+        """
+        Predict falls from per-patient sliding windows
+        
+        Each reading is appended to its patient's window in order and the
+        window after that reading is classified, matching the windowed
+        features the fall model is trained on. Windows hold WINDOW_SAMPLES
+        readings, 1.5 s at the 50 Hz the model was trained on (see
+        sensor_windows.py).
+        
+        A fall stays in the window until it slides out, so is_anomaly is only
+        set on the reading that makes the window anomalous; one fall raises
+        one alert.
+        
+        Args:
+            patient_ids: Sequence of N patient identifiers
+            X: Array-like of shape (N, 6) with columns
+               [acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]
+            
+        Returns:
+            Dictionary of arrays: is_anomaly (bool), window_is_anomalous
+            (bool, whether the window is above the threshold at all),
+            fall_probability, window_samples (readings in the window) and
+            model_version
+        """
+        X = np.asarray(X, dtype=float).reshape(-1, 6)
+        groups = self._model_groups(patient_ids, len(X))
+        features = np.empty((len(X), len(FEATURE_INDEX)))
+        counts = np.empty(len(X), dtype=int)
+        include_quantiles = any(getattr(model_set.fall_model, 'needs_quantiles', False)
+                                for model_set, _ in groups)
+        
+        # Group rows by patient so each window is updated once per batch
+        staged = {}
+        for patient_id, indexes in self._rows_by_patient(patient_ids).items():
+            features[indexes], counts[indexes], staged[patient_id] = self.imu_windows.stage(
+                patient_id, X[indexes], include_quantiles)
         
-        # Make prediction
-        prediction = self.fall_model.predict_proba(X)
-        fall_probability = prediction[0][1]  # Probability of the positive class (fall)
+        fall_probability = np.empty(len(X))
+        model_version = np.empty(len(X), dtype=object)
+        for model_set, indexes in groups:
+            fall_probability[indexes] = model_set.fall_model.predict_proba_window(features[indexes])[:, 1]
+            model_version[indexes] = model_set.version
         
-        # Determine if it's an anomaly based on threshold
-        threshold = 0.6  # Adjust based on your needs
-        is_anomaly = fall_probability >= threshold
+        # Keep the readings only once the batch is scored: a failed batch is
+        # retried item by item (see MicroBatcher) and must not push them twice
+        for patient_id, window in staged.items():
+            self.imu_windows.commit(patient_id, window)
         
+        window_is_anomalous = fall_probability >= FALL_THRESHOLD
+        is_anomaly = np.zeros(len(X), dtype=bool)
+        for patient_id, indexes in self._rows_by_patient(patient_ids).items():
+            is_anomaly[indexes] = self.imu_windows.rising_edges(patient_id, window_is_anomalous[indexes])
         return {
             'is_anomaly': is_anomaly,
+            'window_is_anomalous': window_is_anomalous,
             'fall_probability': fall_probability,
+            'window_samples': counts,
+            'model_version': model_version,
         }
     
-    def predict_vitals_risk(self, heart_rate, spo2):
+    def _model_groups(self, patient_ids, count):
         """
-        Predict health risk based on vital signs
+        Split rows by the model version that scores them
         
         Args:
-            heart_rate: Heart rate in BPM
-            spo2: Blood oxygen saturation percentage
+            patient_ids: Sequence of patient identifiers, or None to score all
+                         rows with the active version
+            count: Number of rows
             
         Returns:
-            Dictionary with prediction results
+            List of (ModelSet, array of row indexes)
         """
-        # Prepare input data
-        X = np.array([[float(heart_rate), float(spo2)]])
+        self.load_models()
+        default = ModelSet(self.model_version, self.fall_model, self.vitals_model, self.model_info)
+        if self.registry is None:
+            return [(default, np.arange(count))]
         
-        # Make prediction
-        prediction = self.vitals_model.predict_proba(X)
-        risk_probability = prediction[0][1]  # Probability of the positive class (risk)
-        
-        # Determine risk level based on probability
-        if risk_probability < 0.3:
-            risk_level = "NORMAL"
-            is_anomaly = False
-        elif risk_probability < 0.6:
-            risk_level = "ELEVATED"
-            is_anomaly = True
-        elif risk_probability < 0.8:
-            risk_level = "HIGH"
-            is_anomaly = True
-        else:
-            risk_level = "CRITICAL"
-            is_anomaly = True
+        # Take one state for the whole batch so a concurrent swap cannot split it
+        state = self.registry.refresh()
+        if state is None:
+            return [(default, np.arange(count))]
+        if patient_ids is None:
+            return [(self.registry.select(None, state) or default, np.arange(count))]
+        
+        groups = {}
+        for patient_id, indexes in self._rows_by_patient(patient_ids).items():
+            model_set = self.registry.select(patient_id, state) or default
+            groups.setdefault(model_set.version, (model_set, []))[1].extend(indexes)
+        return [(model_set, np.array(indexes)) for model_set, indexes in groups.values()]
+    
+    @staticmethod
+    def _rows_by_patient(patient_ids):
+        """Map each patient identifier to the indexes of its rows, in order"""
+        rows_by_patient = {}
+        for index, patient_id in enumerate(patient_ids):
+            rows_by_patient.setdefault(patient_id, []).append(index)
+        return rows_by_patient
+    
+    def _score_fall_items(self, items):
+        """
+        Score queued fall requests with one windowed call
         
+        Args:
+            items: List of (patient_id, readings) with readings of shape (k, 6)
+            
+        Returns:
+            One result per item: the last reading's, with is_anomaly and
+            window_is_anomalous set if any of the item's readings set them
+            and the highest fall_probability, so a fall edge earlier in a
+            multi-reading item is not lost
+        """
+        patient_ids = [patient_id for patient_id, X in items for _ in range(len(X))]
+        X = np.concatenate([X for _, X in items])
+        batch = self.predict_fall_windows(patient_ids, X)
+        rows = self.split_results(batch)
+        bounds = np.cumsum([0] + [len(X) for _, X in items])
+        results = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            result = rows[end - 1]
+            result['is_anomaly'] = bool(batch['is_anomaly'][start:end].any())
+            result['window_is_anomalous'] = bool(batch['window_is_anomalous'][start:end].any())
+            result['fall_probability'] = float(batch['fall_probability'][start:end].max())
+            results.append(result)
+        return results
+    
+    def _score_vitals_items(self, items):
+        """Score queued (patient_id, readings of shape (1, 2)) vitals requests with one call"""
+        X = np.concatenate([X for _, X in items])
+        patient_ids = [patient_id for patient_id, _ in items]
+        return self.split_results(self.predict_vitals_risk_batch(X, patient_ids))
+    
+    def _predict_vitals_sequences(self, model, patient_ids, X, staged):
+        """
+        Score vitals with a trained sequence model and per-patient histories
+        
+        The updated histories are added to staged, by patient, once the
+        model has scored them; the caller commits them.
+        """
+        # Devices do not report temperature; the model substitutes its training mean
+        readings = np.column_stack([X, np.full(len(X), np.nan)])
+        sequences = np.empty((len(X), model_loader.TIME_STEPS_VITALS, model_loader.N_FEATURES_VITALS))
+        histories = {}
+        for patient_id, indexes in self._rows_by_patient(patient_ids).items():
+            sequences[indexes], histories[patient_id] = self.vitals_history.stage(patient_id, readings[indexes])
+        
+        probabilities = model.predict_sequences(sequences)
+        staged.update(histories)
+        risk_level = model.levels[np.argmax(probabilities, axis=1)]
+        if model.normal_index is None:
+            risk_probability = np.ones(len(X))
+        else:
+            risk_probability = 1.0 - probabilities[:, model.normal_index]
         return {
-            'is_anomaly': is_anomaly,
+            'is_anomaly': risk_level != 'NORMAL',
             'risk_probability': risk_probability,
-            'risk_level': risk_level
+            'risk_level': risk_level,
         }
\ No newline at end of file
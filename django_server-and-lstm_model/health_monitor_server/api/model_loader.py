@@ -0,0 +1,311 @@
+"""
+Loading of the trained model artifacts written by ml_lstm_model.py
+
+The training script saves:
+    fall_detection_model.pkl             RandomForest over window features
+    fall_detection_featured_scaler.pkl   StandardScaler for those features
+    vitals_scaler.pkl                    StandardScaler for HR, SpO2, temperature
+    vitals_risk_label_encoder.pkl        LabelEncoder for the risk classes
+    vital_signs_lstm_model.keras         LSTM over TIME_STEPS_VITALS readings
+
+The LSTM is served from vital_signs_lstm_model.npz (written by the
+export_vitals_lstm command) with the NumPy engine in lstm_numpy.py when that
+file exists, and from the .keras file through TensorFlow otherwise. The
+model server, which forks after loading, loads a .keras file in each worker
+after the fork (DeferredKerasNetwork).
+
+Each model is wrapped so that HealthPredictor can call it exactly like the
+heuristic models. Missing or unloadable artifacts leave the heuristic in
+place.
+"""
+import importlib.util
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+from django.conf import settings
+
+from .lstm_numpy import NumpyLSTMNetwork
+from .sensor_windows import FALL_WINDOW_FEATURES
+
+FALL_MODEL_FILE = 'fall_detection_model.pkl'
+FALL_SCALER_FILE = 'fall_detection_featured_scaler.pkl'
+VITALS_SCALER_FILE = 'vitals_scaler.pkl'
+VITALS_LABEL_ENCODER_FILE = 'vitals_risk_label_encoder.pkl'
+VITALS_LSTM_FILE = 'vital_signs_lstm_model.keras'
+VITALS_LSTM_NPZ_FILE = 'vital_signs_lstm_model.npz'
+
+# Vitals LSTM input, matching ml_lstm_model.py
+TIME_STEPS_VITALS = 10
+N_FEATURES_VITALS = 3
+
+# How the training risk classes map onto the API risk levels
+VITALS_CLASS_LEVELS = {
+    'Normal': 'NORMAL',
+    'Low': 'ELEVATED',
+    'Medium': 'HIGH',
+    'High': 'CRITICAL',
+}
+
+
+def artifact_dirs():
+    """Directories searched for model artifacts, in order of preference"""
+    base_dir = Path(settings.BASE_DIR)
+    # The training script writes its artifacts next to itself
+    return [Path(getattr(settings, 'ML_MODELS_DIR', base_dir / 'ml_models')),
+            base_dir.parent / 'lstm_model_and_dataset']
+
+
+def find_artifact(filename, dirs=None):
+    """Return the path of the first artifact with this name, or None"""
+    for directory in dirs or artifact_dirs():
+        path = Path(directory) / filename
+        if path.exists():
+            return path
+    return None
+
+
+class TrainedFallModel:
+    """Scaler + classifier trained on window features"""
+    needs_quantiles = True
+
+    def __init__(self, model, scaler, fallback):
+        self.model = model
+        self.scaler = scaler
+        self.fallback = fallback
+
+    def predict_proba_window(self, F):
+        F = np.asarray(F, dtype=float)
+        # Training fills missing features (single-sample std, diff) with 0
+        F = np.nan_to_num(F, nan=0.0)
+        return self.model.predict_proba(self.scaler.transform(F))
+
+    def predict_proba(self, X):
+        # The trained model needs a window; single readings use the heuristic
+        return self.fallback.predict_proba(X)
+
+
+class TrainedVitalsModel:
+    """Scaler + LSTM over the last TIME_STEPS_VITALS readings of a patient"""
+    needs_history = True
+
+    def __init__(self, network, scaler, label_encoder, fallback):
+        self.network = network
+        self.scaler = scaler
+        self.fallback = fallback
+        classes = [str(c) for c in label_encoder.classes_]
+        self.levels = np.array([VITALS_CLASS_LEVELS.get(c, 'HIGH') for c in classes])
+        self.normal_index = classes.index('Normal') if 'Normal' in classes else None
+
+    def predict_sequences(self, sequences):
+        """
+        Score raw vitals sequences
+
+        Args:
+            sequences: Array of shape (N, TIME_STEPS_VITALS, 3) with
+                       [heart_rate, spo2, temperature]; NaN temperatures are
+                       replaced by the training mean
+
+        Returns:
+            Array of class probabilities, shape (N, n_classes)
+        """
+        sequences = np.array(sequences, dtype=float)
+        means = np.broadcast_to(self.scaler.mean_, sequences.shape)
+        missing = np.isnan(sequences)
+        sequences[missing] = means[missing]
+        scaled = (sequences - self.scaler.mean_) / self.scaler.scale_
+        return np.asarray(self.network(scaled.astype(np.float32)))
+
+    def predict_proba(self, X):
+        # Without a history the readings are scored by the heuristic
+        return self.fallback.predict_proba(X)
+
+
+class KerasNetwork:
+    """Callable wrapper that runs a Keras model without the predict() overhead"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, batch):
+        return self.model(batch, training=False).numpy()
+
+
+def _load_keras(path):
+    """Load a Keras model, or return None when TensorFlow is not installed"""
+    try:
+        from tensorflow import keras
+    except ImportError:
+        return None
+    return KerasNetwork(keras.models.load_model(path))
+
+
+class DeferredKerasNetwork:
+    """
+    A Keras network that is loaded on first use
+
+    The model server loads its models before forking the workers, and
+    TensorFlow must not be imported in a process that forks afterwards: its
+    thread pools do not survive fork(). The server holds this placeholder
+    instead, and each worker loads the model after the fork
+    (load_deferred_network).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.network = None
+        self.error = None
+
+    def load(self):
+        """The loaded network; a failed load is not retried"""
+        if self.network is None:
+            if self.error is None:
+                try:
+                    self.network = _load_keras(self.path)
+                    if self.network is None:
+                        self.error = 'TensorFlow is not installed'
+                except Exception as e:
+                    self.error = f'failed to load {self.path}: {e}'
+            if self.error is not None:
+                raise RuntimeError(self.error)
+        return self.network
+
+    def __call__(self, batch):
+        return self.load()(batch)
+
+
+def _load_network(path):
+    """Load the LSTM with the NumPy engine when exported weights exist"""
+    if Path(path).suffix == '.npz':
+        return NumpyLSTMNetwork.load(path)
+    return _load_keras(path)
+
+
+def load_network_before_fork(path):
+    """_load_network() for a process that forks later: Keras models are left to each child"""
+    if Path(path).suffix == '.npz':
+        return NumpyLSTMNetwork.load(path)
+    # Looks TensorFlow up without importing it
+    if importlib.util.find_spec('tensorflow') is None:
+        return None
+    return DeferredKerasNetwork(path)
+
+
+def load_deferred_network(vitals_model):
+    """Load and warm up the vitals model's DeferredKerasNetwork, if it has one; call after fork"""
+    if isinstance(getattr(vitals_model, 'network', None), DeferredKerasNetwork):
+        vitals_model.network.load()
+        warmup_vitals_model(vitals_model)
+
+
+def load_fall_model(fallback, dirs=None):
+    """
+    Load the trained fall model
+
+    Returns:
+        Tuple (model or None, info dictionary)
+    """
+    info = {'source': 'heuristic'}
+    model_path = find_artifact(FALL_MODEL_FILE, dirs)
+    scaler_path = find_artifact(FALL_SCALER_FILE, dirs)
+    if model_path is None or scaler_path is None:
+        info['reason'] = 'artifacts not found'
+        return None, info
+
+    start = time.perf_counter()
+    try:
+        model = TrainedFallModel(joblib.load(model_path), joblib.load(scaler_path), fallback)
+    except Exception as e:
+        info['reason'] = f'failed to load: {e}'
+        return None, info
+    info.update(source='trained', path=str(model_path),
+                load_seconds=time.perf_counter() - start)
+    return model, info
+
+
+def load_vitals_model(fallback, dirs=None, network_loader=None):
+    """
+    Load the trained vitals model
+
+    Args:
+        fallback: Heuristic model used for readings without history
+        dirs: Directories to search instead of artifact_dirs()
+        network_loader: Callable that turns an artifact path into a network,
+                        defaults to the NumPy engine for .npz files and
+                        Keras otherwise
+
+    Returns:
+        Tuple (model or None, info dictionary)
+    """
+    info = {'source': 'heuristic'}
+    scaler_path = find_artifact(VITALS_SCALER_FILE, dirs)
+    encoder_path = find_artifact(VITALS_LABEL_ENCODER_FILE, dirs)
+    network_path = find_artifact(VITALS_LSTM_NPZ_FILE, dirs) or find_artifact(VITALS_LSTM_FILE, dirs)
+    if scaler_path is None or encoder_path is None or network_path is None:
+        info['reason'] = 'artifacts not found'
+        return None, info
+
+    start = time.perf_counter()
+    try:
+        network = (network_loader or _load_network)(network_path)
+        if network is None:
+            info['reason'] = 'no inference engine available for the LSTM'
+            return None, info
+        model = TrainedVitalsModel(network, joblib.load(scaler_path),
+                                   joblib.load(encoder_path), fallback)
+    except Exception as e:
+        info['reason'] = f'failed to load: {e}'
+        return None, info
+    engine = {NumpyLSTMNetwork: 'numpy', KerasNetwork: 'keras',
+              DeferredKerasNetwork: 'keras'}.get(type(network), 'custom')
+    info.update(source='trained', path=str(network_path), engine=engine,
+                load_seconds=time.perf_counter() - start)
+    return model, info
+
+
+def warmup_fall_model(model, n_features):
+    """Run one inference so the first request does not pay setup costs"""
+    start = time.perf_counter()
+    model.predict_proba_window(np.zeros((1, n_features)))
+    return time.perf_counter() - start
+
+
+def warmup_vitals_model(model):
+    """Run one inference so the first request does not pay graph-building costs"""
+    start = time.perf_counter()
+    model.predict_sequences(np.zeros((1, TIME_STEPS_VITALS, N_FEATURES_VITALS)) + model.scaler.mean_)
+    return time.perf_counter() - start
+
+
+def load_models(heuristic_fall_model, heuristic_vitals_model, dirs=None, network_loader=None):
+    """
+    Load and warm up both models, keeping the heuristic for any that fail
+
+    A DeferredKerasNetwork (from network_loader=load_network_before_fork) is
+    not warmed up, since that would load it.
+
+    Returns:
+        Tuple (fall_model, vitals_model, info) where info holds the source,
+        load time and warmup time of each model
+    """
+    info = {}
+    fall_model, info['fall'] = load_fall_model(heuristic_fall_model, dirs)
+    if fall_model is not None:
+        try:
+            info['fall']['warmup_seconds'] = warmup_fall_model(fall_model, len(FALL_WINDOW_FEATURES))
+        except Exception as e:
+            fall_model = None
+            info['fall'] = {'source': 'heuristic', 'reason': f'warmup failed: {e}'}
+
+    vitals_model, info['vitals'] = load_vitals_model(heuristic_vitals_model, dirs, network_loader)
+    if vitals_model is not None and isinstance(vitals_model.network, DeferredKerasNetwork):
+        info['vitals']['deferred'] = True
+    elif vitals_model is not None:
+        try:
+            info['vitals']['warmup_seconds'] = warmup_vitals_model(vitals_model)
+        except Exception as e:
+            vitals_model = None
+            info['vitals'] = {'source': 'heuristic', 'reason': f'warmup failed: {e}'}
+
+    return fall_model or heuristic_fall_model, vitals_model or heuristic_vitals_model, info
@@ -0,0 +1,211 @@
+"""
+Versioned model registry with hot reload and canary pinning
+
+The registry is a directory of immutable model versions and a manifest:
+
+    registry/
+        manifest.json
+        2024-06-01/     artifacts written by ml_lstm_model.py (see model_loader.py)
+        2024-06-08/
+
+manifest.json:
+
+    {
+        "active": "2024-06-01",
+        "canary": {"version": "2024-06-08", "percent": 10, "patients": [3, 17]}
+    }
+
+The canary version scores the listed patients (Patient ids) plus a stable
+`percent` share of all other patients; everyone else gets the active version.
+"canary" is optional.
+
+Editing the manifest is picked up within ML_MODEL_REGISTRY_POLL_SECONDS. New
+versions are loaded and warmed up in a background thread before the swap, so
+scoring never waits on a load. The swap replaces a single attribute, so
+requests already holding the previous ModelSet finish with it.
+Publish a new version directory instead of changing files in place; once a
+version is loaded it is not read again.
+"""
+import json
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+from . import model_loader
+
+MANIFEST_FILE = 'manifest.json'
+
+ModelSet = namedtuple('ModelSet', ['version', 'fall_model', 'vitals_model', 'info'])
+
+RegistryState = namedtuple('RegistryState', [
+    'active', 'canary', 'canary_percent', 'canary_patients', 'manifest_mtime', 'loaded_at'
+])
+
+
+def canary_bucket(patient_key):
+    """Stable bucket in [0, 100) for a patient, the same in every process"""
+    return zlib.crc32(str(patient_key).encode('utf-8')) % 100
+
+
+class ModelRegistry:
+    """
+    Loads model versions listed in a registry manifest and picks one per patient
+
+    Args:
+        root: Registry directory
+        heuristic_fall_model, heuristic_vitals_model: Used for any artifact a
+                                                      version does not provide
+        poll_seconds: Minimum time between manifest checks
+    """
+
+    def __init__(self, root, heuristic_fall_model, heuristic_vitals_model, poll_seconds=5.0):
+        self.root = Path(root)
+        self.heuristic_fall_model = heuristic_fall_model
+        self.heuristic_vitals_model = heuristic_vitals_model
+        self.poll_seconds = poll_seconds
+        self.state = None
+        self.last_error = None
+        self._sets = {}
+        self._failed_mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._loader = None
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST_FILE
+
+    def read_manifest(self):
+        """Parse and validate the manifest"""
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        if not isinstance(manifest, dict) or not isinstance(manifest.get('active'), str):
+            raise ValueError('The manifest needs an "active" version')
+        canary = manifest.get('canary') or {}
+        if canary and not isinstance(canary.get('version'), str):
+            raise ValueError('The canary needs a "version"')
+        percent = float(canary.get('percent', 0))
+        if not 0 <= percent <= 100:
+            raise ValueError('The canary percent must be between 0 and 100')
+        return {
+            'active': manifest['active'],
+            'canary': canary.get('version'),
+            'canary_percent': percent,
+            'canary_patients': frozenset(str(patient) for patient in canary.get('patients', [])),
+        }
+
+    def version_dir(self, version):
+        """Directory of a version, refusing names that leave the registry"""
+        path = (self.root / version).resolve()
+        if path.parent != self.root.resolve() or not path.is_dir():
+            raise ValueError(f'Unknown model version {version!r}')
+        return path
+
+    def _load_set(self, version):
+        if version in self._sets:
+            return self._sets[version]
+        start = time.perf_counter()
+        fall_model, vitals_model, info = model_loader.load_models(
+            self.heuristic_fall_model, self.heuristic_vitals_model, [self.version_dir(version)])
+        info['total_seconds'] = time.perf_counter() - start
+        print(f"Loaded model version {version}: {info}")
+        return ModelSet(version, fall_model, vitals_model, info)
+
+    def refresh(self, force=False):
+        """
+        Return the current state, starting a reload when the manifest changed
+
+        Only the manifest's mtime is checked in the calling thread: new
+        versions are loaded and warmed up in a background thread, which swaps
+        them in once they are ready, and callers keep the current state until
+        then. With force, as at startup, the load runs in the calling thread
+        instead. A manifest that fails to load is reported in last_error and
+        skipped until it changes again.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self.state
+        self._next_check = now + self.poll_seconds
+
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except OSError:
+            return self.state
+        current = self.state
+        if not force and ((current is not None and current.manifest_mtime == mtime)
+                          or self._failed_mtime == mtime):
+            return current
+
+        # One thread reloads; the others continue with the current versions
+        if not self._reload_lock.acquire(blocking=False):
+            return current
+        if force:
+            try:
+                self._reload(mtime)
+            finally:
+                self._reload_lock.release()
+            return self.state
+        self._loader = threading.Thread(target=self._reload_in_background, args=(mtime,),
+                                        name='model-registry-reload', daemon=True)
+        self._loader.start()
+        return current
+
+    def wait(self, timeout=None):
+        """Wait for a background reload to finish and return the state"""
+        loader = self._loader
+        if loader is not None:
+            loader.join(timeout)
+        return self.state
+
+    def _reload_in_background(self, mtime):
+        try:
+            self._reload(mtime)
+        finally:
+            self._reload_lock.release()
+
+    def _reload(self, mtime):
+        """Load the manifest's versions and swap them in, holding _reload_lock"""
+        try:
+            manifest = self.read_manifest()
+            active = self._load_set(manifest['active'])
+            canary = self._load_set(manifest['canary']) if manifest['canary'] else None
+        except Exception as e:
+            self.last_error = f'{type(e).__name__}: {e}'
+            self._failed_mtime = mtime
+            print(f"Model registry reload failed, keeping the current versions: {self.last_error}")
+            return
+        self._sets = {model_set.version: model_set for model_set in (active, canary) if model_set}
+        self.state = RegistryState(active, canary, manifest['canary_percent'],
+                                   manifest['canary_patients'], mtime, time.time())
+        self.last_error = None
+        self._failed_mtime = None
+
+    def select(self, patient_key=None, state=None):
+        """The ModelSet that scores a patient, or None before the first successful load"""
+        state = state or self.state
+        if state is None:
+            return None
+        if state.canary is not None and patient_key is not None and (
+                str(patient_key) in state.canary_patients
+                or canary_bucket(patient_key) < state.canary_percent):
+            return state.canary
+        return state.active
+
+    def status(self):
+        """Loaded versions, canary configuration and the last reload error"""
+        state = self.state
+        status = {'root': str(self.root), 'last_error': self.last_error}
+        if state is not None:
+            status.update(
+                active=state.active.version,
+                active_info=state.active.info,
+                canary=state.canary.version if state.canary else None,
+                canary_info=state.canary.info if state.canary else None,
+                canary_percent=state.canary_percent,
+                canary_patients=sorted(state.canary_patients),
+                loaded_at=state.loaded_at,
+            )
+        return status
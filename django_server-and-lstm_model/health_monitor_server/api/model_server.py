@@ -0,0 +1,341 @@
+"""
+Out-of-process model server
+
+The run_model_server command loads the models once, then forks a pool of
+worker processes that accept connections on a shared Unix socket. The
+weights are loaded before the fork, so the workers share those pages
+copy-on-write instead of every web worker holding its own copy. Inference
+then scales across cores independently of the web workers. TensorFlow does
+not survive fork(), so a vitals LSTM without exported NumPy weights is
+loaded by each worker after the fork instead (see model_loader.py).
+
+The server is stateless: per-patient sliding windows and vitals histories
+stay in the web process (HealthPredictor), which sends window features and
+vitals sequences and gets class probabilities back. Any worker can answer
+any request.
+
+Protocol, both directions:
+    4 bytes     big-endian length of the JSON header
+    header      JSON object; "arrays" lists {"dtype", "shape"} of the arrays
+                that follow
+    body        raw C-order bytes of each array, back to back
+
+Requests carry {"op": ...}; replies carry {"ok": true} or
+{"ok": false, "error": "..."}.
+
+Operations:
+    info                 model sources and vitals class levels
+    fall_window          (N, n_features) window features -> (N, 2) probabilities
+    fall_instant         (N, 6) readings -> (N, 2)
+    vitals_sequences     (N, T, 3) raw vitals -> (N, n_classes)
+    vitals_instant       (N, 2) readings -> (N, 2)
+"""
+import gc
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import threading
+
+import numpy as np
+
+LENGTH_STRUCT = struct.Struct('>I')
+MAX_HEADER_BYTES = 1 << 20
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the model server reports an error or cannot be reached"""
+
+
+class _Shutdown(Exception):
+    """Raised in the master process by SIGTERM or SIGINT"""
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:])
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        received += chunk
+    return buffer
+
+
+def send_message(sock, header, arrays=()):
+    """Send a header and arrays in the wire format"""
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    header = dict(header, arrays=[{'dtype': array.dtype.str, 'shape': list(array.shape)}
+                                  for array in arrays])
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(b''.join([LENGTH_STRUCT.pack(len(encoded)), encoded]
+                          + [array.tobytes() for array in arrays]))
+
+
+def recv_message(sock):
+    """Receive a message, returning (header, list of arrays)"""
+    (length,) = LENGTH_STRUCT.unpack(_recv_exact(sock, LENGTH_STRUCT.size))
+    if length > MAX_HEADER_BYTES:
+        raise ConnectionError(f'Header of {length} bytes is too large')
+    header = json.loads(_recv_exact(sock, length).decode('utf-8'))
+    arrays = []
+    for spec in header.get('arrays', []):
+        dtype = np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        arrays.append(np.frombuffer(_recv_exact(sock, size), dtype=dtype).reshape(shape))
+    return header, arrays
+
+
+class ModelServer:
+    """
+    Pre-fork model server
+
+    Args:
+        fall_model: Model with predict_proba_window and predict_proba
+        vitals_model: Model with predict_proba, and predict_sequences when
+                      it needs_history
+        socket_path: Unix socket to listen on
+        workers: Number of worker processes
+        info: Extra details reported by the info operation
+        worker_init: Called in each worker after the fork, e.g. to load
+                     models that must not be loaded before it
+    """
+
+    def __init__(self, fall_model, vitals_model, socket_path, workers=2, info=None, worker_init=None):
+        self.fall_model = fall_model
+        self.vitals_model = vitals_model
+        self.socket_path = str(socket_path)
+        self.workers = max(1, int(workers))
+        self.info = dict(info or {})
+        self.worker_init = worker_init
+        self.children = set()
+
+    def handle(self, header, arrays):
+        """Run one request; returns (reply header, reply arrays)"""
+        op = header.get('op')
+        if op == 'info':
+            reply = dict(self.info)
+            reply['fall_needs_quantiles'] = bool(getattr(self.fall_model, 'needs_quantiles', False))
+            reply['vitals_needs_history'] = bool(getattr(self.vitals_model, 'needs_history', False))
+            if reply['vitals_needs_history']:
+                reply['vitals_levels'] = self.vitals_model.levels.tolist()
+                reply['vitals_normal_index'] = self.vitals_model.normal_index
+            return reply, []
+        if op == 'fall_window':
+            return {}, [self.fall_model.predict_proba_window(arrays[0])]
+        if op == 'fall_instant':
+            return {}, [self.fall_model.predict_proba(arrays[0])]
+        if op == 'vitals_sequences':
+            if not getattr(self.vitals_model, 'needs_history', False):
+                raise ValueError('The vitals model does not score sequences')
+            return {}, [self.vitals_model.predict_sequences(arrays[0])]
+        if op == 'vitals_instant':
+            return {}, [self.vitals_model.predict_proba(arrays[0])]
+        raise ValueError(f'Unknown operation {op!r}')
+
+    def _serve_connection(self, conn):
+        """Answer one request on a readable connection; False when it closed"""
+        try:
+            header, arrays = recv_message(conn)
+        except (ConnectionError, OSError, ValueError):
+            return False
+        try:
+            reply, reply_arrays = self.handle(header, arrays)
+            reply['ok'] = True
+        except Exception as e:
+            reply, reply_arrays = {'ok': False, 'error': str(e)}, []
+        try:
+            send_message(conn, reply, [np.asarray(array) for array in reply_arrays])
+        except OSError:
+            return False
+        return True
+
+    def _worker_loop(self, listener):
+        """Multiplex the shared listener and this worker's client connections"""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is listener:
+                    try:
+                        conn, _ = listener.accept()
+                    except BlockingIOError:
+                        # Another worker took the connection
+                        continue
+                    # A request is read whole once readable; a stalled client
+                    # times out instead of holding the worker
+                    conn.settimeout(5.0)
+                    selector.register(conn, selectors.EVENT_READ)
+                elif not self._serve_connection(key.fileobj):
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+
+    def _spawn(self, listener):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if self.worker_init is not None:
+                    try:
+                        self.worker_init()
+                    except Exception as e:
+                        # Requests the failed model would score get an error reply
+                        print(f"Model server worker {os.getpid()} setup failed: {e}")
+                self._worker_loop(listener)
+            finally:
+                os._exit(0)
+        self.children.add(pid)
+
+    def bind(self):
+        """Create the listening socket, replacing a stale socket file"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen(128)
+        listener.setblocking(False)
+        return listener
+
+    def _shutdown(self, *args):
+        raise _Shutdown()
+
+    def serve_forever(self, on_ready=None):
+        """Fork the workers and restart any that exit until SIGTERM or SIGINT"""
+        listener = self.bind()
+        # Keep the loaded models out of the collector so forked workers do
+        # not touch (and copy) their pages
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn(listener)
+
+        signal.signal(signal.SIGTERM, self._shutdown)
+        signal.signal(signal.SIGINT, self._shutdown)
+        if on_ready is not None:
+            on_ready()
+        try:
+            while True:
+                pid, _ = os.wait()
+                self.children.discard(pid)
+                print(f"Model server worker {pid} exited, starting a new one")
+                self._spawn(listener)
+        except _Shutdown:
+            pass
+        finally:
+            for pid in self.children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in list(self.children):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class ModelServerClient:
+    """
+    Client for the model server
+
+    Each thread keeps its own connection open and reuses it for later
+    calls; a broken connection is reopened once before giving up.
+    """
+
+    def __init__(self, socket_path, timeout=5.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.local.sock = sock
+        self.local.pid = os.getpid()
+        return sock
+
+    def _connection(self):
+        sock = getattr(self.local, 'sock', None)
+        # Connections inherited across a fork are not reused
+        if sock is None or self.local.pid != os.getpid():
+            sock = self._connect()
+        return sock
+
+    def close(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def call(self, op, *arrays, **params):
+        """Send one request and return (reply header, reply arrays)"""
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, dict(params, op=op), arrays)
+                header, reply_arrays = recv_message(sock)
+                break
+            except (ConnectionError, OSError) as e:
+                self.close()
+                if attempt:
+                    raise ModelServerError(f'Model server unavailable: {e}')
+        if not header.get('ok'):
+            raise ModelServerError(header.get('error', 'Model server error'))
+        return header, reply_arrays
+
+    def info(self):
+        return self.call('info')[0]
+
+
+class RemoteFallModel:
+    """Fall model proxy that scores on the model server"""
+
+    def __init__(self, client, info, fallback):
+        self.client = client
+        self.fallback = fallback
+        self.needs_quantiles = info.get('fall_needs_quantiles', False)
+
+    def predict_proba_window(self, F):
+        try:
+            return self.client.call('fall_window', np.asarray(F, dtype=np.float64))[1][0]
+        except ModelServerError as e:
+            print(f"Model server fall scoring failed, using the heuristic: {e}")
+            return self.fallback.predict_proba_window(F)
+
+    def predict_proba(self, X):
+        try:
+            return self.client.call('fall_instant', np.asarray(X, dtype=np.float64))[1][0]
+        except ModelServerError as e:
+            print(f"Model server fall scoring failed, using the heuristic: {e}")
+            return self.fallback.predict_proba(X)
+
+
+class RemoteVitalsModel:
+    """Vitals model proxy that scores on the model server"""
+
+    def __init__(self, client, info, fallback):
+        self.client = client
+        self.fallback = fallback
+        self.needs_history = info.get('vitals_needs_history', False)
+        if self.needs_history:
+            self.levels = np.array(info['vitals_levels'])
+            self.normal_index = info['vitals_normal_index']
+
+    def predict_sequences(self, sequences):
+        # Failures raise ModelServerError; HealthPredictor then uses the heuristic
+        return self.client.call('vitals_sequences', np.asarray(sequences, dtype=np.float64))[1][0]
+
+    def predict_proba(self, X):
+        try:
+            return self.client.call('vitals_instant', np.asarray(X, dtype=np.float64))[1][0]
+        except ModelServerError as e:
+            print(f"Model server vitals scoring failed, using the heuristic: {e}")
+            return self.fallback.predict_proba(X)
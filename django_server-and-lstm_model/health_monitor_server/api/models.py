@@ -38,6 +38,12 @@ class Guardian(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Guardians to notify for a patient
+            models.Index(fields=['patient', 'notification_enabled'], name='api_guardian_pat_notify_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} ({self.relationship} of {self.patient.name})"
 
@@ -71,10 +77,101 @@ class HealthData(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # A patient's readings newest first, in the (timestamp, id) order pages are cut in
+            models.Index(fields=['patient', '-timestamp', '-id'], name='api_health_patient_ts_idx'),
+        ]
     
     def __str__(self):
         return f"Health data for {self.patient.name} at {self.timestamp}"
 
+class SensorWindow(models.Model):
+    """
+    A run of one patient's IMU samples stored as a single row
+    
+    samples holds sample_count readings of the six accelerometer and
+    gyroscope axes as little-endian float32, axis by axis (see
+    window_storage.py). Sample i was taken at timestamp + i / sample_rate.
+    """
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='sensor_windows')
+    timestamp = models.DateTimeField(help_text="Time of the first sample")
+    sample_rate = models.FloatField(help_text="Samples per second")
+    sample_count = models.IntegerField()
+    samples = models.BinaryField(help_text="Packed float32 accelerometer and gyroscope axes")
+    
+    # Signal magnitude vector of the accelerometer over the window
+    smv_mean = models.FloatField()
+    smv_max = models.FloatField()
+    smv_std = models.FloatField(null=True, blank=True, help_text="Sample standard deviation, empty for a single sample")
+    
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['patient', '-timestamp', '-id'], name='api_sensorwin_pat_ts_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sample_count} IMU samples for patient {self.patient_id} at {self.timestamp}"
+
+class HealthDataRollup(models.Model):
+    """
+    Summary of a patient's health data over one minute, hour or UTC day
+    
+    Rows are merged into as samples arrive (see rollups.py). Sums are stored
+    instead of means so that partial buckets can be added together.
+    """
+    MINUTE = 60
+    HOUR = 3600
+    DAY = 86400
+    
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.IntegerField(choices=[
+        (MINUTE, 'Minute'),
+        (HOUR, 'Hour'),
+        (DAY, 'Day')
+    ], help_text="Bucket length in seconds")
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(help_text="Number of samples in the bucket")
+    last_timestamp = models.DateTimeField(help_text="Timestamp of the latest sample, the one the last values come from")
+    
+    heart_rate_min = models.FloatField()
+    heart_rate_max = models.FloatField()
+    heart_rate_sum = models.FloatField()
+    heart_rate_last = models.FloatField()
+    
+    spo2_min = models.FloatField()
+    spo2_max = models.FloatField()
+    spo2_sum = models.FloatField()
+    spo2_last = models.FloatField()
+    
+    # Temperature is optional, so it has its own count
+    temperature_count = models.IntegerField(default=0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    temperature_sum = models.FloatField(default=0)
+    temperature_last = models.FloatField(null=True, blank=True)
+    
+    # Magnitudes of the accelerometer and gyroscope vectors
+    acc_magnitude_min = models.FloatField()
+    acc_magnitude_max = models.FloatField()
+    acc_magnitude_sum = models.FloatField()
+    acc_magnitude_last = models.FloatField()
+    
+    gyro_magnitude_min = models.FloatField()
+    gyro_magnitude_max = models.FloatField()
+    gyro_magnitude_sum = models.FloatField()
+    gyro_magnitude_last = models.FloatField()
+    
+    class Meta:
+        ordering = ['patient', 'resolution', 'bucket_start']
+        constraints = [
+            # Also the index trend queries read a time range from
+            models.UniqueConstraint(fields=['patient', 'resolution', 'bucket_start'], name='api_rollup_bucket_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_resolution_display()} rollup for patient {self.patient_id} at {self.bucket_start}"
+
 class Alert(models.Model):
     """Model for health alerts"""
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='alerts')
@@ -99,6 +196,11 @@ class Alert(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='api_alert_ts_idx'),
+            models.Index(fields=['patient', '-timestamp', '-id'], name='api_alert_patient_ts_idx'),
+            models.Index(fields=['patient', 'status', '-timestamp', '-id'], name='api_alert_pat_status_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.type} alert for {self.patient.name} at {self.timestamp}"
@@ -112,4 +214,48 @@ class Alert(models.Model):
         """Mark alert as resolved"""
         self.status = 'RESOLVED'
         self.resolved_at = timezone.now()
-        self.save()
\ No newline at end of file
+        self.save()
+
+class FirebaseOutbox(models.Model):
+    """Pending Firebase mirror operation, written in the same transaction as the model save"""
+    KIND_PATIENT = 'PATIENT'
+    KIND_GUARDIAN = 'GUARDIAN'
+    KIND_HEALTH_DATA = 'HEALTH_DATA'
+    KIND_ALERT = 'ALERT'
+    KIND_NOTIFICATION = 'NOTIFICATION'
+    
+    STATUS_PENDING = 'PENDING'
+    STATUS_DELIVERED = 'DELIVERED'
+    STATUS_FAILED = 'FAILED'
+    
+    kind = models.CharField(max_length=20, choices=[
+        (KIND_PATIENT, 'Patient'),
+        (KIND_GUARDIAN, 'Guardian'),
+        (KIND_HEALTH_DATA, 'Health Data'),
+        (KIND_ALERT, 'Alert'),
+        (KIND_NOTIFICATION, 'Guardian Notification'),
+    ])
+    object_id = models.BigIntegerField(null=True, blank=True, help_text="Primary key of the mirrored object")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, default=STATUS_PENDING, choices=[
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DELIVERED, 'Delivered'),
+        (STATUS_FAILED, 'Failed'),
+    ])
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, help_text="Token of the worker currently delivering this entry")
+    available_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the entry may be (re)tried")
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Firebase outbox entry'
+        verbose_name_plural = 'Firebase outbox entries'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='api_outbox_status_avail_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_id or ''} ({self.status})"
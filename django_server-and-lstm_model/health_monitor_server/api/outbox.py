@@ -0,0 +1,215 @@
+"""
+Firebase outbox - queues Firebase mirror writes in the database so that
+request handlers never wait on Firestore or FCM.
+
+Entries are written in the same transaction as the model save they describe
+and delivered later by the ``run_firebase_outbox`` management command.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Patient, Guardian, HealthData, Alert, FirebaseOutbox
+
+# Map model classes to outbox kinds
+MODEL_KINDS = {
+    Patient: FirebaseOutbox.KIND_PATIENT,
+    Guardian: FirebaseOutbox.KIND_GUARDIAN,
+    HealthData: FirebaseOutbox.KIND_HEALTH_DATA,
+    Alert: FirebaseOutbox.KIND_ALERT,
+}
+
+
+def build_save_entry(instance):
+    """Build an unsaved outbox entry that mirrors a model instance to Firebase"""
+    return FirebaseOutbox(kind=MODEL_KINDS[type(instance)], object_id=instance.pk)
+
+
+def build_notification_entry(patient, alert_type, alert_message):
+    """Build an unsaved outbox entry that notifies a patient's guardians"""
+    return FirebaseOutbox(
+        kind=FirebaseOutbox.KIND_NOTIFICATION,
+        object_id=patient.pk,
+        payload={
+            'patient_name': patient.name,
+            'alert_type': alert_type,
+            'alert_message': alert_message,
+        }
+    )
+
+
+def enqueue_save(instance):
+    """
+    Queue a Firebase mirror write for a saved model instance
+
+    Call this inside the transaction that saved the instance so the entry
+    is committed (or rolled back) together with it.
+    """
+    entry = build_save_entry(instance)
+    entry.save()
+    return entry
+
+
+def enqueue_guardian_notification(patient, alert_type, alert_message):
+    """Queue a push notification to all notification-enabled guardians of a patient"""
+    entry = build_notification_entry(patient, alert_type, alert_message)
+    entry.save()
+    return entry
+
+
+class OutboxWorker:
+    """Drains pending outbox entries to Firebase in batches"""
+
+    def __init__(self, repository=None, batch_size=None, max_attempts=None,
+                 retry_base_seconds=None, retry_max_seconds=None, lease_seconds=None):
+        if repository is None:
+            from .firebase_repository import FirebaseRepository
+            repository = FirebaseRepository()
+        self.repository = repository
+        self.batch_size = batch_size or getattr(settings, 'FIREBASE_OUTBOX_BATCH_SIZE', 100)
+        self.max_attempts = max_attempts or getattr(settings, 'FIREBASE_OUTBOX_MAX_ATTEMPTS', 8)
+        self.retry_base_seconds = retry_base_seconds or getattr(settings, 'FIREBASE_OUTBOX_RETRY_BASE_SECONDS', 2)
+        self.retry_max_seconds = retry_max_seconds or getattr(settings, 'FIREBASE_OUTBOX_RETRY_MAX_SECONDS', 600)
+        self.lease_seconds = lease_seconds or getattr(settings, 'FIREBASE_OUTBOX_LEASE_SECONDS', 60)
+
+    def claim_batch(self):
+        """
+        Claim up to batch_size due entries for this worker
+
+        Claiming moves available_at forward by the lease time, so entries of a
+        crashed worker become due again once the lease expires.
+        """
+        now = timezone.now()
+        candidate_ids = list(
+            FirebaseOutbox.objects
+            .filter(status=FirebaseOutbox.STATUS_PENDING, available_at__lte=now)
+            .order_by('id')
+            .values_list('id', flat=True)[:self.batch_size]
+        )
+        if not candidate_ids:
+            return []
+
+        token = uuid.uuid4().hex
+        FirebaseOutbox.objects.filter(
+            id__in=candidate_ids,
+            status=FirebaseOutbox.STATUS_PENDING,
+            available_at__lte=now
+        ).update(claim_token=token, available_at=now + timedelta(seconds=self.lease_seconds))
+        return list(FirebaseOutbox.objects.filter(claim_token=token, status=FirebaseOutbox.STATUS_PENDING).order_by('id'))
+
+    def drain_once(self):
+        """
+        Deliver one batch of entries
+
+        Returns:
+            Dictionary with counts of delivered, retried and failed entries
+        """
+        entries = self.claim_batch()
+        stats = {'claimed': len(entries), 'delivered': 0, 'retried': 0, 'failed': 0}
+        if not entries:
+            return stats
+
+        objects = self._load_objects(entries)
+
+        # Several saves of the same object in one batch need only one write
+        outcomes = {}
+        for entry in entries:
+            key = (entry.kind, entry.object_id, entry.id if entry.kind == FirebaseOutbox.KIND_NOTIFICATION else None)
+            if key not in outcomes:
+                outcomes[key] = self._deliver(entry, objects)
+            self._record(entry, *outcomes[key], stats=stats)
+
+        return stats
+
+    def drain(self, max_batches=None):
+        """Deliver batches until no due entries remain or max_batches is reached"""
+        totals = {'claimed': 0, 'delivered': 0, 'retried': 0, 'failed': 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            stats = self.drain_once()
+            batches += 1
+            for key, value in stats.items():
+                totals[key] += value
+            if stats['claimed'] < self.batch_size:
+                break
+        return totals
+
+    def _load_objects(self, entries):
+        """Load the mirrored objects of a batch with one query per kind"""
+        ids_by_kind = {}
+        for entry in entries:
+            ids_by_kind.setdefault(entry.kind, set()).add(entry.object_id)
+
+        objects = {}
+        querysets = {
+            FirebaseOutbox.KIND_PATIENT: Patient.objects.all(),
+            FirebaseOutbox.KIND_GUARDIAN: Guardian.objects.select_related('patient'),
+            FirebaseOutbox.KIND_HEALTH_DATA: HealthData.objects.select_related('patient'),
+            FirebaseOutbox.KIND_ALERT: Alert.objects.select_related('patient', 'health_data'),
+        }
+        for kind, ids in ids_by_kind.items():
+            if kind in querysets:
+                objects[kind] = querysets[kind].in_bulk(ids)
+
+        if FirebaseOutbox.KIND_NOTIFICATION in ids_by_kind:
+            guardians = {}
+            for guardian in Guardian.objects.filter(
+                    patient_id__in=ids_by_kind[FirebaseOutbox.KIND_NOTIFICATION],
+                    notification_enabled=True).select_related('patient'):
+                guardians.setdefault(guardian.patient_id, []).append(guardian)
+            objects[FirebaseOutbox.KIND_NOTIFICATION] = guardians
+
+        return objects
+
+    def _deliver(self, entry, objects):
+        """Send one entry to Firebase, returning (delivered, error, retryable)"""
+        try:
+            if entry.kind == FirebaseOutbox.KIND_NOTIFICATION:
+                guardians = [g for g in objects[entry.kind].get(entry.object_id, []) if g.fcm_token]
+                if not guardians:
+                    return True, '', False
+                sent = self.repository.firebase_service.send_alert_to_guardians(
+                    guardians,
+                    entry.payload.get('patient_name', ''),
+                    entry.payload.get('alert_type', ''),
+                    entry.payload.get('alert_message', '')
+                )
+            else:
+                instance = objects.get(entry.kind, {}).get(entry.object_id)
+                if instance is None:
+                    return False, 'Object no longer exists', False
+                sent = {
+                    FirebaseOutbox.KIND_PATIENT: self.repository.save_patient,
+                    FirebaseOutbox.KIND_GUARDIAN: self.repository.save_guardian,
+                    FirebaseOutbox.KIND_HEALTH_DATA: self.repository.save_health_data,
+                    FirebaseOutbox.KIND_ALERT: self.repository.save_alert,
+                }[entry.kind](instance)
+            if sent:
+                return True, '', False
+            return False, 'Firebase rejected or could not deliver the write', True
+        except Exception as e:
+            return False, str(e), True
+
+    def _record(self, entry, delivered, error, retryable, stats):
+        """Store the delivery outcome of an entry"""
+        now = timezone.now()
+        entry.attempts += 1
+        entry.claim_token = ''
+        if delivered:
+            entry.status = FirebaseOutbox.STATUS_DELIVERED
+            entry.delivered_at = now
+            entry.last_error = ''
+            stats['delivered'] += 1
+        elif retryable and entry.attempts < self.max_attempts:
+            delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** (entry.attempts - 1)))
+            entry.available_at = now + timedelta(seconds=delay)
+            entry.last_error = error
+            stats['retried'] += 1
+        else:
+            entry.status = FirebaseOutbox.STATUS_FAILED
+            entry.last_error = error
+            stats['failed'] += 1
+        entry.save(update_fields=['attempts', 'claim_token', 'status', 'delivered_at',
+                                  'available_at', 'last_error'])
@@ -0,0 +1,175 @@
+"""
+Keyset pagination for the time-series endpoints (health data and alerts)
+
+Pages are ordered newest first on (timestamp, id), and a cursor is the
+(timestamp, id) of the row a page stops at. The next page is the rows
+strictly older than the cursor, read from a (..., timestamp, id) index with
+a range bound. Any page, however deep, is then one index seek plus page_size
+rows. Page number pagination instead runs COUNT(*) and skips OFFSET rows. The
+id breaks ties between readings with the same timestamp, so no row is
+skipped or repeated across pages.
+
+Responses look like {"next": url, "previous": url, "results": [...]}. The
+"since" (inclusive) and "until" (exclusive) query parameters limit the time
+range.
+"""
+import base64
+import json
+from datetime import timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def parse_time_param(query_params, param):
+    """The ISO 8601 datetime in query parameter param (UTC if naive), or None if absent"""
+    value = query_params.get(param)
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ParseError(f"'{param}' must be an ISO 8601 datetime, got {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def filter_time_range(queryset, query_params):
+    """Apply the ?since= (inclusive) and ?until= (exclusive) ISO 8601 bounds"""
+    for param, lookup in [('since', 'timestamp__gte'), ('until', 'timestamp__lt')]:
+        moment = parse_time_param(query_params, param)
+        if moment is not None:
+            queryset = queryset.filter(**{lookup: moment})
+    return queryset
+
+
+class TimeSeriesCursorPagination(BasePagination):
+    """Newest-first keyset pagination on (timestamp, id)"""
+    page_size = 20
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ParseError(f"'{self.page_size_query_param}' must be an integer")
+        if page_size < 1:
+            raise ParseError(f"'{self.page_size_query_param}' must be positive")
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        """Opaque cursor for the page after row (reverse=False) or before it"""
+        position = {'t': row.timestamp.isoformat(), 'i': row.pk, 'r': int(reverse)}
+        return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+
+    def decode_cursor(self, request):
+        """(timestamp, id, reverse) of the cursor in the request, or None for the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            timestamp = parse_datetime(position['t'])
+            if timestamp is None:
+                raise ValueError(position['t'])
+            return timestamp, int(position['i']), bool(position['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def fetch_rows(self, queryset, position, reverse, limit):
+        """
+        Up to limit rows past position, a (timestamp, id) or None, in page order
+
+        That is older rows newest first, or with reverse newer rows oldest first.
+        """
+        if position is not None:
+            timestamp, pk = position
+            # Written as a range on timestamp so the index is entered at the cursor
+            if reverse:
+                queryset = queryset.filter(Q(timestamp__gte=timestamp) & ~Q(timestamp=timestamp, pk__lte=pk))
+            else:
+                queryset = queryset.filter(Q(timestamp__lte=timestamp) & ~Q(timestamp=timestamp, pk__gte=pk))
+        ordering = ('timestamp', 'pk') if reverse else ('-timestamp', '-pk')
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        position = cursor[:2] if cursor is not None else None
+        rows = self.fetch_rows(queryset, position, reverse, page_size + 1)
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving back from a cursor, the rows after this page are where we came from
+        has_next = (not reverse and more) or (reverse and cursor is not None)
+        has_previous = (reverse and more) or (not reverse and cursor is not None)
+        self.next_cursor = self.encode_cursor(rows[-1], reverse=False) if rows and has_next else None
+        self.previous_cursor = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.get_link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class HealthDataCursorPagination(TimeSeriesCursorPagination):
+    """
+    Health data pages hold the 100 readings the endpoint used to return
+
+    Given a repository and the patient, archived readings are merged into
+    the pages (see health_data_repository.py).
+    """
+    page_size = 100
+
+    def __init__(self, repository=None, patient=None, since=None, until=None):
+        self.repository = repository
+        self.patient = patient
+        self.since = since
+        self.until = until
+
+    def fetch_rows(self, queryset, position, reverse, limit):
+        rows = super().fetch_rows(queryset, position, reverse, limit)
+        if self.repository is None:
+            return rows
+        return self.repository.merge_page(rows, self.patient, self.since, self.until, position, reverse, limit)
@@ -0,0 +1,24 @@
+"""
+Request parsers for the health data ingest endpoints
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .wire_format import FRAME_MEDIA_TYPE, FrameError, decode_frame
+
+
+class HealthSampleFrameParser(BaseParser):
+    """
+    Parses the compact binary sample frame format (see wire_format.py)
+
+    request.data is the decoded SampleFrame; the ingest views store it from
+    its arrays instead of converting it to sample dictionaries.
+    """
+    media_type = FRAME_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            frame = decode_frame(stream.read())
+        except FrameError as e:
+            raise ParseError(f'Invalid sample frame: {e}')
+        return frame
@@ -0,0 +1,294 @@
+"""
+Minute, hour and day rollups of health data
+
+Each HealthDataRollup row summarizes one patient's samples over one bucket:
+the count, and the min, max, sum and latest value of the heart rate, SpO2,
+temperature and the accelerometer and gyroscope magnitudes. Trend queries
+read these rows instead of the raw samples. A week at one sample per second
+is 604,800 HealthData rows but only 168 hourly rollups.
+
+Ingest keeps the rollups current: every stored batch is grouped into buckets
+with NumPy and merged into the stored rows in the ingest transaction. The
+rebuild_rollups management command recomputes them from the raw rows, e.g.
+after a backfill, or periodically when HEALTH_ROLLUPS_ON_INGEST is off.
+Buckets are aligned to UTC.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .archive import HealthDataArchive
+from .models import HealthData, HealthDataRollup
+
+METRICS = ('heart_rate', 'spo2', 'temperature', 'acc_magnitude', 'gyro_magnitude')
+
+RESOLUTIONS = {
+    'minute': HealthDataRollup.MINUTE,
+    'hour': HealthDataRollup.HOUR,
+    'day': HealthDataRollup.DAY,
+}
+
+# HealthData columns a rollup is computed from, in the order aggregate() expects
+RAW_FIELDS = ('patient_id', 'timestamp', 'heart_rate', 'spo2', 'temperature',
+              'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+              'gyroscope_x', 'gyroscope_y', 'gyroscope_z')
+
+UPDATE_FIELDS = ['count', 'last_timestamp', 'temperature_count'] + [
+    f'{metric}_{stat}' for metric in METRICS for stat in ('min', 'max', 'sum', 'last')]
+
+
+def _to_datetime(seconds):
+    return datetime.fromtimestamp(float(seconds), tz=dt_timezone.utc)
+
+
+def _optional(value):
+    """float of a NumPy scalar, None for NaN"""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def sample_metrics(raw):
+    """
+    Metric arrays from the RAW_FIELDS value columns (heart_rate to gyroscope_z)
+
+    Args:
+        raw: float array of shape (9, n_samples), NaN for a missing temperature
+    """
+    return {
+        'heart_rate': raw[0],
+        'spo2': raw[1],
+        'temperature': raw[2],
+        'acc_magnitude': np.sqrt((raw[3:6] ** 2).sum(axis=0)),
+        'gyro_magnitude': np.sqrt((raw[6:9] ** 2).sum(axis=0)),
+    }
+
+
+def aggregate(records):
+    """
+    Group raw samples into rollups of every resolution
+
+    Args:
+        records: Sequence of tuples in RAW_FIELDS order, e.g. from
+                 HealthData.objects.values_list(*RAW_FIELDS)
+
+    Returns:
+        List of unsaved HealthDataRollup rows, one per patient, resolution and
+        bucket touched by the records
+    """
+    if not records:
+        return []
+    columns = list(zip(*records))
+    # None (no temperature) becomes NaN
+    return aggregate_columns(np.array(columns[0], dtype=np.int64),
+                             np.array([timestamp.timestamp() for timestamp in columns[1]]),
+                             np.array(columns[2:], dtype=np.float64))
+
+
+def aggregate_columns(patient_ids, timestamps, raw):
+    """
+    aggregate() for samples that are already arrays
+
+    Args:
+        patient_ids: int array of patient ids
+        timestamps: float array of epoch seconds
+        raw: float array of shape (9, n_samples), see sample_metrics()
+    """
+    values = sample_metrics(raw)
+    rollups = []
+    for resolution in RESOLUTIONS.values():
+        starts = np.floor(timestamps / resolution) * resolution
+        # Sorted by bucket, and by time within a bucket so its last sample is the latest
+        order = np.lexsort((timestamps, starts, patient_ids))
+        patients, bucket_starts = patient_ids[order], starts[order]
+        boundaries = np.flatnonzero((np.diff(patients) != 0) | (np.diff(bucket_starts) != 0)) + 1
+        first = np.concatenate([[0], boundaries])
+        last = np.concatenate([boundaries - 1, [len(order) - 1]])
+
+        stats = {}
+        for metric, metric_values in values.items():
+            metric_values = metric_values[order]
+            present = ~np.isnan(metric_values)
+            stats[metric] = (
+                np.fmin.reduceat(metric_values, first),  # fmin/fmax skip NaN
+                np.fmax.reduceat(metric_values, first),
+                np.add.reduceat(np.where(present, metric_values, 0.0), first),
+                metric_values[last],
+            )
+        temperature_counts = np.add.reduceat((~np.isnan(values['temperature'][order])).astype(np.int64), first)
+
+        for group, (start, end) in enumerate(zip(first, last)):
+            rollup = HealthDataRollup(
+                patient_id=int(patients[start]),
+                resolution=resolution,
+                bucket_start=_to_datetime(bucket_starts[start]),
+                count=int(end - start + 1),
+                last_timestamp=_to_datetime(timestamps[order[end]]),
+                temperature_count=int(temperature_counts[group]),
+            )
+            for metric, (mins, maxs, sums, lasts) in stats.items():
+                setattr(rollup, f'{metric}_min', _optional(mins[group]))
+                setattr(rollup, f'{metric}_max', _optional(maxs[group]))
+                setattr(rollup, f'{metric}_sum', float(sums[group]))
+                setattr(rollup, f'{metric}_last', _optional(lasts[group]))
+            rollups.append(rollup)
+    return rollups
+
+
+def _combine(function, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return function(a, b)
+
+
+def merge_rollup(rollup, other):
+    """Add the samples summarized by other (same patient and bucket) to rollup"""
+    rollup.count += other.count
+    rollup.temperature_count += other.temperature_count
+    for metric in METRICS:
+        setattr(rollup, f'{metric}_min', _combine(min, getattr(rollup, f'{metric}_min'), getattr(other, f'{metric}_min')))
+        setattr(rollup, f'{metric}_max', _combine(max, getattr(rollup, f'{metric}_max'), getattr(other, f'{metric}_max')))
+        setattr(rollup, f'{metric}_sum', getattr(rollup, f'{metric}_sum') + getattr(other, f'{metric}_sum'))
+    # Samples can arrive out of order; the last values are those of the latest sample
+    if other.last_timestamp >= rollup.last_timestamp:
+        rollup.last_timestamp = other.last_timestamp
+        for metric in METRICS:
+            setattr(rollup, f'{metric}_last', getattr(other, f'{metric}_last'))
+    return rollup
+
+
+def _bucket_key(rollup):
+    return rollup.patient_id, rollup.resolution, rollup.bucket_start
+
+
+def _merge_into_stored(partials):
+    stored = HealthDataRollup.objects.select_for_update().filter(
+        patient_id__in={rollup.patient_id for rollup in partials},
+        resolution__in={rollup.resolution for rollup in partials},
+        bucket_start__in={rollup.bucket_start for rollup in partials},
+    )
+    stored = {_bucket_key(rollup): rollup for rollup in stored}
+    updated, created = [], []
+    for partial in partials:
+        existing = stored.get(_bucket_key(partial))
+        if existing is None:
+            created.append(partial)
+        else:
+            updated.append(merge_rollup(existing, partial))
+    HealthDataRollup.objects.bulk_update(updated, UPDATE_FIELDS)
+    HealthDataRollup.objects.bulk_create(created)
+
+
+def save_rollups(partials):
+    """
+    Merge partial rollups (from aggregate) into the stored rows
+
+    Runs in the caller's transaction, so rollups commit or roll back with
+    the samples they summarize.
+    """
+    if not partials:
+        return
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _merge_into_stored(partials)
+            return
+        except IntegrityError:
+            # A concurrent ingest created one of the buckets first; merge into its row instead
+            if attempt:
+                raise
+
+
+def update_rollups(rows):
+    """Merge newly stored HealthData rows into their rollups, unless HEALTH_ROLLUPS_ON_INGEST is off"""
+    if not rows or not getattr(settings, 'HEALTH_ROLLUPS_ON_INGEST', True):
+        return
+    save_rollups(aggregate([tuple(getattr(row, field) for field in RAW_FIELDS) for row in rows]))
+
+
+def floor_time(moment, resolution):
+    """Start of the bucket containing moment"""
+    seconds = math.floor(moment.timestamp() / resolution) * resolution
+    return _to_datetime(seconds)
+
+
+def rebuild_rollups(patient_ids=None, since=None, until=None, chunk_size=20000, archive=None):
+    """
+    Recompute rollups from the raw rows, in the table and in the archive
+
+    Whole UTC days are rebuilt: since is rounded down and until up to
+    midnight. Rows are read in chunks and archived days one at a time, so
+    memory stays bounded. Samples ingested while a rebuild runs may be
+    counted twice; rebuild ranges that are not receiving data, or run with
+    HEALTH_ROLLUPS_ON_INGEST off.
+
+    Returns:
+        Number of samples read
+    """
+    rollups = HealthDataRollup.objects.all()
+    raw = HealthData.objects.all()
+    if patient_ids is not None:
+        rollups = rollups.filter(patient_id__in=patient_ids)
+        raw = raw.filter(patient_id__in=patient_ids)
+    if since is not None:
+        since = floor_time(since, HealthDataRollup.DAY)
+        rollups = rollups.filter(bucket_start__gte=since)
+        raw = raw.filter(timestamp__gte=since)
+    if until is not None:
+        day_start = floor_time(until, HealthDataRollup.DAY)
+        until = day_start if day_start == until else day_start + timedelta(days=1)
+        rollups = rollups.filter(bucket_start__lt=until)
+        raw = raw.filter(timestamp__lt=until)
+
+    total = 0
+    with transaction.atomic():
+        rollups.delete()
+        # Insertion order keeps a chunk's samples in few buckets, and needs no sort
+        records = raw.order_by('id').values_list(*RAW_FIELDS).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            save_rollups(aggregate(chunk))
+            total += len(chunk)
+
+        archive = archive or HealthDataArchive()
+        for patient_id in (archive.patient_ids() if patient_ids is None else patient_ids):
+            for day in archive.days(patient_id, since, until):
+                columns = archive.read_day(patient_id, day)
+                # Skip samples that were archived but are still in the table, and so already counted
+                start = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+                in_table = raw.filter(patient_id=patient_id, timestamp__gte=start,
+                                      timestamp__lt=start + timedelta(days=1)).values_list('id', flat=True)
+                keep = ~np.isin(columns['id'], list(in_table))
+                if not keep.any():
+                    continue
+                save_rollups(aggregate_columns(
+                    np.full(int(keep.sum()), patient_id, dtype=np.int64),
+                    columns['timestamp'][keep] / 1e6,
+                    np.vstack([columns[field][keep] for field in RAW_FIELDS[2:]])))
+                total += int(keep.sum())
+    return total
+
+
+def choose_resolution(since, until, max_points):
+    """Finest resolution that covers since..until in at most max_points buckets (days otherwise)"""
+    span = (until - since).total_seconds()
+    for resolution in (HealthDataRollup.MINUTE, HealthDataRollup.HOUR):
+        if math.ceil(span / resolution) <= max_points:
+            return resolution
+    return HealthDataRollup.DAY
+
+
+def trend_rollups(patient, since, until, resolution):
+    """Rollups of a patient at one resolution, oldest first, for the buckets overlapping since..until"""
+    return patient.rollups.filter(
+        resolution=resolution,
+        bucket_start__gte=floor_time(since, resolution),
+        bucket_start__lt=until,
+    ).order_by('bucket_start')
@@ -0,0 +1,468 @@
+"""
+Per-patient sliding windows of IMU samples for fall detection
+
+The training script (lstm_model_and_dataset/ml_lstm_model.py) classifies
+1.5 s windows of accelerometer and gyroscope data with the features built by
+extract_windowed_features. This module keeps the most recent window for each
+patient in memory and updates the same features incrementally as samples
+arrive, so serving sees the same inputs as training without reading past
+samples back from the database.
+
+Windows are counted in readings, not seconds: WINDOW_SAMPLES readings span
+WINDOW_SIZE_SECONDS only when the device sends IMU readings at
+SAMPLING_RATE_HZ, the rate of the training data. Devices should stream at
+that rate (in batches, frames or over the WebSocket). Readings sent at a
+lower rate, e.g. one HTTP request per second, fill a window that covers
+proportionally more time than the model was trained on.
+
+Serving scores the window after every reading rather than every
+WINDOW_SAMPLES // 2 readings as training does. A spike therefore keeps the
+window anomalous until it slides out, and only the reading that makes the
+window anomalous is reported (see ImuWindowStore.rising_edges).
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# Window configuration, matching ml_lstm_model.py
+WINDOW_SIZE_SECONDS = 1.5
+SAMPLING_RATE_HZ = 50
+WINDOW_SAMPLES = int(WINDOW_SIZE_SECONDS * SAMPLING_RATE_HZ)
+
+ACC_COLS = ['xAcc', 'yAcc', 'zAcc']
+GYRO_COLS = ['xGyro', 'yGyro', 'zGyro']
+
+# Feature names in the column order produced by extract_windowed_features
+FALL_WINDOW_FEATURES = (
+    ['SMV_Acc_mean', 'SMV_Acc_std', 'SMV_Acc_min', 'SMV_Acc_max', 'SMV_Acc_median', 'SMV_Acc_iqr']
+    + [f'{col}_{stat}' for col in ACC_COLS for stat in ('mean', 'std', 'max_abs_diff')]
+    + ['SMV_Gyro_mean', 'SMV_Gyro_std', 'SMV_Gyro_max', 'SMV_Gyro_iqr']
+    + [f'{col}_{stat}' for col in GYRO_COLS for stat in ('mean', 'std')]
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FALL_WINDOW_FEATURES)}
+
+# Features that need the whole window rather than running aggregates
+QUANTILE_FEATURES = ['SMV_Acc_median', 'SMV_Acc_iqr', 'SMV_Gyro_iqr']
+
+# Channel layout of the running sums: 6 axes followed by the two magnitudes
+_ACC_SMV = 6
+_GYRO_SMV = 7
+
+
+class _MonotonicWindow:
+    """Running max (or min) over the last `size` positions in amortized O(1)"""
+
+    def __init__(self, size, mode='max'):
+        self.size = size
+        self.sign = 1.0 if mode == 'max' else -1.0
+        self.items = deque()
+
+    def push(self, position, value):
+        keyed = self.sign * value
+        while self.items and self.items[-1][1] <= keyed:
+            self.items.pop()
+        self.items.append((position, keyed))
+
+    def evict_before(self, position):
+        while self.items and self.items[0][0] < position:
+            self.items.popleft()
+
+    def value(self):
+        if not self.items:
+            return np.nan
+        return self.sign * self.items[0][1]
+
+    def copy(self):
+        other = _MonotonicWindow(self.size)
+        other.sign = self.sign
+        other.items = deque(self.items)
+        return other
+
+    def clear(self):
+        self.items.clear()
+
+
+class _SortedWindow:
+    """
+    The values of a window kept in sorted order, for its quantiles
+
+    Each reading costs a binary search and one list shift instead of a sort
+    of the whole window. NaN readings are only counted, and make every
+    quantile NaN while they are in the window, as with numpy.percentile.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.nan_count = 0
+
+    def push(self, value):
+        if np.isnan(value):
+            self.nan_count += 1
+        else:
+            bisect.insort(self.values, float(value))
+
+    def remove(self, value):
+        if np.isnan(value):
+            self.nan_count -= 1
+        else:
+            del self.values[bisect.bisect_left(self.values, float(value))]
+
+    def quantile(self, q):
+        """Quantile with linear interpolation, as numpy.percentile"""
+        n = len(self.values)
+        if not n or self.nan_count:
+            return np.nan
+        position = q * (n - 1)
+        lower = int(position)
+        upper = min(lower + 1, n - 1)
+        return self.values[lower] + (self.values[upper] - self.values[lower]) * (position - lower)
+
+    def copy(self):
+        other = _SortedWindow()
+        other.values = list(self.values)
+        other.nan_count = self.nan_count
+        return other
+
+    def clear(self):
+        self.values.clear()
+        self.nan_count = 0
+
+
+class ImuWindow:
+    """
+    Ring buffer of the last WINDOW_SAMPLES IMU readings of one patient
+
+    Each push updates running sums and monotonic queues so that means,
+    standard deviations, extrema and max absolute differences cost O(1) per
+    sample. Median and IQR come from sorted copies of the two magnitude
+    channels, kept up to date as samples enter and leave the window, and are
+    only computed when explicitly requested.
+    """
+
+    def __init__(self, size=WINDOW_SAMPLES):
+        self.size = size
+        self.lock = threading.Lock()
+        self.buffer = np.zeros((size, 8))
+        self.reset()
+
+    def reset(self):
+        """Forget all samples"""
+        self.count = 0
+        self.position = 0
+        self.sums = np.zeros(8)
+        self.sumsq = np.zeros(8)
+        self.acc_max = _MonotonicWindow(self.size, 'max')
+        self.acc_min = _MonotonicWindow(self.size, 'min')
+        self.gyro_max = _MonotonicWindow(self.size, 'max')
+        self.diff_max = [_MonotonicWindow(self.size, 'max') for _ in ACC_COLS]
+        self.acc_sorted = _SortedWindow()
+        self.gyro_sorted = _SortedWindow()
+        self.last_update = None
+        # Whether the window was anomalous after the last scored reading
+        self.anomalous = False
+
+    def copy(self):
+        """Independent copy of the window, with its own lock"""
+        other = ImuWindow.__new__(ImuWindow)
+        other.__dict__.update(self.__dict__)
+        other.lock = threading.Lock()
+        other.buffer = self.buffer.copy()
+        other.sums = self.sums.copy()
+        other.sumsq = self.sumsq.copy()
+        for name in ('acc_max', 'acc_min', 'gyro_max', 'acc_sorted', 'gyro_sorted'):
+            setattr(other, name, getattr(self, name).copy())
+        other.diff_max = [queue.copy() for queue in self.diff_max]
+        return other
+
+    def push(self, row):
+        """
+        Add one reading
+
+        Args:
+            row: Sequence [acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z]
+        """
+        values = np.empty(8)
+        values[:6] = row
+        values[_ACC_SMV] = np.sqrt(values[0] ** 2 + values[1] ** 2 + values[2] ** 2)
+        values[_GYRO_SMV] = np.sqrt(values[3] ** 2 + values[4] ** 2 + values[5] ** 2)
+
+        slot = self.position % self.size
+        if self.count == self.size:
+            old = self.buffer[slot]
+            self.sums -= old
+            self.sumsq -= old * old
+            self.acc_sorted.remove(old[_ACC_SMV])
+            self.gyro_sorted.remove(old[_GYRO_SMV])
+        else:
+            self.count += 1
+
+        previous = self.buffer[(self.position - 1) % self.size].copy() if self.position else None
+        self.buffer[slot] = values
+        self.sums += values
+        self.sumsq += values * values
+        self.acc_sorted.push(values[_ACC_SMV])
+        self.gyro_sorted.push(values[_GYRO_SMV])
+
+        oldest = self.position - self.count + 1
+        self.acc_max.push(self.position, values[_ACC_SMV])
+        self.acc_min.push(self.position, values[_ACC_SMV])
+        self.gyro_max.push(self.position, values[_GYRO_SMV])
+        for queue in (self.acc_max, self.acc_min, self.gyro_max):
+            queue.evict_before(oldest)
+
+        # A difference belongs to the window while both of its samples do
+        for axis, queue in enumerate(self.diff_max):
+            if previous is not None:
+                queue.push(self.position, abs(values[axis] - previous[axis]))
+            queue.evict_before(oldest + 1)
+
+        self.position += 1
+
+        # Refresh the running sums once per window to stop float drift
+        if self.position % self.size == 0:
+            window = self.buffer[:self.count]
+            self.sums = window.sum(axis=0)
+            self.sumsq = (window * window).sum(axis=0)
+
+        self.last_update = time.monotonic()
+
+    def features(self, include_quantiles=False):
+        """
+        Window features in FALL_WINDOW_FEATURES order
+
+        Standard deviations use ddof=1 and are NaN for a single sample, as in
+        pandas. Quantile features are NaN unless include_quantiles is set.
+        """
+        out = np.full(len(FALL_WINDOW_FEATURES), np.nan)
+        n = self.count
+        if n == 0:
+            return out
+
+        means = self.sums / n
+        if n > 1:
+            variances = np.maximum(self.sumsq - n * means * means, 0.0) / (n - 1)
+            stds = np.sqrt(variances)
+        else:
+            stds = np.full(8, np.nan)
+
+        out[FEATURE_INDEX['SMV_Acc_mean']] = means[_ACC_SMV]
+        out[FEATURE_INDEX['SMV_Acc_std']] = stds[_ACC_SMV]
+        out[FEATURE_INDEX['SMV_Acc_min']] = self.acc_min.value()
+        out[FEATURE_INDEX['SMV_Acc_max']] = self.acc_max.value()
+        out[FEATURE_INDEX['SMV_Gyro_mean']] = means[_GYRO_SMV]
+        out[FEATURE_INDEX['SMV_Gyro_std']] = stds[_GYRO_SMV]
+        out[FEATURE_INDEX['SMV_Gyro_max']] = self.gyro_max.value()
+
+        for axis, col in enumerate(ACC_COLS):
+            out[FEATURE_INDEX[f'{col}_mean']] = means[axis]
+            out[FEATURE_INDEX[f'{col}_std']] = stds[axis]
+            out[FEATURE_INDEX[f'{col}_max_abs_diff']] = self.diff_max[axis].value()
+        for axis, col in enumerate(GYRO_COLS, start=3):
+            out[FEATURE_INDEX[f'{col}_mean']] = means[axis]
+            out[FEATURE_INDEX[f'{col}_std']] = stds[axis]
+
+        if include_quantiles:
+            out[FEATURE_INDEX['SMV_Acc_median']] = self.acc_sorted.quantile(0.5)
+            out[FEATURE_INDEX['SMV_Acc_iqr']] = self.acc_sorted.quantile(0.75) - self.acc_sorted.quantile(0.25)
+            out[FEATURE_INDEX['SMV_Gyro_iqr']] = self.gyro_sorted.quantile(0.75) - self.gyro_sorted.quantile(0.25)
+
+        return out
+
+
+class ImuWindowStore:
+    """
+    Bounded collection of ImuWindow objects keyed by patient
+
+    The least recently used windows are dropped once max_patients is
+    reached, and a window is reset when its patient has been silent for
+    longer than max_gap_seconds.
+    """
+
+    def __init__(self, window_size=WINDOW_SAMPLES, max_patients=10000, max_gap_seconds=30.0):
+        self.window_size = window_size
+        self.max_patients = max_patients
+        self.max_gap_seconds = max_gap_seconds
+        self.windows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, patient_key):
+        """Return the window of a patient, creating it if needed"""
+        with self.lock:
+            window = self.windows.get(patient_key)
+            if window is None:
+                window = ImuWindow(self.window_size)
+                self.windows[patient_key] = window
+                while len(self.windows) > self.max_patients:
+                    self.windows.popitem(last=False)
+            else:
+                self.windows.move_to_end(patient_key)
+            return window
+
+    def push(self, patient_key, rows, include_quantiles=False):
+        """
+        Add readings to a patient's window
+
+        Args:
+            patient_key: Patient identifier
+            rows: Array-like of shape (N, 6)
+            include_quantiles: Also compute median and IQR features
+
+        Returns:
+            Tuple (features, window_counts): an (N, len(FALL_WINDOW_FEATURES))
+            array with the window features after each reading, and the
+            number of readings in the window at that point
+        """
+        features, counts, window = self.stage(patient_key, rows, include_quantiles)
+        self.commit(patient_key, window)
+        return features, counts
+
+    def stage(self, patient_key, rows, include_quantiles=False):
+        """
+        Compute what push would return without changing the stored window
+
+        The readings are added to a copy of the patient's window. Passing
+        the copy to commit() stores them, so a caller can commit only once
+        the features have been scored and a failed batch leaves the window
+        as it was. Readings of the same patient staged concurrently are not
+        merged: the last commit wins.
+
+        Returns:
+            Tuple (features, window_counts, window) where window is the
+            updated copy to commit
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, 6)
+        current = self.get(patient_key)
+        with current.lock:
+            window = current.copy()
+        features = np.empty((len(rows), len(FALL_WINDOW_FEATURES)))
+        counts = np.empty(len(rows), dtype=int)
+        if (window.last_update is not None and
+                time.monotonic() - window.last_update > self.max_gap_seconds):
+            window.reset()
+        for i, row in enumerate(rows):
+            window.push(row)
+            features[i] = window.features(include_quantiles)
+            counts[i] = window.count
+        return features, counts, window
+
+    def commit(self, patient_key, window):
+        """Store a window returned by stage() as the patient's window"""
+        with self.lock:
+            self.windows[patient_key] = window
+            self.windows.move_to_end(patient_key)
+            while len(self.windows) > self.max_patients:
+                self.windows.popitem(last=False)
+
+    def rising_edges(self, patient_key, anomalous):
+        """
+        Readings at which a patient's window becomes anomalous
+
+        Args:
+            patient_key: Patient identifier
+            anomalous: Bool per reading pushed, in order: whether the window
+                       after that reading was classified as anomalous
+
+        Returns:
+            Bool array, True only where the window was not anomalous after
+            the reading before (including one scored in an earlier call)
+        """
+        anomalous = np.asarray(anomalous, dtype=bool)
+        if not len(anomalous):
+            return anomalous
+        window = self.get(patient_key)
+        with window.lock:
+            previous = np.concatenate([[window.anomalous], anomalous[:-1]])
+            window.anomalous = bool(anomalous[-1])
+        return anomalous & ~previous
+
+    def clear(self, patient_key=None):
+        """Drop one patient's window, or all windows"""
+        with self.lock:
+            if patient_key is None:
+                self.windows.clear()
+            else:
+                self.windows.pop(patient_key, None)
+
+
+class VitalsHistoryStore:
+    """
+    Bounded collection of recent vitals readings keyed by patient
+
+    Feeds the vitals LSTM, which classifies the last `length` readings of
+    [heart_rate, spo2, temperature]. Eviction and gap handling match
+    ImuWindowStore.
+    """
+
+    def __init__(self, length=10, n_features=3, max_patients=10000, max_gap_seconds=30.0):
+        self.length = length
+        self.n_features = n_features
+        self.max_patients = max_patients
+        self.max_gap_seconds = max_gap_seconds
+        self.histories = OrderedDict()
+        self.lock = threading.Lock()
+
+    def push(self, patient_key, rows):
+        """
+        Add readings to a patient's history
+
+        Args:
+            patient_key: Patient identifier
+            rows: Array-like of shape (N, n_features)
+
+        Returns:
+            Array of shape (N, length, n_features) with the history after
+            each reading. Short histories are padded with their oldest reading.
+        """
+        sequences, history = self.stage(patient_key, rows)
+        self.commit(patient_key, history)
+        return sequences
+
+    def stage(self, patient_key, rows):
+        """
+        Compute what push would return without changing the stored history
+
+        As ImuWindowStore.stage: pass the returned history to commit() once
+        the sequences have been scored.
+
+        Returns:
+            Tuple (sequences, history)
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.n_features)
+        if not len(rows):
+            return np.empty((0, self.length, self.n_features)), None
+        now = time.monotonic()
+        with self.lock:
+            previous, last_update = self.histories.get(patient_key, (rows[:0], now))
+        if now - last_update > self.max_gap_seconds:
+            previous = rows[:0]
+
+        # Pad at the front so every reading has a full history behind it
+        combined = np.concatenate([previous, rows])
+        padding = self.length - 1 - len(previous)
+        if padding > 0:
+            combined = np.concatenate([np.repeat(combined[:1], padding, axis=0), combined])
+        sequences = np.lib.stride_tricks.sliding_window_view(
+            combined, self.length, axis=0).transpose(0, 2, 1)[-len(rows):]
+        history = (combined[len(combined) - self.length + 1:].copy(), now)
+        return np.ascontiguousarray(sequences), history
+
+    def commit(self, patient_key, history):
+        """Store a history returned by stage() as the patient's history"""
+        if history is None:
+            return
+        with self.lock:
+            self.histories.pop(patient_key, None)
+            self.histories[patient_key] = history
+            while len(self.histories) > self.max_patients:
+                self.histories.popitem(last=False)
+
+    def clear(self, patient_key=None):
+        """Drop one patient's history, or all histories"""
+        with self.lock:
+            if patient_key is None:
+                self.histories.clear()
+            else:
+                self.histories.pop(patient_key, None)
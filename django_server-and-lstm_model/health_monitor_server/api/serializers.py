@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Patient, Guardian, HealthData, Alert
+from .models import Patient, Guardian, HealthData, Alert, SensorWindow
+from .rollups import METRICS as ROLLUP_METRICS
+from .window_storage import IMU_FIELDS, unpack_samples
 
 class PatientSerializer(serializers.ModelSerializer):
     """Serializer for Patient model"""
@@ -13,7 +15,7 @@ class PatientSerializer(serializers.ModelSerializer):
 
 class GuardianSerializer(serializers.ModelSerializer):
     """Serializer for Guardian model"""
-    patient_name = serializers.SerializerMethodField()
+    patient_name = serializers.CharField(source='patient.name', read_only=True)
     
     class Meta:
         model = Guardian
@@ -22,13 +24,10 @@ class GuardianSerializer(serializers.ModelSerializer):
             'phone_number', 'email', 'notification_enabled', 
             'fcm_token', 'created_at', 'updated_at'
         ]
-    
-    def get_patient_name(self, obj):
-        return obj.patient.name if obj.patient else None
 
 class HealthDataSerializer(serializers.ModelSerializer):
     """Serializer for HealthData model"""
-    patient_name = serializers.SerializerMethodField()
+    patient_name = serializers.CharField(source='patient.name', read_only=True)
     
     class Meta:
         model = HealthData
@@ -39,13 +38,24 @@ class HealthDataSerializer(serializers.ModelSerializer):
             'gyroscope_x', 'gyroscope_y', 'gyroscope_z',
             'temperature', 'systolic_bp', 'diastolic_bp', 'respiratory_rate'
         ]
+
+class SensorWindowSerializer(serializers.ModelSerializer):
+    """Serializer for SensorWindow model, with the packed readings as one list per axis"""
+    samples = serializers.SerializerMethodField()
     
-    def get_patient_name(self, obj):
-        return obj.patient.name if obj.patient else None
+    class Meta:
+        model = SensorWindow
+        fields = [
+            'id', 'patient', 'timestamp', 'sample_rate', 'sample_count',
+            'smv_mean', 'smv_max', 'smv_std', 'samples'
+        ]
+    
+    def get_samples(self, window):
+        return dict(zip(IMU_FIELDS, unpack_samples(window).tolist()))
 
 class AlertSerializer(serializers.ModelSerializer):
     """Serializer for Alert model"""
-    patient_name = serializers.SerializerMethodField()
+    patient_name = serializers.CharField(source='patient.name', read_only=True)
     
     class Meta:
         model = Alert
@@ -54,6 +64,22 @@ class AlertSerializer(serializers.ModelSerializer):
             'type', 'message', 'health_data', 'status', 
             'resolved_at'
         ]
+
+class HealthDataRollupSerializer(serializers.BaseSerializer):
+    """Read-only serializer for a rollup bucket: min, max, mean and last per metric"""
+    timestamp_field = serializers.DateTimeField()
     
-    def get_patient_name(self, obj):
-        return obj.patient.name if obj.patient else None
\ No newline at end of file
+    def to_representation(self, rollup):
+        data = {
+            'start': self.timestamp_field.to_representation(rollup.bucket_start),
+            'count': rollup.count,
+        }
+        for metric in ROLLUP_METRICS:
+            count = rollup.temperature_count if metric == 'temperature' else rollup.count
+            data[metric] = {
+                'min': getattr(rollup, f'{metric}_min'),
+                'max': getattr(rollup, f'{metric}_max'),
+                'mean': getattr(rollup, f'{metric}_sum') / count if count else None,
+                'last': getattr(rollup, f'{metric}_last'),
+            }
+        return data
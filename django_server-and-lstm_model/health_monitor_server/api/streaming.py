@@ -0,0 +1,151 @@
+"""
+WebSocket streaming ingestion for health data
+
+Each device keeps one WebSocket open to ``/ws/health-data/<user_id>/`` and
+sends samples as JSON text messages. Every message goes through the same
+validation, storage and prediction path as the HTTP ingest endpoints and the
+verdicts are pushed back on the same connection.
+
+Accepted messages:
+    - a single sample object
+    - a list of sample objects
+    - {"seq": 12, "samples": [...]} where seq is echoed in the reply
+    - a binary sample frame (see wire_format.py), whose sequence is echoed
+
+A message holds at most HEALTH_DATA_BATCH_MAX_SAMPLES samples, like a
+request to the batch endpoint; larger ones get an error reply.
+
+Replies:
+    {"type": "verdict", "seq": 12, "results": [...]}
+    {"type": "error", "error": "..."}
+"""
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Patient
+from .views import ingest_health_data_batch, ingest_health_data_frame
+from .wire_format import FrameError, SampleFrame, decode_frame
+
+STREAM_PATH = re.compile(r'^/ws/health-data/(?P<user_id>[^/]+)/?$')
+
+# WebSocket close codes used by the stream
+CLOSE_NOT_FOUND = 4404
+CLOSE_BAD_PATH = 4400
+
+
+def _get_patient(user_id):
+    """Look up the patient a stream belongs to"""
+    return Patient.objects.filter(user_id=user_id).first()
+
+
+def _samples_from_message(message, user_id):
+    """Turn a decoded stream message into a list of samples and an optional sequence number"""
+    seq = None
+    if isinstance(message, dict) and 'samples' in message:
+        seq = message.get('seq')
+        samples = message['samples']
+    elif isinstance(message, list):
+        samples = message
+    else:
+        samples = [message]
+        if isinstance(message, dict):
+            seq = message.get('seq')
+
+    if not isinstance(samples, list):
+        raise ValueError('"samples" must be a list')
+
+    # A stream belongs to a single patient, whatever the samples claim
+    samples = [dict(sample, user_id=user_id) if isinstance(sample, dict) else sample
+               for sample in samples]
+    return samples, seq
+
+
+def _ingest(samples, patients):
+    """
+    ingest_health_data_batch (or ingest_health_data_frame for a frame) on a
+    stream's worker thread
+
+    Nothing closes the database connections of these threads the way a
+    request does, so stale or broken ones are closed around every message,
+    as request_started and request_finished would.
+    """
+    close_old_connections()
+    try:
+        if isinstance(samples, SampleFrame):
+            return ingest_health_data_frame(samples, patients=patients)
+        return ingest_health_data_batch(samples, patients=patients)
+    finally:
+        close_old_connections()
+
+
+async def _send_json(send, payload):
+    await send({'type': 'websocket.send', 'text': json.dumps(payload, cls=JSONEncoder)})
+
+
+async def health_data_stream(scope, receive, send):
+    """ASGI application for per-device health data WebSocket streams"""
+    match = STREAM_PATH.match(scope.get('path', ''))
+
+    # Wait for the handshake before accepting or rejecting
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_BAD_PATH})
+        return
+
+    user_id = match.group('user_id')
+    patient = await sync_to_async(_get_patient)(user_id)
+    if patient is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    await send({'type': 'websocket.accept'})
+    patients = {patient.user_id: patient}
+
+    # Each connection scores its samples on a worker thread of its own so a
+    # slow stream does not hold up the others
+    ingest = sync_to_async(_ingest, thread_sensitive=False)
+
+    while True:
+        event = await receive()
+        if event['type'] == 'websocket.disconnect':
+            break
+        if event['type'] != 'websocket.receive':
+            continue
+
+        try:
+            if event.get('bytes') is not None:
+                frame = decode_frame(event['bytes'])
+                # A stream belongs to a single patient, whatever the frame claims
+                samples, seq = frame._replace(user_id=user_id), frame.sequence
+            else:
+                samples, seq = _samples_from_message(json.loads(event.get('text') or ''), user_id)
+        except (FrameError, ValueError) as e:
+            await _send_json(send, {'type': 'error', 'error': f'Invalid message: {e}'})
+            continue
+
+        count = samples.values.shape[1] if isinstance(samples, SampleFrame) else len(samples)
+        max_samples = getattr(settings, 'HEALTH_DATA_BATCH_MAX_SAMPLES', 5000)
+        if count > max_samples:
+            await _send_json(send, {'type': 'error', 'seq': seq,
+                                    'error': f'Message exceeds maximum of {max_samples} samples'})
+            continue
+
+        if not count:
+            await _send_json(send, {'type': 'verdict', 'seq': seq, 'results': []})
+            continue
+
+        try:
+            results = await ingest(samples, patients=patients)
+        except Exception as e:
+            await _send_json(send, {'type': 'error', 'seq': seq, 'error': str(e)})
+            continue
+
+        await _send_json(send, {'type': 'verdict', 'seq': seq, 'results': results})
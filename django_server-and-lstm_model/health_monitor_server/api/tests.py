@@ -1,8 +1,81 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import joblib
+import numpy as np
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Patient, Guardian, HealthData, Alert
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import Patient, Guardian, HealthData, HealthDataRollup, SensorWindow, Alert, FirebaseOutbox
+from .firebase_service import FirebaseService
+from .outbox import OutboxWorker, enqueue_guardian_notification, enqueue_save
+from .rollups import METRICS as ROLLUP_METRICS, RAW_FIELDS, aggregate, rebuild_rollups
+from .downsampling import downsample_series, lttb
+from .health_data_repository import HealthDataRepository
+from .archive import HealthDataArchive, archive_health_data, day_start, rows_to_columns, ARCHIVE_FIELDS
+from .streaming import health_data_stream, CLOSE_NOT_FOUND
+from .ml_predictor import FALL_THRESHOLD, HealthPredictor
+from . import model_loader
+from .inference_scheduler import MicroBatcher
+from .model_registry import canary_bucket
+from .model_server import ModelServer, send_message, recv_message
+from .lstm_numpy import LSTMLayer, NumpyLSTMNetwork, from_keras
+from .sensor_windows import (ImuWindowStore, FALL_WINDOW_FEATURES, FEATURE_INDEX, QUANTILE_FEATURES,
+                             WINDOW_SAMPLES)
+from .wire_format import (FRAME_MEDIA_TYPE, FRAME_FIELDS, V1_HEADER_STRUCT, FrameError, encode_frame,
+                          decode_frame, frame_to_samples)
+from .timeseries_codec import CodecError, choose_method, decode_block, encode_block
+from .window_storage import IMU_FIELDS, split_windows, unpack_samples
+from . import views
+
+ACC_GYR_CSV = settings.BASE_DIR.parent / 'lstm_model_and_dataset' / 'acc_gyr.csv'
+
+
+class QueryBudgetMixin:
+    """Assertions on how many queries a code path runs"""
+    
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        """Fail if the block runs more than budget queries, listing the queries it ran"""
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(f"{number}. {query['sql']}" for number, query in enumerate(context.captured_queries, 1))
+            self.fail(f"{len(context)} queries, budget {budget}:\n{queries}")
+    
+    def assertConstantQueries(self, run, add_rows, budget):
+        """
+        Fail if run() exceeds budget queries, or if it needs more after add_rows()
+        
+        add_rows should add rows that run() returns, so an N+1 query shows up
+        as a larger count on the second run.
+        """
+        with self.assertMaxQueries(budget) as first:
+            run()
+        add_rows()
+        with self.assertMaxQueries(len(first)):
+            run()
 
 
 class PatientModelTest(TestCase):
@@ -202,4 +275,1952 @@ class APITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         # Verify data was saved
-        self.assertTrue(HealthData.objects.filter(patient=self.patient).exists())
\ No newline at end of file
+        self.assertTrue(HealthData.objects.filter(patient=self.patient).exists())
+    
+    def test_health_data_batch_endpoint(self):
+        """Test sending a batch of health data for several patients"""
+        other_patient = Patient.objects.create(
+            name="Second Patient",
+            age=58,
+            gender="MALE",
+            user_id="apitest456"
+        )
+        sample = {
+            'heart_rate': 75.0,
+            'spo2': 97.0,
+            'accelerometer_x': 0.1,
+            'accelerometer_y': 0.2,
+            'accelerometer_z': 9.8,
+            'gyroscope_x': 0.5,
+            'gyroscope_y': -0.2,
+            'gyroscope_z': 0.1
+        }
+        data = [
+            dict(sample, user_id=self.patient.user_id),
+            dict(sample, user_id=other_patient.user_id, timestamp='2025-01-01T10:00:00Z'),
+            dict(sample, user_id='unknown'),
+            {'user_id': self.patient.user_id, 'heart_rate': 80.0}
+        ]
+        response = self.client.post('/api/health-data/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stored'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        
+        results = response.data['results']
+        self.assertEqual([r['index'] for r in results], [0, 1, 2, 3])
+        self.assertIn('health_data_id', results[0])
+        self.assertIn('not found', results[2]['error'])
+        self.assertIn('spo2', results[3]['error'])
+        self.assertFalse(results[0]['fall_detection']['is_anomaly'])
+        
+        self.assertEqual(HealthData.objects.filter(patient=self.patient).count(), 1)
+        stored = HealthData.objects.get(patient=other_patient)
+        self.assertEqual(stored.timestamp.year, 2025)
+    
+    def test_health_data_batch_with_default_user_id(self):
+        """Test a batch object whose samples inherit the top-level user_id"""
+        sample = {
+            'heart_rate': 72.0,
+            'spo2': 98.0,
+            'accelerometer_x': 0.0,
+            'accelerometer_y': 0.1,
+            'accelerometer_z': 9.7,
+            'gyroscope_x': 0.1,
+            'gyroscope_y': 0.1,
+            'gyroscope_z': 0.1
+        }
+        data = {'user_id': self.patient.user_id, 'samples': [sample, sample, sample]}
+        response = self.client.post('/api/health-data/batch/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stored'], 3)
+        self.assertEqual(HealthData.objects.filter(patient=self.patient).count(), 3)
+        
+        response = self.client.post('/api/health-data/batch/', {'samples': 'bad'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class FakeFirebaseService:
+    """Records notifications instead of sending them"""
+    
+    def __init__(self):
+        self.notifications = []
+    
+    def send_alert_to_guardians(self, guardians, patient_name, alert_type, alert_message):
+        self.notifications.append((list(guardians), patient_name, alert_type, alert_message))
+        return True
+
+
+class FakeFirebaseRepository:
+    """Records Firebase writes instead of sending them"""
+    
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.saved = []
+        self.firebase_service = FakeFirebaseService()
+    
+    def _save(self, instance):
+        self.saved.append(instance)
+        return not self.fail
+    
+    save_patient = save_guardian = save_health_data = save_alert = _save
+
+
+class FirebaseOutboxTest(APITestCase):
+    """Test the Firebase outbox and its worker"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            name="Outbox Patient",
+            age=80,
+            gender="FEMALE",
+            user_id="outbox123"
+        )
+        self.guardian = Guardian.objects.create(
+            patient=self.patient,
+            name="Outbox Guardian",
+            relationship="CHILD",
+            phone_number="555-0100",
+            fcm_token="token-123"
+        )
+    
+    def test_health_data_is_queued_not_sent(self):
+        """Test that ingest writes outbox entries in the request"""
+        data = {
+            'user_id': self.patient.user_id,
+            'heart_rate': 150.0,
+            'spo2': 85.0,
+            'accelerometer_x': 0.1,
+            'accelerometer_y': 0.2,
+            'accelerometer_z': 9.8,
+            'gyroscope_x': 0.5,
+            'gyroscope_y': -0.2,
+            'gyroscope_z': 0.1
+        }
+        response = self.client.post('/api/health-data/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        kinds = sorted(FirebaseOutbox.objects.values_list('kind', flat=True))
+        self.assertEqual(kinds, ['ALERT', 'HEALTH_DATA', 'NOTIFICATION'])
+        
+        repository = FakeFirebaseRepository()
+        totals = OutboxWorker(repository=repository).drain()
+        self.assertEqual(totals['delivered'], 3)
+        self.assertEqual(len(repository.saved), 2)
+        self.assertEqual(len(repository.firebase_service.notifications), 1)
+        self.assertFalse(FirebaseOutbox.objects.filter(status=FirebaseOutbox.STATUS_PENDING).exists())
+    
+    def test_failed_delivery_is_retried_then_failed(self):
+        """Test retry bookkeeping for deliveries Firebase rejects"""
+        enqueue_save(self.patient)
+        worker = OutboxWorker(repository=FakeFirebaseRepository(fail=True), max_attempts=2)
+        
+        self.assertEqual(worker.drain()['retried'], 1)
+        entry = FirebaseOutbox.objects.get()
+        self.assertEqual(entry.status, FirebaseOutbox.STATUS_PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertTrue(entry.last_error)
+        
+        # Not due again until the backoff has passed
+        self.assertEqual(worker.drain()['claimed'], 0)
+        FirebaseOutbox.objects.update(available_at=entry.created_at)
+        self.assertEqual(worker.drain()['failed'], 1)
+        self.assertEqual(FirebaseOutbox.objects.get().status, FirebaseOutbox.STATUS_FAILED)
+    
+    def test_repeated_saves_are_coalesced(self):
+        """Test that several queued saves of one object cost one write"""
+        for _ in range(3):
+            enqueue_save(self.guardian)
+        repository = FakeFirebaseRepository()
+        totals = OutboxWorker(repository=repository).drain()
+        self.assertEqual(totals['delivered'], 3)
+        self.assertEqual(len(repository.saved), 1)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTest(APITestCase):
+    """Test that the per-patient queries are answered from the composite indexes"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(name="Plan Patient", age=75, gender="MALE", user_id="plan123")
+        other = Patient.objects.create(name="Other Patient", age=60, gender="FEMALE", user_id="plan456")
+        for patient in [self.patient, other]:
+            Guardian.objects.create(patient=patient, name="Plan Guardian", relationship="CHILD",
+                                    phone_number="555-0199", fcm_token="token")
+            for i in range(5):
+                reading = HealthData.objects.create(
+                    patient=patient, heart_rate=70 + i, spo2=97, accelerometer_x=0, accelerometer_y=0,
+                    accelerometer_z=9.8, gyroscope_x=0, gyroscope_y=0, gyroscope_z=0)
+                Alert.objects.create(patient=patient, type='VITALS', message="Plan alert", health_data=reading,
+                                     status='NEW' if i % 2 else 'RESOLVED')
+    
+    def capture_plans(self, table, func):
+        """Run func and return the query plan of every SELECT it ran on table"""
+        queries = []
+        
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+        
+        with connection.execute_wrapper(record):
+            func()
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                if sql.startswith('SELECT') and f'FROM "{table}"' in sql:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                    plans.append(' | '.join(row[-1] for row in cursor.fetchall()))
+        self.assertTrue(plans, f'No query on {table}')
+        return plans
+    
+    def assertPlansUseIndex(self, plans, index_name):
+        for plan in plans:
+            self.assertIn(f'USING INDEX {index_name}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_patient_health_data(self):
+        """Test that the latest readings are read in index order, without a sort"""
+        url = f'/api/patients/{self.patient.pk}/health_data/'
+        plans = self.capture_plans('api_healthdata', lambda: self.assertEqual(self.client.get(url).status_code, 200))
+        self.assertPlansUseIndex(plans, 'api_health_patient_ts_idx')
+    
+    def test_patient_alerts(self):
+        """Test the alerts of a patient, with and without a status filter"""
+        url = f'/api/patients/{self.patient.pk}/alerts/'
+        plans = self.capture_plans('api_alert', lambda: self.assertEqual(self.client.get(url).status_code, 200))
+        self.assertPlansUseIndex(plans, 'api_alert_patient_ts_idx')
+        
+        response = {}
+        plans = self.capture_plans('api_alert', lambda: response.update(r=self.client.get(url, {'status': 'NEW'})))
+        self.assertPlansUseIndex(plans, 'api_alert_pat_status_ts_idx')
+        self.assertEqual([alert['status'] for alert in response['r'].data['results']], ['NEW', 'NEW'])
+        self.assertEqual(self.client.get(url, {'status': 'UNKNOWN'}).status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_chat_context_lookup(self):
+        """Test the latest reading lookup for the chat context"""
+        llm_response = mock.Mock(status_code=200)
+        llm_response.json.return_value = {'choices': [{'message': {'content': 'Stay hydrated.'}}]}
+        
+        def chat():
+            with mock.patch('api.views.requests.post', return_value=llm_response):
+                response = self.client.post('/api/chat/', {'message': 'How am I?', 'patient_id': self.patient.pk},
+                                            format='json')
+            self.assertTrue(response.data['patient_context_provided'])
+        
+        self.assertPlansUseIndex(self.capture_plans('api_healthdata', chat), 'api_health_patient_ts_idx')
+    
+    def test_guardian_notification_lookup(self):
+        """Test the notification-enabled guardian lookup of the outbox worker"""
+        enqueue_guardian_notification(self.patient, 'VITALS', 'Plan alert')
+        repository = FakeFirebaseRepository()
+        plans = self.capture_plans('api_guardian', lambda: OutboxWorker(repository=repository).drain())
+        self.assertPlansUseIndex(plans, 'api_guardian_pat_notify_idx')
+        self.assertEqual(len(repository.firebase_service.notifications), 1)
+
+
+class QueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """Test that list endpoints run the same number of queries however many rows they return"""
+    
+    def setUp(self):
+        self.patients = [Patient.objects.create(name=f"Budget Patient {i}", age=70, gender="OTHER",
+                                                user_id=f"budget{i}") for i in range(3)]
+    
+    def add_rows(self, count=5):
+        """Add guardians, readings and alerts for every patient"""
+        for patient in self.patients:
+            for _ in range(count):
+                Guardian.objects.create(patient=patient, name="Budget Guardian", relationship="OTHER",
+                                        phone_number="555-0142", fcm_token="token")
+                reading = HealthData.objects.create(
+                    patient=patient, heart_rate=72, spo2=98, accelerometer_x=0, accelerometer_y=0,
+                    accelerometer_z=9.8, gyroscope_x=0, gyroscope_y=0, gyroscope_z=0)
+                Alert.objects.create(patient=patient, type='VITALS', message="Budget alert", health_data=reading)
+    
+    def get_ok(self, url):
+        def run():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return run
+    
+    def test_list_endpoints(self):
+        """Test the paginated lists: one count and one page query each, and no count for cursor pages"""
+        self.add_rows(1)
+        for url, budget in [('/api/alerts/', 1), ('/api/guardians/', 2), ('/api/patients/', 2)]:
+            with self.subTest(url=url):
+                self.assertConstantQueries(self.get_ok(url), self.add_rows, budget=budget)
+        response = self.client.get('/api/alerts/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertTrue(response.data['results'][0]['patient_name'].startswith("Budget Patient"))
+    
+    def test_patient_actions(self):
+        """Test the per-patient lists: one patient query and one list query each"""
+        self.add_rows(1)
+        patient = self.patients[0]
+        for action in ['guardians', 'alerts', 'health_data']:
+            with self.subTest(action=action):
+                url = f'/api/patients/{patient.pk}/{action}/'
+                self.assertConstantQueries(self.get_ok(url), self.add_rows, budget=2)
+                data = self.client.get(url).data
+                rows = data if action == 'guardians' else data['results']
+                self.assertEqual(rows[0]['patient_name'], patient.name)
+    
+    def test_guardian_notifications(self):
+        """Test that notifying guardians does not load their patient"""
+        self.add_rows(3)
+        service = FirebaseService.__new__(FirebaseService)
+        service.initialized = True
+        sent = []
+        service.send_alert_notification = lambda token, title, body, data: sent.append(data) or True
+        guardians = list(Guardian.objects.filter(patient=self.patients[0]))
+        with self.assertMaxQueries(0):
+            self.assertTrue(service.send_alert_to_guardians(guardians, "Budget Patient 0", "Fall", "Fall detected"))
+        self.assertEqual({data['patient_id'] for data in sent}, {str(self.patients[0].pk)})
+    
+    def test_admin_changelists(self):
+        """Test the admin lists of guardians, readings and alerts, and a patient's alert inline"""
+        self.add_rows(1)
+        User.objects.create_superuser('budget-admin', 'admin@example.com', 'budget-password')
+        self.client.login(username='budget-admin', password='budget-password')
+        for model in ['guardian', 'healthdata', 'alert']:
+            with self.subTest(model=model):
+                url = f'/admin/api/{model}/'
+                self.assertConstantQueries(self.get_ok(url), self.add_rows, budget=10)
+        url = f'/admin/api/patient/{self.patients[0].pk}/change/'
+        self.assertConstantQueries(self.get_ok(url), self.add_rows, budget=20)
+
+
+class CursorPaginationTest(APITestCase):
+    """Test the keyset pagination of the health data and alert lists"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(name="Cursor Patient", age=80, gender="FEMALE", user_id="cursor123")
+        self.start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        # Pairs of readings share a timestamp, so pages have to break ties on id
+        self.readings = [HealthData.objects.create(
+            patient=self.patient, timestamp=self.start + timedelta(minutes=i // 2), heart_rate=60 + i, spo2=97,
+            accelerometer_x=0, accelerometer_y=0, accelerometer_z=9.8, gyroscope_x=0, gyroscope_y=0, gyroscope_z=0)
+            for i in range(25)]
+        for reading in self.readings:
+            Alert.objects.create(patient=self.patient, type='VITALS', message="Cursor alert", health_data=reading,
+                                 timestamp=reading.timestamp)
+        self.newest_first = sorted(self.readings, key=lambda reading: (reading.timestamp, reading.pk), reverse=True)
+    
+    def walk(self, url, params, direction='next'):
+        """Follow the links in direction from url and return the ids on every page"""
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row['id'] for row in response.data['results']])
+            if response.data[direction] is None:
+                return pages, response
+            response = self.client.get(response.data[direction])
+    
+    def test_pages_cover_every_row_once(self):
+        """Test walking forward and back again over rows with equal timestamps"""
+        url = f'/api/patients/{self.patient.pk}/health_data/'
+        pages, last = self.walk(url, {'page_size': 7})
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 4])
+        self.assertEqual(sum(pages, []), [reading.pk for reading in self.newest_first])
+        self.assertIsNone(self.client.get(url, {'page_size': 7}).data['previous'])
+        
+        back, first = self.walk(last.data['previous'], {}, direction='previous')
+        self.assertEqual(back, pages[-2::-1])
+        self.assertIsNotNone(first.data['next'])
+    
+    def test_alert_list_and_time_range(self):
+        """Test since (inclusive) and until (exclusive) on the alert list"""
+        since = (self.start + timedelta(minutes=3)).isoformat()
+        until = (self.start + timedelta(minutes=8)).isoformat()
+        pages, _ = self.walk('/api/alerts/', {'since': since, 'until': until, 'page_size': 4})
+        expected = [reading.pk for reading in self.newest_first
+                    if self.start + timedelta(minutes=3) <= reading.timestamp < self.start + timedelta(minutes=8)]
+        self.assertEqual(len(expected), 10)
+        self.assertEqual([Alert.objects.get(pk=pk).health_data_id for pk in sum(pages, [])], expected)
+        
+        url = f'/api/patients/{self.patient.pk}/alerts/'
+        self.assertEqual(len(self.client.get(url, {'until': '2024-01-01T00:02:00'}).data['results']), 4)
+    
+    def test_bad_parameters(self):
+        """Test that malformed datetimes, page sizes and cursors are rejected"""
+        url = f'/api/patients/{self.patient.pk}/health_data/'
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'page_size': 'all'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, status.HTTP_404_NOT_FOUND)
+    
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+    def test_deep_page_seeks_the_index(self):
+        """Test that a later page is a range scan of the index, with no count, offset or sort"""
+        url = f'/api/patients/{self.patient.pk}/health_data/'
+        next_url = self.client.get(url, {'page_size': 5}).data['next']
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(next_url).status_code, status.HTTP_200_OK)
+        sql = context.captured_queries[-1]['sql']
+        self.assertEqual(len(context), 2)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT', sql)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX api_health_patient_ts_idx (patient_id=? AND timestamp<?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class HealthDataRollupTest(QueryBudgetMixin, APITestCase):
+    """Test that the rollups match the raw samples and back the trends endpoint"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(name="Rollup Patient", age=70, gender="MALE", user_id="rollup123")
+        # Three hours of samples every 20 seconds, across midnight
+        self.start = datetime(2024, 3, 1, 22, 30, tzinfo=dt_timezone.utc)
+        rng = np.random.default_rng(0)
+        self.samples = [{
+            'user_id': 'rollup123', 'timestamp': (self.start + timedelta(seconds=20 * i)).isoformat(),
+            'heart_rate': float(rng.uniform(60, 100)), 'spo2': float(rng.uniform(94, 99)),
+            'accelerometer_x': float(rng.normal()), 'accelerometer_y': float(rng.normal()),
+            'accelerometer_z': float(rng.normal(9.8)), 'gyroscope_x': float(rng.normal()),
+            'gyroscope_y': float(rng.normal()), 'gyroscope_z': float(rng.normal()),
+        } for i in range(540)]
+    
+    def ingest(self, samples):
+        response = self.client.post('/api/health-data/batch/', samples, format='json')
+        self.assertEqual(response.data['stored'], len(samples))
+    
+    def expected_rollups(self):
+        """Rollups computed one sample at a time from the stored rows"""
+        expected = {}
+        rows = HealthData.objects.order_by('timestamp', 'id').values_list(*RAW_FIELDS)
+        for patient_id, timestamp, heart_rate, spo2, temperature, ax, ay, az, gx, gy, gz in rows:
+            values = {'heart_rate': heart_rate, 'spo2': spo2, 'temperature': temperature,
+                      'acc_magnitude': (ax ** 2 + ay ** 2 + az ** 2) ** 0.5,
+                      'gyro_magnitude': (gx ** 2 + gy ** 2 + gz ** 2) ** 0.5}
+            for resolution in [60, 3600, 86400]:
+                start = datetime.fromtimestamp(timestamp.timestamp() // resolution * resolution, tz=dt_timezone.utc)
+                bucket = expected.setdefault((patient_id, resolution, start), {'count': 0})
+                bucket['count'] += 1
+                for metric, value in values.items():
+                    if value is None:
+                        continue
+                    bucket.setdefault(metric, []).append(value)
+                    bucket[f'{metric}_last'] = value
+        return expected
+    
+    def assertRollupsMatchSamples(self):
+        expected = self.expected_rollups()
+        stored = {(rollup.patient_id, rollup.resolution, rollup.bucket_start): rollup
+                  for rollup in HealthDataRollup.objects.all()}
+        self.assertEqual(set(stored), set(expected))
+        for key, bucket in expected.items():
+            rollup = stored[key]
+            self.assertEqual(rollup.count, bucket['count'])
+            for metric in ROLLUP_METRICS:
+                values = bucket.get(metric, [])
+                if not values:
+                    self.assertIsNone(getattr(rollup, f'{metric}_min'))
+                    continue
+                self.assertAlmostEqual(getattr(rollup, f'{metric}_min'), min(values))
+                self.assertAlmostEqual(getattr(rollup, f'{metric}_max'), max(values))
+                self.assertAlmostEqual(getattr(rollup, f'{metric}_sum'), sum(values), places=6)
+                self.assertAlmostEqual(getattr(rollup, f'{metric}_last'), bucket[f'{metric}_last'])
+    
+    def test_ingest_keeps_rollups_current(self):
+        """Test batches that arrive out of order, then a single sample, then a rebuild"""
+        self.ingest(self.samples[270:])
+        self.ingest(self.samples[:270])
+        self.assertEqual(HealthDataRollup.objects.filter(resolution=HealthDataRollup.MINUTE).count(), 180)
+        self.assertEqual(HealthDataRollup.objects.filter(resolution=HealthDataRollup.HOUR).count(), 4)
+        self.assertEqual(HealthDataRollup.objects.filter(resolution=HealthDataRollup.DAY).count(), 2)
+        
+        single = dict(self.samples[0])
+        del single['timestamp']
+        self.assertEqual(self.client.post('/api/health-data/', single, format='json').status_code, status.HTTP_200_OK)
+        self.assertRollupsMatchSamples()
+        
+        HealthDataRollup.objects.update(count=0)
+        self.assertEqual(rebuild_rollups(chunk_size=100), 541)
+        self.assertRollupsMatchSamples()
+    
+    def test_aggregate_optional_temperature(self):
+        """Test that missing temperatures are left out of the temperature summary"""
+        records = [(self.patient.pk, self.start + timedelta(seconds=i), 70.0, 97.0, temperature, 0, 0, 9.8, 0, 0, 0)
+                   for i, temperature in enumerate([36.5, None, 37.5, None])]
+        minute = [rollup for rollup in aggregate(records) if rollup.resolution == HealthDataRollup.MINUTE][0]
+        self.assertEqual((minute.count, minute.temperature_count), (4, 2))
+        self.assertEqual((minute.temperature_min, minute.temperature_max, minute.temperature_sum), (36.5, 37.5, 74.0))
+        self.assertIsNone(minute.temperature_last)
+        self.assertAlmostEqual(minute.acc_magnitude_last, 9.8)
+    
+    def test_rebuild_command(self):
+        """Test rebuilding one patient's day, leaving other days and patients alone"""
+        with override_settings(HEALTH_ROLLUPS_ON_INGEST=False):
+            self.ingest(self.samples)
+        self.assertFalse(HealthDataRollup.objects.exists())
+        call_command('rebuild_rollups', '--patient', 'rollup123', '--since', '2024-03-02', stdout=open(os.devnull, 'w'))
+        self.assertEqual(set(HealthDataRollup.objects.values_list('bucket_start', flat=True).filter(resolution=86400)),
+                         {datetime(2024, 3, 2, tzinfo=dt_timezone.utc)})
+        call_command('rebuild_rollups', stdout=open(os.devnull, 'w'))
+        self.assertRollupsMatchSamples()
+    
+    def test_trends_endpoint(self):
+        """Test that the endpoint picks the finest resolution within max_points and reads only rollups"""
+        self.ingest(self.samples)
+        url = f'/api/patients/{self.patient.pk}/trends/'
+        window = {'since': self.start.isoformat(), 'until': (self.start + timedelta(hours=3)).isoformat()}
+        with self.assertMaxQueries(2):
+            response = self.client.get(url, window)
+        self.assertEqual(response.data['resolution'], 'minute')
+        self.assertEqual(len(response.data['buckets']), 180)
+        
+        response = self.client.get(url, dict(window, max_points=10))
+        self.assertEqual(response.data['resolution'], 'hour')
+        buckets = response.data['buckets']
+        self.assertEqual([bucket['count'] for bucket in buckets], [90, 180, 180, 90])
+        first_hour = [sample['heart_rate'] for sample in self.samples[:90]]
+        self.assertAlmostEqual(buckets[0]['heart_rate']['mean'], sum(first_hour) / 90)
+        self.assertEqual(buckets[0]['heart_rate']['last'], first_hour[-1])
+        self.assertIsNone(buckets[0]['temperature']['mean'])
+        
+        response = self.client.get(url, dict(window, resolution='day'))
+        self.assertEqual([bucket['count'] for bucket in response.data['buckets']], [270, 270])
+        # A week-long view reads hourly rollups
+        self.assertEqual(self.client.get(url, {'until': window['until']}).data['resolution'], 'hour')
+        
+        for params in [{'resolution': 'second'}, {'since': 'yesterday'}, {'max_points': 'many'},
+                       {'since': window['until'], 'until': window['since']}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def reference_lttb(x, y, points):
+    """LTTB one sample at a time, as in the original description"""
+    n = len(x)
+    every = (n - 2) / (points - 2)
+    selected = [0]
+    for bucket in range(points - 2):
+        start, end = int(bucket * every) + 1, int((bucket + 1) * every) + 1
+        next_start, next_end = end, min(int((bucket + 2) * every) + 1, n)
+        if bucket == points - 3:
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x = sum(x[next_start:next_end]) / (next_end - next_start)
+            next_y = sum(y[next_start:next_end]) / (next_end - next_start)
+        ax, ay = x[selected[-1]], y[selected[-1]]
+        areas = [abs((ax - next_x) * (y[i] - ay) - (ax - x[i]) * (next_y - ay)) for i in range(start, end)]
+        selected.append(start + areas.index(max(areas)))
+    return selected + [n - 1]
+
+
+class LttbTest(TestCase):
+    """Test the vectorized LTTB downsampler"""
+    
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for n, points in [(10, 3), (100, 7), (1000, 50), (1001, 64), (5000, 999)]:
+            with self.subTest(n=n, points=points):
+                x = np.sort(rng.uniform(0, 1000, n))
+                y = np.cumsum(rng.normal(size=n))
+                self.assertEqual(lttb(x, y, points).tolist(), reference_lttb(x - x[0], y, points))
+    
+    def test_keeps_peaks(self):
+        y = np.full(10000, 70.0)
+        y[4321], y[7000] = 180.0, 30.0
+        kept = lttb(np.arange(10000), y, 20)
+        self.assertEqual(len(kept), 20)
+        self.assertIn(4321, kept)
+        self.assertIn(7000, kept)
+    
+    def test_short_series_and_bad_points(self):
+        self.assertEqual(lttb(np.arange(5), np.arange(5), 10).tolist(), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            lttb(np.arange(5), np.arange(5), 2)
+
+
+class DownsampledHealthDataTest(APITestCase):
+    """Test the ?points= mode of the patient health data endpoint"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(name="Chart Patient", age=68, gender="FEMALE", user_id="chart123")
+        self.start = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        heart_rates = 70 + np.sin(np.arange(3000) / 100.0) * 5
+        heart_rates[1234] = 165.0
+        HealthData.objects.bulk_create([HealthData(
+            patient=self.patient, timestamp=self.start + timedelta(seconds=i), heart_rate=float(heart_rate), spo2=97.0,
+            accelerometer_x=0.0, accelerometer_y=3.0, accelerometer_z=4.0, gyroscope_x=0.0, gyroscope_y=0.0,
+            gyroscope_z=0.0, temperature=36.6 if i % 10 == 0 else None) for i, heart_rate in enumerate(heart_rates)])
+        self.url = f'/api/patients/{self.patient.pk}/health_data/'
+        self.window = {'since': self.start.isoformat(), 'until': (self.start + timedelta(hours=1)).isoformat()}
+    
+    def test_columnar_series(self):
+        response = self.client.get(self.url, dict(self.window, points=100))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['samples'], 3000)
+        self.assertEqual(set(response.data['series']), set(ROLLUP_METRICS))
+        heart_rate = response.data['series']['heart_rate']
+        start_ms = int(self.start.timestamp() * 1000)
+        self.assertEqual(len(heart_rate['timestamps']), 100)
+        self.assertEqual(heart_rate['timestamps'][0], start_ms)
+        self.assertEqual(heart_rate['timestamps'][-1], start_ms + 2999 * 1000)
+        self.assertIn(165.0, heart_rate['values'])
+        self.assertEqual(set(response.data['series']['acc_magnitude']['values']), {5.0})
+        # Only the 300 readings with a temperature are downsampled
+        temperature = response.data['series']['temperature']
+        self.assertEqual(len(temperature['timestamps']), 100)
+        self.assertTrue(all((timestamp - start_ms) % 10000 == 0 for timestamp in temperature['timestamps']))
+    
+    def test_range_and_metrics(self):
+        window = {'since': (self.start + timedelta(seconds=100)).isoformat(),
+                  'until': (self.start + timedelta(seconds=150)).isoformat()}
+        response = self.client.get(self.url, dict(window, points=500, metrics='heart_rate,spo2'))
+        self.assertEqual(list(response.data['series']), ['heart_rate', 'spo2'])
+        self.assertEqual(len(response.data['series']['spo2']['values']), 50)
+        # The default range is the day up to now
+        self.assertEqual(self.client.get(self.url, {'points': 10}).data['samples'], 0)
+        self.assertIn('results', self.client.get(self.url).data)
+    
+    def test_long_ranges_stream_in_blocks(self):
+        """Test that blocks and chunks bound what is in memory, and one block matches a single pass"""
+        repository = HealthDataRepository()
+        since, until = self.start, self.start + timedelta(hours=1)
+        chunks = list(repository.iter_columns(self.patient.pk, since, until, chunk_size=700))
+        self.assertEqual([len(chunk['id']) for chunk in chunks], [700] * 4 + [200])
+        
+        single = downsample_series(repository, self.patient.pk, since, until, 100)
+        columns = repository.columns(self.patient.pk, since, until)
+        keep = lttb(columns['timestamp'] // 1000, columns['heart_rate'], 100)
+        self.assertEqual(single['series']['heart_rate']['values'], columns['heart_rate'][keep].tolist())
+        
+        blocks = downsample_series(repository, self.patient.pk, since, until, 100, block_samples=500)
+        self.assertEqual(blocks['samples'], 3000)
+        heart_rate = blocks['series']['heart_rate']
+        self.assertEqual(len(heart_rate['values']), 100)
+        self.assertEqual(heart_rate['timestamps'][-1] - heart_rate['timestamps'][0], 2999 * 1000)
+        self.assertIn(165.0, heart_rate['values'])
+    
+    def test_bad_parameters(self):
+        for params in [{'points': 'many'}, {'points': 2}, {'points': 10 ** 6}, {'points': 10, 'metrics': 'pulse'},
+                       {'points': 10, 'since': 'yesterday'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HealthDataArchiveTest(APITestCase):
+    """Test that archived health data leaves the table and still reads back unchanged"""
+    
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        archive_settings = override_settings(HEALTH_DATA_ARCHIVE_DIR=archive_dir.name)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        self.archive = HealthDataArchive()
+        
+        self.patient = Patient.objects.create(name="Archive Patient", age=82, gender="MALE", user_id="archive123")
+        # Three days of readings every 15 minutes, 40 days ago, and a recent hour
+        old_start = day_start(timezone.now()) - timedelta(days=40)
+        moments = [old_start + timedelta(minutes=15 * i) for i in range(3 * 96)]
+        moments += [timezone.now() - timedelta(minutes=i + 1) for i in range(60)]
+        HealthData.objects.bulk_create([HealthData(
+            patient=self.patient, timestamp=moment, heart_rate=60.0 + i % 40, spo2=95.5, accelerometer_x=0.1 * i,
+            accelerometer_y=0.0, accelerometer_z=9.8, gyroscope_x=0.0, gyroscope_y=0.01, gyroscope_z=0.0,
+            temperature=36.8 if i % 3 == 0 else None, systolic_bp=120 if i % 5 == 0 else None, diastolic_bp=None,
+            respiratory_rate=None) for i, moment in enumerate(moments)])
+        self.alerted = HealthData.objects.filter(patient=self.patient).order_by('timestamp')[10]
+        Alert.objects.create(patient=self.patient, type='VITALS', message="Old alert", health_data=self.alerted)
+        self.url = f'/api/patients/{self.patient.pk}/health_data/'
+    
+    def walk(self, params=None, direction='next'):
+        """Every result row, following the links in direction"""
+        rows = []
+        response = self.client.get(self.url, params or {})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            rows += response.data['results']
+            if response.data[direction] is None:
+                return rows, response
+            response = self.client.get(response.data[direction])
+    
+    def test_archive_moves_old_days(self):
+        """Test that old days go to the archive, except readings with alerts, and reruns change nothing"""
+        before = list(HealthData.objects.filter(patient=self.patient).order_by('timestamp', 'id')
+                      .values_list(*ARCHIVE_FIELDS))
+        totals = archive_health_data(retention_days=30)
+        self.assertEqual(totals, {'patients': 1, 'days': 3, 'samples': 287})
+        self.assertEqual(HealthData.objects.count(), 61)
+        self.assertEqual(Alert.objects.get().health_data_id, self.alerted.id)
+        self.assertEqual(len(self.archive.days(self.patient.pk)), 3)
+        
+        archived = self.archive.read(self.patient.pk)
+        expected = rows_to_columns([row for row in before[:288] if row[0] != self.alerted.id])
+        for field in ARCHIVE_FIELDS:
+            np.testing.assert_array_equal(archived[field], expected[field], err_msg=field)
+        self.assertEqual(archive_health_data(retention_days=30)['samples'], 0)
+    
+    def test_reads_fold_in_archive(self):
+        """Test that pages, ranges and downsampled series read the same before and after archiving"""
+        since = (day_start(timezone.now()) - timedelta(days=39, hours=3)).isoformat()
+        reads = [({'page_size': 37}, 'next'), ({'page_size': 50, 'since': since}, 'next')]
+        before = [self.walk(params, direction)[0] for params, direction in reads]
+        chart = {'points': 50, 'since': since, 'until': (timezone.now() + timedelta(hours=1)).isoformat()}
+        series_before = self.client.get(self.url, chart).data
+        archive_health_data(retention_days=30)
+        
+        after = [self.walk(params, direction)[0] for params, direction in reads]
+        self.assertEqual(len(after[0]), 348)
+        self.assertEqual(after, before)
+        self.assertEqual(self.client.get(self.url, chart).data, series_before)
+        
+        # Back from the oldest page to the newest
+        _, oldest = self.walk({'page_size': 37})
+        pages = []
+        response = self.client.get(oldest.data['previous'])
+        while response is not None:
+            pages.insert(0, response.data['results'])
+            response = self.client.get(response.data['previous']) if response.data['previous'] else None
+        self.assertEqual(sum(pages, []) + oldest.data['results'], before[0])
+    
+    def test_recent_pages_skip_the_archive(self):
+        """Test that a full page of rows newer than every archived day opens no day files"""
+        archive_health_data(retention_days=30)
+        with mock.patch.object(HealthDataArchive, 'read_day', autospec=True,
+                               side_effect=HealthDataArchive.read_day) as read_day:
+            response = self.client.get(self.url, {'page_size': 37})
+            self.assertEqual(len(response.data['results']), 37)
+            read_day.assert_not_called()
+            # The table runs out on the second page, which continues into the archive
+            response = self.client.get(response.data['next'])
+            self.assertEqual(len(response.data['results']), 37)
+            self.assertTrue(read_day.called)
+    
+    def test_rows_in_both_places_are_read_once(self):
+        """Test an archived day whose rows were not deleted, as after a failed run"""
+        old_rows = HealthData.objects.filter(patient=self.patient, timestamp__lt=timezone.now() - timedelta(days=30))
+        first_day = day_start(old_rows.order_by('timestamp').first().timestamp)
+        day_rows = old_rows.filter(timestamp__lt=first_day + timedelta(days=1)).order_by('timestamp', 'id')
+        self.archive.write_day(self.patient.pk, first_day.date(), rows_to_columns(day_rows.values_list(*ARCHIVE_FIELDS)))
+        rows, _ = self.walk({'page_size': 100})
+        self.assertEqual(len(rows), 348)
+        self.assertEqual(len({row['id'] for row in rows}), 348)
+    
+    def test_rollup_rebuild_reads_archive(self):
+        """Test that rollups rebuilt after archiving match those rebuilt before"""
+        def snapshot():
+            return list(HealthDataRollup.objects.order_by('resolution', 'bucket_start').values_list(
+                'resolution', 'bucket_start', 'count', 'heart_rate_sum', 'temperature_count', 'acc_magnitude_max'))
+        rebuild_rollups()
+        before = snapshot()
+        archive_health_data(retention_days=30)
+        self.assertEqual(rebuild_rollups(), 348)
+        self.assertEqual(snapshot(), before)
+    
+    def test_command(self):
+        """Test the dry run and a real run of the management command"""
+        out = StringIO()
+        call_command('archive_health_data', '--dry-run', '--patient', 'archive123', stdout=out)
+        self.assertIn("Would archive 287 samples (3 patient-days, 1 patients)", out.getvalue())
+        self.assertEqual(HealthData.objects.count(), 348)
+        call_command('archive_health_data', '--days', '60', stdout=out)
+        self.assertEqual(HealthData.objects.count(), 348)
+        call_command('archive_health_data', stdout=out)
+        self.assertEqual(HealthData.objects.count(), 61)
+    
+    def test_reads_legacy_npz_days(self):
+        """Test that .npz day files from before the codec are read, and replaced when their day is written"""
+        archive_health_data(retention_days=30)
+        expected = self.archive.read(self.patient.pk)
+        for day in self.archive.days(self.patient.pk):
+            columns = self.archive.read_day(self.patient.pk, day)
+            os.remove(self.archive.day_path(self.patient.pk, day))
+            with open(self.archive.day_path(self.patient.pk, day, '.npz'), 'wb') as output:
+                np.savez_compressed(output, **columns)
+        archived = self.archive.read(self.patient.pk)
+        for field in ARCHIVE_FIELDS:
+            np.testing.assert_array_equal(archived[field], expected[field], err_msg=field)
+        
+        first_day = self.archive.days(self.patient.pk)[0]
+        self.archive.write_day(self.patient.pk, first_day, rows_to_columns([]))
+        self.assertTrue(os.path.exists(self.archive.day_path(self.patient.pk, first_day)))
+        self.assertFalse(os.path.exists(self.archive.day_path(self.patient.pk, first_day, '.npz')))
+        self.assertEqual(len(self.archive.days(self.patient.pk)), 3)
+        np.testing.assert_array_equal(self.archive.read(self.patient.pk)['id'], expected['id'])
+
+
+class HealthDataStreamTest(TransactionTestCase):
+    """Test WebSocket streaming ingestion"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            name="Stream Patient",
+            age=72,
+            gender="MALE",
+            user_id="stream123"
+        )
+        self.sample = {
+            'heart_rate': 150.0,
+            'spo2': 85.0,
+            'accelerometer_x': 0.1,
+            'accelerometer_y': 0.2,
+            'accelerometer_z': 9.8,
+            'gyroscope_x': 0.5,
+            'gyroscope_y': -0.2,
+            'gyroscope_z': 0.1
+        }
+    
+    def _communicator(self, user_id):
+        return ApplicationCommunicator(health_data_stream, {
+            'type': 'websocket',
+            'path': f'/ws/health-data/{user_id}/',
+        })
+    
+    async def test_stream_returns_verdicts(self):
+        """Test that streamed samples are stored and answered on the same connection"""
+        communicator = self._communicator(self.patient.user_id)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+        
+        await communicator.send_input({
+            'type': 'websocket.receive',
+            'text': json.dumps({'seq': 7, 'samples': [self.sample, self.sample]})
+        })
+        reply = json.loads((await communicator.receive_output(5))['text'])
+        self.assertEqual(reply['type'], 'verdict')
+        self.assertEqual(reply['seq'], 7)
+        self.assertEqual(len(reply['results']), 2)
+        self.assertTrue(reply['results'][0]['vitals_assessment']['is_anomaly'])
+        self.assertEqual(reply['results'][0]['alerts_created'][0]['type'], 'VITALS')
+        
+        await communicator.send_input({'type': 'websocket.receive', 'text': 'not json'})
+        reply = json.loads((await communicator.receive_output(5))['text'])
+        self.assertEqual(reply['type'], 'error')
+        
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+        
+        count = await HealthData.objects.filter(patient=self.patient).acount()
+        self.assertEqual(count, 2)
+    
+    async def test_stream_closes_old_connections(self):
+        """Test that the worker thread's database connections are checked around every message"""
+        communicator = self._communicator(self.patient.user_id)
+        await communicator.send_input({'type': 'websocket.connect'})
+        await communicator.receive_output(5)
+        with mock.patch('api.streaming.close_old_connections') as close_old:
+            for seq in range(2):
+                await communicator.send_input({'type': 'websocket.receive',
+                                               'text': json.dumps({'seq': seq, 'samples': [self.sample]})})
+                self.assertEqual(json.loads((await communicator.receive_output(5))['text'])['seq'], seq)
+        self.assertEqual(close_old.call_count, 4)
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+    
+    async def test_stream_accepts_frames(self):
+        """Test that a binary frame is stored for the stream's patient and its sequence echoed"""
+        communicator = self._communicator(self.patient.user_id)
+        await communicator.send_input({'type': 'websocket.connect'})
+        await communicator.receive_output(5)
+        await communicator.send_input({'type': 'websocket.receive',
+                                       'bytes': encode_frame('someone-else', [self.sample] * 3, sequence=11)})
+        reply = json.loads((await communicator.receive_output(5))['text'])
+        self.assertEqual((reply['type'], reply['seq'], len(reply['results'])), ('verdict', 11, 3))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+        self.assertEqual(await HealthData.objects.filter(patient=self.patient).acount(), 3)
+    
+    @override_settings(HEALTH_DATA_BATCH_MAX_SAMPLES=2)
+    async def test_stream_caps_samples_per_message(self):
+        """Test that messages over the batch limit get an error and store nothing"""
+        communicator = self._communicator(self.patient.user_id)
+        await communicator.send_input({'type': 'websocket.connect'})
+        await communicator.receive_output(5)
+        for message in ({'text': json.dumps({'seq': 1, 'samples': [self.sample] * 3})},
+                        {'bytes': encode_frame(self.patient.user_id, [self.sample] * 3, sequence=2)}):
+            await communicator.send_input(dict(message, type='websocket.receive'))
+            reply = json.loads((await communicator.receive_output(5))['text'])
+            self.assertEqual(reply['type'], 'error')
+            self.assertIn('maximum of 2 samples', reply['error'])
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps([self.sample] * 2)})
+        self.assertEqual(json.loads((await communicator.receive_output(5))['text'])['type'], 'verdict')
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+        self.assertEqual(await HealthData.objects.filter(patient=self.patient).acount(), 2)
+    
+    async def test_stream_rejects_unknown_patient(self):
+        """Test that a stream for an unknown user_id is closed"""
+        communicator = self._communicator('nobody')
+        await communicator.send_input({'type': 'websocket.connect'})
+        output = await communicator.receive_output(5)
+        self.assertEqual(output['type'], 'websocket.close')
+        self.assertEqual(output['code'], CLOSE_NOT_FOUND)
+
+
+class WireFormatTest(APITestCase):
+    """Test the binary sample frame format and its parser"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            name="Frame Patient",
+            age=67,
+            gender="FEMALE",
+            user_id="frame123"
+        )
+        self.samples = [
+            {
+                'heart_rate': 70.0 + i,
+                'spo2': 97.0,
+                'accelerometer_x': 0.1 * i,
+                'accelerometer_y': -0.2,
+                'accelerometer_z': 9.8,
+                'gyroscope_x': 0.5,
+                'gyroscope_y': -0.25,
+                'gyroscope_z': 0.125
+            }
+            for i in range(50)
+        ]
+    
+    def test_round_trip_and_size(self):
+        """Test that frames decode to the encoded values and are much smaller than JSON"""
+        frame_bytes = encode_frame(self.patient.user_id, self.samples, sequence=42,
+                                   start_time_ms=1735725600000, sample_interval_ms=20)
+        frame = decode_frame(frame_bytes)
+        self.assertEqual(frame.user_id, self.patient.user_id)
+        self.assertEqual(frame.sequence, 42)
+        self.assertEqual(frame.values.shape, (len(FRAME_FIELDS), 50))
+        
+        decoded = frame_to_samples(frame)
+        for original, sample in zip(self.samples, decoded):
+            for field in FRAME_FIELDS:
+                self.assertAlmostEqual(original[field], sample[field], places=5)
+        self.assertEqual(decoded[1]['timestamp'], '2025-01-01T10:00:00.020000+00:00')
+        
+        json_size = len(json.dumps([dict(s, user_id=self.patient.user_id) for s in self.samples]))
+        self.assertGreaterEqual(json_size / len(frame_bytes), 5)
+    
+    def test_frame_posted_to_ingest_endpoints(self):
+        """Test that both ingest endpoints accept binary frames"""
+        single = encode_frame(self.patient.user_id, self.samples[:1])
+        response = self.client.post('/api/health-data/', single, content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        batch = encode_frame(self.patient.user_id, self.samples)
+        response = self.client.post('/api/health-data/batch/', batch, content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stored'], 50)
+        self.assertEqual(HealthData.objects.filter(patient=self.patient).count(), 51)
+        
+        response = self.client.post('/api/health-data/batch/', batch[:-3], content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_single_sample_frame_keeps_its_timestamp(self):
+        """Test that a timed single-sample frame is stored at its start time, not at arrival"""
+        single = encode_frame(self.patient.user_id, self.samples[:1], start_time_ms=1735725600000)
+        response = self.client.post('/api/health-data/', single, content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stored = HealthData.objects.get(id=response.data['health_data_id'])
+        self.assertEqual(stored.timestamp, datetime(2025, 1, 1, 10, 0, tzinfo=dt_timezone.utc))
+    
+    def test_non_finite_values_rejected(self):
+        """Test that frames holding NaN or infinite values are rejected before anything is stored"""
+        for bad in (np.nan, np.inf, -np.inf):
+            samples = [dict(sample) for sample in self.samples[:3]]
+            samples[1]['gyroscope_y'] = bad
+            frame = encode_frame(self.patient.user_id, samples)
+            with self.assertRaises(FrameError):
+                decode_frame(frame)
+            for url in ('/api/health-data/', '/api/health-data/batch/'):
+                response = self.client.post(url, frame, content_type=FRAME_MEDIA_TYPE)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('non-finite', response.data['error'])
+        self.assertFalse(HealthData.objects.filter(patient=self.patient).exists())
+    
+    def test_long_user_ids(self):
+        """Test that any valid Patient.user_id fits in a frame, including non-ASCII ones"""
+        patient = Patient.objects.create(name="Long Id", age=70, gender="MALE", user_id='wearable-é' + 'x' * 89)
+        frame = decode_frame(encode_frame(patient.user_id, self.samples[:3], sequence=5))
+        self.assertEqual(frame.user_id, patient.user_id)
+        self.assertEqual(frame.values.shape, (len(FRAME_FIELDS), 3))
+        
+        response = self.client.post('/api/health-data/batch/', encode_frame(patient.user_id, self.samples),
+                                    content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.data['stored'], 50)
+        self.assertEqual(HealthData.objects.filter(patient=patient).count(), 50)
+    
+    def test_version_1_frames(self):
+        """Test that frames with the fixed 16-byte id field of version 1 are still accepted"""
+        values = np.array([[s[field] for field in FRAME_FIELDS] for s in self.samples], dtype='<f4')
+        header = V1_HEADER_STRUCT.pack(b'HMSF', 1, 0, 50, 9, self.patient.user_id.encode('ascii'), 1735725600000, 20)
+        frame = decode_frame(header + np.ascontiguousarray(values.T).tobytes())
+        self.assertEqual((frame.version, frame.user_id, frame.sequence), (1, self.patient.user_id, 9))
+        np.testing.assert_array_equal(frame.values, values.T)
+        
+        response = self.client.post('/api/health-data/batch/', header + np.ascontiguousarray(values.T).tobytes(),
+                                    content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.data['stored'], 50)
+    
+    def test_frames_skip_sample_dictionaries(self):
+        """Test that frames are stored from their arrays, with the same rows as the JSON path"""
+        frame = encode_frame(self.patient.user_id, self.samples, start_time_ms=1735725600000, sample_interval_ms=20)
+        with mock.patch('api.views._validate_batch_sample') as validate:
+            response = self.client.post('/api/health-data/batch/', frame, content_type=FRAME_MEDIA_TYPE)
+        validate.assert_not_called()
+        self.assertEqual(response.data['stored'], 50)
+        rows = HealthData.objects.filter(patient=self.patient).order_by('timestamp')
+        self.assertEqual(rows[1].timestamp, datetime(2025, 1, 1, 10, 0, 0, 20000, tzinfo=dt_timezone.utc))
+        self.assertAlmostEqual(rows[49].accelerometer_x, 4.9, places=5)
+        
+        response = self.client.post('/api/health-data/batch/', encode_frame('nobody', self.samples[:2]),
+                                    content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertIn('not found', response.data['results'][0]['error'])
+
+
+class TimeseriesCodecTest(TestCase):
+    """Test the delta/XOR time-series codec"""
+    
+    def assertBitEqual(self, decoded, original):
+        """Equal bit for bit, so NaN, -0.0 and the last ulp all count"""
+        original = np.asarray(original)
+        self.assertEqual(decoded.dtype, original.dtype)
+        np.testing.assert_array_equal(decoded.view(np.uint64), original.view(np.uint64))
+    
+    @unittest.skipUnless(ACC_GYR_CSV.exists(), 'acc_gyr.csv is not available')
+    def test_acc_gyr_round_trip_and_ratio(self):
+        """Test that every method round-trips acc_gyr.csv and quantizing compresses it at least 5x"""
+        data = np.genfromtxt(ACC_GYR_CSV, delimiter=',', names=True)
+        columns = {name: np.ascontiguousarray(data[name]) for name in
+                   ('xAcc', 'yAcc', 'zAcc', 'xGyro', 'yGyro', 'zGyro')}
+        raw_size = sum(column.nbytes for column in columns.values())
+        
+        sizes = {}
+        for label, method in (('xor', 'xor'), ('quantize', ('quantize', 2)), ('auto', 'auto')):
+            block = encode_block(columns, {name: method for name in columns})
+            decoded = decode_block(block)
+            self.assertEqual(list(decoded), list(columns))
+            for name, column in columns.items():
+                self.assertBitEqual(decoded[name], column)
+            sizes[label] = len(block)
+        self.assertGreater(raw_size / sizes['xor'], 2)
+        self.assertGreater(raw_size / sizes['quantize'], 5)
+        self.assertEqual(sizes['auto'], sizes['quantize'])
+        self.assertEqual(choose_method(columns['xAcc']), ('quantize', 2))
+    
+    def test_timestamps(self):
+        """Test that 50 Hz timestamps round-trip and compress at least 20x, with millisecond jitter"""
+        rng = np.random.default_rng(7)
+        jitter = rng.choice([-1, 0, 1], 50000, p=[0.05, 0.9, 0.05])
+        timestamps = (1735725600000 + np.arange(50000) * 20 + jitter).astype(np.int64) * 1000
+        block = encode_block({'timestamp': timestamps})
+        self.assertBitEqual(decode_block(block)['timestamp'], timestamps)
+        self.assertGreater(timestamps.nbytes / len(block), 20)
+        regular = encode_block({'timestamp': timestamps - jitter * 1000})
+        self.assertGreater(timestamps.nbytes / len(regular), 1000)
+    
+    def test_edge_values(self):
+        """Test special floats, extreme integers, NaN gaps and empty columns"""
+        floats = np.array([0.0, -0.0, np.inf, -np.inf, np.nan, 5e-324, -1.7976931348623157e308, 1.5, 1.5])
+        integers = np.array([np.iinfo(np.int64).min, np.iinfo(np.int64).max, 0, -1, 1, 0, 7, 7, 7], dtype=np.int64)
+        decoded = decode_block(encode_block({'floats': floats, 'integers': integers}))
+        self.assertBitEqual(decoded['floats'], floats)
+        self.assertBitEqual(decoded['integers'], integers)
+        self.assertEqual(choose_method(floats), ('xor', 0))
+        
+        temperatures = np.array([np.nan, 36.8, np.nan, np.nan, 37.25, np.nan])
+        self.assertEqual(choose_method(temperatures), ('quantize', 2))
+        self.assertBitEqual(decode_block(encode_block({'temperature': temperatures}))['temperature'], temperatures)
+        # Lossy when the values have more decimals than kept
+        rounded = decode_block(encode_block({'x': np.array([0.123456])}, {'x': ('quantize', 3)}))['x']
+        self.assertEqual(rounded.tolist(), [0.123])
+        
+        empty = decode_block(encode_block({'timestamp': np.zeros(0, dtype=np.int64), 'x': np.zeros(0)}))
+        self.assertEqual({name: len(column) for name, column in empty.items()}, {'timestamp': 0, 'x': 0})
+        with self.assertRaises(ValueError):
+            encode_block({'a': np.zeros(2), 'b': np.zeros(3)})
+    
+    def test_corrupt_blocks(self):
+        """Test that truncated or corrupt bytes raise CodecError"""
+        block = encode_block({'timestamp': np.arange(100, dtype=np.int64), 'x': np.linspace(0, 1, 100)})
+        for corrupt in (b'', b'XXXX' + block[4:], block[:-5], block[:20], block[:-1] + b'\xff'):
+            with self.assertRaises(CodecError):
+                decode_block(corrupt)
+
+
+@override_settings(SENSOR_WINDOW_STORAGE=True, SENSOR_WINDOW_SAMPLES=50, SENSOR_WINDOW_SAMPLE_RATE=50.0)
+class SensorWindowStorageTest(APITestCase):
+    """Test that batch ingest packs IMU readings into SensorWindow rows"""
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(name="Window Patient", age=74, gender="FEMALE", user_id="window123")
+        rng = np.random.default_rng(3)
+        self.motion = np.round(rng.normal(0, 2, (120, 6)), 3)
+        # Vitals once a second, IMU-only readings in between
+        self.samples = [dict(zip(IMU_FIELDS, row), heart_rate=70.0 + i // 50 if i % 50 == 0 else None,
+                             spo2=97.0 if i % 50 == 0 else None)
+                        for i, row in enumerate(self.motion.tolist())]
+        # No alerts unless a test flags readings
+        self.flagged = set()
+        for method, score in (('predict_fall_windows', 'fall_probability'),
+                              ('predict_vitals_risk_batch', 'risk_probability')):
+            patcher = mock.patch.object(views.health_predictor, method, side_effect=self.predictions(score))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def predictions(self, score):
+        """Stand-in for a batch predictor; its first argument has one entry per reading"""
+        def predict(readings, *args):
+            anomalies = np.isin(np.arange(len(readings)), list(self.flagged))
+            return {'is_anomaly': anomalies, 'window_is_anomalous': anomalies, score: anomalies.astype(float),
+                    'risk_level': np.where(anomalies, 'HIGH', 'LOW')}
+        return predict
+    
+    def post(self, samples, **frame):
+        frame = encode_frame(self.patient.user_id, samples, **frame)
+        response = self.client.post('/api/health-data/batch/', frame, content_type=FRAME_MEDIA_TYPE)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+    
+    def test_windows_hold_imu_readings(self):
+        """Test windows of 50 readings, their packed samples and summaries, and rows only for vitals"""
+        results = self.post(self.samples, start_time_ms=1735725600000, sample_interval_ms=20)
+        windows = list(SensorWindow.objects.order_by('timestamp'))
+        self.assertEqual([window.sample_count for window in windows], [50, 50, 20])
+        self.assertEqual(windows[1].timestamp, datetime(2025, 1, 1, 10, 0, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(windows[0].sample_rate, 50.0)
+        
+        stored = np.concatenate([unpack_samples(window) for window in windows], axis=1)
+        np.testing.assert_array_equal(stored, self.motion.T.astype(np.float32))
+        smv = np.sqrt((stored[:3].astype(np.float64) ** 2).sum(axis=0))
+        self.assertAlmostEqual(windows[2].smv_mean, smv[100:].mean())
+        self.assertAlmostEqual(windows[2].smv_max, smv[100:].max())
+        self.assertAlmostEqual(windows[2].smv_std, smv[100:].std(ddof=1))
+        
+        # Readings with vitals keep a complete row, IMU-only readings are only in the windows
+        rows = HealthData.objects.order_by('timestamp')
+        self.assertEqual(list(rows.values_list('heart_rate', flat=True)), [70.0, 71.0, 72.0])
+        self.assertEqual(list(rows.values_list(*IMU_FIELDS)[1]), stored[:, 50].tolist())
+        self.assertEqual(results[50]['health_data_id'], rows[1].id)
+        self.assertEqual(results[51]['sensor_window_id'], windows[1].id)
+        self.assertIsNone(results[51]['health_data_id'])
+        self.assertIsNone(results[51]['vitals_assessment'])
+        rollup = HealthDataRollup.objects.get(resolution=HealthDataRollup.MINUTE)
+        self.assertEqual(rollup.count, 3)
+        self.assertEqual(rollup.heart_rate_max, 72.0)
+        self.assertAlmostEqual(rollup.acc_magnitude_max, smv[::50].max())
+        
+        response = self.client.get(f'/api/patients/{self.patient.pk}/sensor_windows/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([window['sample_count'] for window in response.data['results']], [20, 50])
+        self.assertEqual(response.data['results'][0]['samples']['gyroscope_z'],
+                         self.motion[100:, 5].astype(np.float32).tolist())
+    
+    def test_alerts_on_imu_only_readings(self):
+        """Test that a fall on an IMU-only reading raises an alert without a HealthData row"""
+        self.flagged = {0, 7}
+        results = self.post(self.samples[:50], start_time_ms=1735725600000, sample_interval_ms=20)
+        self.assertEqual(HealthData.objects.count(), 1)
+        self.assertEqual(SensorWindow.objects.count(), 1)
+        self.assertEqual(Alert.objects.count(), 3)  # Two falls and the vitals of reading 0
+        
+        alert = Alert.objects.get(type='FALL', health_data__isnull=True)
+        self.assertEqual([created['id'] for created in results[7]['alerts_created']], [alert.id])
+        self.assertEqual(alert.timestamp, datetime(2025, 1, 1, 10, 0, 0, 140000, tzinfo=dt_timezone.utc))
+        vitals_alert = Alert.objects.get(type='VITALS')
+        self.assertEqual(vitals_alert.health_data_id, results[0]['health_data_id'])
+        self.assertEqual(vitals_alert.health_data.gyroscope_z, float(np.float32(self.samples[0]['gyroscope_z'])))
+        # One saved row, three alerts and their guardian notifications
+        self.assertEqual(FirebaseOutbox.objects.count(), 7)
+    
+    def test_imu_only_json_samples(self):
+        """Test IMU-only readings sent as JSON, to the batch and the single-sample endpoints"""
+        imu_only = {field: value for field, value in self.samples[1].items() if value is not None}
+        partial = dict(imu_only, heart_rate=72.0)
+        response = self.client.post('/api/health-data/batch/', {'user_id': self.patient.user_id,
+                                                                 'samples': [imu_only, partial]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result, error = response.data['results']
+        self.assertIsNone(result['health_data_id'])
+        self.assertEqual(error['error'], 'Missing required field: spo2')
+        
+        response = self.client.post('/api/health-data/', dict(imu_only, user_id=self.patient.user_id), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['health_data_id'])
+        self.assertIsNone(response.data['vitals_assessment'])
+        self.assertEqual(SensorWindow.objects.filter(pk=response.data['sensor_window_id']).count(), 1)
+        self.assertFalse(HealthData.objects.exists())
+    
+    def test_archive_keeps_windows(self):
+        """Test that archival moves the vitals rows and leaves the windows, the only copy of IMU-only readings"""
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        with override_settings(HEALTH_DATA_ARCHIVE_DIR=archive_dir.name):
+            start = day_start(timezone.now()) - timedelta(days=40, hours=-10)
+            self.post(self.samples, start_time_ms=int(start.timestamp() * 1000), sample_interval_ms=20)
+            totals = archive_health_data(retention_days=30)
+        self.assertEqual(totals['samples'], 3)
+        self.assertFalse(HealthData.objects.exists())
+        self.assertEqual(SensorWindow.objects.count(), 3)
+    
+    def test_gaps_and_untimed_readings(self):
+        """Test that gaps start a new window and untimed readings are spaced at the sample rate"""
+        period = 0.02
+        timestamps = np.concatenate([np.arange(10) * period, 1.0 + np.arange(5) * period])
+        timestamps[3] += 0.004  # Jitter within half a period
+        self.assertEqual(split_windows(timestamps, 50.0, 50), [(0, 10), (10, 15)])
+        self.assertEqual(split_windows(np.arange(7) * period, 50.0, 3), [(0, 3), (3, 6), (6, 7)])
+        
+        self.post(self.samples[:30])
+        window = SensorWindow.objects.get()
+        self.assertEqual(window.sample_count, 30)
+        self.assertLessEqual(window.timestamp, timezone.now() - timedelta(seconds=29 * period))
+    
+    @override_settings(SENSOR_WINDOW_STORAGE=False)
+    def test_off_by_default_keeps_rows(self):
+        """Test that without window storage every reading gets its own row"""
+        samples = [dict(sample, heart_rate=72.0, spo2=97.0) for sample in self.samples[:20]]
+        results = self.post(samples, start_time_ms=1735725600000, sample_interval_ms=20)
+        self.assertEqual(HealthData.objects.count(), 20)
+        self.assertFalse(SensorWindow.objects.exists())
+        self.assertNotIn('sensor_window_id', results[0])
+        
+        # IMU-only readings need window storage
+        results = self.post(self.samples[:2], start_time_ms=1735725600000, sample_interval_ms=20)
+        self.assertEqual(results[1], {'index': 1, 'error': 'Missing required field: heart_rate'})
+        response = self.client.post('/api/health-data/', dict(self.samples[1], user_id=self.patient.user_id),
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SensorWindowTest(TestCase):
+    """Test the incremental per-patient IMU windows"""
+    
+    def _reference_features(self, window):
+        """Window features computed directly from the samples"""
+        acc_smv = np.sqrt((window[:, :3] ** 2).sum(axis=1))
+        gyro_smv = np.sqrt((window[:, 3:] ** 2).sum(axis=1))
+        expected = {
+            'SMV_Acc_mean': acc_smv.mean(), 'SMV_Acc_std': acc_smv.std(ddof=1),
+            'SMV_Acc_min': acc_smv.min(), 'SMV_Acc_max': acc_smv.max(),
+            'SMV_Acc_median': np.median(acc_smv),
+            'SMV_Acc_iqr': np.percentile(acc_smv, 75) - np.percentile(acc_smv, 25),
+            'SMV_Gyro_mean': gyro_smv.mean(), 'SMV_Gyro_std': gyro_smv.std(ddof=1),
+            'SMV_Gyro_max': gyro_smv.max(),
+            'SMV_Gyro_iqr': np.percentile(gyro_smv, 75) - np.percentile(gyro_smv, 25),
+        }
+        for axis, col in enumerate(['xAcc', 'yAcc', 'zAcc', 'xGyro', 'yGyro', 'zGyro']):
+            expected[f'{col}_mean'] = window[:, axis].mean()
+            expected[f'{col}_std'] = window[:, axis].std(ddof=1)
+            if axis < 3:
+                expected[f'{col}_max_abs_diff'] = np.abs(np.diff(window[:, axis])).max()
+        return np.array([expected[name] for name in FALL_WINDOW_FEATURES])
+    
+    def test_incremental_features_match_full_window(self):
+        """Test that running features equal a full recomputation at every step"""
+        rng = np.random.default_rng(0)
+        rows = rng.normal(size=(3 * WINDOW_SAMPLES + 7, 6)) * [3, 3, 3, 80, 80, 80]
+        store = ImuWindowStore()
+        features, counts = store.push('p1', rows, include_quantiles=True)
+        
+        for i in [1, WINDOW_SAMPLES - 1, WINDOW_SAMPLES, 2 * WINDOW_SAMPLES + 3, len(rows) - 1]:
+            window = rows[max(0, i - WINDOW_SAMPLES + 1):i + 1]
+            self.assertEqual(counts[i], len(window))
+            np.testing.assert_allclose(features[i], self._reference_features(window), rtol=1e-9, atol=1e-9)
+    
+    def test_quantiles_with_repeated_and_missing_values(self):
+        """Test that the sorted magnitudes follow repeated values and NaN readings out of the window"""
+        rows = np.tile([[0.0, 0.0, 9.8, 1.0, 1.0, 1.0]], (WINDOW_SAMPLES + 20, 1))
+        rows[10:20, 0] = np.arange(10)
+        rows[5, 3] = np.nan
+        features, _ = ImuWindowStore().push('p1', rows, include_quantiles=True)
+        
+        self.assertTrue(np.isnan(features[WINDOW_SAMPLES, FEATURE_INDEX['SMV_Gyro_iqr']]))
+        for i in [4, WINDOW_SAMPLES + 5, len(rows) - 1]:
+            window = rows[max(0, i - WINDOW_SAMPLES + 1):i + 1]
+            if np.isnan(window).any():
+                continue
+            quantiles = [FEATURE_INDEX[name] for name in QUANTILE_FEATURES]
+            np.testing.assert_allclose(features[i, quantiles], self._reference_features(window)[quantiles],
+                                       rtol=1e-9, atol=1e-9)
+    
+    def test_multi_reading_item_keeps_earlier_fall(self):
+        """Test that a fall edge on an earlier reading of a queued item is reported for the item"""
+        predictor = HealthPredictor()
+        still = [0.1, 0.2, 9.8, 0.5, -0.2, 0.1]
+        spike = [25.0, -15.0, 3.0, 150.0, -120.0, 90.0]
+        readings = np.array([still, spike] + [still] * (WINDOW_SAMPLES + 2))
+        
+        result = predictor._score_fall_items([('p1', readings)])[0]
+        self.assertTrue(result['is_anomaly'])
+        self.assertTrue(result['window_is_anomalous'])
+        self.assertGreaterEqual(result['fall_probability'], FALL_THRESHOLD)
+        self.assertEqual(result['window_samples'], WINDOW_SAMPLES)
+    
+    def test_fall_spike_stays_in_window(self):
+        """Test that a fall is visible while its spike is inside the window, but reported once"""
+        predictor = HealthPredictor()
+        still = [0.1, 0.2, 9.8, 0.5, -0.2, 0.1]
+        spike = [25.0, -15.0, 3.0, 150.0, -120.0, 90.0]
+        
+        rows = [still] * 5 + [spike] + [still] * WINDOW_SAMPLES
+        results = predictor.split_results(predictor.predict_fall_windows(['p1'] * len(rows), rows))
+        self.assertFalse(results[4]['window_is_anomalous'])
+        self.assertTrue(results[5]['window_is_anomalous'])
+        self.assertTrue(results[5 + WINDOW_SAMPLES - 1]['window_is_anomalous'])
+        self.assertFalse(results[-1]['window_is_anomalous'])
+        self.assertEqual([i for i, result in enumerate(results) if result['is_anomaly']], [5])
+        
+        # A second fall after the first has left the window is reported again
+        again = predictor.split_results(predictor.predict_fall_windows(['p1'] * 2, [spike, still]))
+        self.assertEqual([result['is_anomaly'] for result in again], [True, False])
+        
+        # Other patients have their own windows
+        other = predictor.predict_fall(*[[v] for v in still], patient_id='p2')
+        self.assertFalse(other['is_anomaly'])
+        self.assertEqual(other['window_samples'], 1)
+    
+    def test_one_spike_one_alert(self):
+        """Test that one spike followed by normal single-sample posts raises one fall alert and notification"""
+        patient = Patient.objects.create(name="Spike Patient", age=80, gender="FEMALE", user_id="spike123")
+        still = {'heart_rate': 72.0, 'spo2': 98.0, 'accelerometer_x': 0.1, 'accelerometer_y': 0.2,
+                 'accelerometer_z': 9.8, 'gyroscope_x': 0.5, 'gyroscope_y': -0.2, 'gyroscope_z': 0.1}
+        spike = dict(still, accelerometer_x=25.0, accelerometer_y=-15.0, accelerometer_z=3.0,
+                     gyroscope_x=150.0, gyroscope_y=-120.0, gyroscope_z=90.0)
+        views.health_predictor.imu_windows.clear(patient.id)
+        for sample in [still] * 3 + [spike] + [still] * 80:
+            response = self.client.post('/api/health-data/', json.dumps(dict(sample, user_id=patient.user_id)),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Alert.objects.filter(patient=patient, type='FALL').count(), 1)
+        self.assertEqual(FirebaseOutbox.objects.filter(kind=FirebaseOutbox.KIND_NOTIFICATION).count(), 1)
+    
+    def test_store_is_bounded(self):
+        """Test that the least recently used windows are dropped"""
+        store = ImuWindowStore(max_patients=2)
+        for key in ['a', 'b', 'a', 'c']:
+            store.push(key, [[0, 0, 9.8, 0, 0, 0]])
+        self.assertEqual(list(store.windows), ['a', 'c'])
+
+
+class BatchScoringTest(TestCase):
+    """Test the vectorized batch scoring methods"""
+    
+    def setUp(self):
+        self.predictor = HealthPredictor()
+    
+    def test_vitals_batch_matches_single_predictions(self):
+        """Test that batch vitals scoring agrees with row-by-row scoring"""
+        X = np.array([[72, 98], [45, 97], [40, 97], [125, 98], [80, 88], [30, 70], [44, 95]], dtype=float)
+        batch = self.predictor.predict_vitals_risk_batch(X)
+        self.assertEqual(batch['risk_level'].tolist(),
+                         ['NORMAL', 'NORMAL', 'ELEVATED', 'HIGH', 'CRITICAL', 'CRITICAL', 'ELEVATED'])
+        for i, (heart_rate, spo2) in enumerate(X):
+            single = self.predictor.predict_vitals_risk(heart_rate, spo2)
+            self.assertAlmostEqual(single['risk_probability'], batch['risk_probability'][i])
+            self.assertEqual(single['risk_level'], batch['risk_level'][i])
+            self.assertEqual(single['is_anomaly'], bool(batch['is_anomaly'][i]))
+    
+    def test_fall_batch_matches_single_predictions(self):
+        """Test that batch fall scoring agrees with row-by-row scoring"""
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(200, 6)) * [5, 5, 5, 60, 60, 60] + [0, 0, 9.8, 0, 0, 0]
+        batch = self.predictor.predict_fall_batch(X)
+        self.assertEqual(batch['fall_probability'].shape, (200,))
+        for i in range(0, 200, 17):
+            single = self.predictor.predict_fall(*[[value] for value in X[i]])
+            self.assertAlmostEqual(single['fall_probability'], batch['fall_probability'][i])
+            self.assertEqual(single['is_anomaly'], bool(batch['is_anomaly'][i]))
+
+
+def write_fall_artifacts(model_dir):
+    """Train a small fall classifier on window features and save it like the training script"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, len(FALL_WINDOW_FEATURES)))
+    y = (X[:, FEATURE_INDEX['SMV_Acc_max']] > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(scaler.transform(X), y)
+    joblib.dump(model, Path(model_dir) / model_loader.FALL_MODEL_FILE)
+    joblib.dump(scaler, Path(model_dir) / model_loader.FALL_SCALER_FILE)
+    return model, scaler
+
+
+class ModelLoaderTest(APITestCase):
+    """Test loading of trained model artifacts"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_dir = Path(self.temp_dir.name)
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def write_fall_artifacts(self):
+        return write_fall_artifacts(self.model_dir)
+    
+    def write_vitals_artifacts(self):
+        """Save a vitals scaler and label encoder plus a placeholder LSTM file"""
+        from sklearn.preprocessing import LabelEncoder, StandardScaler
+        scaler = StandardScaler().fit(np.array([[70, 98, 36.8], [90, 94, 37.6], [110, 90, 38.4]]))
+        encoder = LabelEncoder().fit(['Normal', 'Low', 'Medium', 'High'])
+        joblib.dump(scaler, self.model_dir / model_loader.VITALS_SCALER_FILE)
+        joblib.dump(encoder, self.model_dir / model_loader.VITALS_LABEL_ENCODER_FILE)
+        (self.model_dir / model_loader.VITALS_LSTM_FILE).write_bytes(b'')
+        return scaler, encoder
+    
+    def test_missing_artifacts_fall_back_to_heuristics(self):
+        """Test that predictions use the heuristics when no artifacts exist"""
+        predictor = HealthPredictor(model_dirs=[self.model_dir])
+        self.assertFalse(predictor.get_status()['loaded'])
+        
+        result = predictor.predict_vitals_risk(72, 98, patient_id=1)
+        self.assertEqual(result['risk_level'], 'NORMAL')
+        status_info = predictor.get_status()
+        self.assertTrue(status_info['loaded'])
+        self.assertEqual(status_info['fall']['source'], 'heuristic')
+        self.assertEqual(status_info['vitals']['source'], 'heuristic')
+        self.assertIs(predictor.fall_model, predictor.heuristic_fall_model)
+    
+    def test_trained_fall_model_is_loaded_eagerly_and_warmed_up(self):
+        """Test that an eager predictor scores windows with the trained classifier"""
+        model, scaler = self.write_fall_artifacts()
+        predictor = HealthPredictor(model_dirs=[self.model_dir], eager=True)
+        
+        fall_info = predictor.get_status()['fall']
+        self.assertEqual(fall_info['source'], 'trained')
+        self.assertGreaterEqual(fall_info['load_seconds'], 0)
+        self.assertGreaterEqual(fall_info['warmup_seconds'], 0)
+        
+        rng = np.random.default_rng(2)
+        X = rng.normal(size=(30, 6)) * 4 + [0, 0, 9.8, 0, 0, 0]
+        result = predictor.predict_fall_windows([7] * 30, X)
+        
+        features, _ = ImuWindowStore().push(7, X, include_quantiles=True)
+        expected = model.predict_proba(scaler.transform(np.nan_to_num(features)))[:, 1]
+        np.testing.assert_allclose(result['fall_probability'], expected)
+    
+    def test_vitals_model_without_inference_engine_stays_heuristic(self):
+        """Test that an unloadable LSTM leaves the vitals heuristic in place"""
+        self.write_vitals_artifacts()
+        model, info = model_loader.load_vitals_model(
+            None, [self.model_dir], network_loader=lambda path: None)
+        self.assertIsNone(model)
+        self.assertEqual(info['source'], 'heuristic')
+    
+    def test_keras_lstm_is_loaded_after_fork(self):
+        """Test that the model server path leaves a Keras LSTM to be loaded in each worker"""
+        self.write_vitals_artifacts()
+        network = mock.Mock(side_effect=lambda batch: np.tile([0.0, 0.0, 0.0, 1.0], (len(batch), 1)))
+        with mock.patch.object(model_loader.importlib.util, 'find_spec', return_value=object()), \
+                mock.patch.object(model_loader, '_load_keras', return_value=network) as load_keras:
+            predictor = HealthPredictor(model_dirs=[self.model_dir], eager=True, batching=False,
+                                        model_server_socket=False, registry_dir=False,
+                                        network_loader=model_loader.load_network_before_fork)
+            load_keras.assert_not_called()
+            vitals_info = predictor.get_status()['vitals']
+            self.assertEqual((vitals_info['engine'], vitals_info['deferred']), ('keras', True))
+            
+            model_loader.load_deferred_network(predictor.vitals_model)
+            load_keras.assert_called_once_with(self.model_dir / model_loader.VITALS_LSTM_FILE)
+            self.assertTrue(network.called)  # Warmed up
+            
+            # A failed load is reported on every call but only attempted once
+            load_keras.reset_mock()
+            load_keras.return_value = None
+            broken = model_loader.DeferredKerasNetwork('missing.keras')
+            for _ in range(2):
+                with self.assertRaisesRegex(RuntimeError, 'TensorFlow is not installed'):
+                    broken(np.zeros((1, 10, 3)))
+            load_keras.assert_called_once()
+    
+    def test_trained_vitals_model_uses_patient_history(self):
+        """Test that the vitals sequence model sees each patient's recent readings"""
+        self.write_vitals_artifacts()
+        
+        def network(batch):
+            # 'High' when the mean scaled heart rate is high, otherwise 'Normal'
+            high = batch[:, :, 0].mean(axis=1) > 1.0
+            probabilities = np.zeros((len(batch), 4))
+            probabilities[high, 0] = 0.9
+            probabilities[high, 3] = 0.1
+            probabilities[~high, 3] = 1.0
+            return probabilities
+        
+        predictor = HealthPredictor(model_dirs=[self.model_dir], eager=True)
+        model, info = model_loader.load_vitals_model(
+            predictor.heuristic_vitals_model, [self.model_dir], network_loader=lambda path: network)
+        self.assertEqual(info['source'], 'trained')
+        model_loader.warmup_vitals_model(model)
+        predictor.vitals_model = model
+        
+        # Patient 1's history fills with high readings; patient 2 stays normal
+        X = np.array([[150, 97]] * 12 + [[70, 98]] * 3, dtype=float)
+        patient_ids = [1] * 12 + [2] * 3
+        result = predictor.predict_vitals_risk_batch(X, patient_ids)
+        self.assertEqual(result['risk_level'][11], 'CRITICAL')
+        self.assertAlmostEqual(result['risk_probability'][11], 0.9)
+        self.assertEqual(result['risk_level'][12:].tolist(), ['NORMAL'] * 3)
+        self.assertFalse(result['is_anomaly'][12:].any())
+        
+        # Without patient ids single readings fall back to the heuristic
+        self.assertEqual(predictor.predict_vitals_risk(72, 98)['risk_level'], 'NORMAL')
+    
+    def test_model_status_endpoint(self):
+        """Test that the status endpoint reports the loaded models"""
+        response = self.client.get(reverse('ml-model-status'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('loaded', response.data)
+
+
+def random_lstm_network(rng, n_features=3, units=(8, 4), n_classes=4):
+    """Build a NumpyLSTMNetwork with random weights"""
+    layers = []
+    n_inputs = n_features
+    for position, n_units in enumerate(units):
+        layers.append(LSTMLayer(
+            rng.normal(scale=0.5, size=(n_inputs, 4 * n_units)),
+            rng.normal(scale=0.5, size=(n_units, 4 * n_units)),
+            rng.normal(scale=0.1, size=4 * n_units),
+            return_sequences=position < len(units) - 1
+        ))
+        n_inputs = n_units
+    return NumpyLSTMNetwork(layers, rng.normal(size=(n_inputs, n_classes)), rng.normal(size=n_classes))
+
+
+class NumpyLSTMTest(TestCase):
+    """Test the NumPy LSTM inference engine"""
+    
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.batch = self.rng.normal(size=(16, model_loader.TIME_STEPS_VITALS, 3)).astype(np.float32)
+    
+    def test_single_step_matches_lstm_equations(self):
+        """Test one step from a zero state against the LSTM cell equations"""
+        layer = LSTMLayer(self.rng.normal(size=(3, 8)), self.rng.normal(size=(2, 8)),
+                          self.rng.normal(size=8))
+        x = self.batch[:, :1]
+        z = x[:, 0] @ layer.kernel + layer.bias
+        sigmoid = lambda v: 1 / (1 + np.exp(-v))
+        i, f, g, o = z[:, 0:2], z[:, 2:4], z[:, 4:6], z[:, 6:8]
+        expected = sigmoid(o) * np.tanh(sigmoid(i) * np.tanh(g))
+        np.testing.assert_allclose(layer(x), expected, rtol=1e-5, atol=1e-6)
+    
+    @staticmethod
+    def reference_lstm(x, kernel, recurrent_kernel, bias, return_sequences=False):
+        """Textbook LSTM in float64, one sequence and one step at a time, gates in Keras order i, f, c, o"""
+        sigmoid = lambda v: 1 / (1 + np.exp(-v))
+        units = recurrent_kernel.shape[0]
+        outputs = []
+        for sequence in np.asarray(x, dtype=np.float64):
+            h, c, states = np.zeros(units), np.zeros(units), []
+            for x_t in sequence:
+                z = x_t @ kernel + h @ recurrent_kernel + bias
+                i = sigmoid(z[:units])
+                f = sigmoid(z[units:2 * units])
+                g = np.tanh(z[2 * units:3 * units])
+                o = sigmoid(z[3 * units:])
+                c = f * c + i * g
+                h = o * np.tanh(c)
+                states.append(h)
+            outputs.append(states if return_sequences else h)
+        return np.array(outputs)
+    
+    def test_sequences_match_reference_lstm(self):
+        """Test a stacked LSTM over every time step against a reference with nonzero recurrent weights"""
+        def weights(n_inputs, units):
+            kernel = self.rng.normal(scale=0.5, size=(n_inputs, 4 * units))
+            recurrent_kernel = self.rng.normal(scale=0.5, size=(units, 4 * units))
+            bias = self.rng.normal(scale=0.5, size=4 * units)
+            bias[units:2 * units] += 1.0  # Keras' unit forget bias, so c carries over steps
+            return kernel, recurrent_kernel, bias
+        first, second = weights(3, 6), weights(6, 5)
+        
+        sequences = LSTMLayer(*first, return_sequences=True)(self.batch)
+        expected_sequences = self.reference_lstm(self.batch, *first, return_sequences=True)
+        self.assertEqual(sequences.shape, (16, model_loader.TIME_STEPS_VITALS, 6))
+        np.testing.assert_allclose(sequences, expected_sequences, rtol=1e-4, atol=1e-5)
+        
+        dense_kernel, dense_bias = self.rng.normal(size=(5, 4)), self.rng.normal(size=4)
+        network = NumpyLSTMNetwork([LSTMLayer(*first, return_sequences=True), LSTMLayer(*second)],
+                                   dense_kernel, dense_bias)
+        logits = self.reference_lstm(expected_sequences, *second) @ dense_kernel + dense_bias
+        expected = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+        np.testing.assert_allclose(network(self.batch), expected, rtol=1e-4, atol=1e-5)
+        
+        # Swapping two gates of the recurrent kernel must change the output
+        kernel, recurrent_kernel, bias = first
+        units = 6
+        swapped = np.concatenate([recurrent_kernel[:, units:2 * units], recurrent_kernel[:, :units],
+                                  recurrent_kernel[:, 2 * units:]], axis=1)
+        self.assertFalse(np.allclose(LSTMLayer(kernel, swapped, bias)(self.batch),
+                                     LSTMLayer(kernel, recurrent_kernel, bias)(self.batch), atol=1e-3))
+    
+    def test_outputs_are_probabilities(self):
+        """Test that the softmax output rows are valid distributions"""
+        network = random_lstm_network(self.rng)
+        output = network(self.batch)
+        self.assertEqual(output.shape, (16, 4))
+        np.testing.assert_allclose(output.sum(axis=1), 1.0, rtol=1e-5)
+    
+    def test_save_and_load_round_trip(self):
+        """Test that exported weights reload into an identical network"""
+        network = random_lstm_network(self.rng)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / model_loader.VITALS_LSTM_NPZ_FILE
+            network.save(path)
+            loaded = NumpyLSTMNetwork.load(path)
+        np.testing.assert_array_equal(loaded(self.batch), network(self.batch))
+        self.assertEqual([layer.return_sequences for layer in loaded.lstm_layers], [True, False])
+    
+    @unittest.skipUnless(importlib.util.find_spec('tensorflow'), 'TensorFlow is not installed')
+    def test_matches_keras(self):
+        """Test that the NumPy forward pass matches Keras on the training architecture"""
+        from tensorflow import keras
+        model = keras.Sequential([
+            keras.layers.Input(shape=(model_loader.TIME_STEPS_VITALS, 3)),
+            keras.layers.LSTM(128, return_sequences=True),
+            keras.layers.Dropout(0.3),
+            keras.layers.LSTM(64),
+            keras.layers.Dropout(0.3),
+            keras.layers.Dense(4, activation='softmax'),
+        ])
+        expected = model(self.batch, training=False).numpy()
+        np.testing.assert_allclose(from_keras(model)(self.batch), expected, atol=1e-5)
+    
+    def test_predictor_serves_exported_weights(self):
+        """Test that HealthPredictor uses the .npz weights without TensorFlow"""
+        from sklearn.preprocessing import LabelEncoder, StandardScaler
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model_dir = Path(temp_dir)
+            scaler = StandardScaler().fit(np.array([[70, 98, 36.8], [90, 94, 37.6], [110, 90, 38.4]]))
+            joblib.dump(scaler, model_dir / model_loader.VITALS_SCALER_FILE)
+            joblib.dump(LabelEncoder().fit(['Normal', 'Low', 'Medium', 'High']),
+                        model_dir / model_loader.VITALS_LABEL_ENCODER_FILE)
+            network = random_lstm_network(self.rng)
+            network.save(model_dir / model_loader.VITALS_LSTM_NPZ_FILE)
+            
+            predictor = HealthPredictor(model_dirs=[model_dir], eager=True)
+        
+        vitals_info = predictor.get_status()['vitals']
+        self.assertEqual(vitals_info['source'], 'trained')
+        self.assertEqual(vitals_info['engine'], 'numpy')
+        self.assertGreaterEqual(vitals_info['warmup_seconds'], 0)
+        
+        result = predictor.predict_vitals_risk_batch([[80, 97], [82, 96]], [5, 5])
+        sequence = np.array([[80, 97, 37.6]] * 9 + [[82, 96, 37.6]])
+        expected = network(((sequence - scaler.mean_) / scaler.scale_)[None])[0]
+        self.assertAlmostEqual(result['risk_probability'][1], 1 - expected[3], places=5)
+        self.assertEqual(result['risk_level'][1],
+                         ['CRITICAL', 'ELEVATED', 'HIGH', 'NORMAL'][int(np.argmax(expected))])
+
+
+class MicroBatcherTest(TestCase):
+    """Test the micro-batching inference scheduler"""
+    
+    def test_concurrent_items_are_batched_in_order(self):
+        """Test that concurrent submissions share batch calls and get their own results"""
+        batches = []
+        batcher = MicroBatcher(lambda items: batches.append(list(items)) or [x * 2 for x in items],
+                               max_batch_size=8, max_wait_ms=50)
+        barrier = threading.Barrier(20)
+        
+        def call(x):
+            barrier.wait()
+            return batcher(x, timeout=5)
+        
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(call, range(20)))
+        
+        self.assertEqual(results, [x * 2 for x in range(20)])
+        self.assertLess(len(batches), 20)
+        self.assertTrue(all(len(batch) <= 8 for batch in batches))
+        stats = batcher.stats()
+        self.assertEqual(stats['batch_size']['count'], len(batches))
+        self.assertEqual(sum(stats['batch_size']['buckets'].values()), len(batches))
+        self.assertEqual(stats['queue_depth']['count'], len(batches))
+    
+    def test_batch_errors_reach_every_caller(self):
+        """Test that a failing batch call raises in each waiting caller"""
+        def fail(items):
+            raise ValueError('model failed')
+        
+        batcher = MicroBatcher(fail, max_wait_ms=20)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        self.assertGreaterEqual(batcher.stats()['errors'], 1)
+    
+    def test_failures_stay_with_their_items(self):
+        """Test that a bad item fails only its own caller"""
+        def double(items):
+            if any(x < 0 for x in items):
+                raise ValueError('negative reading')
+            return [x * 2 for x in items]
+        
+        batcher = MicroBatcher(double, max_wait_ms=50)
+        futures = [batcher.submit(x) for x in (1, -1, 2)]
+        self.assertEqual(futures[0].result(timeout=5), 2)
+        with self.assertRaises(ValueError):
+            futures[1].result(timeout=5)
+        self.assertEqual(futures[2].result(timeout=5), 4)
+        self.assertEqual(batcher.stats()['errors'], 1)
+    
+    def test_failed_batch_leaves_patient_state_unchanged(self):
+        """Test that a failed batch does not push its readings, so the item-by-item retry pushes them once"""
+        predictor = HealthPredictor(batching=False)
+        predictor.load_models()
+        score = predictor.fall_model.predict_proba_window
+        calls = []
+        
+        def fail_first_call(features):
+            calls.append(len(features))
+            if len(calls) == 1:
+                raise RuntimeError('model failed')
+            return score(features)
+        
+        readings = np.array([[0.1 * i, 0.2, 9.8, 0.5, -0.2, 0.1] for i in range(3)])
+        batcher = MicroBatcher(predictor._score_fall_items, max_batch_size=3, max_wait_ms=1000)
+        with mock.patch.object(predictor.fall_model, 'predict_proba_window', side_effect=fail_first_call):
+            futures = [batcher.submit(('p1', readings[i:i + 1])) for i in range(3)]
+            results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(calls, [3, 1, 1, 1])
+        self.assertEqual([result['window_samples'] for result in results], [1, 2, 3])
+        self.assertEqual(batcher.stats()['retried_batches'], 1)
+        window = predictor.imu_windows.get('p1')
+        self.assertEqual(window.count, 3)
+        np.testing.assert_array_equal(window.buffer[:3, :6], readings)
+        
+        # A failure outside the batcher leaves the window and vitals history as they were
+        buffer = window.buffer.copy()
+        with mock.patch.object(predictor.fall_model, 'predict_proba_window', side_effect=RuntimeError('model failed')):
+            with self.assertRaises(RuntimeError):
+                predictor.predict_fall_windows(['p1'], readings[:1])
+        window = predictor.imu_windows.get('p1')
+        self.assertEqual(window.count, 3)
+        np.testing.assert_array_equal(window.buffer, buffer)
+        
+        sequence_model = mock.Mock(needs_history=True,
+                                   predict_sequences=mock.Mock(side_effect=RuntimeError('model failed')))
+        with mock.patch.object(predictor, 'vitals_model', sequence_model):
+            with self.assertRaises(RuntimeError):
+                predictor.predict_vitals_risk_batch([[72.0, 98.0]], ['p1'])
+        self.assertNotIn('p1', predictor.vitals_history.histories)
+    
+    def test_callers_time_out(self):
+        """Test that callers stop waiting after the timeout and their queued items are dropped"""
+        release = threading.Event()
+        calls = []
+        
+        def slow(items):
+            calls.append(list(items))
+            release.wait(5)
+            return items
+        
+        batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0, timeout=0.05)
+        for item in ('running', 'queued'):
+            with self.assertRaises(FutureTimeoutError):
+                batcher(item)
+        release.set()
+        self.assertEqual(batcher('next', timeout=5), 'next')
+        self.assertEqual(calls, [['running'], ['next']])
+        self.assertEqual(batcher.stats()['timeouts'], 2)
+    
+    def test_batched_predictor_matches_direct_scoring(self):
+        """Test that batched per-patient predictions equal unbatched ones"""
+        rng = np.random.default_rng(3)
+        readings = rng.normal(size=(16, 6)) * [5, 5, 5, 60, 60, 60] + [0, 0, 9.8, 0, 0, 0]
+        vitals = np.column_stack([rng.uniform(40, 140, 16), rng.uniform(85, 100, 16)])
+        batched = HealthPredictor(batching=True)
+        direct = HealthPredictor(batching=False)
+        
+        def predict(predictor, patient_id):
+            fall = predictor.predict_fall(*[[value] for value in readings[patient_id]],
+                                          patient_id=patient_id)
+            risk = predictor.predict_vitals_risk(*vitals[patient_id], patient_id=patient_id)
+            return fall, risk
+        
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda patient_id: predict(batched, patient_id), range(16)))
+        for patient_id, (fall, risk) in enumerate(results):
+            expected_fall, expected_risk = predict(direct, patient_id)
+            self.assertAlmostEqual(fall['fall_probability'], expected_fall['fall_probability'])
+            self.assertEqual(risk['risk_level'], expected_risk['risk_level'])
+        
+        batching = batched.get_status()['batching']
+        self.assertGreater(batching['fall']['batch_size']['count'], 0)
+        self.assertNotIn('batching', direct.get_status())
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX'), 'Needs fork() and Unix sockets')
+class ModelServerTest(TestCase):
+    """Test the out-of-process model server and its client"""
+    
+    def test_message_round_trip(self):
+        """Test that headers and arrays survive the wire format"""
+        arrays = [np.arange(12, dtype=np.float32).reshape(3, 4), np.array([1, 2], dtype=np.int64),
+                  np.empty((0, 25))]
+        left, right = socket.socketpair()
+        with left, right:
+            send_message(left, {'op': 'fall_window', 'extra': 1}, arrays)
+            header, received = recv_message(right)
+        self.assertEqual(header['op'], 'fall_window')
+        self.assertEqual(header['extra'], 1)
+        for original, copy in zip(arrays, received):
+            self.assertEqual(copy.dtype, original.dtype)
+            np.testing.assert_array_equal(copy, original)
+    
+    def test_unknown_operation_is_rejected(self):
+        """Test that the request handler refuses unknown operations"""
+        predictor = HealthPredictor(batching=False, model_server_socket=False)
+        server = ModelServer(predictor.fall_model, predictor.vitals_model, 'unused.sock')
+        with self.assertRaises(ValueError):
+            server.handle({'op': 'train'}, [])
+        self.assertFalse(server.handle({'op': 'info'}, [])[0]['vitals_needs_history'])
+    
+    def test_predictions_match_local_models(self):
+        """Test scoring through a running server against in-process scoring"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, 'models.sock')
+            server = subprocess.Popen(
+                [sys.executable, 'manage.py', 'run_model_server', '--socket', socket_path, '--workers', '2'],
+                cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                deadline = time.monotonic() + 60
+                while not os.path.exists(socket_path) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                
+                remote = HealthPredictor(batching=False, model_server_socket=socket_path)
+                local = HealthPredictor(batching=False, model_server_socket=False)
+                rng = np.random.default_rng(4)
+                X = rng.normal(size=(40, 6)) * [5, 5, 5, 60, 60, 60] + [0, 0, 9.8, 0, 0, 0]
+                patient_ids = [1, 2] * 20
+                
+                # Several threads share the client, each with its own connection
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    remote_results = list(pool.map(
+                        lambda i: remote.predict_fall_batch(X[i:i + 10])['fall_probability'], range(0, 40, 10)))
+                np.testing.assert_allclose(np.concatenate(remote_results),
+                                           local.predict_fall_batch(X)['fall_probability'])
+                np.testing.assert_allclose(remote.predict_fall_windows(patient_ids, X)['fall_probability'],
+                                           local.predict_fall_windows(patient_ids, X)['fall_probability'])
+                self.assertEqual(remote.get_status()['fall']['source'], 'model_server')
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            
+            # Without the server the heuristic keeps answering
+            self.assertFalse(os.path.exists(socket_path))
+            result = remote.predict_vitals_risk(72, 98, patient_id=1)
+            self.assertEqual(result['risk_level'], 'NORMAL')
+
+
+@override_settings(ML_MODEL_REGISTRY_POLL_SECONDS=0)
+class ModelRegistryTest(APITestCase):
+    """Test versioned models with hot reload and canary pinning"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        (self.root / 'v1').mkdir()
+        (self.root / 'v2').mkdir()
+        write_fall_artifacts(self.root / 'v2')
+        self.write_manifest({'active': 'v1', 'canary': {'version': 'v2', 'patients': [7]}})
+        self.predictor = HealthPredictor(model_dirs=[self.root / 'v1'], batching=False,
+                                         model_server_socket=False, registry_dir=self.root)
+        self.X = np.tile([0.5, 0.2, 9.7, 3.0, 1.0, 2.0], (4, 1))
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def write_manifest(self, manifest):
+        path = self.root / 'manifest.json'
+        previous = path.stat().st_mtime_ns if path.exists() else 0
+        path.write_text(json.dumps(manifest))
+        # Make sure the change is visible even with a coarse filesystem clock
+        os.utime(path, ns=(previous + 10 ** 9, previous + 10 ** 9))
+    
+    def test_pinned_patients_use_the_canary(self):
+        """Test that pinned patients are scored by the canary version"""
+        result = self.predictor.predict_fall_windows([7, 7, 8, 8], self.X)
+        self.assertEqual(result['model_version'].tolist(), ['v2', 'v2', 'v1', 'v1'])
+        vitals = self.predictor.predict_vitals_risk_batch([[72, 98], [72, 98]], [7, 8])
+        self.assertEqual(vitals['model_version'].tolist(), ['v2', 'v1'])
+        self.assertEqual(self.predictor.get_status()['registry']['canary'], 'v2')
+    
+    def test_percentage_canary_is_stable(self):
+        """Test that percentage canaries pick the same patients every time"""
+        self.write_manifest({'active': 'v1', 'canary': {'version': 'v2', 'percent': 30}})
+        patient_ids = list(range(200))
+        expected = ['v2' if canary_bucket(patient_id) < 30 else 'v1' for patient_id in patient_ids]
+        result = self.predictor.predict_fall_windows(patient_ids, np.tile(self.X[0], (200, 1)))
+        self.assertEqual(result['model_version'].tolist(), expected)
+        self.assertTrue(0 < expected.count('v2') < 200)
+    
+    def test_manifest_change_swaps_versions(self):
+        """Test that editing the manifest switches the active version without a restart"""
+        self.assertEqual(self.predictor.predict_fall_batch(self.X)['model_version'][0], 'v1')
+        self.write_manifest({'active': 'v2'})
+        self.predictor.registry.refresh()
+        self.predictor.registry.wait(5)
+        self.assertEqual(self.predictor.predict_fall_batch(self.X)['model_version'][0], 'v2')
+        self.assertIsNone(self.predictor.get_status()['registry']['canary'])
+    
+    def test_slow_load_does_not_block_scoring(self):
+        """Test that new versions load in the background while requests keep the current ones"""
+        self.predictor.load_models()
+        release = threading.Event()
+        load_set = self.predictor.registry._load_set
+        
+        def slow_load_set(version):
+            release.wait(5)
+            return load_set(version)
+        
+        self.write_manifest({'active': 'v2'})
+        with mock.patch.object(self.predictor.registry, '_load_set', side_effect=slow_load_set):
+            start = time.monotonic()
+            self.assertEqual(self.predictor.predict_fall_batch(self.X)['model_version'][0], 'v1')
+            self.assertEqual(self.predictor.predict_fall_batch(self.X)['model_version'][0], 'v1')
+            self.assertLess(time.monotonic() - start, 2)
+            release.set()
+            self.predictor.registry.wait(5)
+        self.assertEqual(self.predictor.predict_fall_batch(self.X)['model_version'][0], 'v2')
+    
+    def test_manifest_published_after_start(self):
+        """Test that a registry without a manifest is picked up once one is written"""
+        (self.root / 'manifest.json').unlink()
+        predictor = HealthPredictor(model_dirs=[self.root / 'v1'], batching=False,
+                                    model_server_socket=False, registry_dir=self.root)
+        self.assertNotEqual(predictor.predict_fall_batch(self.X)['model_version'][0], 'v2')
+        self.write_manifest({'active': 'v2'})
+        predictor.registry.refresh()
+        predictor.registry.wait(5)
+        self.assertEqual(predictor.predict_fall_batch(self.X)['model_version'][0], 'v2')
+    
+    def test_model_server_ignores_registry(self):
+        """Test that web workers load no registry versions while the model server scores"""
+        with mock.patch.object(HealthPredictor, '_connect_model_server', return_value=True):
+            predictor = HealthPredictor(batching=False, model_server_socket='models.sock', registry_dir=self.root)
+            predictor.load_models()
+        self.assertIsNone(predictor.registry)
+        self.assertEqual(predictor.predict_fall_windows([7], self.X[:1])['model_version'].tolist(), ['model_server'])
+        self.assertIn('model server', predictor.get_status()['registry']['last_error'])
+    
+    def test_broken_manifest_keeps_current_versions(self):
+        """Test that an invalid manifest is reported and ignored"""
+        self.predictor.load_models()
+        self.write_manifest({'active': '../v1'})
+        self.predictor.registry.refresh()
+        self.predictor.registry.wait(5)
+        result = self.predictor.predict_fall_windows([7, 8], self.X[:2])
+        self.assertEqual(result['model_version'].tolist(), ['v2', 'v1'])
+        self.assertIn('Unknown model version', self.predictor.get_status()['registry']['last_error'])
+    
+    def test_process_health_data_reports_model_version(self):
+        """Test that the ingest response names the version that scored the sample"""
+        Patient.objects.create(name='Versioned', age=50, gender='FEMALE', user_id='version-1')
+        response = self.client.post(reverse('process-health-data'), {
+            'user_id': 'version-1', 'heart_rate': 72, 'spo2': 98,
+            'accelerometer_x': 0.1, 'accelerometer_y': 0.2, 'accelerometer_z': 9.8,
+            'gyroscope_x': 0.0, 'gyroscope_y': 0.0, 'gyroscope_z': 0.0,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('model_version', response.data['fall_detection'])
+        self.assertIn('model_version', response.data['vitals_assessment'])
@@ -0,0 +1,329 @@
+"""
+Compression codec for blocks of time-series columns (IMU and vitals)
+
+A block is a set of equally long columns, each encoded on its own:
+
+    delta2      int64 columns (timestamps, ids): the first value, then the
+                delta of deltas. Regularly spaced timestamps become runs of
+                zeros.
+    xor         float64 columns, lossless: Gorilla-style XOR with the
+                previous value, stored as its leading-zero count, the length
+                of its meaningful bits and those bits. Slowly changing
+                values and float32 readings widened to float64 leave few
+                meaningful bits.
+    quantize:N  float64 columns rounded to N decimals: deltas of the
+                integers value * 10**N. Lossless for values that have at
+                most N decimals (e.g. acc_gyr.csv with N=2), otherwise off
+                by at most half a unit in the N-th decimal. NaN is kept.
+    auto        float64 columns, lossless: quantize with the fewest decimals
+                (up to MAX_AUTO_DECIMALS) that reproduce every value bit for
+                bit, xor otherwise. The block records the method chosen.
+
+Integers are written as zigzag LEB128 varints, and every encoded column is
+deflated. Gorilla interleaves the headers and bits of successive values,
+which can only be decoded one value at a time. Here each column keeps its
+headers and its bits in separate streams, so bit offsets are a cumulative
+sum and NumPy encodes and decodes whole columns at once.
+
+Block layout (little-endian):
+
+    magic b'HMTB', version B, column count B, row count I
+    per column: name length B, name, method B, decimals B, payload length I, payload
+
+This module only depends on NumPy and the standard library, like
+wire_format.py.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+BLOCK_MAGIC = b'HMTB'
+BLOCK_VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sBBI')
+COLUMN_STRUCT = struct.Struct('<BBI')
+
+DELTA2 = 'delta2'
+XOR = 'xor'
+QUANTIZE = 'quantize'
+AUTO = 'auto'
+METHOD_CODES = {DELTA2: 1, XOR: 2, QUANTIZE: 3}
+METHOD_NAMES = {code: name for name, code in METHOD_CODES.items()}
+
+# Values per step of the XOR bit packing; bounds its (chunk, 64) work arrays
+XOR_CHUNK = 1 << 14
+ZLIB_LEVEL = 6
+# Most decimals auto tries; readings with more are stored with xor
+MAX_AUTO_DECIMALS = 6
+
+_BIT_INDEX = np.arange(64)
+
+
+class CodecError(ValueError):
+    """Raised when bytes are not a valid block"""
+
+
+# Variable-length integers
+
+def zigzag(values):
+    """int64 to uint64 with small magnitudes, positive or negative, mapped to small numbers"""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return ((values >> np.uint64(1)) ^ (np.uint64(0) - (values & np.uint64(1)))).view(np.int64)
+
+
+def encode_varints(values):
+    """LEB128 bytes of a uint64 array: 7 bits per byte, high bit set on all but the last byte"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        sizes += values >= np.uint64(1 << (7 * k))
+    starts = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(values) else 0):
+        selected = sizes > k
+        byte = (values[selected] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[selected] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[selected] + k] = byte
+    return out.tobytes()
+
+
+def decode_varints(data, count):
+    """count uint64 values from LEB128 bytes"""
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) != count or (count and ends[-1] != len(data) - 1):
+        raise CodecError(f"Expected {count} varints, found {len(ends)}")
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+    sizes = ends - starts + 1
+    if count and sizes.max() > 10:
+        raise CodecError("Varint longer than 64 bits")
+    values = np.zeros(count, dtype=np.uint64)
+    for k in range(int(sizes.max()) if count else 0):
+        selected = sizes > k
+        values[selected] |= (data[starts[selected] + k].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * k)
+    return values
+
+
+# delta2: integers as the first value and the deltas of deltas
+
+def encode_delta2(values):
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return b''
+    # Wrapping int64 arithmetic round-trips any values
+    with np.errstate(over='ignore'):
+        deltas = np.diff(values)
+        delta2 = np.diff(deltas, prepend=np.int64(0))
+    return encode_varints(zigzag(np.concatenate([values[:1], delta2])))
+
+
+def decode_delta2(data, count):
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    stream = unzigzag(decode_varints(data, count))
+    with np.errstate(over='ignore'):
+        deltas = np.cumsum(stream[1:], dtype=np.int64)
+        return stream[0] + np.concatenate([[np.int64(0)], np.cumsum(deltas, dtype=np.int64)])
+
+
+# xor: lossless floats
+
+def _bit_length(values):
+    """Number of significant bits of each uint64"""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = (values >> np.uint64(shift)) != 0
+        lengths[wide] += shift
+        values[wide] >>= np.uint64(shift)
+    return lengths + (values != 0)
+
+
+def encode_xor(values):
+    """
+    Bytes of a float64 array: a header stream (leading zeros, meaningful
+    length) per value, then the meaningful bits of every value
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    xored = bits ^ np.concatenate([[np.uint64(0)], bits[:-1]])
+    significant = _bit_length(xored)
+    trailing = np.where(xored != 0, _bit_length(xored & (~xored + np.uint64(1))) - 1, 0)
+    lengths = significant - trailing  # 0 when the value repeats
+    leading = np.where(lengths > 0, 64 - significant, 0)
+    # Meaningful bits moved to the top, so they are the first bits of the big-endian bytes
+    aligned = np.where(lengths > 0, xored << leading.astype(np.uint64), np.uint64(0)).astype('>u8')
+
+    packed = []
+    for start in range(0, len(values), XOR_CHUNK):
+        chunk_bits = np.unpackbits(aligned[start:start + XOR_CHUNK].view(np.uint8).reshape(-1, 8), axis=1)
+        packed.append(chunk_bits[_BIT_INDEX < lengths[start:start + XOR_CHUNK, None]])
+    payload = np.packbits(np.concatenate(packed)) if packed else np.zeros(0, dtype=np.uint8)
+    headers = np.stack([leading, lengths], axis=1).astype(np.uint8)
+    return headers.tobytes() + payload.tobytes()
+
+
+def decode_xor(data, count):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) < 2 * count:
+        raise CodecError("Truncated XOR column")
+    headers = data[:2 * count].reshape(count, 2).astype(np.int64)
+    leading, lengths = headers[:, 0], headers[:, 1]
+    if np.any(leading + lengths > 64):
+        raise CodecError("Invalid XOR header")
+    payload = np.unpackbits(data[2 * count:])
+    if len(payload) < lengths.sum():
+        raise CodecError("Truncated XOR column")
+    offsets = np.cumsum(lengths) - lengths
+
+    xored = np.zeros(count, dtype=np.uint64)
+    for start in range(0, count, XOR_CHUNK):
+        present = _BIT_INDEX < lengths[start:start + XOR_CHUNK, None]
+        positions = np.where(present, offsets[start:start + XOR_CHUNK, None] + _BIT_INDEX, 0)
+        chunk_bits = payload[positions] & present
+        aligned = np.packbits(chunk_bits, axis=1).view('>u8').ravel().astype(np.uint64)
+        xored[start:start + XOR_CHUNK] = np.where(lengths[start:start + XOR_CHUNK] > 0,
+                                                  aligned >> leading[start:start + XOR_CHUNK].astype(np.uint64),
+                                                  np.uint64(0))
+    return np.bitwise_xor.accumulate(xored).view(np.float64)
+
+
+# quantize: floats rounded to a number of decimals
+
+def encode_quantized(values, decimals):
+    """Zigzag varints of a NaN mask count followed by the deltas of round(value * 10**decimals)"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    scaled = np.round(np.where(missing, 0.0, values) * 10.0 ** decimals)
+    if np.any(np.abs(scaled) >= 2 ** 62):
+        raise ValueError(f"Values too large to quantize to {decimals} decimals")
+    integers = scaled.astype(np.int64)
+    deltas = np.diff(integers, prepend=np.int64(0))
+    # NaN positions as gaps between them, so a column without NaN costs one byte
+    gaps = np.diff(np.flatnonzero(missing), prepend=-1)
+    return encode_varints(zigzag(np.concatenate([[len(gaps)], gaps, deltas])))
+
+
+def decode_quantized(data, count, decimals):
+    stream = unzigzag(decode_varints(data, _varint_count(data)))
+    n_missing = int(stream[0])
+    if len(stream) != 1 + n_missing + count:
+        raise CodecError("Quantized column has the wrong length")
+    # Division, not multiplication by 10**-decimals, returns the nearest float to the decimal
+    values = np.cumsum(stream[1 + n_missing:]) / 10.0 ** decimals
+    values[np.cumsum(stream[1:1 + n_missing]) - 1] = np.nan
+    return values
+
+
+def _varint_count(data):
+    return int(np.count_nonzero(np.frombuffer(data, dtype=np.uint8) < 0x80))
+
+
+# Blocks
+
+def lossless_decimals(values):
+    """Fewest decimals (up to MAX_AUTO_DECIMALS) that quantize values losslessly, or None"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    present = values[~missing]
+    for decimals in range(MAX_AUTO_DECIMALS + 1):
+        scaled = np.round(present * 10.0 ** decimals)
+        if np.any(~np.isfinite(scaled)) or np.any(np.abs(scaled) >= 2 ** 62):
+            return None
+        # Compared as bits, so -0.0 (which quantizes to 0.0) is not lossless
+        if np.array_equal((scaled / 10.0 ** decimals).view(np.uint64), present.view(np.uint64)):
+            return decimals
+    return None
+
+
+def choose_method(column):
+    """The concrete (method, decimals) auto stands for"""
+    decimals = lossless_decimals(column)
+    return (XOR, 0) if decimals is None else (QUANTIZE, decimals)
+
+
+def default_method(column):
+    return DELTA2 if np.asarray(column).dtype.kind in 'iu' else AUTO
+
+
+def encode_block(columns, methods=None):
+    """
+    Encode equally long columns into one block
+
+    Args:
+        columns: dict of column name to 1-D array (integers or floats)
+        methods: dict of column name to 'delta2', 'xor', 'auto' or
+                 ('quantize', decimals); by default delta2 for integer columns
+                 and auto for floats
+
+    Returns:
+        bytes
+    """
+    methods = methods or {}
+    counts = {len(column) for column in columns.values()}
+    if len(counts) > 1:
+        raise ValueError("Columns must have the same length")
+    count = counts.pop() if counts else 0
+    parts = [HEADER_STRUCT.pack(BLOCK_MAGIC, BLOCK_VERSION, len(columns), count)]
+    for name, column in columns.items():
+        method = methods.get(name) or default_method(column)
+        method, decimals = (method, 0) if isinstance(method, str) else method
+        if method == AUTO:
+            method, decimals = choose_method(column)
+        if method == DELTA2:
+            encoded = encode_delta2(column)
+        elif method == XOR:
+            encoded = encode_xor(column)
+        elif method == QUANTIZE:
+            encoded = encode_quantized(column, decimals)
+        else:
+            raise ValueError(f"Unknown method {method!r} for column {name!r}")
+        payload = zlib.compress(encoded, ZLIB_LEVEL)
+        name_bytes = name.encode('ascii')
+        parts += [bytes([len(name_bytes)]), name_bytes,
+                  COLUMN_STRUCT.pack(METHOD_CODES[method], decimals, len(payload)), payload]
+    return b''.join(parts)
+
+
+def decode_block(data):
+    """
+    Columns of a block, in the order they were encoded
+
+    Returns:
+        dict of column name to int64 (delta2) or float64 array
+    """
+    data = memoryview(data)
+    if len(data) < HEADER_STRUCT.size:
+        raise CodecError("Block is shorter than its header")
+    magic, version, n_columns, count = HEADER_STRUCT.unpack_from(data)
+    if magic != BLOCK_MAGIC:
+        raise CodecError(f"Bad block magic {bytes(magic)!r}")
+    if version != BLOCK_VERSION:
+        raise CodecError(f"Unsupported block version {version}")
+    offset = HEADER_STRUCT.size
+    columns = {}
+    try:
+        for _ in range(n_columns):
+            name_length = data[offset]
+            name = bytes(data[offset + 1:offset + 1 + name_length]).decode('ascii')
+            offset += 1 + name_length
+            method_code, decimals, length = COLUMN_STRUCT.unpack_from(data, offset)
+            offset += COLUMN_STRUCT.size
+            encoded = zlib.decompress(data[offset:offset + length])
+            offset += length
+            method = METHOD_NAMES.get(method_code)
+            if method == DELTA2:
+                columns[name] = decode_delta2(encoded, count)
+            elif method == XOR:
+                columns[name] = decode_xor(encoded, count)
+            elif method == QUANTIZE:
+                columns[name] = decode_quantized(encoded, count, decimals)
+            else:
+                raise CodecError(f"Unknown method code {method_code} for column {name!r}")
+    except (IndexError, struct.error, zlib.error, UnicodeDecodeError) as e:
+        raise CodecError(f"Truncated or corrupt block: {e}")
+    return columns
@@ -12,5 +12,7 @@ router.register(r'alerts', views.AlertViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('health-data/', views.process_health_data, name='process-health-data'),
+    path('health-data/batch/', views.process_health_data_batch, name='process-health-data-batch'),
+    path('ml/status/', views.ml_model_status, name='ml-model-status'),
     path('chat/', views.chat_with_health_assistant, name='chat-with-health-assistant'),
 ]
\ No newline at end of file
@@ -1,12 +1,28 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, action
+from rest_framework.decorators import api_view, action, parser_classes
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, redirect
-from .models import Patient, Guardian, HealthData, Alert
-from .serializers import PatientSerializer, GuardianSerializer, HealthDataSerializer, AlertSerializer
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+from collections import Counter
+import numpy as np
+from .models import Patient, Guardian, HealthData, Alert, FirebaseOutbox, SensorWindow
+from .serializers import (PatientSerializer, GuardianSerializer, HealthDataSerializer, HealthDataRollupSerializer,
+                          AlertSerializer, SensorWindowSerializer)
 from .ml_predictor import HealthPredictor
-from .firebase_service import FirebaseService
-from .firebase_repository import FirebaseRepository
+from .pagination import HealthDataCursorPagination, TimeSeriesCursorPagination, filter_time_range, parse_time_param
+from .parsers import HealthSampleFrameParser
+from .wire_format import FRAME_FIELDS, VITALS_FIELDS, SampleFrame, frame_to_request_data
+from .rollups import METRICS, RESOLUTIONS, choose_resolution, trend_rollups, update_rollups
+from .downsampling import downsample_series
+from .health_data_repository import HealthDataRepository
+from .window_storage import build_sensor_windows, window_settings
+from .outbox import enqueue_save, enqueue_guardian_notification, build_save_entry, build_notification_entry
 import json
 import requests
 
@@ -96,6 +112,9 @@ def home(request):
             <li><code>GET /api/patients/{id}/guardians/</code> - Get patient's guardians</li>
             <li><code>GET /api/patients/{id}/alerts/</code> - Get patient's alerts</li>
             <li><code>POST /api/health-data/</code> - Send health data from IoT devices</li>
+            <li><code>POST /api/health-data/batch/</code> - Send a batch of health data samples</li>
+            <li><code>WS /ws/health-data/{user_id}/</code> - Stream health data samples (ASGI only)</li>
+            <li><code>GET /api/ml/status/</code> - Show the models in use</li>
             <li><code>GET /api/guardians/</code> - List all guardians</li>
             <li><code>POST /api/guardians/</code> - Add a guardian</li>
             <li><code>GET /api/alerts/</code> - List all alerts</li>
@@ -124,10 +143,16 @@ def home(request):
     
     return HttpResponse(html)
 
-# Initialize ML predictor, Firebase service, and Firebase repository
+# Initialize ML predictor. Firebase writes go through the outbox and are
+# delivered by the run_firebase_outbox worker, not the request thread.
 health_predictor = HealthPredictor()
-firebase_service = FirebaseService()
-firebase_repository = FirebaseRepository()
+
+# Ingest endpoints accept the compact binary sample frames as well as JSON
+INGEST_PARSER_CLASSES = api_settings.DEFAULT_PARSER_CLASSES + [HealthSampleFrameParser]
+
+# Fields every health data sample must provide
+REQUIRED_HEALTH_FIELDS = ['heart_rate', 'spo2', 'accelerometer_x', 'accelerometer_y',
+                          'accelerometer_z', 'gyroscope_x', 'gyroscope_y', 'gyroscope_z']
 
 class PatientViewSet(viewsets.ModelViewSet):
     """API endpoint for patients"""
@@ -135,84 +160,190 @@ class PatientViewSet(viewsets.ModelViewSet):
     serializer_class = PatientSerializer
     
     def perform_create(self, serializer):
-        """Override create to save patient to Firebase"""
-        patient = serializer.save()
-        firebase_repository.save_patient(patient)
+        """Override create to queue the patient for Firebase in the same transaction"""
+        with transaction.atomic():
+            patient = serializer.save()
+            enqueue_save(patient)
         return patient
     
     def perform_update(self, serializer):
-        """Override update to save patient to Firebase"""
-        patient = serializer.save()
-        firebase_repository.save_patient(patient)
+        """Override update to queue the patient for Firebase in the same transaction"""
+        with transaction.atomic():
+            patient = serializer.save()
+            enqueue_save(patient)
         return patient
     
     @action(detail=True, methods=['get'])
     def guardians(self, request, pk=None):
         """Get guardians for a specific patient"""
         patient = self.get_object()
-        guardians = Guardian.objects.filter(patient=patient)
+        # The related manager hands every row this patient, so patient_name costs no queries
+        guardians = patient.guardians.all()
         serializer = GuardianSerializer(guardians, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def alerts(self, request, pk=None):
-        """Get alerts for a specific patient"""
+        """Get a page of a patient's alerts, optionally only those with ?status= (see pagination.py)"""
         patient = self.get_object()
-        alerts = Alert.objects.filter(patient=patient).order_by('-timestamp')
-        serializer = AlertSerializer(alerts, many=True)
-        return Response(serializer.data)
+        alerts = filter_time_range(patient.alerts.all(), request.query_params)
+        alert_status = request.query_params.get('status')
+        if alert_status:
+            if alert_status not in dict(Alert._meta.get_field('status').choices):
+                return Response({'error': f'Unknown alert status: {alert_status}'}, status=status.HTTP_400_BAD_REQUEST)
+            alerts = alerts.filter(status=alert_status)
+        paginator = TimeSeriesCursorPagination()
+        page = paginator.paginate_queryset(alerts, request, view=self)
+        return paginator.get_paginated_response(AlertSerializer(page, many=True).data)
     
     @action(detail=True, methods=['get'])
     def health_data(self, request, pk=None):
-        """Get health data for a specific patient"""
+        """
+        Get a page of a patient's health data, newest first (see pagination.py)
+        
+        With ?points=N, get the since..until range (default: the day up to
+        now) instead, downsampled to at most N samples per metric with LTTB
+        (see downsampling.py). ?metrics= limits the metrics, comma-separated.
+        """
         patient = self.get_object()
-        health_data = HealthData.objects.filter(patient=patient).order_by('-timestamp')[:100]  # Get last 100 entries
-        serializer = HealthDataSerializer(health_data, many=True)
-        return Response(serializer.data)
+        if 'points' in request.query_params:
+            return self._downsampled_health_data(request, patient)
+        health_data = filter_time_range(patient.health_data.all(), request.query_params)
+        # Pages reach back into the archive once the table runs out
+        paginator = HealthDataCursorPagination(HealthDataRepository(), patient,
+                                               parse_time_param(request.query_params, 'since'),
+                                               parse_time_param(request.query_params, 'until'))
+        page = paginator.paginate_queryset(health_data, request, view=self)
+        return paginator.get_paginated_response(HealthDataSerializer(page, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def sensor_windows(self, request, pk=None):
+        """Get a page of a patient's packed IMU windows, newest first (see window_storage.py)"""
+        patient = self.get_object()
+        windows = filter_time_range(patient.sensor_windows.all(), request.query_params)
+        paginator = TimeSeriesCursorPagination()
+        page = paginator.paginate_queryset(windows, request, view=self)
+        return paginator.get_paginated_response(SensorWindowSerializer(page, many=True).data)
+    
+    def _downsampled_health_data(self, request, patient):
+        max_points = getattr(settings, 'HEALTH_DATA_MAX_POINTS', 5000)
+        try:
+            points = int(request.query_params['points'])
+        except ValueError:
+            return Response({'error': "'points' must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 3 <= points <= max_points:
+            return Response({'error': f"'points' must be between 3 and {max_points}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        metrics = [metric for metric in request.query_params.get('metrics', '').split(',') if metric] or METRICS
+        unknown = [metric for metric in metrics if metric not in METRICS]
+        if unknown:
+            return Response({'error': f"Unknown metric: {', '.join(unknown)}; expected one of {', '.join(METRICS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            until = parse_time_param(request.query_params, 'until') or timezone.now()
+            since = parse_time_param(request.query_params, 'since') or until - timedelta(days=1)
+        except ParseError as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(dict(downsample_series(HealthDataRepository(), patient.id, since, until, points, metrics),
+                             patient=patient.id, since=since, until=until, points=points))
+    
+    @action(detail=True, methods=['get'])
+    def trends(self, request, pk=None):
+        """
+        Get per-bucket summaries of a patient's health data from the rollups (see rollups.py)
+        
+        Query parameters: since and until (default: the week up to now),
+        resolution (minute, hour or day; by default the finest with at most
+        max_points buckets) and max_points (default 500).
+        """
+        patient = self.get_object()
+        try:
+            until = parse_time_param(request.query_params, 'until') or timezone.now()
+            since = parse_time_param(request.query_params, 'since') or until - timedelta(days=7)
+        except ParseError as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+        if since >= until:
+            return Response({'error': "'since' must be before 'until'"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resolution_name = request.query_params.get('resolution')
+        if resolution_name:
+            if resolution_name not in RESOLUTIONS:
+                return Response({'error': f"Unknown resolution: {resolution_name}; expected one of "
+                                          f"{', '.join(RESOLUTIONS)}"}, status=status.HTTP_400_BAD_REQUEST)
+            resolution = RESOLUTIONS[resolution_name]
+        else:
+            try:
+                max_points = int(request.query_params.get('max_points', 500))
+            except ValueError:
+                return Response({'error': "'max_points' must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            resolution = choose_resolution(since, until, max(max_points, 1))
+            resolution_name = next(name for name, seconds in RESOLUTIONS.items() if seconds == resolution)
+        
+        rollups = trend_rollups(patient, since, until, resolution)
+        return Response({
+            'patient': patient.id,
+            'resolution': resolution_name,
+            'since': since,
+            'until': until,
+            'buckets': HealthDataRollupSerializer(rollups, many=True).data
+        })
 
 class GuardianViewSet(viewsets.ModelViewSet):
     """API endpoint for guardians"""
-    queryset = Guardian.objects.all()
+    queryset = Guardian.objects.select_related('patient')
     serializer_class = GuardianSerializer
     
     def perform_create(self, serializer):
-        """Override create to save guardian to Firebase"""
-        guardian = serializer.save()
-        firebase_repository.save_guardian(guardian)
+        """Override create to queue the guardian for Firebase in the same transaction"""
+        with transaction.atomic():
+            guardian = serializer.save()
+            enqueue_save(guardian)
         return guardian
     
     def perform_update(self, serializer):
-        """Override update to save guardian to Firebase"""
-        guardian = serializer.save()
-        firebase_repository.save_guardian(guardian)
+        """Override update to queue the guardian for Firebase in the same transaction"""
+        with transaction.atomic():
+            guardian = serializer.save()
+            enqueue_save(guardian)
         return guardian
 
 class AlertViewSet(viewsets.ModelViewSet):
     """API endpoint for alerts"""
-    queryset = Alert.objects.all().order_by('-timestamp')
+    queryset = Alert.objects.select_related('patient').order_by('-timestamp', '-id')
     serializer_class = AlertSerializer
+    pagination_class = TimeSeriesCursorPagination
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = filter_time_range(queryset, self.request.query_params)
+        return queryset
     
     def perform_create(self, serializer):
-        """Override create to save alert to Firebase"""
-        alert = serializer.save()
-        firebase_repository.save_alert(alert)
+        """Override create to queue the alert for Firebase in the same transaction"""
+        with transaction.atomic():
+            alert = serializer.save()
+            enqueue_save(alert)
         return alert
     
     def perform_update(self, serializer):
-        """Override update to save alert to Firebase"""
-        alert = serializer.save()
-        firebase_repository.save_alert(alert)
+        """Override update to queue the alert for Firebase in the same transaction"""
+        with transaction.atomic():
+            alert = serializer.save()
+            enqueue_save(alert)
         return alert
     
     @action(detail=True, methods=['post'])
     def acknowledge(self, request, pk=None):
         """Mark an alert as acknowledged"""
         alert = self.get_object()
-        alert.status = 'ACKNOWLEDGED'
-        alert.save()
-        
-        # Update in Firebase
-        firebase_repository.save_alert(alert)
+        with transaction.atomic():
+            alert.status = 'ACKNOWLEDGED'
+            alert.save()
+            
+            # Queue the update for Firebase
+            enqueue_save(alert)
         
         serializer = AlertSerializer(alert)
         return Response(serializer.data)
@@ -221,131 +352,409 @@ class AlertViewSet(viewsets.ModelViewSet):
     def resolve(self, request, pk=None):
         """Mark an alert as resolved"""
         alert = self.get_object()
-        alert.status = 'RESOLVED'
-        alert.save()
-        
-        # Update in Firebase
-        firebase_repository.save_alert(alert)
+        with transaction.atomic():
+            alert.status = 'RESOLVED'
+            alert.save()
+            
+            # Queue the update for Firebase
+            enqueue_save(alert)
         
         serializer = AlertSerializer(alert)
         return Response(serializer.data)
 
 @api_view(['POST'])
+@parser_classes(INGEST_PARSER_CLASSES)
 def process_health_data(request):
-    """Process health data from sensors and predict anomalies"""
+    """
+    Process health data from sensors and predict anomalies
+    
+    The sample is stored and scored like a one-sample batch (see
+    ingest_health_data_batch), so window storage and timestamps apply to it
+    the same way; the scoring still goes through the micro-batchers.
+    """
     try:
         # Get data from request
         data = request.data
-        user_id = data.get('user_id')
+        if isinstance(data, SampleFrame):
+            data = frame_to_request_data(data)
         
-        # Validate required fields
-        required_fields = ['heart_rate', 'spo2', 'accelerometer_x', 'accelerometer_y', 
-                          'accelerometer_z', 'gyroscope_x', 'gyroscope_y', 'gyroscope_z']
+        if 'samples' in data:
+            return Response({'error': 'Multi-sample payloads must be sent to /api/health-data/batch/'},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        for field in required_fields:
-            if field not in data:
-                return Response({'error': f'Missing required field: {field}'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
+        # Validate required fields
+        error = _validate_batch_sample(data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         
         # Find patient by user_id
+        user_id = str(data['user_id'])
         try:
             patient = Patient.objects.get(user_id=user_id)
         except Patient.DoesNotExist:
             return Response({'error': f'Patient with user_id {user_id} not found'}, 
                            status=status.HTTP_404_NOT_FOUND)
         
-        # Create health data entry
-        health_data = HealthData.objects.create(
+        # Store the sample and any alerts together with their Firebase outbox entries
+        response_data = ingest_health_data_batch([data], patients={user_id: patient})[0]
+        del response_data['index']
+        return Response(response_data, status=status.HTTP_200_OK)
+    
+    except ParseError as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _validate_batch_sample(sample):
+    """
+    Return an error message for an invalid batch sample, or None if it is valid
+    
+    With SENSOR_WINDOW_STORAGE on, a sample may leave out both vitals (an
+    IMU-only reading, see window_storage.py).
+    """
+    if not isinstance(sample, dict):
+        return 'Sample must be an object'
+    if not sample.get('user_id'):
+        return 'Missing required field: user_id'
+    imu_only = (getattr(settings, 'SENSOR_WINDOW_STORAGE', False)
+                and all(sample.get(field) is None for field in VITALS_FIELDS))
+    for field in REQUIRED_HEALTH_FIELDS:
+        if imu_only and field in VITALS_FIELDS:
+            continue
+        if sample.get(field) is None:
+            return f'Missing required field: {field}'
+        try:
+            float(sample[field])
+        except (TypeError, ValueError):
+            return f'Invalid value for field: {field}'
+    if sample.get('timestamp') is not None:
+        try:
+            if parse_datetime(str(sample['timestamp'])) is None:
+                return 'Invalid value for field: timestamp'
+        except ValueError:
+            return 'Invalid value for field: timestamp'
+    return None
+
+
+def ingest_health_data_batch(samples, patients=None):
+    """
+    Validate, store and score a batch of health data samples
+    
+    Patients are resolved with a single query, all rows are inserted with
+    bulk_create inside one transaction and the whole batch is scored with one
+    predictor call per model. Firebase mirroring is queued in the outbox.
+    With SENSOR_WINDOW_STORAGE on, IMU readings are packed into SensorWindow
+    rows (see window_storage.py) and results also carry a sensor_window_id;
+    only samples with vitals get a HealthData row.
+    
+    Args:
+        samples: List of sample dictionaries, each with a user_id
+        patients: Optional mapping of user_id to an already loaded Patient,
+                  used by long-lived stream connections to skip the lookup
+        
+    Returns:
+        List of per-sample result dictionaries in input order
+    """
+    results = [None] * len(samples)
+    
+    # Validate every sample before touching the database
+    valid_indexes = []
+    for index, sample in enumerate(samples):
+        error = _validate_batch_sample(sample)
+        if error:
+            results[index] = {'index': index, 'error': error}
+        else:
+            valid_indexes.append(index)
+    
+    # Resolve all patients in one query
+    user_ids = {str(samples[index]['user_id']) for index in valid_indexes}
+    patients = dict(patients or {})
+    missing_user_ids = user_ids - set(patients)
+    if missing_user_ids:
+        patients.update({p.user_id: p for p in Patient.objects.filter(user_id__in=missing_user_ids)})
+    
+    # With window storage, a patient's untimed samples are consecutive readings ending now
+    use_windows = getattr(settings, 'SENSOR_WINDOW_STORAGE', False)
+    _, sample_rate = window_settings()
+    received = timezone.now()
+    untimed_left = Counter(str(samples[index]['user_id']) for index in valid_indexes
+                           if samples[index].get('timestamp') is None)
+    
+    stored_indexes = []
+    rows = []
+    for index in valid_indexes:
+        sample = samples[index]
+        patient = patients.get(str(sample['user_id']))
+        if patient is None:
+            results[index] = {'index': index,
+                              'error': f"Patient with user_id {sample['user_id']} not found"}
+            continue
+        
+        timestamp = timezone.now()
+        if sample.get('timestamp') is not None:
+            timestamp = parse_datetime(str(sample['timestamp']))
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+        elif use_windows:
+            untimed_left[patient.user_id] -= 1
+            timestamp = received - timedelta(seconds=untimed_left[patient.user_id] / sample_rate)
+        
+        stored_indexes.append(index)
+        has_vitals = sample.get('heart_rate') is not None
+        rows.append(HealthData(
             patient=patient,
-            heart_rate=data['heart_rate'],
-            spo2=data['spo2'],
-            accelerometer_x=data['accelerometer_x'],
-            accelerometer_y=data['accelerometer_y'],
-            accelerometer_z=data['accelerometer_z'],
-            gyroscope_x=data['gyroscope_x'],
-            gyroscope_y=data['gyroscope_y'],
-            gyroscope_z=data['gyroscope_z']
-        )
+            timestamp=timestamp,
+            heart_rate=float(sample['heart_rate']) if has_vitals else None,
+            spo2=float(sample['spo2']) if has_vitals else None,
+            accelerometer_x=float(sample['accelerometer_x']),
+            accelerometer_y=float(sample['accelerometer_y']),
+            accelerometer_z=float(sample['accelerometer_z']),
+            gyroscope_x=float(sample['gyroscope_x']),
+            gyroscope_y=float(sample['gyroscope_y']),
+            gyroscope_z=float(sample['gyroscope_z'])
+        ))
+    
+    return _store_and_score(rows, stored_indexes, results)
+
+
+def ingest_health_data_frame(frame, patients=None):
+    """
+    Store and score the samples of a decoded binary frame (see wire_format.py)
+    
+    Does what ingest_health_data_batch does, but builds the rows and the
+    model inputs straight from the frame's float32 columns: its samples need
+    no per-field validation, and all belong to one patient. Samples with NaN
+    vitals are IMU-only readings (see window_storage.py).
+    
+    Args:
+        frame: SampleFrame from wire_format.decode_frame
+        patients: Optional mapping of user_id to an already loaded Patient
         
-        # Save health data to Firebase
-        firebase_repository.save_health_data(health_data)
+    Returns:
+        List of per-sample result dictionaries in frame order
+    """
+    count = frame.values.shape[1]
+    patient = (patients or {}).get(frame.user_id) or Patient.objects.filter(user_id=frame.user_id).first()
+    if patient is None:
+        return [{'index': index, 'error': f"Patient with user_id {frame.user_id} not found"}
+                for index in range(count)]
+    if not count:
+        return []
+    
+    use_windows = getattr(settings, 'SENSOR_WINDOW_STORAGE', False)
+    results = [None] * count
+    missing = np.isnan(frame.values[:len(VITALS_FIELDS)])
+    imu_only = missing.all(axis=0)
+    for index in np.flatnonzero(missing.any(axis=0) & ~(imu_only & use_windows)).tolist():
+        field = VITALS_FIELDS[int(np.argmax(missing[:, index]))]
+        results[index] = {'index': index, 'error': f'Missing required field: {field}'}
+    stored = [index for index in range(count) if results[index] is None]
+    
+    columns = dict(zip(FRAME_FIELDS, frame.values.astype(np.float64).tolist()))
+    if frame.start_time_ms:
+        start = datetime.fromtimestamp(frame.start_time_ms / 1000.0, tz=dt_timezone.utc)
+        timestamps = [start + timedelta(milliseconds=frame.sample_interval_ms * i) for i in range(count)]
+    elif use_windows:
+        # Consecutive readings ending now, as for untimed batch samples
+        _, sample_rate = window_settings()
+        received = timezone.now()
+        timestamps = [received - timedelta(seconds=(count - 1 - i) / sample_rate) for i in range(count)]
+    else:
+        timestamps = [timezone.now()] * count
+    
+    rows = [HealthData(patient=patient, timestamp=timestamps[i],
+                       **{field: None if imu_only[i] and field in VITALS_FIELDS else columns[field][i]
+                          for field in FRAME_FIELDS})
+            for i in stored]
+    motion = frame.values[len(VITALS_FIELDS):, stored].T.astype(np.float64)
+    return _store_and_score(rows, stored, results, motion)
+
+
+def _store_and_score(rows, stored_indexes, results, motion=None):
+    """
+    Score unsaved HealthData rows and store them with their alerts and outbox entries
+    
+    Rows without vitals (IMU-only readings, see window_storage.py) are only
+    stored in their SensorWindow; a fall alert on one has no health_data.
+    A single row is scored through the predictor's micro-batchers, so
+    concurrent single-sample requests still share model calls.
+    
+    Args:
+        rows: Unsaved HealthData rows with patient and timestamp set
+        stored_indexes: Index in results of each row
+        results: Per-sample results, filled in at stored_indexes
+        motion: IMU model input of the rows, if already an array
+    """
+    if not rows:
+        return results
+    use_windows = getattr(settings, 'SENSOR_WINDOW_STORAGE', False)
+    
+    if motion is None:
+        motion = [[row.accelerometer_x, row.accelerometer_y, row.accelerometer_z,
+                   row.gyroscope_x, row.gyroscope_y, row.gyroscope_z] for row in rows]
+    vitals_positions = [position for position, row in enumerate(rows) if row.heart_rate is not None]
+    vitals = [[rows[position].heart_rate, rows[position].spo2] for position in vitals_positions]
+    patient_ids = [row.patient_id for row in rows]
+    
+    # Score the whole batch with one call per model
+    vitals_results = [None] * len(rows)
+    if len(rows) == 1:
+        fall_results = [health_predictor.predict_fall(*[[value] for value in motion[0]],
+                                                      patient_id=patient_ids[0])]
+        if vitals:
+            vitals_results[0] = health_predictor.predict_vitals_risk(*vitals[0], patient_id=patient_ids[0])
+    else:
+        fall_results = health_predictor.split_results(
+            health_predictor.predict_fall_windows(patient_ids, motion))
+        if vitals:
+            scored = health_predictor.split_results(health_predictor.predict_vitals_risk_batch(
+                vitals, [patient_ids[position] for position in vitals_positions]))
+            for position, result in zip(vitals_positions, scored):
+                vitals_results[position] = result
+    
+    # With window storage, IMU readings go to SensorWindow rows and only
+    # readings with vitals keep a HealthData row
+    saved = [rows[position] for position in vitals_positions]
+    windows, row_windows = [], [None] * len(rows)
+    if use_windows:
+        windows, row_windows = build_sensor_windows(rows)
+    
+    alerts = []
+    alert_rows = []
+    with transaction.atomic():
+        update_rollups(saved)
+        if use_windows:
+            SensorWindow.objects.bulk_create(windows)
+        HealthData.objects.bulk_create(saved)
         
-        # Run ML predictions
-        # 1. Fall detection
-        fall_result = health_predictor.predict_fall(
-            [data['accelerometer_x']], [data['accelerometer_y']], [data['accelerometer_z']],
-            [data['gyroscope_x']], [data['gyroscope_y']], [data['gyroscope_z']]
-        )
+        for position, row in enumerate(rows):
+            fall_result = fall_results[position]
+            vitals_result = vitals_results[position]
+            if fall_result['is_anomaly']:
+                alerts.append(Alert(
+                    patient=row.patient,
+                    type='FALL',
+                    message=f"Fall detected with {fall_result['fall_probability']:.2%} confidence",
+                    health_data=row if row.pk else None,
+                    timestamp=row.timestamp,
+                    status='NEW'
+                ))
+                alert_rows.append(position)
+            if vitals_result is not None and vitals_result['is_anomaly']:
+                alerts.append(Alert(
+                    patient=row.patient,
+                    type='VITALS',
+                    message=f"Abnormal vitals detected: {vitals_result['risk_level']}. " +
+                            f"HR: {row.heart_rate}, SpO2: {row.spo2}",
+                    health_data=row,
+                    timestamp=row.timestamp,
+                    status='NEW'
+                ))
+                alert_rows.append(position)
         
-        # 2. Vitals risk assessment
-        vitals_result = health_predictor.predict_vitals_risk(
-            data['heart_rate'], data['spo2']
-        )
+        Alert.objects.bulk_create(alerts)
         
-        # Process results and create alerts if anomalies detected
-        alerts_created = []
-        
-        # Check for fall
-        if fall_result['is_anomaly']:
-            fall_alert = Alert.objects.create(
-                patient=patient,
-                type='FALL',
-                message=f"Fall detected with {fall_result['fall_probability']:.2%} confidence",
-                health_data=health_data,
-                status='NEW'
-            )
-            alerts_created.append(fall_alert)
-            
-            # Save alert to Firebase
-            firebase_repository.save_alert(fall_alert)
-            
-            # Send notifications to guardians
-            guardians = Guardian.objects.filter(patient=patient, notification_enabled=True)
-            firebase_service.send_alert_to_guardians(
-                guardians, 
-                patient.name, 
-                "Fall Detected", 
-                f"A fall was detected with {fall_result['fall_probability']:.2%} confidence"
+        # Queue Firebase mirroring and guardian notifications in the same transaction
+        outbox_entries = [build_save_entry(row) for row in saved]
+        outbox_entries += [build_save_entry(alert) for alert in alerts]
+        outbox_entries += [
+            build_notification_entry(
+                alert.patient,
+                "Fall Detected" if alert.type == 'FALL' else "Abnormal Vitals",
+                alert.message
             )
+            for alert in alerts
+        ]
+        FirebaseOutbox.objects.bulk_create(outbox_entries)
+    
+    alerts_by_row = {}
+    for alert, position in zip(alerts, alert_rows):
+        alerts_by_row.setdefault(position, []).append(alert)
+    
+    for position, (index, row) in enumerate(zip(stored_indexes, rows)):
+        results[index] = {
+            'index': index,
+            'health_data_id': row.id,
+            'fall_detection': fall_results[position],
+            'vitals_assessment': vitals_results[position],
+            'alerts_created': AlertSerializer(alerts_by_row.get(position, []), many=True).data
+        }
+        if use_windows:
+            results[index]['sensor_window_id'] = row_windows[position].id
+    
+    return results
+
+def _batch_response(results):
+    stored = sum(1 for result in results if 'error' not in result)
+    return Response({
+        'received': len(results),
+        'stored': stored,
+        'failed': len(results) - stored,
+        'results': results
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@parser_classes(INGEST_PARSER_CLASSES)
+def process_health_data_batch(request):
+    """
+    Process a batch of health data samples from sensors
+    
+    Accepts either a list of samples, an object with a "samples" list or a
+    single sample object. A top-level user_id in the object is used for
+    samples that omit it. Binary sample frames are stored from their arrays
+    (see ingest_health_data_frame).
+    """
+    try:
+        data = request.data
+        max_samples = getattr(settings, 'HEALTH_DATA_BATCH_MAX_SAMPLES', 5000)
+        if isinstance(data, SampleFrame):
+            if data.values.shape[1] > max_samples:
+                return Response({'error': f'Batch exceeds maximum of {max_samples} samples'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not data.values.shape[1]:
+                return Response({'error': 'No samples provided'}, status=status.HTTP_400_BAD_REQUEST)
+            results = ingest_health_data_frame(data)
+            return _batch_response(results)
         
-        # Check for abnormal vitals
-        if vitals_result['is_anomaly']:
-            vitals_alert = Alert.objects.create(
-                patient=patient,
-                type='VITALS',
-                message=f"Abnormal vitals detected: {vitals_result['risk_level']}. " +
-                        f"HR: {data['heart_rate']}, SpO2: {data['spo2']}",
-                health_data=health_data,
-                status='NEW'
-            )
-            alerts_created.append(vitals_alert)
-            
-            # Save alert to Firebase
-            firebase_repository.save_alert(vitals_alert)
-            
-            # Send notifications to guardians
-            guardians = Guardian.objects.filter(patient=patient, notification_enabled=True)
-            firebase_service.send_alert_to_guardians(
-                guardians, 
-                patient.name, 
-                "Abnormal Vitals", 
-                f"Abnormal vitals detected: {vitals_result['risk_level']}. " +
-                f"HR: {data['heart_rate']}, SpO2: {data['spo2']}"
-            )
+        if isinstance(data, list):
+            samples = data
+        elif isinstance(data, dict) and isinstance(data.get('samples'), list):
+            default_user_id = data.get('user_id')
+            samples = data['samples']
+            if default_user_id:
+                samples = [
+                    dict(sample, user_id=sample.get('user_id') or default_user_id)
+                    if isinstance(sample, dict) else sample
+                    for sample in samples
+                ]
+        elif isinstance(data, dict) and 'samples' not in data and data.get('user_id'):
+            samples = [data]
+        else:
+            return Response({'error': 'Expected a list of samples or an object with a "samples" list'},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Return results
-        response_data = {
-            'health_data_id': health_data.id,
-            'fall_detection': fall_result,
-            'vitals_assessment': vitals_result,
-            'alerts_created': AlertSerializer(alerts_created, many=True).data
-        }
+        if not samples:
+            return Response({'error': 'No samples provided'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(response_data, status=status.HTTP_200_OK)
+        if len(samples) > max_samples:
+            return Response({'error': f'Batch exceeds maximum of {max_samples} samples'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        return _batch_response(ingest_health_data_batch(samples))
     
+    except ParseError as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+def ml_model_status(request):
+    """
+    Report which models are serving predictions, with their load and warmup times
+    """
+    return Response(health_predictor.get_status())
+
 @api_view(['POST'])
 def chat_with_health_assistant(request):
     """
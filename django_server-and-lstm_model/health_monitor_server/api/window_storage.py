@@ -0,0 +1,135 @@
+"""
+Packed storage of IMU samples in SensorWindow rows
+
+At 50 Hz, six float columns per reading make motion data the largest part
+of the HealthData table by far. With SENSOR_WINDOW_STORAGE on, ingest packs
+a patient's consecutive IMU readings into SensorWindow rows of up to
+SENSOR_WINDOW_SAMPLES samples: the six axes as one float32 blob, the start
+time, the sample rate and the accelerometer SMV mean, max and standard
+deviation. Only readings that carry vitals (heart_rate and spo2) also get a
+HealthData row, a complete one; IMU-only readings are stored in their window
+alone. Devices that sample vitals at 1 Hz and motion at 50 Hz thus write one
+row per second instead of fifty, and the windows hold the whole motion
+series.
+
+A window covers readings spaced 1 / SENSOR_WINDOW_SAMPLE_RATE apart, so
+their times follow from the start time. A reading that is off that grid by
+more than half a sample period (a gap, a clock jump or a repeated
+timestamp) starts a new window. Readings are sorted by time first.
+
+Blob layout: sample_count little-endian float32 values per axis, in
+IMU_FIELDS order (column-major, like the body of a wire_format frame).
+"""
+import numpy as np
+from django.conf import settings
+
+from .models import SensorWindow
+
+IMU_FIELDS = ('accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+              'gyroscope_x', 'gyroscope_y', 'gyroscope_z')
+SAMPLE_DTYPE = np.dtype('<f4')
+
+
+def window_settings():
+    """(samples per window, sample rate in Hz) from the settings"""
+    return (getattr(settings, 'SENSOR_WINDOW_SAMPLES', 50),
+            float(getattr(settings, 'SENSOR_WINDOW_SAMPLE_RATE', 50.0)))
+
+
+def pack_samples(motion):
+    """Blob of an (n, 6) array of readings in IMU_FIELDS order"""
+    return np.ascontiguousarray(np.asarray(motion, dtype=SAMPLE_DTYPE).T).tobytes()
+
+
+def unpack_samples(window):
+    """float32 array of shape (6, sample_count) of a SensorWindow's readings"""
+    values = np.frombuffer(bytes(window.samples), dtype=SAMPLE_DTYPE)
+    if len(values) != len(IMU_FIELDS) * window.sample_count:
+        raise ValueError(f"Sensor window {window.pk} holds {len(values)} values, "
+                         f"expected {len(IMU_FIELDS) * window.sample_count}")
+    return values.reshape(len(IMU_FIELDS), window.sample_count)
+
+
+def summarize(motion):
+    """
+    Accelerometer SMV mean, max and standard deviation of (n, 6) readings
+
+    Computed from the float32 values that are stored. The standard deviation
+    uses ddof=1, as the fall model's features do, and is None for one sample.
+    """
+    acc = np.asarray(motion, dtype=SAMPLE_DTYPE)[:, :3].astype(np.float64)
+    smv = np.sqrt((acc ** 2).sum(axis=1))
+    return {
+        'smv_mean': float(smv.mean()),
+        'smv_max': float(smv.max()),
+        'smv_std': float(smv.std(ddof=1)) if len(smv) > 1 else None,
+    }
+
+
+def split_windows(timestamps, sample_rate, max_samples):
+    """
+    Split increasing timestamps into runs on a 1 / sample_rate grid
+
+    Args:
+        timestamps: Epoch seconds of one patient's readings, sorted
+        sample_rate: Expected readings per second
+        max_samples: Most readings per run
+
+    Returns:
+        List of (start, end) index ranges
+    """
+    period = 1.0 / sample_rate
+    runs = []
+    start = 0
+    for position in range(1, len(timestamps)):
+        offset = position - start
+        expected = timestamps[start] + offset * period
+        if offset >= max_samples or abs(timestamps[position] - expected) > period / 2:
+            runs.append((start, position))
+            start = position
+    if len(timestamps):
+        runs.append((start, len(timestamps)))
+    return runs
+
+
+def build_sensor_windows(rows, sample_rate=None, max_samples=None):
+    """
+    Group unsaved HealthData rows into SensorWindow rows, per patient
+
+    Args:
+        rows: HealthData rows with patient and timestamp set
+        sample_rate, max_samples: Default to the settings
+
+    Returns:
+        Tuple (windows, row_windows): the unsaved SensorWindow rows and the
+        window holding each row's readings
+    """
+    default_samples, default_rate = window_settings()
+    sample_rate = sample_rate or default_rate
+    max_samples = max_samples or default_samples
+
+    positions_by_patient = {}
+    for position, row in enumerate(rows):
+        positions_by_patient.setdefault(row.patient_id, []).append(position)
+
+    windows, row_windows = [], [None] * len(rows)
+    for positions in positions_by_patient.values():
+        positions.sort(key=lambda position: rows[position].timestamp)
+        timestamps = np.array([rows[position].timestamp.timestamp() for position in positions])
+        motion = np.array([[getattr(rows[position], field) for field in IMU_FIELDS] for position in positions],
+                          dtype=np.float64).reshape(-1, len(IMU_FIELDS))
+        for start, end in split_windows(timestamps, sample_rate, max_samples):
+            first = rows[positions[start]]
+            window = SensorWindow(
+                patient=first.patient,
+                timestamp=first.timestamp,
+                sample_rate=sample_rate,
+                sample_count=end - start,
+                samples=pack_samples(motion[start:end]),
+                **summarize(motion[start:end]),
+            )
+            windows.append(window)
+            for position in positions[start:end]:
+                row_windows[position] = window
+    return windows, row_windows
+
@@ -0,0 +1,199 @@
+"""
+Compact binary wire format for health sample frames
+
+A frame carries N samples from one device in a fixed little-endian layout:
+
+    Header (24 bytes)
+        magic               4s   b'HMSF'
+        version             B    FRAME_VERSION
+        flags               B    reserved, 0
+        sample_count        H    N
+        sequence            I    device sequence number
+        start_time_ms       Q    timestamp of the first sample in ms since the
+                                 Unix epoch, 0 if the server should stamp it
+        sample_interval_ms  H    spacing between samples in ms
+        device_id_length    B    L, at most MAX_DEVICE_ID_SIZE
+        reserved            x
+
+    Device id (L bytes, then NUL padding to a multiple of 4 bytes)
+        patient user_id, UTF-8
+
+    Body (N * 8 float32 values, column-major)
+        heart_rate[N], spo2[N],
+        accelerometer_x[N], accelerometer_y[N], accelerometer_z[N],
+        gyroscope_x[N], gyroscope_y[N], gyroscope_z[N]
+
+    NaN vitals mark a reading without them, e.g. IMU readings taken between
+    two heart rate readings (see window_storage.py). Every other value must
+    be finite.
+
+Version 1 frames, whose header held the user_id in a fixed 16-byte field
+(magic, version, flags, sample_count, sequence, device_id 16s,
+start_time_ms, sample_interval_ms, 2 reserved bytes: 40 bytes), are still
+decoded, so devices can be updated at their own pace.
+
+A sample costs 32 bytes instead of roughly 230 bytes of JSON, and the whole
+body decodes with a single numpy.frombuffer call. The ingest endpoints store
+frames from these arrays directly (see views.ingest_health_data_frame).
+
+This module only depends on numpy and the standard library so that device
+simulators and test scripts can use it as the reference encoder.
+"""
+import math
+import struct
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+
+FRAME_MAGIC = b'HMSF'
+FRAME_VERSION = 2
+FRAME_MEDIA_TYPE = 'application/x-health-sample-frame'
+
+HEADER_STRUCT = struct.Struct('<4sBBHIQHBx')
+HEADER_SIZE = HEADER_STRUCT.size
+# Patient.user_id is at most 100 characters; the length field allows more
+MAX_DEVICE_ID_SIZE = 255
+
+# Version 1 header, with the user_id in a fixed field
+V1_HEADER_STRUCT = struct.Struct('<4sBBHI16sQH2x')
+V1_DEVICE_ID_SIZE = 16
+
+# Column order of the frame body
+FRAME_FIELDS = ['heart_rate', 'spo2',
+                'accelerometer_x', 'accelerometer_y', 'accelerometer_z',
+                'gyroscope_x', 'gyroscope_y', 'gyroscope_z']
+N_FIELDS = len(FRAME_FIELDS)
+# Leading columns that are NaN in a reading without vitals
+VITALS_FIELDS = FRAME_FIELDS[:2]
+MAX_SAMPLES = 0xFFFF
+
+SampleFrame = namedtuple('SampleFrame', [
+    'version', 'user_id', 'sequence', 'start_time_ms', 'sample_interval_ms', 'values'
+])
+
+
+class FrameError(ValueError):
+    """Raised when bytes are not a valid sample frame"""
+
+
+def encode_frame(user_id, samples, sequence=0, start_time_ms=0, sample_interval_ms=0):
+    """
+    Encode samples into a binary frame
+
+    Args:
+        user_id: Patient user_id, at most MAX_DEVICE_ID_SIZE bytes of UTF-8
+        samples: List of sample dictionaries with FRAME_FIELDS keys, or an
+                 array of shape (N, 8) in FRAME_FIELDS column order
+        sequence: Device sequence number of the frame
+        start_time_ms: Timestamp of the first sample in ms since the epoch
+        sample_interval_ms: Spacing between samples in ms
+
+    Returns:
+        Encoded frame as bytes
+    """
+    device_id = str(user_id).encode('utf-8')
+    if len(device_id) > MAX_DEVICE_ID_SIZE:
+        raise FrameError(f'user_id is longer than {MAX_DEVICE_ID_SIZE} bytes')
+
+    if len(samples) and isinstance(samples[0], dict):
+        values = np.array([[sample[field] for field in FRAME_FIELDS] for sample in samples],
+                          dtype='<f4')
+    else:
+        values = np.asarray(samples, dtype='<f4')
+    values = values.reshape(-1, N_FIELDS)
+
+    if len(values) > MAX_SAMPLES:
+        raise FrameError(f'A frame holds at most {MAX_SAMPLES} samples')
+
+    header = HEADER_STRUCT.pack(FRAME_MAGIC, FRAME_VERSION, 0, len(values),
+                                int(sequence), int(start_time_ms),
+                                int(sample_interval_ms), len(device_id))
+    # Padding keeps the body 4-byte aligned
+    device_id += b'\x00' * (-len(device_id) % 4)
+    # Column-major body: one contiguous float32 vector per field
+    return header + device_id + np.ascontiguousarray(values.T).tobytes()
+
+
+def decode_frame(data):
+    """
+    Decode a binary frame of either version
+
+    Returns:
+        SampleFrame whose values field is a read-only float32 array of shape
+        (8, N) in FRAME_FIELDS row order
+
+    Raises:
+        FrameError: If the bytes are not a valid frame or a value other than
+                    a missing vital is NaN or infinite
+    """
+    if len(data) < 5:
+        raise FrameError('Frame is shorter than the header')
+    magic, version = bytes(data[:4]), data[4]
+    if magic != FRAME_MAGIC:
+        raise FrameError('Not a health sample frame')
+
+    if version == FRAME_VERSION:
+        if len(data) < HEADER_SIZE:
+            raise FrameError('Frame is shorter than the header')
+        (_magic, _version, _flags, count, sequence, start_time_ms,
+         sample_interval_ms, device_id_length) = HEADER_STRUCT.unpack_from(data)
+        device_id = bytes(data[HEADER_SIZE:HEADER_SIZE + device_id_length])
+        body_offset = HEADER_SIZE + device_id_length + (-device_id_length % 4)
+    elif version == 1:
+        if len(data) < V1_HEADER_STRUCT.size:
+            raise FrameError('Frame is shorter than the header')
+        (_magic, _version, _flags, count, sequence, device_id,
+         start_time_ms, sample_interval_ms) = V1_HEADER_STRUCT.unpack_from(data)
+        device_id = device_id.rstrip(b'\x00')
+        body_offset = V1_HEADER_STRUCT.size
+    else:
+        raise FrameError(f'Unsupported frame version {version}')
+
+    expected = body_offset + count * N_FIELDS * 4
+    if len(data) != expected:
+        raise FrameError(f'Frame length {len(data)} does not match {count} samples')
+
+    values = np.frombuffer(data, dtype='<f4', count=count * N_FIELDS,
+                           offset=body_offset).reshape(N_FIELDS, count)
+    if not np.isfinite(values[len(VITALS_FIELDS):]).all() or np.isinf(values[:len(VITALS_FIELDS)]).any():
+        raise FrameError('Frame contains non-finite values')
+    user_id = device_id.decode('utf-8', errors='replace')
+    return SampleFrame(version, user_id, sequence, start_time_ms, sample_interval_ms, values)
+
+
+def frame_to_samples(frame):
+    """Convert a decoded frame into a list of sample dictionaries, with None for missing vitals"""
+    columns = {field: frame.values[i].tolist() for i, field in enumerate(FRAME_FIELDS)}
+    for field in VITALS_FIELDS:
+        columns[field] = [None if math.isnan(value) else value for value in columns[field]]
+    count = frame.values.shape[1]
+
+    timestamps = [None] * count
+    if frame.start_time_ms:
+        start = datetime.fromtimestamp(frame.start_time_ms / 1000.0, tz=dt_timezone.utc)
+        step = timedelta(milliseconds=frame.sample_interval_ms)
+        timestamps = [(start + step * i).isoformat() for i in range(count)]
+
+    samples = []
+    for i in range(count):
+        sample = {field: columns[field][i] for field in FRAME_FIELDS}
+        sample['user_id'] = frame.user_id
+        if timestamps[i] is not None:
+            sample['timestamp'] = timestamps[i]
+        samples.append(sample)
+    return samples
+
+
+def frame_to_request_data(frame):
+    """
+    Convert a decoded frame into request data for the ingest endpoints
+
+    A single-sample frame becomes a flat sample, as POST /api/health-data/
+    expects; larger frames become {"user_id", "sequence", "samples"} for
+    POST /api/health-data/batch/.
+    """
+    samples = frame_to_samples(frame)
+    if len(samples) == 1:
+        return dict(samples[0], sequence=frame.sequence)
+    return {'user_id': frame.user_id, 'sequence': frame.sequence, 'samples': samples}
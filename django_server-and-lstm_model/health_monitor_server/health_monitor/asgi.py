@@ -2,6 +2,8 @@
 ASGI config for health_monitor project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are handled by Django, WebSocket connections to
+``/ws/health-data/<user_id>/`` by the streaming ingestion in ``api.streaming``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +15,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_monitor.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+# Imported after Django is set up because it uses the ORM
+from api.streaming import health_data_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Route WebSocket connections to the stream handler and everything else to Django"""
+    if scope['type'] == 'websocket':
+        await health_data_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -63,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'health_monitor.wsgi.application'
+ASGI_APPLICATION = 'health_monitor.asgi.application'
 
 
 # Database
@@ -125,4 +126,56 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
-}
\ No newline at end of file
+}
+
+# Health data ingestion settings
+HEALTH_DATA_BATCH_MAX_SAMPLES = 5000
+
+# Health data reads: rollups kept current on ingest (see api/rollups.py), and the
+# largest ?points= of a downsampled series (see api/downsampling.py)
+HEALTH_ROLLUPS_ON_INGEST = True
+HEALTH_DATA_MAX_POINTS = 5000
+
+# Samples older than this many days are moved to the archive by the
+# archive_health_data command (see api/archive.py)
+HEALTH_DATA_RETENTION_DAYS = 30
+HEALTH_DATA_ARCHIVE_DIR = BASE_DIR / 'health_data_archive'
+
+# Batch ingest packs IMU readings into SensorWindow rows of up to
+# SENSOR_WINDOW_SAMPLES readings taken SENSOR_WINDOW_SAMPLE_RATE times a second;
+# only readings with vitals also get a HealthData row (see api/window_storage.py)
+SENSOR_WINDOW_STORAGE = False
+SENSOR_WINDOW_SAMPLES = 50
+SENSOR_WINDOW_SAMPLE_RATE = 50.0
+
+# Per-patient IMU windows kept in memory for fall detection (see api/sensor_windows.py)
+FALL_WINDOW_MAX_PATIENTS = 10000
+FALL_WINDOW_MAX_GAP_SECONDS = 30.0
+
+# Trained model artifacts (see api/model_loader.py). Models are loaded on first
+# use unless ML_MODELS_EAGER_LOAD is set
+ML_MODELS_DIR = BASE_DIR / 'ml_models'
+ML_MODELS_EAGER_LOAD = os.environ.get('ML_MODELS_EAGER_LOAD', '').lower() in ('1', 'true', 'yes')
+
+# Versioned model registry with hot reload and canary pinning (see api/model_registry.py)
+ML_MODEL_REGISTRY_DIR = BASE_DIR / 'ml_models' / 'registry'
+ML_MODEL_REGISTRY_POLL_SECONDS = 5.0
+
+# Micro-batching of concurrent single-sample predictions (see api/inference_scheduler.py)
+ML_BATCHING_ENABLED = True
+ML_BATCH_MAX_SIZE = 64
+ML_BATCH_MAX_WAIT_MS = 2.0
+# Longest a request waits for its batched prediction
+ML_BATCH_TIMEOUT_SECONDS = 10.0
+
+# Out-of-process model server (see api/model_server.py and the run_model_server
+# command). When set, web workers score on the server instead of loading models
+ML_MODEL_SERVER_SOCKET = os.environ.get('ML_MODEL_SERVER_SOCKET') or None
+ML_MODEL_SERVER_WORKERS = None
+
+# Firebase outbox settings (see api/outbox.py and the run_firebase_outbox command)
+FIREBASE_OUTBOX_BATCH_SIZE = 100
+FIREBASE_OUTBOX_MAX_ATTEMPTS = 8
+FIREBASE_OUTBOX_RETRY_BASE_SECONDS = 2
+FIREBASE_OUTBOX_RETRY_MAX_SECONDS = 600
+FIREBASE_OUTBOX_LEASE_SECONDS = 60
@@ -0,0 +1,72 @@
+"""
+Benchmark the vectorized windowed feature extraction against the loop
+
+    python benchmark_windowing.py [--repeat N] [--scale K] [--dataset PATH]
+
+--scale K tiles acc_gyr.csv K times to simulate longer recordings.
+--dataset times the chunked extraction over a recording converted with
+imu_dataset.py, which is read lazily instead of parsed from CSV.
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from imu_dataset import open_dataset
+from windowing import extract_windowed_features, extract_windowed_features_chunked, extract_windowed_features_loop
+
+ACC_COLS = ['xAcc', 'yAcc', 'zAcc']
+GYRO_COLS = ['xGyro', 'yGyro', 'zGyro']
+WINDOW_SAMPLES = 75
+STEP_SAMPLES = WINDOW_SAMPLES // 2
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acc_gyr.csv')
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--skip-loop', action='store_true', help="Only time the vectorized version")
+    parser.add_argument('--dataset', help="Converted IMU dataset directory")
+    args = parser.parse_args()
+
+    if args.dataset:
+        start = time.perf_counter()
+        dataset = open_dataset(args.dataset)
+        open_time = time.perf_counter() - start
+        labels = dataset.label_lookup(lambda name: 'fall' in name) if dataset.label_names else None
+        chunked_time, chunked = best_time(
+            lambda: extract_windowed_features_chunked(dataset, WINDOW_SAMPLES, STEP_SAMPLES, ACC_COLS, GYRO_COLS,
+                                                      'label', labels=labels), args.repeat)
+        print(f"{len(dataset)} rows: opened in {open_time * 1000:.2f} ms, "
+              f"chunked extraction {chunked_time:.3f} s for {len(chunked)} windows")
+        return
+
+    df = pd.read_csv(DATASET_PATH)
+    df['label'] = df['label'].str.contains('fall').astype(int)
+    if args.scale > 1:
+        df = pd.concat([df] * args.scale, ignore_index=True)
+    print(f"{len(df)} rows, window {WINDOW_SAMPLES}, step {STEP_SAMPLES}")
+
+    run = lambda extract: extract(df, WINDOW_SAMPLES, STEP_SAMPLES, ACC_COLS, GYRO_COLS, 'label')
+    vectorized_time, vectorized = best_time(lambda: run(extract_windowed_features), args.repeat)
+    print(f"vectorized: {vectorized_time:.3f} s for {len(vectorized)} windows")
+
+    if not args.skip_loop:
+        loop_time, loop = best_time(lambda: run(extract_windowed_features_loop), 1)
+        print(f"loop:       {loop_time:.3f} s")
+        print(f"speedup:    {loop_time / vectorized_time:.0f}x, identical: {loop.equals(vectorized)}")
+
+
+if __name__ == '__main__':
+    main()
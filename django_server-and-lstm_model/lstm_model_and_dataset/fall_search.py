@@ -0,0 +1,144 @@
+"""
+Hyperparameter search for the fall detection RandomForest
+
+Two modes over the same parameter grid:
+
+    grid        GridSearchCV: every candidate on the full training set
+    halving     HalvingGridSearchCV: every candidate on a small subsample,
+                then only the best 1/factor of them on factor times more
+                samples, until the survivors train on the full set
+
+Parallelism is at the search level (one candidate fit per worker, each
+forest single-threaded) instead of nesting n_jobs=-1 forests inside a
+parallel search. The training matrix is dumped once to a .npy file and
+memory-mapped, so the workers share it instead of each receiving a copy.
+"""
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.metrics import f1_score, make_scorer, precision_score, recall_score
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV
+
+SEARCH_MODES = ('grid', 'halving')
+
+
+def normalize_param_grid(grid):
+    """JSON config turns class_weight keys into strings; the labels are ints"""
+    grid = dict(grid)
+    if 'class_weight' in grid:
+        grid['class_weight'] = [{int(label): weight for label, weight in value.items()} if isinstance(value, dict) else value
+                                for value in grid['class_weight']]
+    return grid
+
+
+@contextmanager
+def shared_matrix(X, directory=None):
+    """
+    X as a read-only memory-mapped array for the duration of the block
+
+    joblib hands memory-mapped arrays to worker processes by file reference,
+    so every worker reads the same pages.
+    """
+    folder = tempfile.mkdtemp(prefix='fall-search-', dir=directory)
+    try:
+        path = os.path.join(folder, 'X.npy')
+        np.save(path, np.ascontiguousarray(X))
+        yield np.load(path, mmap_mode='r')
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_search(mode, X, y, param_grid, cv=3, n_jobs=-1, random_state=42, factor=3, verbose=1):
+    """
+    Search the grid and refit the best forest on all of X
+
+    Returns:
+        (fitted search object, summary dict with the mode, wall time, number
+        of candidates and fits, best parameters and best CV F1)
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    # Prioritize the fall class (label 1)
+    f1_fall_scorer = make_scorer(f1_score, pos_label=1, average='binary')
+    estimator = RandomForestClassifier(random_state=random_state, n_jobs=1)
+    param_grid = normalize_param_grid(param_grid)
+    if mode == 'halving':
+        search = HalvingGridSearchCV(estimator, param_grid, cv=cv, scoring=f1_fall_scorer, factor=factor,
+                                     resource='n_samples', min_resources='exhaust',
+                                     random_state=random_state, n_jobs=n_jobs, verbose=verbose)
+    else:
+        search = GridSearchCV(estimator, param_grid, cv=cv, scoring=f1_fall_scorer, n_jobs=n_jobs, verbose=verbose)
+
+    with shared_matrix(X) as X_shared:
+        start = time.perf_counter()
+        search.fit(X_shared, np.asarray(y))
+        seconds = time.perf_counter() - start
+    # The refit forest predicts with all cores
+    search.best_estimator_.set_params(n_jobs=-1)
+
+    n_evaluated = len(search.cv_results_['params'])
+    summary = {
+        'mode': mode,
+        'seconds': seconds,
+        'n_candidates': int(np.prod([len(values) for values in param_grid.values()])),
+        # Halving counts its fits on subsamples too
+        'n_fits': n_evaluated * search.n_splits_,
+        'best_params': search.best_params_,
+        'best_cv_f1': float(search.best_score_),
+    }
+    if mode == 'halving':
+        summary['n_iterations'] = int(search.n_iterations_)
+        summary['n_resources'] = [int(n) for n in search.n_resources_]
+    return search, summary
+
+
+def held_out_scores(model, X_test, y_test):
+    """Fall-class precision, recall and F1 on held-out windows"""
+    y_pred = model.predict(X_test)
+    return {
+        'precision_fall': float(precision_score(y_test, y_pred, pos_label=1, zero_division=0)),
+        'recall_fall': float(recall_score(y_test, y_pred, pos_label=1, zero_division=0)),
+        'f1_fall': float(f1_score(y_test, y_pred, pos_label=1, zero_division=0)),
+    }
+
+
+def comparison_report(summaries):
+    """
+    Compare search summaries (each with test scores) against the exhaustive grid
+
+    Returns:
+        dict with the summaries by mode and, for every other mode, its speedup
+        and the change in test recall and F1 relative to 'grid'
+    """
+    by_mode = {summary['mode']: summary for summary in summaries}
+    report = {'searches': by_mode}
+    baseline = by_mode.get('grid')
+    if baseline is not None:
+        report['relative_to_grid'] = {
+            mode: {
+                'speedup': baseline['seconds'] / summary['seconds'] if summary['seconds'] else None,
+                'recall_fall_delta': summary['test']['recall_fall'] - baseline['test']['recall_fall'],
+                'f1_fall_delta': summary['test']['f1_fall'] - baseline['test']['f1_fall'],
+                'same_best_params': summary['best_params'] == baseline['best_params'],
+            }
+            for mode, summary in by_mode.items() if mode != 'grid'
+        }
+    return report
+
+
+def format_report(report):
+    """Plain-text table of a comparison_report"""
+    lines = [f"{'mode':8} {'seconds':>9} {'fits':>6} {'cv F1':>7} {'recall':>7} {'F1':>7}  best params"]
+    for mode, summary in report['searches'].items():
+        lines.append(f"{mode:8} {summary['seconds']:9.1f} {summary['n_fits']:6d} {summary['best_cv_f1']:7.4f} "
+                     f"{summary['test']['recall_fall']:7.4f} {summary['test']['f1_fall']:7.4f}  {summary['best_params']}")
+    for mode, relative in report.get('relative_to_grid', {}).items():
+        lines.append(f"{mode} vs grid: {relative['speedup']:.1f}x faster, "
+                     f"recall {relative['recall_fall_delta']:+.4f}, F1 {relative['f1_fall_delta']:+.4f}")
+    return '\n'.join(lines)
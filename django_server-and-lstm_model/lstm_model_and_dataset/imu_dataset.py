@@ -0,0 +1,348 @@
+"""
+Memory-mapped columnar format for IMU recordings
+
+A recording converted from CSV is a directory:
+
+    acc_gyr.imu/
+        meta.json       sidecar: row count, columns, label names, source
+        xAcc.npy        one float32 .npy file per sensor column
+        ...
+        label.npy       label column: int16 codes into meta["label"]["names"]
+                        for text labels, int32 values for numeric labels
+
+Opening a dataset reads meta.json and memory-maps the columns, so it takes
+constant time whatever the recording's size, with no parsing. Rows are only
+read from disk when a slice is used. The converter streams the CSV in chunks,
+so converting a recording never holds more than one chunk in memory.
+
+    python imu_dataset.py convert acc_gyr.csv acc_gyr.imu --sampling-rate 50
+    python imu_dataset.py info acc_gyr.imu
+"""
+import argparse
+import json
+import os
+import shutil
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+FORMAT_NAME = 'imu-columnar'
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+FEATURE_DTYPE = np.dtype('<f4')
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+# The .npy header is written once the row count is known, in space reserved
+# before streaming the data; 128 bytes fits any 1-D shape and keeps the data
+# 64-byte aligned
+_NPY_HEADER_BYTES = 128
+_NPY_PREFIX = b'\x93NUMPY\x01\x00'
+
+
+class _NpyColumnWriter:
+    """Appends to a 1-D .npy file whose length is not known in advance"""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.file = open(path, 'wb')
+        self.file.write(b'\0' * _NPY_HEADER_BYTES)
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            self.dtype.str, self.rows)
+        space = _NPY_HEADER_BYTES - len(_NPY_PREFIX) - 2
+        encoded = header.encode('latin1').ljust(space - 1) + b'\n'
+        if len(encoded) > space:
+            raise ValueError(f'.npy header for {self.path} does not fit')
+        self.file.seek(0)
+        self.file.write(_NPY_PREFIX + struct.pack('<H', space) + encoded)
+        self.file.close()
+
+
+def _column_file(name):
+    if not name or os.sep in name or name in ('.', '..'):
+        raise ValueError(f'Column name {name!r} cannot be stored')
+    return f'{name}.npy'
+
+
+class DatasetWriter:
+    """
+    Streams columns into a new dataset directory
+
+    Rows are appended in blocks; the dataset only appears at out_dir, complete
+    with its meta.json, when close() succeeds. Used as a context manager, an
+    exception discards everything written so far.
+
+    Args:
+        out_dir: Dataset directory to create; an existing one is replaced
+        columns: Sensor column names, stored as float32
+        label_col: Label column name, or None when there is no label
+        label_names: For text labels, the names the label codes index (the
+                     list grows with encode_labels); None stores numeric labels
+        sampling_rate_hz: Stored in the sidecar for readers that need it
+        source: JSON-serializable description of where the rows came from
+    """
+
+    def __init__(self, out_dir, columns, label_col=None, label_names=None, sampling_rate_hz=None, source=None):
+        self.out_dir = os.fspath(out_dir)
+        self.tmp_dir = f'{self.out_dir}.tmp-{os.getpid()}'
+        self.label_col = label_col
+        self.label_names = None if label_names is None else list(label_names)
+        self._label_codes = {name: code for code, name in enumerate(self.label_names or [])}
+        self.sampling_rate_hz = sampling_rate_hz
+        self.source = source
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.writers = {}
+        self.label_writer = None
+        try:
+            self.writers = {col: _NpyColumnWriter(os.path.join(self.tmp_dir, _column_file(col)), FEATURE_DTYPE)
+                            for col in columns}
+            if label_col is not None:
+                self.label_writer = _NpyColumnWriter(os.path.join(self.tmp_dir, _column_file(label_col)),
+                                                     '<i4' if self.label_names is None else '<i2')
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def rows(self):
+        return next(iter(self.writers.values())).rows if self.writers else 0
+
+    def encode_labels(self, names):
+        """Codes for text labels, in order of first appearance, stable across blocks"""
+        names = pd.Series(names).astype(str)
+        for name in pd.unique(names):
+            if name not in self._label_codes:
+                self._label_codes[name] = len(self.label_names)
+                self.label_names.append(name)
+        return names.map(self._label_codes).to_numpy()
+
+    def append(self, columns, labels=None):
+        """
+        Append one block of rows
+
+        Args:
+            columns: Mapping of every sensor column to its values
+            labels: Label codes (text labels) or values (numeric labels)
+        """
+        for col, writer in self.writers.items():
+            writer.append(columns[col])
+        if self.label_writer is not None:
+            self.label_writer.append(labels)
+
+    def abort(self):
+        for writer in list(self.writers.values()) + [self.label_writer]:
+            if writer is not None and not writer.file.closed:
+                writer.file.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def close(self):
+        """Finish the dataset and return it opened"""
+        for writer in list(self.writers.values()) + [self.label_writer]:
+            if writer is not None:
+                writer.close()
+        lengths = {writer.rows for writer in list(self.writers.values()) + [self.label_writer] if writer is not None}
+        if len(lengths) > 1:
+            self.abort()
+            raise ValueError(f'Columns of {self.out_dir} have different lengths: {sorted(lengths)}')
+        meta = {
+            'format': FORMAT_NAME,
+            'format_version': FORMAT_VERSION,
+            'n_rows': self.rows,
+            'columns': list(self.writers),
+            'dtype': FEATURE_DTYPE.str,
+            'label': None if self.label_writer is None else {
+                'name': self.label_col,
+                'dtype': self.label_writer.dtype.str,
+                'names': self.label_names,
+            },
+            'sampling_rate_hz': self.sampling_rate_hz,
+            'source': self.source,
+        }
+        # meta.json is written last: a directory without it is an unfinished conversion
+        with open(os.path.join(self.tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+        os.replace(self.tmp_dir, self.out_dir)
+        return ImuDataset(self.out_dir)
+
+
+def convert_csv(csv_path, out_dir, label_col='label', columns=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                sampling_rate_hz=None):
+    """
+    Convert a CSV recording to the columnar format
+
+    Args:
+        csv_path: Source CSV
+        out_dir: Dataset directory to create; an existing one is replaced
+        label_col: Label column name, or None when the recording has none
+        columns: Sensor columns to keep (default: every column except the label)
+        chunk_rows: Rows parsed per chunk; bounds the converter's memory
+        sampling_rate_hz: Stored in the sidecar for readers that need it
+
+    Returns:
+        The opened ImuDataset
+    """
+    source = {'path': os.path.basename(os.fspath(csv_path)), 'bytes': os.path.getsize(csv_path)}
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=max(1, int(chunk_rows))):
+            if writer is None:
+                if label_col is not None and label_col not in chunk.columns:
+                    raise ValueError(f"Label column '{label_col}' not found in {csv_path}")
+                columns = list(columns or [col for col in chunk.columns if col != label_col])
+                missing = [col for col in columns if col not in chunk.columns]
+                if missing:
+                    raise ValueError(f'Columns {missing} not found in {csv_path}')
+                numeric = label_col is not None and pd.api.types.is_numeric_dtype(chunk[label_col])
+                writer = DatasetWriter(out_dir, columns, label_col, None if numeric else [],
+                                       sampling_rate_hz, source)
+
+            values = {col: pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                      for col in columns}
+            labels = None
+            if label_col is not None:
+                labels = chunk[label_col].to_numpy() if writer.label_names is None else writer.encode_labels(chunk[label_col])
+            writer.append(values, labels)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is None:
+        raise ValueError(f'{csv_path} is empty')
+    return writer.close()
+
+
+def is_imu_dataset(path):
+    return os.path.isfile(os.path.join(os.fspath(path), META_FILE))
+
+
+class ImuDataset:
+    """
+    A converted recording, memory-mapped column by column
+
+    Columns are read-only np.memmap arrays; slicing one reads only those rows.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != FORMAT_NAME or self.meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f'{self.path} is not a version {FORMAT_VERSION} {FORMAT_NAME} dataset')
+        self.n_rows = int(self.meta['n_rows'])
+        self.columns = list(self.meta['columns'])
+        label = self.meta.get('label') or {}
+        self.label_col = label.get('name')
+        self.label_names = label.get('names')
+        self.sampling_rate_hz = self.meta.get('sampling_rate_hz')
+        self._arrays = {}
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, name):
+        return name in self.columns or (name is not None and name == self.label_col)
+
+    def __getitem__(self, name):
+        """Memory-mapped column (sensor or label)"""
+        if name not in self:
+            raise KeyError(name)
+        if name not in self._arrays:
+            path = os.path.join(self.path, _column_file(name))
+            # An empty file cannot be mapped
+            self._arrays[name] = np.load(path, mmap_mode='r') if self.n_rows else np.load(path)
+        return self._arrays[name]
+
+    @property
+    def labels(self):
+        """Raw label column: codes into label_names, or the numeric labels"""
+        return self[self.label_col] if self.label_col else None
+
+    def label_lookup(self, func, dtype=np.int8):
+        """
+        Map every label through func, e.g. activity name -> fall flag
+
+        For text labels func is applied once per distinct name and the codes
+        are translated with a lookup table, so this is one pass over the
+        column.
+        """
+        labels = self.labels
+        if labels is None:
+            raise ValueError(f'{self.path} has no label column')
+        if self.label_names is None:
+            return np.vectorize(func, otypes=[dtype])(labels) if len(labels) else np.empty(0, dtype)
+        table = np.array([func(name) for name in self.label_names], dtype=dtype)
+        return table[labels]
+
+    def to_frame(self, start=0, stop=None, columns=None, labels=True):
+        """
+        DataFrame of rows [start, stop); only these rows are read
+
+        Text labels are decoded to their names.
+        """
+        columns = self.columns if columns is None else list(columns)
+        frame = pd.DataFrame({col: np.asarray(self[col][start:stop]) for col in columns})
+        if labels and self.label_col:
+            values = np.asarray(self.labels[start:stop])
+            if self.label_names is not None:
+                values = np.asarray(self.label_names, dtype=object)[values]
+            frame[self.label_col] = values
+        return frame
+
+    def iter_frames(self, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, labels=True):
+        """Consecutive DataFrames of at most chunk_rows rows"""
+        chunk_rows = max(1, int(chunk_rows))
+        for start in range(0, self.n_rows, chunk_rows):
+            yield self.to_frame(start, min(start + chunk_rows, self.n_rows), columns, labels)
+
+
+def open_dataset(path):
+    return ImuDataset(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help="Convert a CSV recording")
+    convert.add_argument('csv')
+    convert.add_argument('out')
+    convert.add_argument('--label-col', default='label', help="Label column ('' for none)")
+    convert.add_argument('--columns', nargs='+', help="Sensor columns to keep (default: all but the label)")
+    convert.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    convert.add_argument('--sampling-rate', type=float, help="Sampling rate in Hz, stored in the sidecar")
+    info = commands.add_parser('info', help="Describe a converted dataset")
+    info.add_argument('path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        dataset = convert_csv(args.csv, args.out, args.label_col or None, args.columns,
+                              args.chunk_rows, args.sampling_rate)
+        print(f"Wrote {dataset.n_rows} rows, columns {dataset.columns} to {dataset.path}")
+    else:
+        dataset = open_dataset(args.path)
+        print(json.dumps(dataset.meta, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,55 @@
-import pandas as pd
+"""
+Train the vitals LSTM and the fall detection model
+
+Usage:
+    python ml_lstm_model.py                       run every stage, reusing cached results
+    python ml_lstm_model.py --headless            no plot windows; figures go to reports/
+    python ml_lstm_model.py --models fall         only the fall detection stages
+    python ml_lstm_model.py --until window        stop after the window stages
+    python ml_lstm_model.py --force fall.train    rerun a stage (and what follows it)
+    python ml_lstm_model.py --set fall.cv=5       override a config value (JSON)
+    python ml_lstm_model.py --config grid.json    override config values from a JSON file
+    python ml_lstm_model.py --list                show stages and whether they are cached
+
+Stages (see pipeline.py for the caching):
+    vitals: load -> label -> scale -> window -> train -> evaluate
+    fall:   load -> label -> window -> resample -> scale -> train -> evaluate
+            (and train -> search_report, which compares search modes when
+            fall.compare_search is set)
+
+Each stage is cached under .pipeline_cache/, keyed by its code, the config
+values it reads and its inputs, so e.g. changing fall.param_grid only reruns
+fall.train and fall.evaluate. The trained artifacts (the files the Django
+server loads) are written to --output-dir, this directory by default.
+"""
+import argparse
+import json
+import os
+import sys
+
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import (classification_report, confusion_matrix, roc_auc_score,
-                             roc_curve, precision_recall_curve, make_scorer,
-                             recall_score, f1_score)
-import seaborn as sns
-import os
-import joblib # For saving/loading sklearn objects
-
-# TensorFlow / Keras
-from tensorflow.keras.models import Sequential # Removed: load_model as load_keras_model (re-added if needed later)
-from tensorflow.keras.layers import LSTM, Dense, Dropout, Input
-from tensorflow.keras.callbacks import EarlyStopping
+                             roc_curve, precision_recall_curve, recall_score)
 from sklearn.utils import class_weight # For Keras class weights
-# If you need to load a Keras model later, uncomment and use:
-# from tensorflow.keras.models import load_model as load_keras_model
 
+import fall_search
+import imu_dataset
+import sequences
+import synthetic
+import windowing
+from fall_search import comparison_report, format_report, held_out_scores, run_search
+from imu_dataset import is_imu_dataset, open_dataset
+from pipeline import Pipeline, Stage, StageSkipped
+from sequences import WindowedSequences, keras_sequence
+from synthetic import IMU_COLUMNS, generate_imu, generate_vitals
+from windowing import extract_windowed_features, extract_windowed_features_chunked
+
+# TensorFlow is imported by the vitals train and evaluate stages only, so the
+# fall stages and cached runs start without it
 
 # Imbalanced-learn for SMOTE
 try:
@@ -27,424 +59,636 @@ except ImportError:
     IMBLEARN_AVAILABLE = False
     print("Warning: imbalanced-learn (for SMOTE) is not installed. Run '!pip install imbalanced-learn'. SMOTE will be skipped.")
 
-# XGBoost (Optional, for an alternative fall detection model)
-try:
-    import xgboost as xgb
-    XGBOOST_AVAILABLE = True
-except ImportError:
-    XGBOOST_AVAILABLE = False
-    print("Warning: xgboost is not installed. Run '!pip install xgboost'. XGBoost model will be skipped.")
-
 
 # --- Configuration ---
-
-
-# OPTION 2: Files in Google Drive (Mount Drive First)
-# Make sure to uncomment these lines if using Google Drive and adjust the path
-# from google.colab import drive
-# drive.mount('/content/drive', force_remount=True) # force_remount can be useful
-
 # Local file paths - adjust these to your actual data file locations
 BASE_DATA_DIR = os.path.dirname(os.path.abspath(__file__))  # Current directory
 VITALS_DATASET_PATH = os.path.join(BASE_DATA_DIR, 'human_vital_signs_dataset_2024.csv')
+# A CSV, or a recording converted with imu_dataset.py (read lazily, for large recordings)
 FALL_DATASET_PATH = os.path.join(BASE_DATA_DIR, 'acc_gyr.csv')
+CACHE_DIR = os.path.join(BASE_DATA_DIR, '.pipeline_cache')
+REPORTS_DIR = 'reports' # Under the output directory
+
+# Every value a stage reads; override with --config or --set
+DEFAULT_CONFIG = {
+    'random_state': 42,
+
+    # --- Vitals LSTM Configuration ---
+    'vitals.dataset': VITALS_DATASET_PATH,
+    'vitals.columns': ['Heart Rate', 'Oxygen Saturation', 'Body Temperature'],
+    'vitals.time_steps': 10,
+    'vitals.test_size': 0.2,
+    'vitals.lstm_units': [128, 64],
+    'vitals.dropout': 0.3,
+    'vitals.epochs': 100,
+    'vitals.batch_size': 64, # Increased batch size
+    'vitals.patience': 15,
+
+    # --- Fall Detection Configuration ---
+    'fall.dataset': FALL_DATASET_PATH,
+    'fall.feature_cols': ['xAcc', 'yAcc', 'zAcc', 'xGyro', 'yGyro', 'zGyro'],
+    'fall.label_col': 'label', # <<<--- CRITICAL FIX: Changed from 'FallLabel'
+    'fall.window_seconds': 1.5,
+    'fall.sampling_rate_hz': 50, # <<<--- ADJUST THIS TO YOUR acc_gyr.csv SAMPLING RATE
+    'fall.test_size': 0.30,
+    'fall.smote': True,
+    'fall.param_grid': {
+        'n_estimators': [100, 200, 300], 'max_depth': [10, 20, None],
+        'min_samples_split': [2, 5, 10], 'min_samples_leaf': [1, 2, 4],
+        'class_weight': ['balanced', {0: 1, 1: 10}, {0: 1, 1: 15}, {0: 1, 1: 20}] # More emphasis on fall class
+    },
+    'fall.cv': 3,
+    'fall.search': 'halving', # 'halving' (successive halving) or 'grid' (exhaustive); see fall_search.py
+    'fall.halving_factor': 3,
+    'fall.search_jobs': -1, # Parallel candidate fits; each forest is single-threaded
+    'fall.compare_search': False, # Also run the other search mode and write reports/fall_search_report.json
+
+    # --- Synthetic data, used when a dataset is missing (see synthetic.py) ---
+    'synthetic.vitals_rows': 2000,
+    'synthetic.anomaly_fraction': 0.2,
+    'synthetic.fall_rows': 10000,
+    'synthetic.fall_fraction': 0.05,
+}
+
+
+# --- Plotting ---
+def _pyplot():
+    """matplotlib.pyplot and seaborn, or (None, None) when they are not installed"""
+    try:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+    except ImportError:
+        return None, None
+    return plt, sns
+
+
+def save_figure(ctx, fig, file_name):
+    """Save a figure into the stage's cache entry; show it too unless headless"""
+    plt, _ = _pyplot()
+    path = ctx.path(file_name)
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
+    if not ctx.headless:
+        plt.show()
+    plt.close(fig)
+    return path
+
+
+def confusion_matrix_figure(ctx, cm, labels, title, cmap, file_name):
+    plt, sns = _pyplot()
+    if plt is None:
+        print("matplotlib/seaborn are not installed; skipping the confusion matrix plot.")
+        return None
+    fig, ax = plt.subplots(figsize=(max(6, len(labels) * 2), max(4, len(labels) * 1.5)))
+    sns.heatmap(cm, annot=True, fmt='d', cmap=cmap, xticklabels=labels, yticklabels=labels, ax=ax)
+    ax.set_title(title); ax.set_xlabel('Predicted'); ax.set_ylabel('True')
+    return save_figure(ctx, fig, file_name)
 
 
-# --- Vitals LSTM Configuration ---
-TIME_STEPS_VITALS = 10
-N_FEATURES_VITALS = 3   # Heart Rate, Oxygen Saturation, Body Temperature
-N_CLASSES_VITALS = 4    # Default: High, Medium, Low, Normal. Adjust if create_risk_labels_vitals changes this.
-
-# --- Fall Detection Configuration ---
-FALL_FEATURE_COLS_RAW = ['xAcc', 'yAcc', 'zAcc', 'xGyro', 'yGyro', 'zGyro']
-FALL_LABEL_COL = 'label' # <<<--- CRITICAL FIX: Changed from 'FallLabel'
-WINDOW_SIZE_SECONDS = 1.5
-SAMPLING_RATE_HZ = 50 # <<<--- ADJUST THIS TO YOUR acc_gyr.csv SAMPLING RATE
-WINDOW_SAMPLES = int(WINDOW_SIZE_SECONDS * SAMPLING_RATE_HZ)
-STEP_SAMPLES = WINDOW_SAMPLES // 2 # 50% overlap
-
-SAMPLE_DATA_PLOT_RANGE = 300 # For visualization
-
 # --- Helper Function for Plotting ROC Curve ---
 def plot_roc_curve_custom(y_true, y_pred_proba, model_name="Model", ax=None):
     fpr, tpr, _ = roc_curve(y_true, y_pred_proba)
     auc = roc_auc_score(y_true, y_pred_proba)
-    if ax is None:
-        fig, ax_roc_plot = plt.subplots(figsize=(8, 6)) # Use a different variable name
-    else:
-        ax_roc_plot = ax
-    ax_roc_plot.plot(fpr, tpr, label=f'{model_name} (AUC = {auc:.3f})')
-    ax_roc_plot.plot([0, 1], [0, 1], 'k--')
-    ax_roc_plot.set_xlabel('False Positive Rate')
-    ax_roc_plot.set_ylabel('True Positive Rate')
-    ax_roc_plot.set_title(f'ROC Curve - {model_name}')
-    ax_roc_plot.legend(loc='lower right')
-    ax_roc_plot.grid(True)
-    if ax is None: plt.show()
+    ax.plot(fpr, tpr, label=f'{model_name} (AUC = {auc:.3f})')
+    ax.plot([0, 1], [0, 1], 'k--')
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title(f'ROC Curve - {model_name}')
+    ax.legend(loc='lower right')
+    ax.grid(True)
 
 
 # --- Helper Function for Plotting Precision-Recall Curve ---
 def plot_precision_recall_curve_custom(y_true, y_pred_proba, model_name="Model", ax=None):
     precision, recall, _ = precision_recall_curve(y_true, y_pred_proba)
-    if ax is None:
-        fig, ax_pr_plot = plt.subplots(figsize=(8, 6)) # Use a different variable name
-    else:
-        ax_pr_plot = ax
-    ax_pr_plot.plot(recall, precision, label=model_name)
-    ax_pr_plot.set_xlabel('Recall')
-    ax_pr_plot.set_ylabel('Precision')
-    ax_pr_plot.set_title(f'Precision-Recall Curve - {model_name}')
-    ax_pr_plot.legend(loc='lower left')
-    ax_pr_plot.grid(True)
-    if ax is None: plt.show()
+    ax.plot(recall, precision, label=model_name)
+    ax.set_xlabel('Recall')
+    ax.set_ylabel('Precision')
+    ax.set_title(f'Precision-Recall Curve - {model_name}')
+    ax.legend(loc='lower left')
+    ax.grid(True)
+
 
 # ==============================================================================
 # PART 1: VITAL SIGNS ANOMALY DETECTION (LSTM)
 # ==============================================================================
-print("========================================================")
-print("PART 1: VITAL SIGNS ANOMALY DETECTION (LSTM)")
-print("========================================================")
-
-vitals_full_df = None
-try:
-    if not os.path.exists(VITALS_DATASET_PATH):
-        raise FileNotFoundError(f"Vitals dataset file not found at '{VITALS_DATASET_PATH}'")
-    vitals_full_df = pd.read_csv(VITALS_DATASET_PATH)
-    print(f"Successfully loaded vitals dataset: {VITALS_DATASET_PATH}")
-    print("Vitals dataset columns:", vitals_full_df.columns.tolist())
-
-    # Display sample data and stats from REAL vitals data
-    print("\nSample Vitals Data (first 5 rows from real data):")
-    print(vitals_full_df[['Heart Rate', 'Oxygen Saturation', 'Body Temperature']].head())
-    print("\nDescriptive Statistics for Vitals (from real data):")
-    print(vitals_full_df[['Heart Rate', 'Oxygen Saturation', 'Body Temperature']].describe())
-
-except FileNotFoundError as e:
-    print(f"Error: {e}")
-    print("Generating a dummy vitals dataset as real one not found...")
-    n_rows = 2000
-    vitals_full_df = pd.DataFrame({
-        'Heart Rate': np.random.randint(50, 120, n_rows),
-        'Oxygen Saturation': np.random.randint(90, 101, n_rows),
-        'Body Temperature': np.random.normal(36.8, 0.5, n_rows).round(1),
-    })
-    vitals_full_df['Body Temperature'] = np.clip(vitals_full_df['Body Temperature'], 35.0, 41.0)
-    print("Loaded dummy vitals dataset.")
-except Exception as e:
-    print(f"An error occurred while loading the vitals dataset: {e}")
-    vitals_full_df = None # Ensure it's None to skip processing if error
-
-if vitals_full_df is not None:
-    vitals_columns_for_lstm = ['Heart Rate', 'Oxygen Saturation', 'Body Temperature']
-    if not all(col in vitals_full_df.columns for col in vitals_columns_for_lstm):
-        print(f"Error: One or more vital columns {vitals_columns_for_lstm} not found in the vitals dataset.")
-        vitals_full_df = None # Skip processing
-
-if vitals_full_df is not None:
-    vitals_df_lstm = vitals_full_df[vitals_columns_for_lstm].copy()
-
-    def create_risk_labels_vitals(df_in):
-        df = df_in.copy()
-        # --- YOU NEED TO ADJUST THESE THRESHOLDS BASED ON YOUR REAL DATA DISTRIBUTION ---
-        # Example:
-        # High: Very abnormal HR OR very low SpO2
-        # Medium: Moderately abnormal HR OR moderately low SpO2
-        # Low: Abnormal Body Temp (if others are okay)
-        conditions = [
-            (df['Heart Rate'] > 100) | (df['Heart Rate'] < 50) | (df['Oxygen Saturation'] < 90), # High risk
-            (df['Heart Rate'] > 90)  | (df['Heart Rate'] < 60) | (df['Oxygen Saturation'] < 94), # Medium risk
-            (df['Body Temperature'] > 37.5) | (df['Body Temperature'] < 36.0)                  # Low risk
-        ]
-        risk_values = ['High', 'Medium', 'Low']
-        df['Risk'] = np.select(conditions, risk_values, default='Normal')
-        return df['Risk']
-
-    vitals_df_lstm['Risk'] = create_risk_labels_vitals(vitals_df_lstm)
+def vitals_load(ctx):
+    path = ctx.config['vitals.dataset']
+    columns = ctx.config['vitals.columns']
+    if is_imu_dataset(path):
+        vitals_full_df = open_dataset(path).to_frame(labels=False)
+        print(f"Opened vitals dataset: {path}")
+        if not all(col in vitals_full_df.columns for col in columns):
+            raise StageSkipped(f"One or more vital columns {columns} not found in the vitals dataset.")
+    elif os.path.exists(path):
+        vitals_full_df = pd.read_csv(path)
+        print(f"Successfully loaded vitals dataset: {path}")
+        print("Vitals dataset columns:", vitals_full_df.columns.tolist())
+        if not all(col in vitals_full_df.columns for col in columns):
+            raise StageSkipped(f"One or more vital columns {columns} not found in the vitals dataset.")
+    else:
+        print(f"Vitals dataset file not found at '{path}'")
+        print("Generating a dummy vitals dataset as real one not found...")
+        # Seeded so the dummy data, and everything cached after it, is reproducible
+        vitals_full_df = generate_vitals(ctx.config['synthetic.vitals_rows'], seed=ctx.config['random_state'],
+                                         anomaly_fraction=ctx.config['synthetic.anomaly_fraction'])
+    vitals_df = vitals_full_df[columns].copy()
+    print("\nSample Vitals Data (first 5 rows):")
+    print(vitals_df.head())
+    print("\nDescriptive Statistics for Vitals:")
+    print(vitals_df.describe())
+    return {'vitals': vitals_df}
+
+
+def create_risk_labels_vitals(df_in):
+    df = df_in.copy()
+    # --- YOU NEED TO ADJUST THESE THRESHOLDS BASED ON YOUR REAL DATA DISTRIBUTION ---
+    # Example:
+    # High: Very abnormal HR OR very low SpO2
+    # Medium: Moderately abnormal HR OR moderately low SpO2
+    # Low: Abnormal Body Temp (if others are okay)
+    conditions = [
+        (df['Heart Rate'] > 100) | (df['Heart Rate'] < 50) | (df['Oxygen Saturation'] < 90), # High risk
+        (df['Heart Rate'] > 90)  | (df['Heart Rate'] < 60) | (df['Oxygen Saturation'] < 94), # Medium risk
+        (df['Body Temperature'] > 37.5) | (df['Body Temperature'] < 36.0)                  # Low risk
+    ]
+    risk_values = ['High', 'Medium', 'Low']
+    df['Risk'] = np.select(conditions, risk_values, default='Normal')
+    return df['Risk']
+
+
+def vitals_label(ctx):
+    risk = create_risk_labels_vitals(ctx.inputs['vitals.load']['vitals'])
     print("\nVitals Risk distribution (after create_risk_labels_vitals applied):")
-    print(vitals_df_lstm['Risk'].value_counts(normalize=True))
-    print(vitals_df_lstm['Risk'].value_counts())
-
+    print(risk.value_counts(normalize=True))
+    print(risk.value_counts())
 
     label_encoder_vitals = LabelEncoder()
-    vitals_df_lstm['Risk_Encoded'] = label_encoder_vitals.fit_transform(vitals_df_lstm['Risk'])
-    joblib.dump(label_encoder_vitals, 'vitals_risk_label_encoder.pkl')
+    risk_encoded = label_encoder_vitals.fit_transform(risk)
     print("Vitals Risk Label Encoder classes:", label_encoder_vitals.classes_)
-
-    # Update N_CLASSES_VITALS based on actual unique classes found
-    N_CLASSES_VITALS_ACTUAL = len(label_encoder_vitals.classes_)
-    if N_CLASSES_VITALS_ACTUAL != N_CLASSES_VITALS:
-        print(f"Warning: N_CLASSES_VITALS was {N_CLASSES_VITALS}, but found {N_CLASSES_VITALS_ACTUAL} unique risk classes. Adjusting N_CLASSES_VITALS.")
-        N_CLASSES_VITALS = N_CLASSES_VITALS_ACTUAL
+    if len(label_encoder_vitals.classes_) < 2:
+        raise StageSkipped(f"Only one risk class ({label_encoder_vitals.classes_[0]}) in the vitals data.")
+    return {'risk_encoded': risk_encoded, 'label_encoder': label_encoder_vitals}
 
 
-    features_to_scale_vitals = vitals_df_lstm[vitals_columns_for_lstm].values
+def vitals_scale(ctx):
+    features = ctx.inputs['vitals.load']['vitals'].to_numpy(dtype=np.float64)
     scaler_vitals = StandardScaler()
-    scaled_features_vitals = scaler_vitals.fit_transform(features_to_scale_vitals)
-    joblib.dump(scaler_vitals, 'vitals_scaler.pkl')
+    scaled_features_vitals = scaler_vitals.fit_transform(features)
+    return {'scaled': scaled_features_vitals, 'scaler': scaler_vitals}
+
+
+def vitals_sequences(inputs, time_steps):
+    return WindowedSequences(inputs['vitals.scale']['scaled'], inputs['vitals.label']['risk_encoded'], time_steps)
+
+
+def vitals_window(ctx):
+    # Sequences are strided views over the scaled readings (see sequences.py),
+    # so only the train/test split of sequence indices is stored
+    sequences = vitals_sequences(ctx.inputs, ctx.config['vitals.time_steps'])
+    y_vitals = sequences.labels
+    if len(sequences) < 50:
+        raise StageSkipped(f"Not enough data for vitals model training (Sequences: {len(sequences)}).")
+    train_idx_v, test_idx_v = train_test_split(
+        np.arange(len(sequences)), test_size=ctx.config['vitals.test_size'],
+        random_state=ctx.config['random_state'],
+        stratify=y_vitals if np.unique(y_vitals).size > 1 else None)
+    print(f"{len(sequences)} sequences: {len(train_idx_v)} train, {len(test_idx_v)} test")
+    return {'train_idx': train_idx_v, 'test_idx': test_idx_v}
+
+
+def vitals_class_weights(y_train_v):
+    unique_classes_v_train = np.unique(y_train_v)
+    if len(unique_classes_v_train) < 2: # Need at least 2 classes for balanced weights
+        print("Warning: Less than 2 classes in y_train_v. Using uniform weights for Keras.")
+        return None
+    keras_class_weights_v = class_weight.compute_class_weight('balanced', classes=unique_classes_v_train, y=y_train_v)
+    keras_class_weights_dict_v = dict(zip(unique_classes_v_train.tolist(), keras_class_weights_v))
+    print("Keras Class Weights for Vitals:", keras_class_weights_dict_v)
+    return keras_class_weights_dict_v
+
+
+def vitals_train(ctx):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Dropout, Input
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    time_steps = ctx.config['vitals.time_steps']
+    sequences = vitals_sequences(ctx.inputs, time_steps)
+    split = ctx.inputs['vitals.window']
+    n_classes = len(ctx.inputs['vitals.label']['label_encoder'].classes_)
+    y_train_v = sequences.labels[split['train_idx']]
+
+    # Class weights are applied as per-sample weights in each batch
+    train_batches_v = keras_sequence(sequences.batches(
+        split['train_idx'], batch_size=ctx.config['vitals.batch_size'],
+        class_weights=vitals_class_weights(y_train_v), shuffle=True, seed=ctx.config['random_state']))
+    test_batches_v = keras_sequence(sequences.batches(split['test_idx'], batch_size=256))
+
+    units = ctx.config['vitals.lstm_units']
+    layers = [Input(shape=(time_steps, sequences.shape[2]))]
+    for i, n_units in enumerate(units):
+        layers.append(LSTM(n_units, return_sequences=i < len(units) - 1, kernel_regularizer='l2')) # Added L2 regularization
+        layers.append(Dropout(ctx.config['vitals.dropout']))
+    layers.append(Dense(n_classes, activation='softmax'))
+    model_vitals_lstm = Sequential(layers)
+    model_vitals_lstm.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model_vitals_lstm.summary()
+    early_stopping_vitals = EarlyStopping(monitor='val_loss', patience=ctx.config['vitals.patience'],
+                                          restore_best_weights=True, verbose=1)
+
+    print("\nTraining LSTM model for vitals...")
+    history_vitals = model_vitals_lstm.fit(
+        train_batches_v,
+        epochs=ctx.config['vitals.epochs'],
+        validation_data=test_batches_v,
+        callbacks=[early_stopping_vitals],
+        verbose=2 if ctx.headless else 1
+    )
+    model_path = ctx.path('vital_signs_lstm_model.keras')
+    model_vitals_lstm.save(str(model_path))
+    return {
+        'model': model_path,
+        'history': {name: [float(value) for value in values] for name, values in history_vitals.history.items()},
+    }
 
-    def create_sequences_lstm(input_data, target_data, time_steps):
-        Xs, ys = [], []
-        for i in range(len(input_data) - time_steps):
-            Xs.append(input_data[i:(i + time_steps)])
-            ys.append(target_data[i + time_steps -1])
-        if not Xs: return np.array([]), np.array([])
-        return np.array(Xs), np.array(ys)
 
-    X_vitals, y_vitals = create_sequences_lstm(scaled_features_vitals, vitals_df_lstm['Risk_Encoded'].values, TIME_STEPS_VITALS)
+def vitals_evaluate(ctx):
+    from tensorflow.keras.models import load_model
+
+    print("\nEvaluating Vitals LSTM model...")
+    model_vitals_lstm = load_model(str(ctx.inputs['vitals.train']['model']))
+    sequences = vitals_sequences(ctx.inputs, ctx.config['vitals.time_steps'])
+    test_idx_v = ctx.inputs['vitals.window']['test_idx']
+    y_test_v = sequences.labels[test_idx_v]
+    test_batches_v = keras_sequence(sequences.batches(test_idx_v, batch_size=256))
+
+    loss_v, acc_v = model_vitals_lstm.evaluate(test_batches_v, verbose=0)
+    print(f"Vitals LSTM Test Loss: {loss_v:.4f}, Test Accuracy: {acc_v:.4f}")
+    pred_encoded_v = np.argmax(model_vitals_lstm.predict(test_batches_v, verbose=0), axis=1)
+
+    print("\nClassification Report (Vitals LSTM):")
+    target_names_report_v = ctx.inputs['vitals.label']['label_encoder'].classes_
+    labels_report_v = np.arange(len(target_names_report_v))
+    print(classification_report(y_test_v, pred_encoded_v, labels=labels_report_v, target_names=target_names_report_v, zero_division=0, digits=4))
+    report = classification_report(y_test_v, pred_encoded_v, labels=labels_report_v, target_names=target_names_report_v,
+                                   zero_division=0, output_dict=True)
+
+    cm_v = confusion_matrix(y_test_v, pred_encoded_v, labels=labels_report_v)
+    return {
+        'metrics': {'loss': float(loss_v), 'accuracy': float(acc_v), 'report': report,
+                    'confusion_matrix': cm_v.tolist()},
+        'confusion_matrix_figure': confusion_matrix_figure(
+            ctx, cm_v, target_names_report_v, 'Confusion Matrix - Vitals LSTM', 'Blues',
+            'vitals_confusion_matrix.png'),
+    }
 
-    if X_vitals.shape[0] < 50 or N_CLASSES_VITALS < 2:
-        print(f"Not enough data/classes for vitals model training (Sequences: {X_vitals.shape[0]}, Classes: {N_CLASSES_VITALS}). Skipping.")
-    else:
-        X_train_v, X_test_v, y_train_v, y_test_v = train_test_split(
-            X_vitals, y_vitals, test_size=0.2, random_state=42,
-            stratify=y_vitals if np.unique(y_vitals).size > 1 else None)
-
-        keras_class_weights_dict_v = None
-        if N_CLASSES_VITALS > 1 : # Only compute if multiple classes
-            unique_classes_v_train, _ = np.unique(y_train_v, return_counts=True)
-            if len(unique_classes_v_train) >= 2: # Need at least 2 classes for balanced weights
-                try:
-                    keras_class_weights_v = class_weight.compute_class_weight(
-                        'balanced', classes=np.unique(y_train_v), y=y_train_v # Use unique classes from y_train_v
-                    )
-                    keras_class_weights_dict_v = dict(enumerate(keras_class_weights_v))
-                    print("Keras Class Weights for Vitals:", keras_class_weights_dict_v)
-                except ValueError as e_cw: # Handles cases where a class might be missing after split
-                    print(f"Could not compute Keras class weights: {e_cw}. Using uniform weights.")
-            else:
-                print("Warning: Less than 2 classes in y_train_v. Using uniform weights for Keras.")
-        else:
-            print("Only one risk class identified. Using uniform weights for Keras.")
-
-
-        model_vitals_lstm = Sequential([
-            Input(shape=(TIME_STEPS_VITALS, N_FEATURES_VITALS)),
-            LSTM(128, return_sequences=True, kernel_regularizer='l2'), # Added L2 regularization
-            Dropout(0.3),
-            LSTM(64, kernel_regularizer='l2'),
-            Dropout(0.3),
-            Dense(N_CLASSES_VITALS, activation='softmax') # N_CLASSES_VITALS is now dynamic
-        ])
-        model_vitals_lstm.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
-        model_vitals_lstm.summary()
-        early_stopping_vitals = EarlyStopping(monitor='val_loss', patience=15, restore_best_weights=True, verbose=1)
-
-        print("\nTraining LSTM model for vitals...")
-        history_vitals = model_vitals_lstm.fit(
-            X_train_v, y_train_v,
-            epochs=100, batch_size=64, # Increased batch size
-            validation_data=(X_test_v, y_test_v),
-            callbacks=[early_stopping_vitals],
-            class_weight=keras_class_weights_dict_v,
-            verbose=1
-        )
-        model_vitals_lstm.save('vital_signs_lstm_model.keras')
-        print("Trained Vitals LSTM model saved as vital_signs_lstm_model.keras")
-
-        print("\nEvaluating Vitals LSTM model...")
-        loss_v, acc_v = model_vitals_lstm.evaluate(X_test_v, y_test_v, verbose=0)
-        print(f"Vitals LSTM Test Loss: {loss_v:.4f}, Test Accuracy: {acc_v:.4f}")
-
-        pred_proba_v = model_vitals_lstm.predict(X_test_v)
-        pred_encoded_v = np.argmax(pred_proba_v, axis=1)
-
-        print("\nClassification Report (Vitals LSTM):")
-        target_names_report_v = label_encoder_vitals.classes_
-        labels_report_v = np.arange(len(target_names_report_v))
-        print(classification_report(y_test_v, pred_encoded_v, labels=labels_report_v, target_names=target_names_report_v, zero_division=0, digits=4))
-
-        cm_v = confusion_matrix(y_test_v, pred_encoded_v, labels=labels_report_v)
-        plt.figure(figsize=(max(6, N_CLASSES_VITALS*2), max(4, N_CLASSES_VITALS*1.5)))
-        sns.heatmap(cm_v, annot=True, fmt='d', cmap='Blues', xticklabels=target_names_report_v, yticklabels=target_names_report_v)
-        plt.title('Confusion Matrix - Vitals LSTM'); plt.xlabel('Predicted'); plt.ylabel('True'); plt.show()
 
 # ==============================================================================
 # PART 2: ADVANCED FALL DETECTION (Accelerometer/Gyroscope Data)
 # ==============================================================================
-print("\n========================================================")
-print("PART 2: ADVANCED FALL DETECTION (ACCELEROMETER/GYROSCOPE)")
-print("========================================================")
-
-# --- Feature Extraction Function ---
-def extract_windowed_features(df_segment, window_size, step_size, acc_cols, gyro_cols, label_col=None):
-    all_window_features = []
-    num_samples = len(df_segment)
-    if num_samples < window_size:
-        print(f"Warning: Data segment length ({num_samples}) is less than window size ({window_size}). No windows extracted.")
-        return pd.DataFrame(all_window_features)
-
-    for i in range(0, num_samples - window_size + 1, step_size):
-        window = df_segment.iloc[i : i + window_size]
-        current_features = {}
-        if label_col and label_col in window.columns:
-            label_val = window[label_col].iloc[window_size // 2]
-            current_features[label_col] = int(label_val)
-
-        if all(c in window.columns for c in acc_cols):
-            smv_acc = np.sqrt(window[acc_cols[0]]**2 + window[acc_cols[1]]**2 + window[acc_cols[2]]**2)
-            current_features['SMV_Acc_mean'] = smv_acc.mean(); current_features['SMV_Acc_std'] = smv_acc.std()
-            current_features['SMV_Acc_min'] = smv_acc.min(); current_features['SMV_Acc_max'] = smv_acc.max()
-            current_features['SMV_Acc_median'] = smv_acc.median(); current_features['SMV_Acc_iqr'] = smv_acc.quantile(0.75) - smv_acc.quantile(0.25)
-            for col_name in acc_cols:
-                current_features[f'{col_name}_mean'] = window[col_name].mean(); current_features[f'{col_name}_std'] = window[col_name].std()
-                current_features[f'{col_name}_max_abs_diff'] = window[col_name].diff().abs().max()
-
-        if all(c in window.columns for c in gyro_cols):
-            smv_gyro = np.sqrt(window[gyro_cols[0]]**2 + window[gyro_cols[1]]**2 + window[gyro_cols[2]]**2)
-            current_features['SMV_Gyro_mean'] = smv_gyro.mean(); current_features['SMV_Gyro_std'] = smv_gyro.std()
-            current_features['SMV_Gyro_max'] = smv_gyro.max(); current_features['SMV_Gyro_iqr'] = smv_gyro.quantile(0.75) - smv_gyro.quantile(0.25)
-            for col_name in gyro_cols:
-                current_features[f'{col_name}_mean'] = window[col_name].mean(); current_features[f'{col_name}_std'] = window[col_name].std()
-
-        min_expected_features = 1 if label_col and label_col in current_features else 0
-        if len(current_features) > min_expected_features: all_window_features.append(current_features)
-
-    processed_df = pd.DataFrame(all_window_features)
-    if not processed_df.empty:
-         processed_df = processed_df.dropna(subset=[col for col in processed_df.columns if col != label_col], how='all')
-    return processed_df
-
-# --- Load Fall Dataset ---
-print(f"\nAttempting to load fall dataset from: {FALL_DATASET_PATH}")
-if not os.path.exists(FALL_DATASET_PATH):
-    print(f"ERROR: File '{FALL_DATASET_PATH}' DOES NOT EXIST. Check path/upload file.")
-    if '/content/drive/MyDrive/' in FALL_DATASET_PATH and not os.path.exists('/content/drive/MyDrive/'):
-        print("Google Drive might not be mounted. Run the Drive mounting cell if using Drive paths.")
-    elif os.path.exists('/content/'):
-         print("Files in /content/:", os.listdir('/content/'))
-
-fall_df_raw = None
-try:
-    if not os.path.exists(FALL_DATASET_PATH): raise FileNotFoundError(f"Fall data file missing: {FALL_DATASET_PATH}")
-    fall_df_raw = pd.read_csv(FALL_DATASET_PATH)
-    print(f"Successfully loaded fall dataset: {FALL_DATASET_PATH}")
-    print("Fall dataset (raw) columns:", fall_df_raw.columns.tolist())
-    if FALL_LABEL_COL not in fall_df_raw.columns: # FALL_LABEL_COL is now 'label'
-        print(f"CRITICAL: RAW CSV does NOT contain the label column '{FALL_LABEL_COL}'. Checking for 'Activity' column...")
-        if 'Activity' in fall_df_raw.columns:
-            fall_df_raw[FALL_LABEL_COL] = fall_df_raw['Activity'].apply(lambda x: 1 if isinstance(x, str) and 'FALL' in x.upper() else 0)
-            print(f"Derived '{FALL_LABEL_COL}' from 'Activity' column.")
-        else: raise KeyError(f"'{FALL_LABEL_COL}' not found and no 'Activity' column to derive it from.")
-    print("\nRAW FallLabel ('{}') distribution in loaded CSV:".format(FALL_LABEL_COL)); print(fall_df_raw[FALL_LABEL_COL].value_counts(normalize=True)); print(fall_df_raw[FALL_LABEL_COL].value_counts())
-    if not all(col in fall_df_raw.columns for col in FALL_FEATURE_COLS_RAW):
-        raise ValueError(f"Missing one or more raw feature columns for fall detection: {FALL_FEATURE_COLS_RAW}")
-except (FileNotFoundError, pd.errors.EmptyDataError, KeyError, ValueError) as e_load:
-    print(f"Error loading/processing fall dataset '{FALL_DATASET_PATH}': {e_load}")
-    print("Generating a DUMMY fall dataset...")
-    n_rows_fall = 10000
-    fall_df_raw = pd.DataFrame(np.random.randn(n_rows_fall, len(FALL_FEATURE_COLS_RAW)) * np.array([3,3,3,80,80,80]), columns=FALL_FEATURE_COLS_RAW)
-    fall_df_raw['zAcc'] -= 9.8
-    fall_df_raw[FALL_LABEL_COL] = 0
-    num_dummy_falls_to_create = int(n_rows_fall * 0.05)
-    fall_event_len = SAMPLING_RATE_HZ // 2
-    for _ in range(num_dummy_falls_to_create):
-        start_idx = np.random.randint(0, n_rows_fall - fall_event_len)
-        fall_df_raw.loc[start_idx : start_idx + fall_event_len, FALL_LABEL_COL] = 1
-        for col in FALL_FEATURE_COLS_RAW[:3]: fall_df_raw.loc[start_idx : start_idx + fall_event_len, col] *= np.random.uniform(3, 7)
-        for col in FALL_FEATURE_COLS_RAW[3:]: fall_df_raw.loc[start_idx : start_idx + fall_event_len, col] *= np.random.uniform(2, 6)
-    print("Loaded DUMMY fall dataset. RAW FallLabel ('{}') distribution:".format(FALL_LABEL_COL)); print(fall_df_raw[FALL_LABEL_COL].value_counts(normalize=True))
-
-# --- Process Fall Data: Feature Extraction ---
-fall_df_featured = pd.DataFrame()
-if fall_df_raw is not None and FALL_LABEL_COL in fall_df_raw.columns and fall_df_raw[FALL_LABEL_COL].nunique() > 0:
-    print(f"\nExtracting windowed features for fall detection (Window: {WINDOW_SAMPLES} samples, Step: {STEP_SAMPLES} samples)...")
-    fall_df_featured = extract_windowed_features(fall_df_raw, WINDOW_SAMPLES, STEP_SAMPLES, FALL_FEATURE_COLS_RAW[:3], FALL_FEATURE_COLS_RAW[3:], FALL_LABEL_COL)
-    if fall_df_featured.empty or FALL_LABEL_COL not in fall_df_featured.columns:
-        print("Warning: No features extracted or label column missing from featured DataFrame. Fall detection part will be skipped.")
-        fall_df_featured = pd.DataFrame()
+def fall_load(ctx):
+    path = ctx.config['fall.dataset']
+    feature_cols = ctx.config['fall.feature_cols']
+    label_col = ctx.config['fall.label_col']
+    if is_imu_dataset(path):
+        # Memory-mapped: nothing is read here, and the later stages read the
+        # recording chunk by chunk instead of caching a copy
+        dataset = open_dataset(path)
+        print(f"Opened IMU dataset: {path} ({len(dataset)} rows, columns {dataset.columns})")
+        missing = [col for col in feature_cols if col not in dataset.columns]
+        if missing:
+            raise StageSkipped(f"Missing one or more raw feature columns for fall detection: {missing}")
+        if dataset.label_col is None:
+            raise StageSkipped("The IMU dataset has no label column.")
+        rate = dataset.sampling_rate_hz
+        if rate and rate != ctx.config['fall.sampling_rate_hz']:
+            print(f"Warning: the dataset was recorded at {rate} Hz but fall.sampling_rate_hz is {ctx.config['fall.sampling_rate_hz']}.")
+        return {'dataset': os.path.abspath(path)}
+    try:
+        if not os.path.exists(path): raise FileNotFoundError(f"Fall data file missing: {path}")
+        fall_df_raw = pd.read_csv(path)
+        print(f"Successfully loaded fall dataset: {path}")
+        print("Fall dataset (raw) columns:", fall_df_raw.columns.tolist())
+        if label_col not in fall_df_raw.columns and 'Activity' not in fall_df_raw.columns:
+            raise KeyError(f"'{label_col}' not found and no 'Activity' column to derive it from.")
+        if not all(col in fall_df_raw.columns for col in feature_cols):
+            raise ValueError(f"Missing one or more raw feature columns for fall detection: {feature_cols}")
+    except (FileNotFoundError, pd.errors.EmptyDataError, KeyError, ValueError) as e_load:
+        print(f"Error loading/processing fall dataset '{path}': {e_load}")
+        print("Generating a DUMMY fall dataset...")
+        fall_df_raw = generate_imu(ctx.config['synthetic.fall_rows'], seed=ctx.config['random_state'], label_col=label_col,
+                                   fall_fraction=ctx.config['synthetic.fall_fraction'],
+                                   sampling_rate_hz=ctx.config['fall.sampling_rate_hz'])
+        fall_df_raw = fall_df_raw.rename(columns=dict(zip(IMU_COLUMNS, feature_cols)))
+    keep = feature_cols + [col for col in (label_col, 'Activity') if col in fall_df_raw.columns]
+    return {'raw': fall_df_raw[keep]}
+
+
+def is_fall_activity(name):
+    # Activity names (e.g. fall, lfall, rfall, walk, sit): any kind of fall is 1
+    return 'FALL' in str(name).upper()
+
+
+def fall_label(ctx):
+    label_col = ctx.config['fall.label_col']
+    if 'dataset' in ctx.inputs['fall.load']:
+        dataset = open_dataset(ctx.inputs['fall.load']['dataset'])
+        if dataset.label_names is not None:
+            labels = dataset.label_lookup(is_fall_activity)
+        else:
+            labels = np.asarray(dataset.labels, dtype=np.int8)
+        counts = pd.Series(np.bincount(labels, minlength=2))
+        print("\nRAW FallLabel ('{}') distribution in the dataset:".format(label_col)); print(counts / max(1, len(labels))); print(counts)
+        return {'labels': labels}
+
+    fall_df_raw = ctx.inputs['fall.load']['raw']
+    if label_col in fall_df_raw.columns:
+        labels = fall_df_raw[label_col]
     else:
-        print(f"Extracted {fall_df_featured.shape[1]-1} features from {len(fall_df_featured)} windows.")
-        print("\nFeatured fall data distribution (after windowing):"); print(fall_df_featured[FALL_LABEL_COL].value_counts(normalize=True)); print(fall_df_featured[FALL_LABEL_COL].value_counts())
-
-# --- Proceed with Model Training if Features are Available and Diverse ---
-if not fall_df_featured.empty and FALL_LABEL_COL in fall_df_featured.columns and fall_df_featured[FALL_LABEL_COL].nunique() > 1:
-    y_fall_labels_featured = fall_df_featured[FALL_LABEL_COL]
-    X_fall_features_df = fall_df_featured.drop(columns=[FALL_LABEL_COL])
-    X_fall_features_df = X_fall_features_df.fillna(method='bfill').fillna(method='ffill').fillna(0)
-    X_fall_features_values = X_fall_features_df.values
+        print(f"CRITICAL: RAW CSV does NOT contain the label column '{label_col}'. Deriving it from the 'Activity' column.")
+        labels = fall_df_raw['Activity']
+    if not pd.api.types.is_numeric_dtype(labels):
+        labels = labels.map(is_fall_activity)
+    labels = labels.astype(int)
+    print("\nRAW FallLabel ('{}') distribution in loaded CSV:".format(label_col)); print(labels.value_counts(normalize=True)); print(labels.value_counts())
+    return {'labels': labels.to_numpy()}
+
+
+def fall_window(ctx):
+    feature_cols = ctx.config['fall.feature_cols']
+    label_col = ctx.config['fall.label_col']
+    window_samples = int(ctx.config['fall.window_seconds'] * ctx.config['fall.sampling_rate_hz'])
+    step_samples = window_samples // 2 # 50% overlap
+    labels = ctx.inputs['fall.label']['labels']
+
+    print(f"\nExtracting windowed features for fall detection (Window: {window_samples} samples, Step: {step_samples} samples)...")
+    if 'dataset' in ctx.inputs['fall.load']:
+        dataset = open_dataset(ctx.inputs['fall.load']['dataset'])
+        fall_df_featured = extract_windowed_features_chunked(dataset, window_samples, step_samples, feature_cols[:3], feature_cols[3:],
+                                                             label_col, labels=labels)
+    else:
+        fall_df = ctx.inputs['fall.load']['raw'][feature_cols].copy()
+        fall_df[label_col] = labels
+        fall_df_featured = extract_windowed_features(fall_df, window_samples, step_samples, feature_cols[:3], feature_cols[3:], label_col)
+    if fall_df_featured.empty or label_col not in fall_df_featured.columns:
+        raise StageSkipped("No features extracted or label column missing from featured DataFrame.")
+    if fall_df_featured[label_col].nunique() <= 1:
+        raise StageSkipped(f"Featured fall dataset has only one class ('{fall_df_featured[label_col].unique()[0]}') after windowing. Model training would be ineffective.")
+    print(f"Extracted {fall_df_featured.shape[1]-1} features from {len(fall_df_featured)} windows.")
+    print("\nFeatured fall data distribution (after windowing):"); print(fall_df_featured[label_col].value_counts(normalize=True)); print(fall_df_featured[label_col].value_counts())
+
+    feature_names = [col for col in fall_df_featured.columns if col != label_col]
+    fall_df_featured[feature_names] = fall_df_featured[feature_names].bfill().ffill().fillna(0)
+    return {'featured': fall_df_featured}
+
+
+def fall_resample(ctx):
+    label_col = ctx.config['fall.label_col']
+    fall_df_featured = ctx.inputs['fall.window']['featured']
+    y_fall_labels_featured = fall_df_featured[label_col].to_numpy()
+    X_fall_features_df = fall_df_featured.drop(columns=[label_col])
 
     X_train_f_orig, X_test_f_orig, y_train_f_orig, y_test_f = train_test_split(
-        X_fall_features_values, y_fall_labels_featured, test_size=0.30, random_state=42, stratify=y_fall_labels_featured)
-
-    if IMBLEARN_AVAILABLE:
+        X_fall_features_df.to_numpy(), y_fall_labels_featured, test_size=ctx.config['fall.test_size'],
+        random_state=ctx.config['random_state'], stratify=y_fall_labels_featured)
+
+    X_train_f_formodel, y_train_f = X_train_f_orig, y_train_f_orig
+    if not ctx.config['fall.smote']:
+        print("\nSMOTE disabled (fall.smote).")
+    elif not IMBLEARN_AVAILABLE:
+        print("\nSMOTE not available.")
+    else:
         minority_class_count = pd.Series(y_train_f_orig).value_counts().min()
         k_neighbors_smote = min(5, minority_class_count - 1) if minority_class_count > 1 else 1 # k must be < n_samples in minority class
         if k_neighbors_smote >= 1 and pd.Series(y_train_f_orig).nunique() > 1: # Check if SMOTE is applicable
             print(f"\nApplying SMOTE to training data (k_neighbors={k_neighbors_smote})...")
-            smote = SMOTE(random_state=42, k_neighbors=k_neighbors_smote)
+            smote = SMOTE(random_state=ctx.config['random_state'], k_neighbors=k_neighbors_smote)
             try:
-                X_train_f_resampled, y_train_f_resampled = smote.fit_resample(X_train_f_orig, y_train_f_orig)
-                X_train_f_formodel, y_train_f = X_train_f_resampled, y_train_f_resampled
+                X_train_f_formodel, y_train_f = smote.fit_resample(X_train_f_orig, y_train_f_orig)
             except ValueError as e_smote:
                 print(f"SMOTE Error: {e_smote}. Using original training data.")
-                X_train_f_formodel, y_train_f = X_train_f_orig, y_train_f_orig
-        else: X_train_f_formodel, y_train_f = X_train_f_orig, y_train_f_orig; print("\nSkipping SMOTE (minority too small or single class).")
-    else: X_train_f_formodel, y_train_f = X_train_f_orig, y_train_f_orig; print("\nSMOTE not available.")
+        else: print("\nSkipping SMOTE (minority too small or single class).")
     print("Training distribution before/after SMOTE (if applied):"); print("Original:", pd.Series(y_train_f_orig).value_counts().to_dict()); print("For Model:", pd.Series(y_train_f).value_counts().to_dict())
+    return {
+        'X_train': np.asarray(X_train_f_formodel), 'y_train': np.asarray(y_train_f),
+        'X_test': X_test_f_orig, 'y_test': y_test_f,
+        'feature_names': X_fall_features_df.columns.tolist(),
+    }
 
 
+def fall_scale(ctx):
+    split = ctx.inputs['fall.resample']
     scaler_fall = StandardScaler()
-    X_train_f = scaler_fall.fit_transform(X_train_f_formodel)
-    X_test_f = scaler_fall.transform(X_test_f_orig)
-    joblib.dump(scaler_fall, 'fall_detection_featured_scaler.pkl')
-
-    print("\nTraining Fall Detection model (RandomForest with GridSearchCV)...")
-    param_grid_rf = {
-        'n_estimators': [100, 200, 300], 'max_depth': [10, 20, None],
-        'min_samples_split': [2, 5, 10], 'min_samples_leaf': [1, 2, 4],
-        'class_weight': ['balanced', {0:1, 1:10}, {0:1, 1:15}, {0:1, 1:20}] # More emphasis on fall class
+    return {
+        'X_train': scaler_fall.fit_transform(split['X_train']),
+        'X_test': scaler_fall.transform(split['X_test']),
+        'scaler': scaler_fall,
     }
-    # Define scorers - prioritize recall for fall class (label 1)
-    recall_fall_scorer = make_scorer(recall_score, pos_label=1, average='binary')
-    f1_fall_scorer = make_scorer(f1_score, pos_label=1, average='binary')
 
-    if pd.Series(y_train_f).nunique() > 1: # Ensure CV can run
-        grid_search_rf = GridSearchCV(RandomForestClassifier(random_state=42, n_jobs=-1),
-                                      param_grid_rf, cv=3, scoring=f1_fall_scorer, verbose=1) # Score on F1 for fall
-        grid_search_rf.fit(X_train_f, y_train_f)
-        print("Best parameters for Fall RF:", grid_search_rf.best_params_)
-        fall_model = grid_search_rf.best_estimator_
-    else:
-        print("Only one class in y_train_f for model. Training basic RF.")
-        fall_model = RandomForestClassifier(n_estimators=150, random_state=42, class_weight='balanced', n_jobs=-1)
-        fall_model.fit(X_train_f, y_train_f) if X_train_f.shape[0] > 0 else print("No training data for basic RF.")
-
-
-    if X_train_f.shape[0] > 0: # Only save if model was trained
-        joblib.dump(fall_model, 'fall_detection_model.pkl')
-        print("Trained Fall Detection model saved.")
-
-        print("\nEvaluating Fall Detection model...")
-        y_pred_f = fall_model.predict(X_test_f)
-        y_pred_proba_f = fall_model.predict_proba(X_test_f)[:, 1]
-
-        print("\nClassification Report (Fall Detection - Tuned RF):")
-        print(classification_report(y_test_f, y_pred_f, target_names=['No Fall (0)', 'Fall (1)'], digits=4, zero_division=0))
-        cm_f = confusion_matrix(y_test_f, y_pred_f); sns.heatmap(cm_f, annot=True, fmt='d', cmap='Greens', xticklabels=['No Fall', 'Fall'], yticklabels=['No Fall', 'Fall']); plt.title('Confusion Matrix - Fall Detection'); plt.xlabel('Predicted'); plt.ylabel('True'); plt.show()
-
-        fig_metrics, (ax_roc_f, ax_pr_f) = plt.subplots(1, 2, figsize=(16,6)) # Different ax names
-        plot_roc_curve_custom(y_test_f, y_pred_proba_f, "Fall Detection RF", ax=ax_roc_f)
-        plot_precision_recall_curve_custom(y_test_f, y_pred_proba_f, "Fall Detection RF", ax=ax_pr_f)
-        plt.tight_layout(); plt.show()
-
-        if hasattr(fall_model, 'feature_importances_') and not X_fall_features_df.empty and X_fall_features_df.shape[1] > 0 :
-            importances = fall_model.feature_importances_
-            feature_names = X_fall_features_df.columns
-            if len(importances) == len(feature_names):
-                sorted_indices = np.argsort(importances)[::-1]
-                plt.figure(figsize=(12, max(6, min(20, len(feature_names)//2)))); plt.title("Top Feature Importances - Fall Detection")
-                plt.bar(range(min(20,X_train_f.shape[1])), importances[sorted_indices][:min(20,X_train_f.shape[1])], align="center")
-                plt.xticks(range(min(20,X_train_f.shape[1])), feature_names[sorted_indices][:min(20,X_train_f.shape[1])], rotation=90)
-                plt.tight_layout(); plt.show()
-    else:
-        print("Skipping evaluation for fall model as it was not trained.")
 
+def fall_train(ctx):
+    X_train_f = ctx.inputs['fall.scale']['X_train']
+    y_train_f = ctx.inputs['fall.resample']['y_train']
+    mode = ctx.config['fall.search']
 
-elif not fall_df_featured.empty and FALL_LABEL_COL in fall_df_featured.columns and fall_df_featured[FALL_LABEL_COL].nunique() <= 1:
-    print("\n--- Skipping Fall Detection Model Training ---")
-    print(f"Reason: Featured fall dataset has only one class ('{fall_df_featured[FALL_LABEL_COL].unique()[0]}') after windowing. Model training would be ineffective.")
-else:
-    print("\n--- Skipping Advanced Fall Detection Model Training ---")
-    print("Reason: Critical issues with loading, processing, or diversity of the fall dataset (e.g., no features extracted).")
+    if pd.Series(y_train_f).nunique() > 1: # Ensure CV can run
+        print(f"\nTraining Fall Detection model (RandomForest, {mode} search, scored on F1 for fall)...")
+        search, summary = run_search(mode, X_train_f, y_train_f, ctx.config['fall.param_grid'], cv=ctx.config['fall.cv'],
+                                     n_jobs=ctx.config['fall.search_jobs'], random_state=ctx.config['random_state'],
+                                     factor=ctx.config['fall.halving_factor'])
+        print("Best parameters for Fall RF:", search.best_params_)
+        print(f"Search took {summary['seconds']:.1f} s for {summary['n_fits']} fits")
+        return {'model': search.best_estimator_, 'search': summary}
+
+    print("Only one class in y_train_f for model. Training basic RF.")
+    fall_model = RandomForestClassifier(n_estimators=150, random_state=ctx.config['random_state'], class_weight='balanced', n_jobs=-1)
+    fall_model.fit(X_train_f, y_train_f)
+    return {'model': fall_model}
+
+
+def fall_search_report(ctx):
+    """Run the other search mode on the same data and compare wall time and held-out recall/F1"""
+    train = ctx.inputs['fall.train']
+    if not ctx.config['fall.compare_search'] or 'search' not in train:
+        return {}
+    X_train_f = ctx.inputs['fall.scale']['X_train']
+    y_train_f = ctx.inputs['fall.resample']['y_train']
+    X_test_f = ctx.inputs['fall.scale']['X_test']
+    y_test_f = ctx.inputs['fall.resample']['y_test']
+
+    trained = dict(train['search'], test=held_out_scores(train['model'], X_test_f, y_test_f))
+    other_mode = 'grid' if trained['mode'] != 'grid' else 'halving'
+    print(f"\nRunning the {other_mode} search for comparison...")
+    search, other = run_search(other_mode, X_train_f, y_train_f, ctx.config['fall.param_grid'], cv=ctx.config['fall.cv'],
+                               n_jobs=ctx.config['fall.search_jobs'], random_state=ctx.config['random_state'],
+                               factor=ctx.config['fall.halving_factor'], verbose=0)
+    other['test'] = held_out_scores(search.best_estimator_, X_test_f, y_test_f)
+    report = comparison_report([trained, other])
+    print(format_report(report))
+    return {'report': report}
+
+
+def fall_evaluate(ctx):
+    fall_model = ctx.inputs['fall.train']['model']
+    X_test_f = ctx.inputs['fall.scale']['X_test']
+    y_test_f = ctx.inputs['fall.resample']['y_test']
+    feature_names = np.array(ctx.inputs['fall.resample']['feature_names'])
+
+    print("\nEvaluating Fall Detection model...")
+    y_pred_f = fall_model.predict(X_test_f)
+    y_pred_proba_f = fall_model.predict_proba(X_test_f)[:, 1]
+
+    print("\nClassification Report (Fall Detection - Tuned RF):")
+    print(classification_report(y_test_f, y_pred_f, target_names=['No Fall (0)', 'Fall (1)'], digits=4, zero_division=0))
+    cm_f = confusion_matrix(y_test_f, y_pred_f)
+    outputs = {
+        'metrics': {
+            'report': classification_report(y_test_f, y_pred_f, target_names=['No Fall (0)', 'Fall (1)'],
+                                            zero_division=0, output_dict=True),
+            'roc_auc': float(roc_auc_score(y_test_f, y_pred_proba_f)),
+            'recall_fall': float(recall_score(y_test_f, y_pred_f, pos_label=1, zero_division=0)),
+            'confusion_matrix': cm_f.tolist(),
+        },
+        'confusion_matrix_figure': confusion_matrix_figure(
+            ctx, cm_f, ['No Fall', 'Fall'], 'Confusion Matrix - Fall Detection', 'Greens',
+            'fall_confusion_matrix.png'),
+    }
 
-print("\n\n--- Full Analysis Script Finished ---")
\ No newline at end of file
+    plt, _ = _pyplot()
+    if plt is None:
+        return outputs
+    fig_metrics, (ax_roc_f, ax_pr_f) = plt.subplots(1, 2, figsize=(16,6)) # Different ax names
+    plot_roc_curve_custom(y_test_f, y_pred_proba_f, "Fall Detection RF", ax=ax_roc_f)
+    plot_precision_recall_curve_custom(y_test_f, y_pred_proba_f, "Fall Detection RF", ax=ax_pr_f)
+    outputs['curves_figure'] = save_figure(ctx, fig_metrics, 'fall_roc_pr.png')
+
+    if hasattr(fall_model, 'feature_importances_') and len(fall_model.feature_importances_) == len(feature_names):
+        importances = fall_model.feature_importances_
+        top = np.argsort(importances)[::-1][:20]
+        fig, ax = plt.subplots(figsize=(12, max(6, min(20, len(feature_names)//2)))); ax.set_title("Top Feature Importances - Fall Detection")
+        ax.bar(range(len(top)), importances[top], align="center")
+        ax.set_xticks(range(len(top))); ax.set_xticklabels(feature_names[top], rotation=90)
+        outputs['importances_figure'] = save_figure(ctx, fig, 'fall_feature_importances.png')
+    return outputs
+
+
+# Helpers of each stage outside its function, hashed into its cache key
+FIGURE_CODE = [_pyplot, save_figure, confusion_matrix_figure]
+VITALS_SEQUENCE_CODE = [vitals_sequences, sequences]
+
+STAGES = [
+    Stage('vitals.load', vitals_load, config=['vitals.columns', 'synthetic.vitals_rows', 'synthetic.anomaly_fraction',
+                                             'random_state'], files=['vitals.dataset'],
+          code=[synthetic, imu_dataset]),
+    Stage('vitals.label', vitals_label, requires=['vitals.load'], code=[create_risk_labels_vitals],
+          artifacts={'vitals_risk_label_encoder.pkl': 'label_encoder'}),
+    Stage('vitals.scale', vitals_scale, requires=['vitals.load'],
+          artifacts={'vitals_scaler.pkl': 'scaler'}),
+    Stage('vitals.window', vitals_window, requires=['vitals.label', 'vitals.scale'],
+          config=['vitals.time_steps', 'vitals.test_size', 'random_state'], code=VITALS_SEQUENCE_CODE),
+    Stage('vitals.train', vitals_train, requires=['vitals.label', 'vitals.scale', 'vitals.window'],
+          config=['vitals.time_steps', 'vitals.lstm_units', 'vitals.dropout', 'vitals.epochs',
+                  'vitals.batch_size', 'vitals.patience', 'random_state'],
+          code=VITALS_SEQUENCE_CODE + [vitals_class_weights],
+          artifacts={'vital_signs_lstm_model.keras': 'model'}),
+    Stage('vitals.evaluate', vitals_evaluate, requires=['vitals.label', 'vitals.scale', 'vitals.window', 'vitals.train'],
+          config=['vitals.time_steps'], code=VITALS_SEQUENCE_CODE + FIGURE_CODE,
+          artifacts={f'{REPORTS_DIR}/vitals_metrics.json': 'metrics',
+                     f'{REPORTS_DIR}/vitals_confusion_matrix.png': 'confusion_matrix_figure'}),
+
+    Stage('fall.load', fall_load, config=['fall.feature_cols', 'fall.label_col', 'fall.sampling_rate_hz',
+                                               'synthetic.fall_rows', 'synthetic.fall_fraction', 'random_state'],
+          files=['fall.dataset'], code=[synthetic, imu_dataset]),
+    Stage('fall.label', fall_label, requires=['fall.load'], config=['fall.label_col'],
+          code=[is_fall_activity, imu_dataset]),
+    Stage('fall.window', fall_window, requires=['fall.load', 'fall.label'],
+          config=['fall.feature_cols', 'fall.label_col', 'fall.window_seconds', 'fall.sampling_rate_hz'],
+          code=[windowing, imu_dataset]),
+    Stage('fall.resample', fall_resample, requires=['fall.window'],
+          config=['fall.label_col', 'fall.test_size', 'fall.smote', 'random_state']),
+    Stage('fall.scale', fall_scale, requires=['fall.resample'],
+          artifacts={'fall_detection_featured_scaler.pkl': 'scaler'}),
+    Stage('fall.train', fall_train, requires=['fall.resample', 'fall.scale'],
+          config=['fall.param_grid', 'fall.cv', 'fall.search', 'fall.halving_factor', 'fall.search_jobs', 'random_state'],
+          code=[fall_search], artifacts={'fall_detection_model.pkl': 'model'}),
+    Stage('fall.search_report', fall_search_report, requires=['fall.resample', 'fall.scale', 'fall.train'],
+          config=['fall.compare_search', 'fall.param_grid', 'fall.cv', 'fall.halving_factor', 'fall.search_jobs', 'random_state'],
+          code=[fall_search], artifacts={f'{REPORTS_DIR}/fall_search_report.json': 'report'}),
+    Stage('fall.evaluate', fall_evaluate, requires=['fall.resample', 'fall.scale', 'fall.train'],
+          code=FIGURE_CODE + [plot_roc_curve_custom, plot_precision_recall_curve_custom],
+          artifacts={f'{REPORTS_DIR}/fall_metrics.json': 'metrics',
+                     f'{REPORTS_DIR}/fall_confusion_matrix.png': 'confusion_matrix_figure',
+                     f'{REPORTS_DIR}/fall_roc_pr.png': 'curves_figure',
+                     f'{REPORTS_DIR}/fall_feature_importances.png': 'importances_figure'}),
+]
+
+
+def build_config(config_file=None, overrides=()):
+    """DEFAULT_CONFIG updated from a JSON file and KEY=VALUE overrides (values parsed as JSON)"""
+    config = dict(DEFAULT_CONFIG)
+    updates = {}
+    if config_file:
+        with open(config_file) as f:
+            updates.update(json.load(f))
+    for override in overrides:
+        key, sep, value = override.partition('=')
+        if not sep:
+            raise ValueError(f'Expected KEY=VALUE, got {override!r}')
+        try:
+            updates[key] = json.loads(value)
+        except json.JSONDecodeError:
+            updates[key] = value # Plain strings, e.g. file paths
+    unknown = sorted(set(updates) - set(config))
+    if unknown:
+        raise ValueError(f'Unknown config keys: {", ".join(unknown)}')
+    config.update(updates)
+    return config
+
+
+def build_pipeline(models=('vitals', 'fall'), config=None, cache_dir=CACHE_DIR, force=(), headless=False):
+    stages = [stage for stage in STAGES if stage.name.split('.')[0] in models]
+    return Pipeline(stages, config or dict(DEFAULT_CONFIG), cache_dir, force=force, headless=headless)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', choices=['vitals', 'fall'], default=['vitals', 'fall'])
+    parser.add_argument('--until', nargs='+', metavar='STAGE', help="Only run these stages and what they need")
+    parser.add_argument('--force', nargs='+', metavar='STAGE', default=[], help="Rerun these stages even if cached")
+    parser.add_argument('--config', help="JSON file of config overrides")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="Override one config value")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--output-dir', default=BASE_DATA_DIR, help="Where the model artifacts are written")
+    parser.add_argument('--headless', action='store_true', help="Never open plot windows (for unattended runs)")
+    parser.add_argument('--list', action='store_true', help="List the stages and whether they are cached")
+    args = parser.parse_args(argv)
+
+    if args.headless:
+        # Must be set before pyplot is imported
+        os.environ['MPLBACKEND'] = 'Agg'
+    try:
+        config = build_config(args.config, args.set)
+        pipeline = build_pipeline(args.models, config, args.cache_dir, args.force, args.headless)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.list:
+        for name, key, cached in pipeline.status():
+            print(f"{name:18} {key}  {'cached' if cached else '-'}")
+        return 0
+
+    pipeline.run(args.until)
+    written = pipeline.publish(args.output_dir)
+    print("\n========================================================")
+    print(f"Ran: {', '.join(pipeline.ran) or 'nothing (all stages cached)'}")
+    for name, reason in pipeline.skipped.items():
+        print(f"Skipped {name}: {reason}")
+    for path in written:
+        print(f"Wrote {path}")
+    # An unattended run that skipped a stage did not produce the full artifact set
+    return 1 if pipeline.skipped else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""
+Cached stage pipeline
+
+A pipeline is a list of named stages. A stage reads the outputs of the stages
+it requires plus the config values it declares, and returns a dict of
+outputs. Each result is cached on disk in
+
+    <cache_dir>/<stage name>/<key>/
+
+where the key hashes the stage's code (its function plus the helper
+functions and modules it declares), the config values it reads, the
+contents of its input files and the keys of the stages it requires.
+Changing a config value therefore reruns the stages that read it and the
+stages downstream of them, and nothing else.
+
+Outputs are stored by type:
+    numpy arrays                arrays.npz
+    pandas DataFrames           <name>.parquet (pandas pickle without a parquet engine)
+    pathlib.Path in ctx.workdir files the stage wrote, kept with the entry
+    JSON values                 meta.json
+    anything else               <name>.joblib
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+CACHE_FORMAT_VERSION = 1
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        PARQUET_AVAILABLE = True
+    except ImportError:
+        PARQUET_AVAILABLE = False
+
+
+class StageSkipped(Exception):
+    """Raised by a stage when its input cannot be used; dependent stages are skipped too"""
+
+
+class Stage:
+    """
+    One pipeline step
+
+    Args:
+        name: Unique name, e.g. 'fall.train'
+        func: Callable(ctx) returning a dict of outputs
+        requires: Names of the stages whose outputs func reads (ctx.inputs)
+        config: Config keys func reads (ctx.config)
+        files: Config keys holding paths of input files; their contents are
+               part of the cache key (for a directory: its files' names,
+               sizes and modification times)
+        artifacts: {file name: output name} written by Pipeline.publish
+        code: Functions and modules func calls; their source is part of the
+              cache key, so editing a helper reruns the stages that use it
+        version: Bump to invalidate cached results when code the stage calls
+                 changes outside func and code, e.g. in a library
+    """
+
+    def __init__(self, name, func, requires=(), config=(), files=(), artifacts=None, code=(), version=1):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.config = tuple(config)
+        self.files = tuple(files)
+        self.artifacts = dict(artifacts or {})
+        self.code = tuple(code)
+        self.version = version
+
+
+class StageContext:
+    """What a stage function sees: its config values, upstream outputs and a working directory"""
+
+    def __init__(self, stage, config, inputs, workdir, headless):
+        self.stage = stage
+        self.config = config
+        self.inputs = inputs
+        self.workdir = workdir
+        self.headless = headless
+
+    def path(self, name):
+        """Path for a file the stage writes; return it as an output to keep it"""
+        return self.workdir / name
+
+
+def _json_value(value):
+    try:
+        json.dumps(value, allow_nan=True)
+    except (TypeError, ValueError):
+        return False
+    return not isinstance(value, (np.ndarray, pd.DataFrame, Path))
+
+
+def _hash_directory(path):
+    # Directories (e.g. memory-mapped datasets) can be many GB, so they are
+    # identified by file names, sizes and modification times, not contents
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            relative = os.path.relpath(os.path.join(root, name), path)
+            digest.update(f'{relative}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _hash_file(path, chunk_size=1 << 20):
+    if os.path.isdir(path):
+        return _hash_directory(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_outputs(outputs, entry_dir):
+    """Write a stage's outputs into its cache entry"""
+    arrays, meta, kinds = {}, {}, {}
+    for name, value in outputs.items():
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            arrays[name] = value
+            kinds[name] = 'array'
+        elif isinstance(value, pd.DataFrame):
+            if PARQUET_AVAILABLE:
+                value.to_parquet(entry_dir / f'{name}.parquet')
+                kinds[name] = 'parquet'
+            else:
+                value.to_pickle(entry_dir / f'{name}.pkl')
+                kinds[name] = 'dataframe_pickle'
+        elif isinstance(value, Path):
+            relative = value.resolve().relative_to(entry_dir.resolve())
+            meta[name] = str(relative)
+            kinds[name] = 'file'
+        elif _json_value(value):
+            meta[name] = value
+            kinds[name] = 'json'
+        else:
+            joblib.dump(value, entry_dir / f'{name}.joblib')
+            kinds[name] = 'joblib'
+    if arrays:
+        np.savez(entry_dir / 'arrays.npz', **arrays)
+    with open(entry_dir / 'meta.json', 'w') as f:
+        json.dump({'kinds': kinds, 'values': meta}, f, indent=2)
+
+
+def load_outputs(entry_dir):
+    """Read outputs written by save_outputs"""
+    with open(entry_dir / 'meta.json') as f:
+        meta = json.load(f)
+    arrays = {}
+    if (entry_dir / 'arrays.npz').exists():
+        with np.load(entry_dir / 'arrays.npz', allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    outputs = {}
+    for name, kind in meta['kinds'].items():
+        if kind == 'array':
+            outputs[name] = arrays[name]
+        elif kind == 'parquet':
+            outputs[name] = pd.read_parquet(entry_dir / f'{name}.parquet')
+        elif kind == 'dataframe_pickle':
+            outputs[name] = pd.read_pickle(entry_dir / f'{name}.pkl')
+        elif kind == 'file':
+            outputs[name] = entry_dir / meta['values'][name]
+        elif kind == 'json':
+            outputs[name] = meta['values'][name]
+        else:
+            outputs[name] = joblib.load(entry_dir / f'{name}.joblib')
+    return outputs
+
+
+class Pipeline:
+    """
+    Runs stages in dependency order, reusing cached results
+
+    Args:
+        stages: Stage list; a stage may only require stages listed before it
+        config: Flat {key: value} configuration
+        cache_dir: Root of the cache
+        force: Stage names to rerun even when cached; stages downstream of
+               them rerun as well
+        headless: Passed to stages (no interactive plots)
+    """
+
+    def __init__(self, stages, config, cache_dir, force=(), headless=False):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f'Duplicate stage {stage.name!r}')
+            missing = [name for name in stage.requires if name not in self.stages]
+            if missing:
+                raise ValueError(f'Stage {stage.name!r} requires unknown or later stages {missing}')
+            unknown = [key for key in stage.config + stage.files if key not in config]
+            if unknown:
+                raise ValueError(f'Stage {stage.name!r} reads missing config keys {unknown}')
+            self.stages[stage.name] = stage
+        self.config = config
+        self.cache_dir = Path(cache_dir)
+        self.headless = headless
+        self.force = self._with_downstream(self.resolve(force) if force else [])
+        self.results = {}
+        self.ran = []
+        self.skipped = {}
+        self._keys = {}
+        self._file_digests = {}
+        self._code_digests = {}
+
+    def resolve(self, names):
+        """Stage names for exact names or suffixes ('train' matches 'fall.train' and 'vitals.train')"""
+        resolved = []
+        for name in names:
+            matches = [stage for stage in self.stages
+                       if stage == name or stage.endswith('.' + name)]
+            if not matches:
+                raise ValueError(f'Unknown stage {name!r}; stages: {", ".join(self.stages)}')
+            resolved.extend(match for match in matches if match not in resolved)
+        return resolved
+
+    def _with_downstream(self, names):
+        selected = set(names)
+        for stage in self.stages.values():
+            if selected.intersection(stage.requires):
+                selected.add(stage.name)
+        return selected
+
+    def _upstream(self, names):
+        needed = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].requires)
+        return [name for name in self.stages if name in needed]
+
+    def _file_digest(self, path):
+        path = str(path)
+        if path not in self._file_digests:
+            self._file_digests[path] = _hash_file(path) if os.path.exists(path) else 'missing'
+        return self._file_digests[path]
+
+    def _code_digest(self, obj):
+        name = f'{obj.__module__}.{obj.__qualname__}' if hasattr(obj, '__qualname__') else obj.__name__
+        if name not in self._code_digests:
+            self._code_digests[name] = hashlib.sha256(inspect.getsource(obj).encode('utf-8')).hexdigest()
+        return name, self._code_digests[name]
+
+    def key(self, name):
+        """Cache key of a stage for the current config and inputs"""
+        if name not in self._keys:
+            stage = self.stages[name]
+            payload = {
+                'format': CACHE_FORMAT_VERSION,
+                'stage': stage.name,
+                'version': stage.version,
+                'code': inspect.getsource(stage.func),
+                'helpers': dict(self._code_digest(obj) for obj in stage.code),
+                'config': {key: self.config[key] for key in stage.config},
+                'files': {key: self._file_digest(self.config[key]) for key in stage.files},
+                'requires': {required: self.key(required) for required in stage.requires},
+            }
+            encoded = json.dumps(payload, sort_keys=True, default=repr).encode('utf-8')
+            self._keys[name] = hashlib.sha256(encoded).hexdigest()[:20]
+        return self._keys[name]
+
+    def entry_dir(self, name):
+        return self.cache_dir / name / self.key(name)
+
+    def is_cached(self, name):
+        return (self.entry_dir(name) / 'meta.json').exists()
+
+    def status(self):
+        """(name, key, cached) for every stage"""
+        return [(name, self.key(name), self.is_cached(name)) for name in self.stages]
+
+    def _run_stage(self, stage):
+        entry_dir = self.entry_dir(stage.name)
+        inputs = {name: self.results[name] for name in stage.requires}
+        workdir = entry_dir.with_name(f'{entry_dir.name}.tmp-{os.getpid()}')
+        shutil.rmtree(workdir, ignore_errors=True)
+        workdir.mkdir(parents=True)
+        try:
+            ctx = StageContext(stage, {key: self.config[key] for key in stage.config + stage.files},
+                               inputs, workdir, self.headless)
+            outputs = stage.func(ctx) or {}
+            save_outputs(outputs, workdir)
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        # Publish the entry in one rename so an interrupted run never leaves
+        # a partial result behind
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(workdir, entry_dir)
+        return load_outputs(entry_dir)
+
+    def run(self, targets=None):
+        """
+        Run the target stages (all by default) and what they require
+
+        Returns {stage name: outputs} for the stages that ran or were
+        loaded from the cache.
+        """
+        names = self._upstream(self.resolve(targets)) if targets else list(self.stages)
+        for name in names:
+            stage = self.stages[name]
+            blocked = [required for required in stage.requires if required in self.skipped]
+            if blocked:
+                self.skipped[name] = f'requires skipped stage {blocked[0]}'
+                continue
+            if name not in self.force and self.is_cached(name):
+                print(f"[{name}] cached ({self.key(name)})")
+                self.results[name] = load_outputs(self.entry_dir(name))
+                continue
+            print(f"[{name}] running")
+            start = time.perf_counter()
+            try:
+                self.results[name] = self._run_stage(stage)
+            except StageSkipped as e:
+                self.skipped[name] = str(e)
+                print(f"[{name}] skipped: {e}")
+                continue
+            self.ran.append(name)
+            print(f"[{name}] done in {time.perf_counter() - start:.1f} s ({self.key(name)})")
+        return self.results
+
+    def publish(self, output_dir):
+        """
+        Write the artifacts of the stages in results to output_dir
+
+        File outputs are copied, .json artifacts are written as JSON and other
+        outputs with joblib.
+        Returns the written paths.
+        """
+        output_dir = Path(output_dir)
+        written = []
+        for name, outputs in self.results.items():
+            for file_name, output_name in self.stages[name].artifacts.items():
+                value = outputs.get(output_name)
+                if value is None:
+                    continue
+                target = output_dir / file_name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if isinstance(value, Path):
+                    shutil.copy2(value, target)
+                elif target.suffix == '.json':
+                    with open(target, 'w') as f:
+                        json.dump(value, f, indent=2)
+                else:
+                    joblib.dump(value, target)
+                written.append(target)
+        return written
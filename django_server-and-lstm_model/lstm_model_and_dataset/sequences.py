@@ -0,0 +1,182 @@
+"""
+Windowed sequences for LSTM training
+
+create_sequences_lstm_loop copied every window into a Python list and then
+into one (N, time_steps, n_features) array, so the training set held each
+reading time_steps times. Here the windows are a read-only strided view over
+the feature array (numpy's sliding_window_view). They take no extra memory
+and are built in constant time. Only the batch being fed to the model is
+copied.
+
+    dataset = WindowedSequences(scaled_features, labels, time_steps)
+    train_idx, test_idx = train_test_split(np.arange(len(dataset)), stratify=dataset.labels)
+    model.fit(keras_sequence(dataset.batches(train_idx, 64, shuffle=True)), ...)
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def create_sequences_lstm_loop(input_data, target_data, time_steps):
+    """Reference implementation: copies every window into a new array"""
+    Xs, ys = [], []
+    for i in range(len(input_data) - time_steps):
+        Xs.append(input_data[i:(i + time_steps)])
+        ys.append(target_data[i + time_steps -1])
+    if not Xs: return np.array([]), np.array([])
+    return np.array(Xs), np.array(ys)
+
+
+def _window_view(features, time_steps, count):
+    """(count, time_steps, n_features) strided view; window i starts at row i"""
+    return sliding_window_view(features, (time_steps, features.shape[1]))[:count, 0]
+
+
+def create_sequences_lstm(input_data, target_data, time_steps):
+    """
+    Same sequences and labels as create_sequences_lstm_loop, without the copy
+
+    Returns:
+        (X, y): X is a read-only view of input_data with shape
+        (len - time_steps, time_steps, n_features); the label of each
+        sequence is the target of its last reading
+    """
+    input_data = np.asarray(input_data)
+    count = len(input_data) - time_steps
+    if count <= 0:
+        return np.array([]), np.array([])
+    X = _window_view(input_data.reshape(len(input_data), -1), time_steps, count)
+    if input_data.ndim == 1:
+        X = X[..., 0]
+    return X, np.asarray(target_data)[time_steps - 1:time_steps - 1 + count]
+
+
+class WindowedSequences:
+    """
+    Training windows over one feature array, materialized by index on demand
+
+    Args:
+        features: (n_rows, n_features) array
+        targets: (n_rows,) labels; a window is labelled with the target of its
+                 last reading
+        time_steps: Readings per window
+        dtype: Stored feature dtype; float32 is what Keras trains in and
+               halves the memory of the float64 scaler output
+    """
+
+    def __init__(self, features, targets, time_steps, dtype=np.float32):
+        self.features = np.ascontiguousarray(features, dtype=dtype)
+        if self.features.ndim != 2:
+            raise ValueError(f'Expected (n_rows, n_features) features, got shape {self.features.shape}')
+        targets = np.asarray(targets)
+        if len(targets) != len(self.features):
+            raise ValueError(f'{len(targets)} targets for {len(self.features)} feature rows')
+        self.time_steps = int(time_steps)
+        count = max(0, len(self.features) - self.time_steps)
+        if count:
+            self.windows = _window_view(self.features, self.time_steps, count)
+        else:
+            self.windows = np.empty((0, self.time_steps, self.features.shape[1]), dtype=self.features.dtype)
+        self.labels = targets[self.time_steps - 1:self.time_steps - 1 + count]
+
+    def __len__(self):
+        return len(self.windows)
+
+    @property
+    def shape(self):
+        return self.windows.shape
+
+    def take(self, indices):
+        """Copy of the windows at indices and their labels"""
+        indices = np.asarray(indices)
+        return self.windows[indices], self.labels[indices]
+
+    def batches(self, indices=None, batch_size=64, class_weights=None, shuffle=False, seed=None):
+        """SequenceBatches over a subset of the windows (all of them by default)"""
+        if indices is None:
+            indices = np.arange(len(self))
+        return SequenceBatches(self, indices, batch_size, class_weights, shuffle, seed)
+
+
+class SequenceBatches:
+    """
+    Batches of windows built when requested
+
+    Implements the keras.utils.Sequence interface (__len__, __getitem__,
+    on_epoch_end) without importing TensorFlow; wrap it with keras_sequence()
+    to pass it to model.fit.
+
+    Args:
+        dataset: WindowedSequences
+        indices: Window indices in this split
+        batch_size: Windows per batch
+        class_weights: Optional {label: weight}; batches then carry per-sample
+                       weights, which works with every Keras version (class_weight
+                       is not accepted with generators by all of them)
+        shuffle: Reshuffle the windows at the end of every epoch, as fit does
+                 for in-memory arrays
+        seed: Seed for the shuffling
+    """
+
+    def __init__(self, dataset, indices, batch_size=64, class_weights=None, shuffle=False, seed=None):
+        self.dataset = dataset
+        self.indices = np.array(indices, dtype=np.int64)
+        self.batch_size = max(1, int(batch_size))
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.sample_weights = None
+        if class_weights:
+            weights = np.ones(int(max(np.max(dataset.labels, initial=0), max(class_weights))) + 1,
+                              dtype=np.float32)
+            for label, weight in class_weights.items():
+                weights[int(label)] = weight
+            self.sample_weights = weights
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
+
+    def __len__(self):
+        return -(-len(self.indices) // self.batch_size)
+
+    @property
+    def labels(self):
+        """Labels of the windows in the current batch order"""
+        return self.dataset.labels[self.indices]
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(f'Batch {index} out of range')
+        X, y = self.dataset.take(self.indices[index * self.batch_size:(index + 1) * self.batch_size])
+        if self.sample_weights is None:
+            return X, y
+        return X, y, self.sample_weights[y]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
+
+
+def keras_sequence(batches):
+    """
+    Wrap SequenceBatches in a keras.utils.Sequence for model.fit, evaluate
+    and predict. TensorFlow is only imported here.
+    """
+    from tensorflow import keras
+
+    class KerasSequenceBatches(keras.utils.Sequence):
+        def __init__(self, batches):
+            super().__init__()
+            self.batches = batches
+
+        def __len__(self):
+            return len(self.batches)
+
+        def __getitem__(self, index):
+            return self.batches[index]
+
+        def on_epoch_end(self):
+            self.batches.on_epoch_end()
+
+    return KerasSequenceBatches(batches)
@@ -0,0 +1,346 @@
+"""
+Synthetic labelled IMU and vitals recordings
+
+Stands in for the real recordings when they are missing or have a single
+class, and produces recordings of any size for training, benchmarks and load
+tests. Every sample is computed with array operations over a whole block of
+rows. A recording is a sequence of segments, and each row looks up its
+segment's parameters by index, so there is no per-event or per-row Python
+loop.
+
+IMU recordings alternate activities of daily living (walk, step, light, sit)
+with fall events labelled fall, lfall or rfall by direction. A fall event is
+a short walk, then free fall (acceleration magnitude well below 1 g), then an
+impact spike of several g with fast rotation, and then stillness with the
+device lying in its new orientation. Vitals recordings alternate normal
+stretches with tachycardia, bradycardia, hypoxemia and fever episodes. Each
+channel is an AR(1) process around the episode's baseline.
+
+fall_fraction and anomaly_fraction set the share of rows inside fall events
+or anomalous episodes. A seed makes a recording reproducible: blocks are
+generated from independent child seeds, so the same seed and block_rows give
+the same rows however the recording is consumed.
+
+    python synthetic.py imu falls.imu --rows 10000000 --fall-fraction 0.2 --seed 7
+    python synthetic.py vitals vitals.imu --rows 1000000 --anomaly-fraction 0.3
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from imu_dataset import DatasetWriter
+
+IMU_COLUMNS = ['xAcc', 'yAcc', 'zAcc', 'xGyro', 'yGyro', 'zGyro']
+VITALS_COLUMNS = ['Heart Rate', 'Oxygen Saturation', 'Body Temperature']
+DEFAULT_BLOCK_ROWS = 1 << 18
+GRAVITY = 9.81
+
+# Activities of daily living: mean segment length (s), periodic acceleration
+# amplitude along gravity (m/s^2), step frequency (Hz), acceleration noise
+# (m/s^2), gyroscope noise (deg/s)
+ADL_ACTIVITIES = {
+    'walk': (60.0, 3.0, 1.8, 0.6, 15.0),
+    'step': (30.0, 2.0, 1.2, 0.5, 15.0),
+    'light': (90.0, 1.5, 0.8, 1.5, 35.0),
+    'sit': (120.0, 0.0, 0.0, 0.3, 8.0),
+}
+# Direction of gravity in the device frame when lying after each kind of fall
+FALL_DIRECTIONS = {
+    'fall': (0.1, 0.0, 1.0),
+    'lfall': (0.2, 0.95, 0.2),
+    'rfall': (0.2, -0.95, 0.2),
+}
+# Direction of gravity in the device frame when upright, as in acc_gyr.csv
+UPRIGHT = (0.75, 0.0, -0.66)
+# Fall event phases (s): walking before, free fall, impact, lying still
+FALL_PHASES = (1.5, 0.3, 0.2, 3.0)
+IMU_LABELS = list(ADL_ACTIVITIES) + list(FALL_DIRECTIONS)
+
+# Vitals episodes: mean length (s) and the baseline heart rate (bpm),
+# SpO2 (%) and body temperature (C)
+VITALS_EPISODES = {
+    'normal': (600.0, (75.0, 97.5, 36.8)),
+    'tachycardia': (120.0, (130.0, 96.5, 37.0)),
+    'bradycardia': (120.0, (45.0, 96.5, 36.6)),
+    'hypoxemia': (120.0, (85.0, 87.0, 36.8)),
+    'fever': (300.0, (100.0, 95.5, 38.6)),
+}
+VITALS_LABELS = list(VITALS_EPISODES)
+# Spread of the baselines between episodes and of the AR(1) noise around them
+_VITALS_BASELINE_STD = np.array([6.0, 1.0, 0.2])
+_VITALS_NOISE_STD = np.array([3.0, 0.6, 0.1])
+_VITALS_AR = 0.95
+
+
+def _weights(names, weights):
+    weights = np.array([1.0 if weights is None else float(weights.get(name, 0.0)) for name in names])
+    if weights.sum() <= 0:
+        raise ValueError(f'At least one of {names} needs a positive weight')
+    return weights / weights.sum()
+
+
+def _unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _segments(rng, n_rows, kind_probabilities, kind_lengths):
+    """
+    Random segment kinds and lengths covering n_rows
+
+    Args:
+        kind_probabilities: Probability of each kind per segment
+        kind_lengths: (low, high) segment length in rows for each kind
+
+    Returns:
+        (kind, start, length) arrays, one entry per segment; the last segment
+        is cut at n_rows
+    """
+    kind_lengths = np.asarray(kind_lengths)
+    mean_length = float(kind_probabilities @ kind_lengths.mean(axis=1))
+    kinds, lengths = [], []
+    total = 0
+    while total < n_rows:
+        count = int((n_rows - total) / mean_length * 1.2) + 2
+        kind = rng.choice(len(kind_probabilities), count, p=kind_probabilities)
+        length = rng.integers(kind_lengths[kind, 0], kind_lengths[kind, 1] + 1)
+        kinds.append(kind)
+        lengths.append(length)
+        total += int(length.sum())
+    kind = np.concatenate(kinds)
+    length = np.concatenate(lengths)
+    end = np.cumsum(length)
+    count = int(np.searchsorted(end, n_rows)) + 1
+    kind, length, end = kind[:count], length[:count].copy(), end[:count]
+    length[-1] -= end[-1] - n_rows
+    return kind, end - length, length
+
+
+def _segment_rows(starts, lengths):
+    """Segment index and position within the segment of every row"""
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    return segment, np.arange(len(segment)) - starts[segment]
+
+
+def _fall_probability(fall_fraction, adl_mean_rows, fall_rows):
+    """Chance that a segment is a fall event, so that fall_fraction of the rows are"""
+    if not 0 <= fall_fraction < 1:
+        raise ValueError('fall_fraction must be in [0, 1)')
+    return fall_fraction * adl_mean_rows / (fall_fraction * adl_mean_rows + (1 - fall_fraction) * fall_rows)
+
+
+def imu_block(rng, n_rows, fall_fraction=0.05, sampling_rate_hz=50, activity_weights=None):
+    """
+    One block of a synthetic IMU recording
+
+    Args:
+        rng: numpy Generator
+        n_rows: Rows in the block
+        fall_fraction: Share of rows inside fall events
+        sampling_rate_hz: Sampling rate of the recording
+        activity_weights: Relative frequency of the ADL_ACTIVITIES (default: equal)
+
+    Returns:
+        (dict of float32 IMU_COLUMNS arrays, int16 codes into IMU_LABELS)
+    """
+    adl = _weights(list(ADL_ACTIVITIES), activity_weights)
+    adl_params = np.array(list(ADL_ACTIVITIES.values()))
+    phase_rows = np.maximum(1, np.round(np.array(FALL_PHASES) * sampling_rate_hz)).astype(int)
+    fall_rows = int(phase_rows.sum())
+    adl_lengths = np.round(np.outer(adl_params[:, 0] * sampling_rate_hz, [0.5, 1.5])).astype(int)
+    p_fall = _fall_probability(fall_fraction, float(adl @ adl_lengths.mean(axis=1)), fall_rows)
+    n_falls = len(FALL_DIRECTIONS)
+    probabilities = np.concatenate([adl * (1 - p_fall), np.full(n_falls, p_fall / n_falls)])
+    lengths = np.vstack([adl_lengths, np.full((n_falls, 2), fall_rows)])
+    kind, starts, seg_lengths = _segments(rng, n_rows, probabilities, lengths)
+    n_segments = len(kind)
+    is_fall = kind >= len(ADL_ACTIVITIES)
+    # Falls start from a walk
+    params = adl_params[np.where(is_fall, 0, kind)]
+    amplitude, frequency, acc_noise, gyro_noise = params[:, 1:].T
+
+    upright = _unit(np.array(UPRIGHT) + rng.normal(0, 0.1, (n_segments, 3)))
+    fall_directions = np.array(list(FALL_DIRECTIONS.values()))
+    lying = _unit(fall_directions[np.maximum(kind - len(ADL_ACTIVITIES), 0)]
+                  + rng.normal(0, 0.15, (n_segments, 3)))
+    offset = rng.uniform(0, 2 * np.pi, n_segments)
+
+    segment, position = _segment_rows(starts, seg_lengths)
+    t = position / sampling_rate_hz
+    cycle = 2 * np.pi * frequency[segment] * t + offset[segment]
+    acc = (GRAVITY + amplitude[segment] * np.sin(cycle))[:, None] * upright[segment]
+    acc += rng.standard_normal((n_rows, 3)) * acc_noise[segment, None]
+    # Arm swing around the device's y axis
+    gyro = rng.standard_normal((n_rows, 3)) * gyro_noise[segment, None]
+    gyro[:, 1] += 7 * amplitude[segment] * np.cos(cycle)
+
+    if is_fall.any():
+        phase = np.searchsorted(np.cumsum(phase_rows), position, side='right')
+        phase[~is_fall[segment]] = 0
+        phase_start = np.concatenate([[0], np.cumsum(phase_rows)])
+
+        rows = phase == 1 # Free fall: the device measures a fraction of gravity while tumbling
+        seg = segment[rows]
+        acc[rows] *= rng.uniform(0.1, 0.4, n_segments)[seg, None]
+        tumble = _unit(rng.standard_normal((n_segments, 3))) * rng.uniform(100, 250, n_segments)[:, None]
+        gyro[rows] += tumble[seg]
+
+        rows = phase == 2 # Impact: a half-sine spike of several g, with fast rotation
+        seg = segment[rows]
+        pulse = np.sin(np.pi * (position[rows] - phase_start[2] + 0.5) / phase_rows[2])
+        impact = _unit(rng.standard_normal((n_segments, 3))) * (rng.uniform(2.0, 4.0, n_segments) * GRAVITY)[:, None]
+        acc[rows] = GRAVITY * lying[seg] + pulse[:, None] * impact[seg] + rng.normal(0, 2.0, (len(seg), 3))
+        gyro[rows] = rng.normal(0, 200.0, (len(seg), 3))
+
+        rows = phase == 3 # Lying still in the new orientation
+        seg = segment[rows]
+        acc[rows] = GRAVITY * lying[seg] + rng.normal(0, 0.05, (len(seg), 3))
+        gyro[rows] = rng.normal(0, 1.0, (len(seg), 3))
+
+    columns = dict(zip(IMU_COLUMNS, np.hstack([acc, gyro]).astype(np.float32).T))
+    return columns, kind[segment].astype(np.int16)
+
+
+def vitals_block(rng, n_rows, anomaly_fraction=0.2, sampling_rate_hz=1, episode_weights=None):
+    """
+    One block of a synthetic vitals recording
+
+    Args:
+        rng: numpy Generator
+        n_rows: Rows in the block
+        anomaly_fraction: Share of rows inside anomalous episodes (approximate)
+        sampling_rate_hz: Sampling rate of the recording
+        episode_weights: Relative frequency of the anomalous VITALS_EPISODES (default: equal)
+
+    Returns:
+        (dict of float32 VITALS_COLUMNS arrays, int16 codes into VITALS_LABELS)
+    """
+    if not 0 <= anomaly_fraction < 1:
+        raise ValueError('anomaly_fraction must be in [0, 1)')
+    anomalies = _weights(VITALS_LABELS[1:], episode_weights)
+    mean_seconds = np.array([seconds for seconds, _ in VITALS_EPISODES.values()])
+    lengths = np.maximum(1, np.round(np.outer(mean_seconds * sampling_rate_hz, [0.5, 1.5]))).astype(int)
+    normal_rows = lengths[0].mean()
+    anomaly_rows = float(anomalies @ lengths[1:].mean(axis=1))
+    p_anomaly = (anomaly_fraction * normal_rows
+                 / (anomaly_fraction * normal_rows + (1 - anomaly_fraction) * anomaly_rows))
+    probabilities = np.concatenate([[1 - p_anomaly], anomalies * p_anomaly])
+    kind, starts, seg_lengths = _segments(rng, n_rows, probabilities, lengths)
+
+    baselines = np.array([baseline for _, baseline in VITALS_EPISODES.values()])
+    baseline = baselines[kind] + rng.standard_normal((len(kind), 3)) * _VITALS_BASELINE_STD
+    segment, position = _segment_rows(starts, seg_lengths)
+    # Drift from the previous episode's baseline over the first minute
+    previous = baseline[np.maximum(segment - 1, 0)]
+    ramp = np.minimum(1.0, position / (60.0 * sampling_rate_hz))[:, None]
+    level = previous + (baseline[segment] - previous) * ramp
+    innovations = rng.standard_normal((n_rows, 3)) * (_VITALS_NOISE_STD * np.sqrt(1 - _VITALS_AR ** 2))
+    values = level + lfilter([1.0], [1.0, -_VITALS_AR], innovations, axis=0)
+    values[:, 1] = np.minimum(values[:, 1], 100.0)
+
+    columns = dict(zip(VITALS_COLUMNS, values.astype(np.float32).T))
+    return columns, kind[segment].astype(np.int16)
+
+
+def _blocks(block_func, n_rows, seed=None, block_rows=DEFAULT_BLOCK_ROWS, **params):
+    block_rows = max(1, int(block_rows))
+    n_blocks = -(-int(n_rows) // block_rows)
+    for index, child in enumerate(np.random.SeedSequence(seed).spawn(n_blocks)):
+        yield block_func(np.random.default_rng(child), min(block_rows, n_rows - index * block_rows), **params)
+
+
+def imu_blocks(n_rows, seed=None, block_rows=DEFAULT_BLOCK_ROWS, **params):
+    """Blocks of imu_block rows adding up to n_rows; params go to imu_block"""
+    return _blocks(imu_block, n_rows, seed, block_rows, **params)
+
+
+def vitals_blocks(n_rows, seed=None, block_rows=DEFAULT_BLOCK_ROWS, **params):
+    """Blocks of vitals_block rows adding up to n_rows; params go to vitals_block"""
+    return _blocks(vitals_block, n_rows, seed, block_rows, **params)
+
+
+def _frame(blocks, columns, label_names, label_col):
+    blocks = list(blocks)
+    frame = pd.DataFrame({col: np.concatenate([block[col] for block, _ in blocks]) for col in columns})
+    codes = np.concatenate([codes for _, codes in blocks])
+    frame[label_col] = np.asarray(label_names, dtype=object)[codes]
+    return frame
+
+
+def generate_imu(n_rows, seed=None, label_col='label', **params):
+    """Synthetic IMU recording as a DataFrame with IMU_COLUMNS and activity names in label_col"""
+    return _frame(imu_blocks(n_rows, seed, **params), IMU_COLUMNS, IMU_LABELS, label_col)
+
+
+def generate_vitals(n_rows, seed=None, label_col='episode', **params):
+    """Synthetic vitals recording as a DataFrame with VITALS_COLUMNS and episode names in label_col"""
+    return _frame(vitals_blocks(n_rows, seed, **params), VITALS_COLUMNS, VITALS_LABELS, label_col)
+
+
+def _write(out_dir, blocks, columns, label_col, label_names, sampling_rate_hz, source):
+    writer = DatasetWriter(out_dir, columns, label_col, label_names, sampling_rate_hz, source)
+    try:
+        for block, codes in blocks:
+            writer.append(block, codes)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def write_imu_dataset(out_dir, n_rows, seed=None, sampling_rate_hz=50, label_col='label',
+                      block_rows=DEFAULT_BLOCK_ROWS, **params):
+    """
+    Stream a synthetic IMU recording into the columnar format (imu_dataset.py)
+
+    Only one block is in memory at a time. Returns the opened ImuDataset.
+    """
+    source = {'generator': 'synthetic.imu', 'seed': seed, 'block_rows': block_rows, **params}
+    blocks = imu_blocks(n_rows, seed, block_rows, sampling_rate_hz=sampling_rate_hz, **params)
+    return _write(out_dir, blocks, IMU_COLUMNS, label_col, IMU_LABELS, sampling_rate_hz, source)
+
+
+def write_vitals_dataset(out_dir, n_rows, seed=None, sampling_rate_hz=1, label_col='episode',
+                         block_rows=DEFAULT_BLOCK_ROWS, **params):
+    """Stream a synthetic vitals recording into the columnar format; returns the opened ImuDataset"""
+    source = {'generator': 'synthetic.vitals', 'seed': seed, 'block_rows': block_rows, **params}
+    blocks = vitals_blocks(n_rows, seed, block_rows, sampling_rate_hz=sampling_rate_hz, **params)
+    return _write(out_dir, blocks, VITALS_COLUMNS, label_col, VITALS_LABELS, sampling_rate_hz, source)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='kind', required=True)
+    imu = commands.add_parser('imu', help="Write a synthetic IMU recording")
+    imu.add_argument('--fall-fraction', type=float, default=0.05, help="Share of rows inside fall events")
+    imu.add_argument('--sampling-rate', type=float, default=50, help="Sampling rate in Hz")
+    vitals = commands.add_parser('vitals', help="Write a synthetic vitals recording")
+    vitals.add_argument('--anomaly-fraction', type=float, default=0.2, help="Share of rows inside anomalous episodes")
+    vitals.add_argument('--sampling-rate', type=float, default=1, help="Sampling rate in Hz")
+    for command in (imu, vitals):
+        command.add_argument('out', help="Dataset directory (imu_dataset.py format), or a .csv file")
+        command.add_argument('--rows', type=int, required=True)
+        command.add_argument('--seed', type=int)
+        command.add_argument('--block-rows', type=int, default=DEFAULT_BLOCK_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.kind == 'imu':
+        params = {'fall_fraction': args.fall_fraction}
+        write, generate = write_imu_dataset, generate_imu
+    else:
+        params = {'anomaly_fraction': args.anomaly_fraction}
+        write, generate = write_vitals_dataset, generate_vitals
+    if args.out.endswith('.csv'):
+        generate(args.rows, args.seed, sampling_rate_hz=args.sampling_rate, block_rows=args.block_rows,
+                 **params).to_csv(args.out, index=False)
+        print(f"Wrote {args.rows} rows to {args.out}")
+    else:
+        dataset = write(args.out, args.rows, args.seed, args.sampling_rate, block_rows=args.block_rows, **params)
+        print(f"Wrote {dataset.n_rows} rows, columns {dataset.columns} to {dataset.path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
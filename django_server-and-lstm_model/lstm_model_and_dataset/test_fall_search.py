@@ -0,0 +1,78 @@
+"""
+Tests for the fall model hyperparameter search
+
+Run from this directory with:
+
+    python -m unittest test_fall_search
+"""
+import os
+import unittest
+
+import numpy as np
+from sklearn.datasets import make_classification
+
+from fall_search import (comparison_report, format_report, held_out_scores, normalize_param_grid,
+                         run_search, shared_matrix)
+
+PARAM_GRID = {
+    'n_estimators': [5, 10],
+    'max_depth': [2, None],
+    'class_weight': ['balanced', {'0': 1, '1': 5}],
+}
+
+
+def fall_windows(n_samples=600, seed=0):
+    return make_classification(n_samples=n_samples, n_features=8, n_informative=4,
+                               weights=[0.8, 0.2], random_state=seed)
+
+
+class FallSearchTest(unittest.TestCase):
+
+    def test_normalize_param_grid(self):
+        grid = normalize_param_grid(PARAM_GRID)
+        self.assertEqual(grid['class_weight'], ['balanced', {0: 1, 1: 5}])
+        self.assertEqual(PARAM_GRID['class_weight'][1], {'0': 1, '1': 5})
+
+    def test_shared_matrix_is_a_read_only_memmap(self):
+        X = np.arange(12.0).reshape(4, 3)
+        with shared_matrix(X) as shared:
+            self.assertIsInstance(shared, np.memmap)
+            self.assertFalse(shared.flags.writeable)
+            np.testing.assert_array_equal(shared, X)
+            path = shared.filename
+        self.assertFalse(os.path.exists(path))
+
+    def test_halving_and_grid_searches(self):
+        X, y = fall_windows()
+        summaries = []
+        for mode in ['grid', 'halving']:
+            with self.subTest(mode=mode):
+                search, summary = run_search(mode, X[:450], y[:450], PARAM_GRID, cv=3, n_jobs=2, verbose=0)
+                self.assertEqual(summary['mode'], mode)
+                self.assertEqual(summary['n_candidates'], 8)
+                self.assertIn(search.best_params_['class_weight'], ['balanced', {0: 1, 1: 5}])
+                self.assertEqual(search.best_estimator_.n_jobs, -1)
+                # The refit model was trained on every sample
+                self.assertEqual(search.best_estimator_.n_features_in_, 8)
+                summary['test'] = held_out_scores(search.best_estimator_, X[450:], y[450:])
+                summaries.append(summary)
+
+        grid, halving = summaries
+        self.assertEqual(grid['n_fits'], 8 * 3)
+        self.assertGreater(halving['n_iterations'], 1)
+        self.assertLessEqual(halving['n_resources'][-1], 450)
+
+        report = comparison_report(summaries)
+        relative = report['relative_to_grid']['halving']
+        self.assertAlmostEqual(relative['recall_fall_delta'],
+                               halving['test']['recall_fall'] - grid['test']['recall_fall'])
+        self.assertIn('halving vs grid', format_report(report))
+
+    def test_unknown_mode(self):
+        X, y = fall_windows(60)
+        with self.assertRaises(ValueError):
+            run_search('random', X, y, PARAM_GRID)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Tests for the memory-mapped IMU dataset format
+
+Run from this directory with:
+
+    python -m unittest test_imu_dataset
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from imu_dataset import DatasetWriter, ImuDataset, convert_csv, is_imu_dataset, open_dataset
+from windowing import extract_windowed_features, extract_windowed_features_chunked
+
+ACC_COLS = ['xAcc', 'yAcc', 'zAcc']
+GYRO_COLS = ['xGyro', 'yGyro', 'zGyro']
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acc_gyr.csv')
+
+
+def recording(n_rows, seed=0, labels=('walk', 'fall', 'sit', 'lfall')):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, 6)) * [3, 3, 3, 80, 80, 80], columns=ACC_COLS + GYRO_COLS)
+    df['label'] = rng.choice(list(labels), n_rows)
+    return df
+
+
+class ImuDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, 'recording.csv')
+        self.out = os.path.join(self.tmp.name, 'recording.imu')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def convert(self, df, **kwargs):
+        df.to_csv(self.csv_path, index=False)
+        return convert_csv(self.csv_path, self.out, **kwargs)
+
+    def test_round_trip_across_chunks(self):
+        df = recording(1000)
+        df.loc[[3, 500], 'yGyro'] = np.nan
+        dataset = self.convert(df, chunk_rows=97, sampling_rate_hz=50)
+        self.assertTrue(is_imu_dataset(self.out))
+        self.assertEqual(len(dataset), 1000)
+        self.assertEqual(dataset.columns, ACC_COLS + GYRO_COLS)
+        self.assertEqual(dataset.sampling_rate_hz, 50)
+        # Label codes follow the order of first appearance
+        self.assertEqual(dataset.label_names, list(pd.unique(df['label'])))
+        expected = pd.read_csv(self.csv_path)
+        for col in ACC_COLS + GYRO_COLS:
+            np.testing.assert_array_equal(dataset[col], expected[col].to_numpy(np.float32))
+        pd.testing.assert_frame_equal(
+            dataset.to_frame(100, 250),
+            expected.iloc[100:250].reset_index(drop=True).astype({col: np.float32 for col in ACC_COLS + GYRO_COLS}))
+
+    def test_columns_are_memory_mapped_npy_files(self):
+        self.convert(recording(300))
+        dataset = open_dataset(self.out)
+        self.assertIsInstance(dataset['xAcc'], np.memmap)
+        self.assertFalse(dataset['xAcc'].flags.writeable)
+        np.testing.assert_array_equal(np.load(os.path.join(self.out, 'zGyro.npy')), dataset['zGyro'])
+        self.assertEqual(dataset.labels.dtype, np.int16)
+
+    def test_label_lookup(self):
+        dataset = self.convert(recording(400))
+        flags = dataset.label_lookup(lambda name: 'fall' in name)
+        decoded = dataset.to_frame()['label']
+        np.testing.assert_array_equal(flags, decoded.str.contains('fall').astype(np.int8))
+        self.assertEqual(flags.dtype, np.int8)
+
+    def test_numeric_labels_and_no_labels(self):
+        df = recording(200)
+        df['label'] = (df['label'] == 'fall').astype(int)
+        dataset = self.convert(df)
+        self.assertIsNone(dataset.label_names)
+        np.testing.assert_array_equal(dataset.labels, df['label'])
+        np.testing.assert_array_equal(dataset.label_lookup(lambda value: value * 2), df['label'] * 2)
+
+        dataset = convert_csv(self.csv_path, self.out, label_col=None, columns=ACC_COLS)
+        self.assertEqual(dataset.columns, ACC_COLS)
+        self.assertIsNone(dataset.labels)
+        self.assertEqual(list(dataset.to_frame().columns), ACC_COLS)
+
+    def test_failed_conversion_leaves_nothing(self):
+        recording(50).to_csv(self.csv_path, index=False)
+        with self.assertRaises(ValueError):
+            convert_csv(self.csv_path, self.out, label_col='activity')
+        self.assertEqual(os.listdir(self.tmp.name), ['recording.csv'])
+
+    def test_writer_appends_blocks_and_discards_on_error(self):
+        with DatasetWriter(self.out, ACC_COLS, 'activity', ['walk', 'fall'], sampling_rate_hz=25) as writer:
+            for block in range(3):
+                writer.append({col: np.full(4, block, np.float64) for col in ACC_COLS},
+                              writer.encode_labels(['walk', 'sit', 'fall', 'sit']))
+        dataset = open_dataset(self.out)
+        self.assertEqual(len(dataset), 12)
+        self.assertEqual(dataset.label_names, ['walk', 'fall', 'sit'])
+        np.testing.assert_array_equal(dataset['yAcc'], np.repeat([0, 1, 2], 4))
+        self.assertEqual(list(dataset.to_frame(0, 4)['activity']), ['walk', 'sit', 'fall', 'sit'])
+
+        with self.assertRaises(RuntimeError):
+            with DatasetWriter(self.out, ACC_COLS) as writer:
+                writer.append({col: np.zeros(2) for col in ACC_COLS})
+                raise RuntimeError('generator failed')
+        # The previous dataset is untouched
+        self.assertEqual(len(open_dataset(self.out)), 12)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['recording.imu'])
+
+    def test_rejects_other_directories(self):
+        os.makedirs(self.out)
+        with open(os.path.join(self.out, 'meta.json'), 'w') as f:
+            f.write('{"format": "something-else"}')
+        with self.assertRaises(ValueError):
+            ImuDataset(self.out)
+
+    def test_chunked_windowing_matches_whole_recording(self):
+        dataset = self.convert(recording(3000, seed=3), chunk_rows=512)
+        flags = dataset.label_lookup(lambda name: 'fall' in name)
+        frame = dataset.to_frame(labels=False)
+        frame['label'] = flags
+        expected = extract_windowed_features(frame, 75, 37, ACC_COLS, GYRO_COLS, 'label')
+        for chunk_windows in [1, 7, 1000]:
+            with self.subTest(chunk_windows=chunk_windows):
+                actual = extract_windowed_features_chunked(dataset, 75, 37, ACC_COLS, GYRO_COLS, 'label',
+                                                           labels=flags, chunk_windows=chunk_windows)
+                pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+                actual = extract_windowed_features_chunked(frame, 75, 37, ACC_COLS, GYRO_COLS, 'label',
+                                                           chunk_windows=chunk_windows)
+                pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+    @unittest.skipUnless(os.path.exists(DATASET_PATH), 'acc_gyr.csv is not available')
+    def test_converts_acc_gyr(self):
+        dataset = convert_csv(DATASET_PATH, self.out, chunk_rows=10000)
+        expected = pd.read_csv(DATASET_PATH)
+        self.assertEqual(len(dataset), len(expected))
+        self.assertTrue((dataset.to_frame()['label'] == expected['label']).all())
+        np.testing.assert_array_equal(dataset['zAcc'], expected['zAcc'].to_numpy(np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()
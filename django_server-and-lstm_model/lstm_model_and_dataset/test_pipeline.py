@@ -0,0 +1,183 @@
+"""
+Tests for the cached stage pipeline
+
+Run from this directory with:
+
+    python -m unittest test_pipeline
+"""
+import importlib
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from pipeline import Pipeline, Stage, StageSkipped
+
+CALLS = []
+
+
+def load(ctx):
+    CALLS.append('load')
+    values = np.loadtxt(ctx.config['data'], ndmin=1)
+    return {'values': values, 'frame': pd.DataFrame({'v': values})}
+
+
+def scale(ctx):
+    CALLS.append('scale')
+    return {'scaled': ctx.inputs['load']['values'] * ctx.config['factor'], 'factor': ctx.config['factor']}
+
+
+def train(ctx):
+    CALLS.append('train')
+    if ctx.config['depth'] < 0:
+        raise StageSkipped('negative depth')
+    path = ctx.path('model.txt')
+    path.write_text(str(ctx.inputs['scale']['scaled'].sum() + ctx.config['depth']))
+    return {'model_file': path, 'model': {'depth': ctx.config['depth']}, 'coef': np.float64(1.5)}
+
+
+def evaluate(ctx):
+    CALLS.append('evaluate')
+    return {'metrics': {'score': float(Path(ctx.inputs['train']['model_file']).read_text())}}
+
+
+def stages():
+    return [
+        Stage('load', load, files=['data']),
+        Stage('scale', scale, requires=['load'], config=['factor']),
+        Stage('train', train, requires=['scale'], config=['depth'],
+              artifacts={'model.txt': 'model_file', 'model.pkl': 'model'}),
+        Stage('evaluate', evaluate, requires=['train'], artifacts={'reports/metrics.json': 'metrics'}),
+    ]
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.data = self.root / 'data.txt'
+        self.data.write_text('1\n2\n3\n')
+        self.config = {'data': str(self.data), 'factor': 2.0, 'depth': 3}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_pipeline(self, targets=None, force=(), **config):
+        pipeline = Pipeline(stages(), dict(self.config, **config), self.root / 'cache', force=force)
+        pipeline.run(targets)
+        return pipeline
+
+    def test_second_run_is_fully_cached(self):
+        first = self.run_pipeline()
+        self.assertEqual(CALLS, ['load', 'scale', 'train', 'evaluate'])
+        CALLS.clear()
+        second = self.run_pipeline()
+        self.assertEqual(CALLS, [])
+        self.assertEqual(second.ran, [])
+        self.assertEqual(second.results['evaluate']['metrics'], {'score': 15.0})
+        self.assertEqual([key for _, key, _ in first.status()], [key for _, key, _ in second.status()])
+
+    def test_config_change_reruns_only_the_stage_and_downstream(self):
+        self.run_pipeline()
+        CALLS.clear()
+        pipeline = self.run_pipeline(depth=4)
+        self.assertEqual(CALLS, ['train', 'evaluate'])
+        self.assertEqual(pipeline.results['evaluate']['metrics'], {'score': 16.0})
+
+        # The previous result is still cached
+        CALLS.clear()
+        self.run_pipeline()
+        self.assertEqual(CALLS, [])
+
+    def test_input_file_change_reruns_everything(self):
+        self.run_pipeline()
+        CALLS.clear()
+        self.data.write_text('1\n2\n4\n')
+        self.run_pipeline()
+        self.assertEqual(CALLS, ['load', 'scale', 'train', 'evaluate'])
+
+    def test_helper_change_reruns_the_stages_using_it(self):
+        helper = self.root / 'pipeline_helper.py'
+        helper.write_text('FACTOR = 2\n')
+        sys.path.insert(0, str(self.root))
+        self.addCleanup(sys.path.remove, str(self.root))
+        self.addCleanup(sys.modules.pop, 'pipeline_helper', None)
+        module = importlib.import_module('pipeline_helper')
+
+        def run():
+            Pipeline([Stage('load', load, files=['data']),
+                      Stage('scale', scale, requires=['load'], config=['factor'], code=[module])],
+                     self.config, self.root / 'cache').run()
+
+        run()
+        self.assertEqual(CALLS, ['load', 'scale'])
+        CALLS.clear()
+        run()
+        self.assertEqual(CALLS, [])
+        helper.write_text('FACTOR = 3  # changed\n')
+        run()
+        self.assertEqual(CALLS, ['scale'])
+
+    def test_targets_and_force(self):
+        self.run_pipeline(targets=['scale'])
+        self.assertEqual(CALLS, ['load', 'scale'])
+        CALLS.clear()
+        self.run_pipeline(force=['scale'])
+        self.assertEqual(CALLS, ['scale', 'train', 'evaluate'])
+
+    def test_outputs_round_trip(self):
+        self.run_pipeline()
+        pipeline = self.run_pipeline()
+        load_outputs = pipeline.results['load']
+        np.testing.assert_array_equal(load_outputs['values'], [1.0, 2.0, 3.0])
+        pd.testing.assert_frame_equal(load_outputs['frame'], pd.DataFrame({'v': [1.0, 2.0, 3.0]}))
+        self.assertEqual(pipeline.results['scale']['factor'], 2.0)
+        train_outputs = pipeline.results['train']
+        self.assertEqual(train_outputs['model_file'].read_text(), '15.0')
+        self.assertEqual(train_outputs['model'], {'depth': 3})
+        self.assertEqual(train_outputs['coef'], 1.5)
+
+    def test_skipped_stage_skips_dependents_and_is_not_cached(self):
+        pipeline = self.run_pipeline(depth=-1)
+        self.assertEqual(set(pipeline.skipped), {'train', 'evaluate'})
+        self.assertNotIn('train', pipeline.results)
+        self.assertFalse(pipeline.is_cached('train'))
+        self.assertEqual(list((self.root / 'cache' / 'train').iterdir()), [])
+
+    def test_failed_stage_leaves_no_entry(self):
+        def broken(ctx):
+            raise RuntimeError('boom')
+
+        pipeline = Pipeline([Stage('broken', broken)], {}, self.root / 'cache')
+        with self.assertRaises(RuntimeError):
+            pipeline.run()
+        self.assertFalse(pipeline.is_cached('broken'))
+        self.assertEqual(list((self.root / 'cache' / 'broken').iterdir()), [])
+
+    def test_publish_writes_artifacts(self):
+        pipeline = self.run_pipeline()
+        written = pipeline.publish(self.root / 'out')
+        self.assertEqual(len(written), 3)
+        self.assertEqual((self.root / 'out' / 'model.txt').read_text(), '15.0')
+        self.assertEqual(joblib.load(self.root / 'out' / 'model.pkl'), {'depth': 3})
+        with open(self.root / 'out' / 'reports' / 'metrics.json') as f:
+            self.assertEqual(json.load(f), {'score': 15.0})
+
+    def test_rejects_bad_definitions(self):
+        with self.assertRaises(ValueError):
+            Pipeline([Stage('scale', scale, requires=['load'], config=['factor'])], self.config, self.root)
+        with self.assertRaises(ValueError):
+            Pipeline([Stage('load', load, files=['missing'])], self.config, self.root)
+        with self.assertRaises(ValueError):
+            Pipeline(stages(), self.config, self.root).resolve(['unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()
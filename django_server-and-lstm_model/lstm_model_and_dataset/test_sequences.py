@@ -0,0 +1,102 @@
+"""
+Tests for the strided LSTM training sequences
+
+Run from this directory with:
+
+    python -m unittest test_sequences
+"""
+import unittest
+
+import numpy as np
+
+from sequences import WindowedSequences, create_sequences_lstm, create_sequences_lstm_loop
+
+
+def vitals_rows(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_rows, 3))
+    targets = rng.integers(0, 4, n_rows)
+    return features, targets
+
+
+class CreateSequencesParityTest(unittest.TestCase):
+    """The strided sequences must match the list-building loop"""
+
+    def test_same_sequences_and_labels(self):
+        features, targets = vitals_rows(500)
+        for time_steps in [1, 10, 499]:
+            with self.subTest(time_steps=time_steps):
+                expected_X, expected_y = create_sequences_lstm_loop(features, targets, time_steps)
+                X, y = create_sequences_lstm(features, targets, time_steps)
+                np.testing.assert_array_equal(X, expected_X)
+                np.testing.assert_array_equal(y, expected_y)
+
+    def test_is_a_view(self):
+        features, targets = vitals_rows(100)
+        X, _ = create_sequences_lstm(features, targets, 10)
+        self.assertTrue(np.shares_memory(X, features))
+        self.assertFalse(X.flags.writeable)
+
+    def test_one_dimensional_input(self):
+        values = np.arange(20.0)
+        expected_X, expected_y = create_sequences_lstm_loop(values, values, 5)
+        X, y = create_sequences_lstm(values, values, 5)
+        np.testing.assert_array_equal(X, expected_X)
+        np.testing.assert_array_equal(y, expected_y)
+
+    def test_too_short(self):
+        features, targets = vitals_rows(10)
+        X, y = create_sequences_lstm(features, targets, 10)
+        self.assertEqual(X.shape, (0,))
+        self.assertEqual(y.shape, (0,))
+
+
+class WindowedSequencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.features, self.targets = vitals_rows(300)
+        self.expected_X, self.expected_y = create_sequences_lstm_loop(self.features, self.targets, 10)
+        self.dataset = WindowedSequences(self.features, self.targets, 10)
+
+    def test_take_matches_the_loop(self):
+        self.assertEqual(len(self.dataset), len(self.expected_X))
+        indices = np.array([0, 17, 5, len(self.dataset) - 1])
+        X, y = self.dataset.take(indices)
+        np.testing.assert_array_equal(X, self.expected_X[indices].astype(np.float32))
+        np.testing.assert_array_equal(y, self.expected_y[indices])
+        self.assertEqual(X.dtype, np.float32)
+
+    def test_batches_cover_the_split_once(self):
+        indices = np.arange(0, len(self.dataset), 3)
+        batches = self.dataset.batches(indices, batch_size=32)
+        self.assertEqual(len(batches), -(-len(indices) // 32))
+        X = np.concatenate([X for X, _ in batches])
+        y = np.concatenate([y for _, y in batches])
+        np.testing.assert_array_equal(X, self.expected_X[indices].astype(np.float32))
+        np.testing.assert_array_equal(y, self.expected_y[indices])
+        with self.assertRaises(IndexError):
+            batches[len(batches)]
+
+    def test_shuffle_keeps_windows_and_labels_together(self):
+        batches = self.dataset.batches(batch_size=50, shuffle=True, seed=1)
+        first_order = batches.indices.copy()
+        batches.on_epoch_end()
+        self.assertFalse(np.array_equal(first_order, batches.indices))
+        self.assertEqual(sorted(batches.indices), list(range(len(self.dataset))))
+        for X, y in batches:
+            for window, label in zip(X, y):
+                start = int(np.flatnonzero((self.expected_X.astype(np.float32) == window).all(axis=(1, 2)))[0])
+                self.assertEqual(label, self.expected_y[start])
+
+    def test_class_weights_become_sample_weights(self):
+        batches = self.dataset.batches(batch_size=64, class_weights={0: 1.0, 1: 2.0, 2: 0.5, 3: 4.0})
+        X, y, weights = batches[0]
+        np.testing.assert_array_equal(weights, np.array([1.0, 2.0, 0.5, 4.0], dtype=np.float32)[y])
+
+    def test_rejects_mismatched_targets(self):
+        with self.assertRaises(ValueError):
+            WindowedSequences(self.features, self.targets[:-1], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
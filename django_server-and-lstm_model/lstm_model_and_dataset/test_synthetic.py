@@ -0,0 +1,104 @@
+"""
+Tests for the synthetic IMU and vitals generators
+
+Run from this directory with:
+
+    python -m unittest test_synthetic
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from imu_dataset import open_dataset
+from synthetic import (IMU_COLUMNS, IMU_LABELS, VITALS_COLUMNS, VITALS_LABELS, generate_imu, generate_vitals,
+                       imu_blocks, write_imu_dataset, write_vitals_dataset)
+from windowing import extract_windowed_features
+
+
+def is_fall(name):
+    return 'fall' in name
+
+
+class SyntheticImuTest(unittest.TestCase):
+
+    def test_reproducible_and_blocked(self):
+        df = generate_imu(5000, seed=3, block_rows=1200)
+        self.assertEqual(list(df.columns), IMU_COLUMNS + ['label'])
+        self.assertEqual(len(df), 5000)
+        self.assertTrue(set(df['label']) <= set(IMU_LABELS))
+        self.assertTrue((df[IMU_COLUMNS].dtypes == np.float32).all())
+        pd.testing.assert_frame_equal(df, generate_imu(5000, seed=3, block_rows=1200))
+        self.assertFalse(df.equals(generate_imu(5000, seed=4, block_rows=1200)))
+        self.assertEqual([len(codes) for _, codes in imu_blocks(5000, seed=3, block_rows=1200)],
+                         [1200, 1200, 1200, 1200, 200])
+
+    def test_fall_fraction(self):
+        for fraction in [0.0, 0.05, 0.3]:
+            with self.subTest(fall_fraction=fraction):
+                df = generate_imu(400000, seed=1, fall_fraction=fraction)
+                self.assertAlmostEqual(df['label'].map(is_fall).mean(), fraction, delta=0.02)
+        df = generate_imu(50000, seed=1, activity_weights={'sit': 1})
+        self.assertEqual(set(df['label']) - {'fall', 'lfall', 'rfall'}, {'sit'})
+
+    def test_fall_events_have_free_fall_impact_and_stillness(self):
+        df = generate_imu(200000, seed=5, fall_fraction=0.3)
+        magnitude = np.sqrt((df[['xAcc', 'yAcc', 'zAcc']].astype(np.float64) ** 2).sum(axis=1))
+        falls = df['label'].map(is_fall)
+        # Free fall and impact only happen during falls
+        self.assertLess(magnitude[falls].min(), 4.0)
+        self.assertGreater(magnitude[falls].max(), 25.0)
+        self.assertGreater(magnitude[~falls].min(), 2.0)
+        self.assertLess(magnitude[~falls].max(), 20.0)
+
+        features = df[IMU_COLUMNS].copy()
+        features['label'] = falls.astype(int)
+        windows = extract_windowed_features(features, 75, 37, IMU_COLUMNS[:3], IMU_COLUMNS[3:], 'label')
+        self.assertEqual(set(windows['label']), {0, 1})
+        by_class = windows.groupby('label')['SMV_Acc_max'].median()
+        self.assertGreater(by_class[1], by_class[0])
+
+    def test_writes_columnar_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'synthetic.imu')
+            dataset = write_imu_dataset(out, 3000, seed=2, block_rows=700, fall_fraction=0.2)
+            self.assertEqual(len(dataset), 3000)
+            self.assertEqual(dataset.label_names, IMU_LABELS)
+            self.assertEqual(dataset.sampling_rate_hz, 50)
+            self.assertEqual(dataset.meta['source']['seed'], 2)
+            pd.testing.assert_frame_equal(open_dataset(out).to_frame(),
+                                          generate_imu(3000, seed=2, block_rows=700, fall_fraction=0.2))
+
+    def test_rejects_bad_fraction(self):
+        with self.assertRaises(ValueError):
+            generate_imu(100, fall_fraction=1.0)
+
+
+class SyntheticVitalsTest(unittest.TestCase):
+
+    def test_episodes(self):
+        df = generate_vitals(200000, seed=1, anomaly_fraction=0.3)
+        self.assertEqual(list(df.columns), VITALS_COLUMNS + ['episode'])
+        self.assertEqual(set(df['episode']), set(VITALS_LABELS))
+        self.assertAlmostEqual((df['episode'] != 'normal').mean(), 0.3, delta=0.05)
+        self.assertLessEqual(df['Oxygen Saturation'].max(), 100.0)
+        medians = df.groupby('episode').median()
+        self.assertGreater(medians.loc['tachycardia', 'Heart Rate'], 110)
+        self.assertLess(medians.loc['bradycardia', 'Heart Rate'], 55)
+        self.assertLess(medians.loc['hypoxemia', 'Oxygen Saturation'], 90)
+        self.assertGreater(medians.loc['fever', 'Body Temperature'], 38)
+
+    def test_writes_columnar_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = write_vitals_dataset(os.path.join(tmp, 'vitals.imu'), 2000, seed=9,
+                                           episode_weights={'fever': 1})
+            self.assertEqual(dataset.columns, VITALS_COLUMNS)
+            self.assertEqual(dataset.label_col, 'episode')
+            names = set(np.asarray(dataset.label_names)[np.unique(dataset.labels)])
+            self.assertLessEqual(names, {'normal', 'fever'})
+
+
+if __name__ == '__main__':
+    unittest.main()
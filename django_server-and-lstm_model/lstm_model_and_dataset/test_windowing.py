@@ -0,0 +1,80 @@
+"""
+Parity tests for the vectorized windowed feature extraction
+
+Run from this directory with:
+
+    python -m unittest test_windowing
+"""
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from windowing import extract_windowed_features, extract_windowed_features_loop
+
+ACC_COLS = ['xAcc', 'yAcc', 'zAcc']
+GYRO_COLS = ['xGyro', 'yGyro', 'zGyro']
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acc_gyr.csv')
+
+
+def synthetic_recording(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, 6)) * [3, 3, 3, 80, 80, 80], columns=ACC_COLS + GYRO_COLS)
+    df['zAcc'] -= 9.8
+    df['label'] = (rng.random(n_rows) < 0.1).astype(int)
+    return df
+
+
+class WindowedFeatureParityTest(unittest.TestCase):
+    """The vectorized extractor must reproduce the per-window loop"""
+
+    def assert_parity(self, df, window_size, step_size, label_col='label', exact=True,
+                      acc_cols=ACC_COLS, gyro_cols=GYRO_COLS):
+        expected = extract_windowed_features_loop(df, window_size, step_size, acc_cols, gyro_cols, label_col)
+        actual = extract_windowed_features(df, window_size, step_size, acc_cols, gyro_cols, label_col)
+        if expected.empty:
+            self.assertTrue(actual.empty)
+            return
+        pd.testing.assert_frame_equal(actual, expected, check_exact=exact, rtol=1e-12, atol=1e-12)
+
+    @unittest.skipUnless(os.path.exists(DATASET_PATH), 'acc_gyr.csv is not available')
+    def test_dataset_is_bit_identical(self):
+        df = pd.read_csv(DATASET_PATH)
+        df['label'] = df['label'].str.contains('fall').astype(int)
+        self.assert_parity(df, 75, 37)
+
+    def test_window_and_step_combinations(self):
+        df = synthetic_recording(1000)
+        for window_size, step_size in [(75, 37), (50, 50), (20, 7), (2, 1), (10, 25)]:
+            with self.subTest(window_size=window_size, step_size=step_size):
+                self.assert_parity(df, window_size, step_size)
+
+    def test_without_label_and_single_sensor(self):
+        df = synthetic_recording(400)
+        self.assert_parity(df.drop(columns=['label']), 75, 37, label_col=None)
+        self.assert_parity(df.drop(columns=GYRO_COLS), 75, 37)
+        self.assert_parity(df.drop(columns=ACC_COLS), 75, 37)
+
+    def test_integer_columns(self):
+        df = synthetic_recording(300).round().astype(int)
+        self.assert_parity(df, 30, 10)
+
+    def test_missing_values(self):
+        df = synthetic_recording(600, seed=1)
+        rng = np.random.default_rng(2)
+        for col in ACC_COLS + GYRO_COLS:
+            df.loc[rng.random(len(df)) < 0.05, col] = np.nan
+        # A stretch where every sensor value is missing
+        df.loc[100:160, ACC_COLS + GYRO_COLS] = np.nan
+        self.assert_parity(df, 40, 20, exact=False)
+
+    def test_short_or_sensorless_input(self):
+        df = synthetic_recording(50)
+        self.assert_parity(df, 75, 37)
+        self.assertTrue(extract_windowed_features(df[['label']], 10, 5, ACC_COLS, GYRO_COLS, 'label').empty)
+        self.assertTrue(extract_windowed_features_loop(df[['label']], 10, 5, ACC_COLS, GYRO_COLS, 'label').empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
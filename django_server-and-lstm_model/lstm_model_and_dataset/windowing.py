@@ -0,0 +1,244 @@
+"""
+Windowed feature extraction for fall detection
+
+extract_windowed_features computes the per-window statistics used to train
+the fall model. Windows are zero-copy strided views over the raw columns
+(numpy's sliding_window_view), so every feature is computed for all windows
+with a handful of array reductions instead of a pandas slice per window.
+
+extract_windowed_features_loop is the original per-window implementation,
+kept as the reference for the parity test (test_windowing.py) and the
+benchmark (benchmark_windowing.py).
+"""
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def extract_windowed_features_loop(df_segment, window_size, step_size, acc_cols, gyro_cols, label_col=None):
+    """Reference implementation: one pandas slice and dict of reductions per window"""
+    all_window_features = []
+    num_samples = len(df_segment)
+    if num_samples < window_size:
+        print(f"Warning: Data segment length ({num_samples}) is less than window size ({window_size}). No windows extracted.")
+        return pd.DataFrame(all_window_features)
+
+    for i in range(0, num_samples - window_size + 1, step_size):
+        window = df_segment.iloc[i : i + window_size]
+        current_features = {}
+        if label_col and label_col in window.columns:
+            label_val = window[label_col].iloc[window_size // 2]
+            current_features[label_col] = int(label_val)
+
+        if all(c in window.columns for c in acc_cols):
+            smv_acc = np.sqrt(window[acc_cols[0]]**2 + window[acc_cols[1]]**2 + window[acc_cols[2]]**2)
+            current_features['SMV_Acc_mean'] = smv_acc.mean(); current_features['SMV_Acc_std'] = smv_acc.std()
+            current_features['SMV_Acc_min'] = smv_acc.min(); current_features['SMV_Acc_max'] = smv_acc.max()
+            current_features['SMV_Acc_median'] = smv_acc.median(); current_features['SMV_Acc_iqr'] = smv_acc.quantile(0.75) - smv_acc.quantile(0.25)
+            for col_name in acc_cols:
+                current_features[f'{col_name}_mean'] = window[col_name].mean(); current_features[f'{col_name}_std'] = window[col_name].std()
+                current_features[f'{col_name}_max_abs_diff'] = window[col_name].diff().abs().max()
+
+        if all(c in window.columns for c in gyro_cols):
+            smv_gyro = np.sqrt(window[gyro_cols[0]]**2 + window[gyro_cols[1]]**2 + window[gyro_cols[2]]**2)
+            current_features['SMV_Gyro_mean'] = smv_gyro.mean(); current_features['SMV_Gyro_std'] = smv_gyro.std()
+            current_features['SMV_Gyro_max'] = smv_gyro.max(); current_features['SMV_Gyro_iqr'] = smv_gyro.quantile(0.75) - smv_gyro.quantile(0.25)
+            for col_name in gyro_cols:
+                current_features[f'{col_name}_mean'] = window[col_name].mean(); current_features[f'{col_name}_std'] = window[col_name].std()
+
+        min_expected_features = 1 if label_col and label_col in current_features else 0
+        if len(current_features) > min_expected_features: all_window_features.append(current_features)
+
+    processed_df = pd.DataFrame(all_window_features)
+    if not processed_df.empty:
+         processed_df = processed_df.dropna(subset=[col for col in processed_df.columns if col != label_col], how='all')
+    return processed_df
+
+
+class _WindowStats:
+    """Reductions over the windows of one series, matching pandas' NaN-skipping semantics"""
+
+    def __init__(self, values, window_size, step_size):
+        self.values = values
+        self.windows = sliding_window_view(values, window_size)[::step_size]
+        self.has_nan = bool(np.isnan(values).any())
+
+    def mean(self):
+        if self.has_nan:
+            counts = (~np.isnan(self.windows)).sum(axis=1)
+            sums = np.nansum(self.windows, axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(counts > 0, sums / counts, np.nan)
+        return self.windows.mean(axis=1)
+
+    def std(self):
+        # Two-pass sample standard deviation (ddof=1) with the same operation
+        # order as pandas' nanvar, so results match bit for bit
+        windows = self.windows
+        if self.has_nan:
+            counts = (~np.isnan(windows)).sum(axis=1)
+            deviations = np.where(np.isnan(windows), 0.0, self.mean()[:, None] - windows)
+        else:
+            counts = np.full(len(windows), windows.shape[1])
+            deviations = windows.sum(axis=1)[:, None] / counts[:, None] - windows
+        squares = (deviations ** 2).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+
+    def _reduce(self, func, nan_func):
+        if not self.has_nan:
+            return func(self.windows, axis=1)
+        with np.errstate(invalid='ignore'), _ignore_all_nan_warnings():
+            return nan_func(self.windows, axis=1)
+
+    def min(self):
+        return self._reduce(np.min, np.nanmin)
+
+    def max(self):
+        return self._reduce(np.max, np.nanmax)
+
+    def median(self):
+        return self._reduce(np.median, np.nanmedian)
+
+    def quantiles(self, qs):
+        if not self.has_nan:
+            return np.quantile(self.windows, qs, axis=1)
+        with _ignore_all_nan_warnings():
+            return np.nanquantile(self.windows, qs, axis=1)
+
+    def max_abs_diff(self, window_size, step_size):
+        # Differences inside a window are window_size - 1 consecutive entries of
+        # the whole series' differences
+        if window_size < 2:
+            return np.full(len(self.windows), np.nan)
+        diffs = np.abs(np.diff(self.values))
+        diff_windows = sliding_window_view(diffs, window_size - 1)[::step_size]
+        if not self.has_nan:
+            return diff_windows.max(axis=1)
+        with _ignore_all_nan_warnings():
+            return np.nanmax(diff_windows, axis=1)
+
+
+@contextmanager
+def _ignore_all_nan_warnings():
+    """Silence the RuntimeWarning numpy emits for all-NaN slices; pandas returns NaN quietly"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        yield
+
+
+def _column(df, name):
+    return df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _magnitude(df, cols):
+    x, y, z = (_column(df, col) for col in cols)
+    return np.sqrt(x ** 2 + y ** 2 + z ** 2)
+
+
+def extract_windowed_features(df_segment, window_size, step_size, acc_cols, gyro_cols, label_col=None):
+    """
+    Extract fall detection features from sliding windows
+
+    Args:
+        df_segment: DataFrame of raw samples
+        window_size: Samples per window
+        step_size: Samples between window starts
+        acc_cols: Accelerometer column names (x, y, z)
+        gyro_cols: Gyroscope column names (x, y, z)
+        label_col: Optional label column; each window takes the label of its
+                   middle sample
+
+    Returns:
+        DataFrame with one row per window and the same columns, order and
+        values as extract_windowed_features_loop: bit-identical for complete
+        data, and equal up to floating point rounding when values are missing
+    """
+    num_samples = len(df_segment)
+    if num_samples < window_size:
+        print(f"Warning: Data segment length ({num_samples}) is less than window size ({window_size}). No windows extracted.")
+        return pd.DataFrame([])
+
+    has_acc = all(c in df_segment.columns for c in acc_cols)
+    has_gyro = all(c in df_segment.columns for c in gyro_cols)
+    if not has_acc and not has_gyro:
+        return pd.DataFrame([])
+
+    starts = np.arange(0, num_samples - window_size + 1, step_size)
+    features = {}
+    if label_col and label_col in df_segment.columns:
+        middle = df_segment[label_col].to_numpy()[starts + window_size // 2]
+        features[label_col] = np.array([int(value) for value in middle], dtype=np.int64)
+
+    if has_acc:
+        smv = _WindowStats(_magnitude(df_segment, acc_cols), window_size, step_size)
+        q1, q3 = smv.quantiles([0.25, 0.75])
+        features['SMV_Acc_mean'] = smv.mean()
+        features['SMV_Acc_std'] = smv.std()
+        features['SMV_Acc_min'] = smv.min()
+        features['SMV_Acc_max'] = smv.max()
+        features['SMV_Acc_median'] = smv.median()
+        features['SMV_Acc_iqr'] = q3 - q1
+        for col_name in acc_cols:
+            stats = _WindowStats(_column(df_segment, col_name), window_size, step_size)
+            features[f'{col_name}_mean'] = stats.mean()
+            features[f'{col_name}_std'] = stats.std()
+            features[f'{col_name}_max_abs_diff'] = stats.max_abs_diff(window_size, step_size)
+
+    if has_gyro:
+        smv = _WindowStats(_magnitude(df_segment, gyro_cols), window_size, step_size)
+        q1, q3 = smv.quantiles([0.25, 0.75])
+        features['SMV_Gyro_mean'] = smv.mean()
+        features['SMV_Gyro_std'] = smv.std()
+        features['SMV_Gyro_max'] = smv.max()
+        features['SMV_Gyro_iqr'] = q3 - q1
+        for col_name in gyro_cols:
+            stats = _WindowStats(_column(df_segment, col_name), window_size, step_size)
+            features[f'{col_name}_mean'] = stats.mean()
+            features[f'{col_name}_std'] = stats.std()
+
+    processed_df = pd.DataFrame(features)
+    return processed_df.dropna(subset=[col for col in processed_df.columns if col != label_col], how='all')
+
+
+def extract_windowed_features_chunked(source, window_size, step_size, acc_cols, gyro_cols, label_col=None,
+                                      labels=None, chunk_windows=20000):
+    """
+    extract_windowed_features over a recording too large to load at once
+
+    Args:
+        source: DataFrame, or an ImuDataset (imu_dataset.py) read lazily
+        labels: Optional per-row labels added as label_col (e.g. fall flags
+                derived from an ImuDataset's activity names)
+        chunk_windows: Windows per chunk; a chunk holds
+                       (chunk_windows - 1) * step_size + window_size rows
+
+    Returns:
+        The same DataFrame as extract_windowed_features on the whole source
+    """
+    num_samples = len(source)
+    if num_samples < window_size:
+        return extract_windowed_features(pd.DataFrame(index=range(num_samples)), window_size, step_size,
+                                         acc_cols, gyro_cols, label_col)
+    columns = [col for col in list(acc_cols) + list(gyro_cols) if col in source.columns]
+    chunk_windows = max(1, int(chunk_windows))
+    total_windows = (num_samples - window_size) // step_size + 1
+    frames = []
+    for first_window in range(0, total_windows, chunk_windows):
+        # Chunks start on a window boundary, so every window lies in exactly one chunk
+        start = first_window * step_size
+        stop = min(num_samples, start + (chunk_windows - 1) * step_size + window_size)
+        if isinstance(source, pd.DataFrame):
+            chunk = source.iloc[start:stop][columns + ([label_col] if label_col in source.columns else [])]
+        else:
+            chunk = source.to_frame(start, stop, columns, labels=label_col is not None and label_col == source.label_col)
+        if labels is not None:
+            chunk = chunk.assign(**{label_col: np.asarray(labels[start:stop])})
+        features = extract_windowed_features(chunk, window_size, step_size, acc_cols, gyro_cols, label_col)
+        features.index += first_window
+        frames.append(features)
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames) if frames else pd.DataFrame([])
@@ -6,6 +6,15 @@ import sys
 import requests
 import json
 import random
+import time
+
+import numpy as np
+
+# The binary frame encoder lives with the server so both sides share one definition
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'health_monitor_server'))
+from api.wire_format import encode_frame, FRAME_MEDIA_TYPE
+# The synthetic recordings come from the training data generator, imported only for the load test
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lstm_model_and_dataset')
 
 def send_anomalous_data():
     """Send anomalous health data to the API"""
@@ -118,10 +127,17 @@ def send_anomalous_data():
         print("Operation cancelled.")
         return
     
+    use_binary = input("Send as compact binary frame instead of JSON? (y/N): ").lower() == 'y'
+    
     # Send data to API
     try:
         print("\nSending data to API...")
-        response = requests.post(api_url, json=data)
+        if use_binary:
+            frame = encode_frame(user_id, [data])
+            print(f"Binary frame: {len(frame)} bytes (JSON: {len(json.dumps(data))} bytes)")
+            response = requests.post(api_url, data=frame, headers={'Content-Type': FRAME_MEDIA_TYPE})
+        else:
+            response = requests.post(api_url, json=data)
         
         if response.status_code == 200:
             result = response.json()
@@ -160,6 +176,73 @@ def send_anomalous_data():
         print(f"\n❌ Error sending data: {e}")
         print("\nMake sure the Django server is running and accessible.")
 
+def synthetic_samples(seconds, sampling_rate_hz=50, fall_fraction=0.05, anomaly_fraction=0.2, seed=None):
+    """
+    Synthetic watch samples in wire_format.FRAME_FIELDS column order
+
+    IMU rows at sampling_rate_hz with vitals at 1 Hz, held between readings.
+    Needs the training dependencies (pandas, scipy), which the other senders
+    do not.
+    """
+    if DATASET_DIR not in sys.path:
+        sys.path.append(DATASET_DIR)
+    from synthetic import IMU_COLUMNS, VITALS_COLUMNS, generate_imu, generate_vitals
+
+    n_rows = int(seconds * sampling_rate_hz)
+    imu = generate_imu(n_rows, seed=seed, fall_fraction=fall_fraction, sampling_rate_hz=sampling_rate_hz)
+    vitals = generate_vitals(int(np.ceil(seconds)), seed=seed, anomaly_fraction=anomaly_fraction)
+    vitals = vitals[VITALS_COLUMNS[:2]].to_numpy().repeat(sampling_rate_hz, axis=0)[:n_rows]
+    return np.hstack([vitals, imu[IMU_COLUMNS].to_numpy()]), imu['label'].to_numpy()
+
+
+def send_synthetic_stream():
+    """Send a synthetic recording as binary frames, for load testing"""
+    print("\n" + "="*70)
+    print("SYNTHETIC STREAM SENDER".center(70))
+    print("="*70)
+
+    api_url = input("\nEnter batch API URL (default: http://127.0.0.1:8000/api/health-data/batch/): ") or "http://127.0.0.1:8000/api/health-data/batch/"
+    user_id = input("\nEnter user ID (must exist in database): ")
+    if not user_id:
+        print("User ID is required. Please try again.")
+        return
+    try:
+        seconds = float(input("Seconds of recording to send (default: 60): ") or 60)
+        frame_seconds = float(input("Seconds per frame (default: 1): ") or 1)
+        fall_fraction = float(input("Share of samples inside falls (default: 0.05): ") or 0.05)
+    except ValueError:
+        print("Please enter numbers.")
+        return
+
+    rate = 50
+    try:
+        samples, labels = synthetic_samples(seconds, rate, fall_fraction=fall_fraction)
+    except ImportError as e:
+        print(f"The synthetic recording needs the training dependencies (see lstm_model_and_dataset): {e}")
+        return
+    frame_rows = max(1, int(frame_seconds * rate))
+    print(f"\nGenerated {len(samples)} samples, {int(np.isin(labels, ['fall', 'lfall', 'rfall']).sum())} of them in falls. Sending...")
+
+    start_ms = int(time.time() * 1000)
+    sent = errors = 0
+    started = time.perf_counter()
+    for sequence, first in enumerate(range(0, len(samples), frame_rows)):
+        frame = encode_frame(user_id, samples[first:first + frame_rows], sequence=sequence,
+                             start_time_ms=start_ms + first * 1000 // rate, sample_interval_ms=1000 // rate)
+        try:
+            response = requests.post(api_url, data=frame, headers={'Content-Type': FRAME_MEDIA_TYPE})
+        except requests.RequestException as e:
+            print(f"\n❌ Error sending data: {e}")
+            print("\nMake sure the Django server is running and accessible.")
+            return
+        if response.status_code == 200:
+            sent += len(samples[first:first + frame_rows])
+        else:
+            errors += 1
+            print(f"❌ Frame {sequence}: {response.status_code} {response.text[:200]}")
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Sent {sent} samples in {elapsed:.1f} s ({sent / max(elapsed, 1e-9):.0f} samples/s), {errors} failed frame(s)")
+
 def test_chat_api():
     """Test the new chat endpoint that uses LLM7.io"""
     print("\n" + "="*70)
@@ -233,17 +316,20 @@ def show_menu():
         print("="*70)
         
         print("\n1. Send Anomalous Health Data")
-        print("2. Test Health Assistant Chat")
-        print("3. Exit")
+        print("2. Send a Synthetic Stream (load test)")
+        print("3. Test Health Assistant Chat")
+        print("4. Exit")
         
         try:
-            choice = int(input("\nEnter your choice (1-3): "))
+            choice = int(input("\nEnter your choice (1-4): "))
             
             if choice == 1:
                 send_anomalous_data()
             elif choice == 2:
-                test_chat_api()
+                send_synthetic_stream()
             elif choice == 3:
+                test_chat_api()
+            elif choice == 4:
                 print("\nExiting. Goodbye!")
                 break
             else: